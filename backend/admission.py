@@ -0,0 +1,297 @@
+"""Priority admission control and per-client rate limits in front of the API.
+
+Every request is put in a class by method and path, highest priority first:
+emergency alerts, clinical writes, reads, AI-backed calls, and bulk sync.
+Each class runs at most `limit` requests at once. Apart from emergencies,
+the classes also share `capacity` slots, so a flood of low-priority work
+cannot take the event loop and the Mongo pool from the rest. A request that
+cannot start waits in its class's bounded queue; when a slot frees, the
+queues are served in priority order. A request that finds its queue full,
+or is still queued at the class deadline, gets 503 with Retry-After instead
+of waiting behind work that will not finish in time.
+
+CPU-bound work can stall the single event loop with few requests running,
+so a monitor also measures how late the loop runs a timer. While that lag
+is over a class's max_lag, the class starts nothing new: its requests wait
+in the queue, and are shed by its bound and deadline if the loop does not
+catch up in time.
+
+Rate limits are token buckets per (client, class), kept for the most
+recently seen clients only. A client over its rate gets 429 with the
+seconds until its next token. Emergency alerts are never rate limited.
+"""
+import asyncio
+import json
+import math
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Pattern, Set, Tuple
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import registry
+
+EMERGENCY, CLINICAL, READ, AI, BULK = "emergency", "clinical", "read", "ai", "bulk"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# One long stall (a startup job, a big GC) counts as this much lag, so it is not still shed long after it ends
+MAX_LAG_SAMPLE = 1.0
+
+admission_rejections = registry.counter("admission_rejections_total", "Requests turned away by admission control",
+                                        ("class", "reason"))
+admission_wait = registry.histogram("admission_queue_wait_seconds", "Time requests spent queued for admission",
+                                    ("class",))
+
+
+class ClassPolicy(NamedTuple):
+    limit: int  # requests of this class running at once
+    queue: int  # requests of this class waiting at once
+    timeout: float  # seconds a request may wait queued
+    rate: Optional[float] = None  # requests per second per client; None is unlimited
+    burst: int = 1
+    shared: bool = True  # counts against the shared capacity
+    max_lag: Optional[float] = None  # seconds of event loop lag above which new requests wait
+
+
+# Highest priority first; the order is the order queues are served in
+DEFAULT_POLICIES: Dict[str, ClassPolicy] = {
+    EMERGENCY: ClassPolicy(limit=32, queue=128, timeout=10.0, shared=False),
+    CLINICAL: ClassPolicy(limit=32, queue=128, timeout=5.0, rate=10, burst=30, max_lag=1.0),
+    READ: ClassPolicy(limit=64, queue=256, timeout=2.0, rate=20, burst=60, max_lag=0.5),
+    AI: ClassPolicy(limit=16, queue=64, timeout=2.0, rate=1, burst=5, max_lag=0.2),
+    BULK: ClassPolicy(limit=4, queue=16, timeout=2.0, rate=0.5, burst=3, max_lag=0.1),
+}
+
+# First match wins, anything else is a read; None runs without admission (probes, and streams that stay open)
+ROUTE_CLASSES: List[Tuple[Optional[str], Optional[Set[str]], Pattern]] = [
+    (None, None, re.compile(r"^/api/(health|metrics)$")),
+    (None, {"GET"}, re.compile(r"^/api/emergency-alerts/stream$")),
+    (EMERGENCY, {"POST"}, re.compile(r"^/api/emergency-alert$")),
+    (EMERGENCY, {"GET"}, re.compile(r"^/api/emergency-alerts$")),
+    (EMERGENCY, {"PUT"}, re.compile(r"^/api/emergency-alerts/[^/]+/respond$")),
+    (AI, {"POST"}, re.compile(r"^/api/(symptom-check|translate|translate/batch)$")),
+    (BULK, None, re.compile(r"^/api/(health-records/sync|health-records/sync/stream|sync/changes)$")),
+    (BULK, {"PUT"}, re.compile(r"^/api/attachments/uploads/[^/]+$")),
+    (CLINICAL, WRITE_METHODS, re.compile(r"^/api/")),
+]
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _ClassState:
+    __slots__ = ("name", "policy", "running", "waiters", "admitted", "service_seconds")
+
+    def __init__(self, name: str, policy: ClassPolicy):
+        self.name = name
+        self.policy = policy
+        self.running = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.service_seconds = 0.05  # moving average of how long one request runs
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class AdmissionController:
+    """Priority classes with concurrency limits, bounded queues with deadlines, and token buckets per client"""
+
+    def __init__(self, policies: Dict[str, ClassPolicy] = DEFAULT_POLICIES, capacity: int = 96,
+                 rate_limits: bool = True, max_clients: int = 100_000, enabled: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.classes = {name: _ClassState(name, policy) for name, policy in policies.items()}
+        self.capacity = capacity
+        self.rate_limits = rate_limits
+        self.max_clients = max_clients
+        self.enabled = enabled
+        self._clock = clock
+        self.shared_running = 0
+        self.loop_lag = 0.0
+        self._buckets: "OrderedDict[Tuple[str, str], _Bucket]" = OrderedDict()
+        self.counters = {"queue_full": 0, "queue_timeout": 0, "rate_limited": 0}
+
+    def classify(self, method: str, path: str) -> Optional[str]:
+        for name, methods, pattern in ROUTE_CLASSES:
+            if (methods is None or method in methods) and pattern.match(path):
+                return name
+        return READ
+
+    # -- rate limits ------------------------------------------------------------
+
+    def check_rate(self, client: str, name: str) -> float:
+        """Take a token from the client's bucket; returns 0, or the seconds until one is available"""
+        policy = self.classes[name].policy
+        if not self.rate_limits or policy.rate is None:
+            return 0.0
+        now = self._clock()
+        key = (client, name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(policy.burst, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(policy.burst, bucket.tokens + (now - bucket.updated) * policy.rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        self.counters["rate_limited"] += 1
+        admission_rejections.inc(name, "rate_limited")
+        return (1 - bucket.tokens) / policy.rate
+
+    # -- concurrency ------------------------------------------------------------
+
+    def _lagging(self, state: _ClassState) -> bool:
+        return state.policy.max_lag is not None and self.loop_lag >= state.policy.max_lag
+
+    def _can_run(self, state: _ClassState) -> bool:
+        return (state.running < state.policy.limit and not self._lagging(state)
+                and (not state.policy.shared or self.shared_running < self.capacity))
+
+    def _start(self, state: _ClassState) -> None:
+        state.running += 1
+        state.admitted += 1
+        if state.policy.shared:
+            self.shared_running += 1
+
+    def _retry_after(self, state: _ClassState) -> float:
+        # Time for the work already queued ahead to drain
+        return state.service_seconds * (len(state.waiters) + 1) / state.policy.limit
+
+    async def acquire(self, name: str) -> None:
+        """Wait for a slot of the class; raises Rejected when its queue is full or the deadline passes"""
+        state = self.classes[name]
+        if not state.waiters and self._can_run(state):
+            self._start(state)
+            return
+        if len(state.waiters) >= state.policy.queue:
+            self.counters["queue_full"] += 1
+            admission_rejections.inc(name, "queue_full")
+            raise Rejected(503, self._retry_after(state), "queue_full")
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, state.policy.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as the deadline passed or the client went away
+                self.release(name)
+            else:
+                try:
+                    state.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.counters["queue_timeout"] += 1
+            admission_rejections.inc(name, "queue_timeout")
+            raise Rejected(503, self._retry_after(state), "queue_timeout") from None
+        finally:
+            admission_wait.observe(time.perf_counter() - started, name)
+
+    def release(self, name: str, seconds: Optional[float] = None) -> None:
+        state = self.classes[name]
+        state.running -= 1
+        if state.policy.shared:
+            self.shared_running -= 1
+        if seconds is not None:
+            state.service_seconds += (seconds - state.service_seconds) * 0.1
+        self._wake()
+
+    def _wake(self) -> None:
+        for state in self.classes.values():
+            while state.waiters and self._can_run(state):
+                waiter = state.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._start(state)
+                waiter.set_result(None)
+
+    async def monitor(self, interval: float = 0.05) -> None:
+        """Measure how late the event loop runs a timer; while it lags, classes with a max_lag are held"""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = min(time.perf_counter() - started - interval, MAX_LAG_SAMPLE)
+            # Rise at once, settle over a few ticks, so one slow tick does not flap admission
+            self.loop_lag = lag if lag > self.loop_lag else self.loop_lag * 0.7 + lag * 0.3
+            self._wake()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "capacity": self.capacity,
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "shared_running": self.shared_running,
+            "rate_limited_clients": len(self._buckets),
+            "classes": {
+                name: {"running": state.running, "queued": len(state.waiters), "limit": state.policy.limit,
+                       "admitted": state.admitted, "service_ms": round(state.service_seconds * 1000, 2)}
+                for name, state in self.classes.items()
+            },
+            **self.counters,
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting each HTTP request through an AdmissionController"""
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController, trust_forwarded: bool = False):
+        self.app = app
+        self.controller = controller
+        self.trust_forwarded = trust_forwarded
+
+    def client(self, scope: Scope) -> str:
+        if self.trust_forwarded:
+            forwarded = Headers(scope=scope).get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "-"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = self.controller
+        name = controller.classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if name is None or not controller.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        wait = controller.check_rate(self.client(scope), name)
+        if wait:
+            await self.reject(send, 429, wait, "Too many requests, retry later")
+            return
+        try:
+            await controller.acquire(name)
+        except Rejected as e:
+            await self.reject(send, e.status, e.retry_after, "Server busy, retry later")
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(name, time.perf_counter() - start)
+
+    @staticmethod
+    async def reject(send: Send, status: int, retry_after: float, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,116 @@
+"""Guard rails for outbound AI calls: concurrency limit, single-flight, deadline and circuit breaker."""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """The provider is marked unhealthy; callers should take their offline path"""
+
+
+class AIGovernor:
+    """Runs AI calls through one provider-wide set of limits.
+
+    - at most max_concurrency calls run at once; the rest wait for a slot
+    - identical in-flight calls (same key) share one provider round trip
+    - each call, including its wait for a slot, must finish within timeout
+    - failure_threshold consecutive failures open the circuit for reset_timeout
+      seconds, after which a single probe call decides whether it closes again
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 8, timeout: float = 10.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._semaphore = asyncio.BoundedSemaphore(max_concurrency)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.counters = {"calls": 0, "coalesced": 0, "succeeded": 0, "failed": 0, "timed_out": 0, "short_circuited": 0}
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return CLOSED
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    async def call(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Run factory() under the governor, or join an identical call already in flight"""
+        self.counters["calls"] += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        self._admit()
+        task = asyncio.ensure_future(self._run(factory))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _admit(self) -> None:
+        state = self.state
+        if state == OPEN or (state == HALF_OPEN and self._probing):
+            self.counters["short_circuited"] += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if state == HALF_OPEN:
+            self._probing = True
+
+    async def _run(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async def guarded():
+            async with self._semaphore:
+                return await factory()
+
+        try:
+            result = await asyncio.wait_for(guarded(), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters["timed_out"] += 1
+            self._record_failure()
+            raise
+        except Exception:
+            self._record_failure()
+            raise
+        self._record_success()
+        return result
+
+    def _record_success(self) -> None:
+        self.counters["succeeded"] += 1
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def _record_failure(self) -> None:
+        self.counters["failed"] += 1
+        self._consecutive_failures += 1
+        if self._probing or self._consecutive_failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+        self._probing = False
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            self._probing = False
+            return
+        # Every caller may have been cancelled; retrieve the error so asyncio does not log it
+        task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "in_flight": len(self._inflight),
+            "consecutive_failures": self._consecutive_failures,
+            **self.counters,
+        }
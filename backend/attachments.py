@@ -0,0 +1,487 @@
+"""Chunked, resumable attachment uploads stored once per distinct content.
+
+A client opens an upload with the file's size, then PUTs the bytes in as
+many pieces as its connection allows, each tagged with the offset it starts
+at. The session remembers how many contiguous bytes are stored, so after a
+dropped connection the client asks for that offset and carries on from
+there. Bytes below it are skipped, which makes a retried piece harmless; a
+piece starting past it is refused. Bodies are written in parts of at most
+PART_SIZE bytes as they arrive, so memory use does not grow with the file.
+
+When the last byte is in, the upload is hashed and becomes a blob keyed by
+its sha256; if that content is already stored the new copy is dropped. An
+attachment is one owner's reference to a blob (one per owner and hash), and
+health records hold attachment ids instead of inline base64. Blobs live in
+GridFS, or in a directory on a single host.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from PIL import Image, ImageOps
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+UPLOADS = "attachment_uploads"
+PARTS = "attachment_parts"
+BLOBS = "attachment_blobs"
+ATTACHMENTS = "attachments"
+THUMBNAILS = "attachment_thumbnails"
+
+PART_SIZE = 256 * 1024
+UPLOADING, FINALIZING, COMPLETE = "uploading", "finalizing", "complete"
+UPLOAD_OFFSET_HEADER = "Upload-Offset"
+
+# Attachment ids are uuid4s; links to files kept elsewhere are left alone
+_UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+REFERENCE = re.compile(rf"^({_UUID}$|https?://)", re.IGNORECASE)
+# Matches an array holding any value that is not a reference
+INLINE = re.compile(rf"^(?!{_UUID}$|https?://)", re.IGNORECASE)
+
+
+class UploadNotFound(Exception):
+    """No such upload, or it expired before it was finished"""
+
+
+class OffsetMismatch(Exception):
+    """A piece starts past the bytes stored so far"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload continues at offset {offset}")
+        self.offset = offset
+
+
+class UploadTooLarge(Exception):
+    """More bytes than the upload declared, or than attachments may have"""
+
+
+class DigestMismatch(Exception):
+    """The uploaded bytes do not hash to the sha256 the client declared"""
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range starts past the end of the attachment"""
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """First and last byte of a single "bytes=" range; None sends the whole body"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:
+            # A suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def is_reference(value: str) -> bool:
+    return bool(REFERENCE.match(value))
+
+
+def decode_inline(value: str) -> Tuple[bytes, str]:
+    """Bytes and content type of an inline attachment: base64, optionally as a data: URL"""
+    content_type = "application/octet-stream"
+    if value.startswith("data:"):
+        header, _, value = value.partition(",")
+        if not header.endswith(";base64"):
+            raise ValueError("only base64 data URLs are supported")
+        content_type = header[len("data:"):-len(";base64")] or content_type
+    return base64.b64decode(value, validate=True), content_type
+
+
+def render_thumbnail(source: bytes, size: int) -> Optional[bytes]:
+    """A JPEG fitting in size x size, or None when source is not an image Pillow can read"""
+    try:
+        with Image.open(io.BytesIO(source)) as image:
+            # JPEGs are decoded straight at a reduced scale, which is most of the saving
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            out = io.BytesIO()
+            image.convert("RGB").save(out, "JPEG", quality=80, optimize=True)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        return None
+    return out.getvalue()
+
+
+async def _once(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+class DiskStore:
+    """Uploads and blobs as files under root; only for a single host"""
+
+    def __init__(self, root: Path):
+        self.uploads = Path(root) / "uploads"
+        self.blobs = Path(root) / "blobs"
+        self.uploads.mkdir(parents=True, exist_ok=True)
+        self.blobs.mkdir(parents=True, exist_ok=True)
+
+    async def write(self, upload_id: str, offset: int, data: bytes) -> None:
+        await asyncio.to_thread(self._write, self.uploads / upload_id, offset, data)
+
+    @staticmethod
+    def _write(path: Path, offset: int, data: bytes) -> None:
+        # No truncation: a concurrent retry of the same piece writes the same bytes
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+
+    def read_upload(self, upload_id: str) -> AsyncIterator[bytes]:
+        return self._read(self.uploads / upload_id, 0, None)
+
+    async def commit(self, upload_id: str) -> str:
+        await asyncio.to_thread(os.replace, self.uploads / upload_id, self.blobs / upload_id)
+        return upload_id
+
+    async def discard(self, upload_id: str) -> None:
+        await asyncio.to_thread((self.uploads / upload_id).unlink, missing_ok=True)
+
+    async def delete(self, location: str) -> None:
+        await asyncio.to_thread((self.blobs / location).unlink, missing_ok=True)
+
+    def read(self, location: str, start: int, end: int) -> AsyncIterator[bytes]:
+        return self._read(self.blobs / location, start, end - start + 1)
+
+    async def _read(self, path: Path, start: int, length: Optional[int]) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, path, "rb")
+        try:
+            f.seek(start)
+            while length is None or length > 0:
+                block = await asyncio.to_thread(f.read, PART_SIZE if length is None else min(PART_SIZE, length))
+                if not block:
+                    break
+                if length is not None:
+                    length -= len(block)
+                yield block
+        finally:
+            f.close()
+
+
+class GridFSStore:
+    """Parts in a collection while uploading, blobs in GridFS; shared by every worker"""
+
+    def __init__(self, db, bucket_name: str = "attachment_files"):
+        self.db = db
+        self.parts = db[PARTS]
+        self.bucket_name = bucket_name
+        self._bucket = None
+
+    @property
+    def bucket(self) -> AsyncIOMotorGridFSBucket:
+        if self._bucket is None:
+            self._bucket = AsyncIOMotorGridFSBucket(self.db, bucket_name=self.bucket_name,
+                                                    chunk_size_bytes=PART_SIZE)
+        return self._bucket
+
+    async def write(self, upload_id: str, offset: int, data: bytes) -> None:
+        await self.parts.update_one({"upload_id": upload_id, "offset": offset}, {"$set": {"data": data}}, upsert=True)
+
+    async def read_upload(self, upload_id: str) -> AsyncIterator[bytes]:
+        position = 0
+        async for part in self.parts.find({"upload_id": upload_id}).sort("offset", 1).batch_size(8):
+            if part["offset"] > position:
+                raise RuntimeError(f"Upload {upload_id} is missing bytes at {position}")
+            # Pieces retried from a different offset can overlap; each byte is read once
+            data = part["data"][position - part["offset"]:]
+            position += len(data)
+            if data:
+                yield data
+
+    async def commit(self, upload_id: str) -> str:
+        grid_in = self.bucket.open_upload_stream_with_id(upload_id, upload_id)
+        try:
+            async for data in self.read_upload(upload_id):
+                await grid_in.write(data)
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+        await self.discard(upload_id)
+        return upload_id
+
+    async def discard(self, upload_id: str) -> None:
+        await self.parts.delete_many({"upload_id": upload_id})
+
+    async def delete(self, location: str) -> None:
+        try:
+            await self.bucket.delete(location)
+        except NoFile:
+            pass
+
+    async def read(self, location: str, start: int, end: int) -> AsyncIterator[bytes]:
+        grid_out = await self.bucket.open_download_stream(location)
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = await grid_out.read(min(PART_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+class AttachmentStore:
+    """Upload sessions, deduplicated blobs, per-owner attachments and their thumbnails"""
+
+    def __init__(self, db, store, max_bytes: int, upload_ttl_seconds: float,
+                 thumbnail_sizes: Sequence[int] = (128, 256, 512), max_thumbnail_source_bytes: int = 25 * 1024 * 1024,
+                 thumbnail_workers: int = 2):
+        self.uploads = db[UPLOADS]
+        self.blobs = db[BLOBS]
+        self.attachments = db[ATTACHMENTS]
+        self.thumbnails = db[THUMBNAILS]
+        self.store = store
+        self.max_bytes = max_bytes
+        self.upload_ttl = timedelta(seconds=upload_ttl_seconds)
+        self.thumbnail_sizes = sorted(thumbnail_sizes)
+        self.max_thumbnail_source_bytes = max_thumbnail_source_bytes
+        # Decoding images is CPU bound; a few at a time keeps the event loop's thread pool free
+        self._thumbnailing = asyncio.Semaphore(thumbnail_workers)
+
+    async def start(self, owner_id: str, filename: str, content_type: str, size: int,
+                    sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Open an upload; an owner re-sending content they already stored gets it back at once"""
+        if size > self.max_bytes:
+            raise UploadTooLarge(f"Attachments are limited to {self.max_bytes} bytes")
+        now = utcnow()
+        upload = {
+            "id": str(uuid.uuid4()), "owner_id": owner_id, "filename": filename, "content_type": content_type,
+            "size": size, "sha256": sha256.lower() if sha256 else None, "offset": 0, "status": UPLOADING,
+            "attachment_id": None, "created_at": now, "expires_at": now + self.upload_ttl,
+        }
+        if sha256:
+            # Only the owner's own attachments: telling anyone else would reveal that the content exists
+            existing = await self.attachments.find_one({"owner_id": owner_id, "sha256": upload["sha256"]}, {"id": 1})
+            if existing:
+                upload.update(offset=size, status=COMPLETE, attachment_id=existing["id"])
+        await self.uploads.insert_one(upload)
+        upload.pop("_id", None)
+        return upload
+
+    async def status(self, upload_id: str) -> Dict[str, Any]:
+        upload = await self.uploads.find_one({"id": upload_id}, {"_id": 0})
+        if not upload:
+            raise UploadNotFound(upload_id)
+        return upload
+
+    async def receive(self, upload_id: str, start: int, body: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """Store the bytes of body, which begin at offset start; the last byte completes the upload"""
+        upload = await self.status(upload_id)
+        if upload["status"] != UPLOADING:
+            # A late retry of a finished upload
+            return upload
+        offset, size = upload["offset"], upload["size"]
+        if start > offset:
+            raise OffsetMismatch(offset)
+
+        position = start
+        pending = bytearray()
+        try:
+            async for chunk in body:
+                if position < offset:
+                    skip = min(len(chunk), offset - position)
+                    chunk = chunk[skip:]
+                    position += skip
+                if not chunk:
+                    continue
+                if position + len(chunk) > size:
+                    raise UploadTooLarge(f"Upload {upload_id} declared {size} bytes")
+                view = memoryview(chunk)
+                while view:
+                    take = min(PART_SIZE - len(pending), len(view))
+                    pending += view[:take]
+                    view = view[take:]
+                    position += take
+                    if len(pending) == PART_SIZE:
+                        await self._store_part(upload_id, position - PART_SIZE, bytes(pending))
+                        pending.clear()
+        finally:
+            # Whatever arrived before a dropped connection is kept, so the client resumes after it
+            if pending:
+                await self._store_part(upload_id, position - len(pending), bytes(pending))
+
+        upload = await self.status(upload_id)
+        if upload["status"] == UPLOADING and upload["offset"] == size:
+            return await self._finish(upload)
+        return upload
+
+    async def _store_part(self, upload_id: str, at: int, data: bytes) -> None:
+        await self.store.write(upload_id, at, data)
+        end = at + len(data)
+        await self.uploads.update_one(
+            {"id": upload_id, "status": UPLOADING, "offset": {"$gte": at, "$lt": end}},
+            {"$set": {"offset": end, "expires_at": utcnow() + self.upload_ttl}},
+        )
+
+    async def _finish(self, upload: Dict[str, Any]) -> Dict[str, Any]:
+        upload_id = upload["id"]
+        claimed = await self.uploads.find_one_and_update(
+            {"id": upload_id, "status": UPLOADING, "offset": upload["size"]}, {"$set": {"status": FINALIZING}}
+        )
+        if not claimed:
+            # Another request is finishing it
+            return await self.status(upload_id)
+
+        digest = hashlib.sha256()
+        async for data in self.store.read_upload(upload_id):
+            digest.update(data)
+        sha256 = digest.hexdigest()
+        if upload["sha256"] and upload["sha256"] != sha256:
+            await self.store.discard(upload_id)
+            await self.uploads.delete_one({"id": upload_id})
+            raise DigestMismatch(f"Uploaded bytes hash to {sha256}, not {upload['sha256']}")
+
+        if await self.blobs.find_one({"sha256": sha256}, {"_id": 1}):
+            await self.store.discard(upload_id)
+        else:
+            location = await self.store.commit(upload_id)
+            try:
+                await self.blobs.insert_one({"sha256": sha256, "size": upload["size"], "location": location,
+                                             "created_at": utcnow()})
+            except DuplicateKeyError:
+                # The same content finished uploading elsewhere in the meantime
+                await self.store.delete(location)
+
+        attachment = await self._attach(upload, sha256)
+        return await self.uploads.find_one_and_update(
+            {"id": upload_id},
+            {"$set": {"status": COMPLETE, "sha256": sha256, "attachment_id": attachment["id"],
+                      "expires_at": utcnow() + self.upload_ttl}},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+
+    async def _attach(self, upload: Dict[str, Any], sha256: str) -> Dict[str, Any]:
+        query = {"owner_id": upload["owner_id"], "sha256": sha256}
+        existing = await self.attachments.find_one(query, {"_id": 0})
+        if existing:
+            return existing
+        attachment = {
+            "id": str(uuid.uuid4()), **query, "size": upload["size"], "filename": upload["filename"],
+            "content_type": upload["content_type"], "created_at": utcnow(),
+        }
+        try:
+            await self.attachments.insert_one(attachment)
+        except DuplicateKeyError:
+            return await self.attachments.find_one(query, {"_id": 0})
+        attachment.pop("_id", None)
+        return attachment
+
+    async def abort(self, upload_id: str) -> None:
+        upload = await self.uploads.find_one_and_delete({"id": upload_id, "status": {"$ne": FINALIZING}})
+        if not upload:
+            raise UploadNotFound(upload_id)
+        if upload["status"] == UPLOADING:
+            await self.store.discard(upload_id)
+
+    async def ingest(self, owner_id: str, data: bytes, filename: str, content_type: str) -> Dict[str, Any]:
+        """Store bytes already in memory, such as a base64 attachment from an older client"""
+        upload = await self.start(owner_id, filename, content_type, len(data), hashlib.sha256(data).hexdigest())
+        if upload["status"] != COMPLETE:
+            upload = await self.receive(upload["id"], 0, _once(data))
+        return await self.get(upload["attachment_id"])
+
+    async def replace_inline(self, owner_id: str, values: List[str], filename: str) -> List[str]:
+        """Attachment ids for a record's attachments, storing any that are still inline base64"""
+        references = []
+        for value in values:
+            if is_reference(value):
+                references.append(value)
+                continue
+            data, content_type = decode_inline(value)
+            attachment = await self.ingest(owner_id, data, filename, content_type)
+            references.append(attachment["id"])
+        return references
+
+    async def get(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        return await self.attachments.find_one({"id": attachment_id}, {"_id": 0})
+
+    async def open(self, attachment: Dict[str, Any], start: int, end: int) -> AsyncIterator[bytes]:
+        """The attachment's bytes from start to end inclusive"""
+        blob = await self.blobs.find_one({"sha256": attachment["sha256"]}, {"location": 1})
+        if not blob:
+            raise FileNotFoundError(attachment["sha256"])
+        return self.store.read(blob["location"], start, end)
+
+    def thumbnail_size(self, requested: int) -> int:
+        """The smallest rendered size at least as large as requested"""
+        return next((size for size in self.thumbnail_sizes if size >= requested), self.thumbnail_sizes[-1])
+
+    async def thumbnail(self, attachment: Dict[str, Any], size: int) -> Optional[bytes]:
+        """A JPEG preview of an image attachment, rendered once per content and size"""
+        if not attachment["content_type"].startswith("image/"):
+            return None
+        cached = await self.thumbnails.find_one({"sha256": attachment["sha256"], "size": size}, {"data": 1})
+        if cached:
+            return cached["data"]
+        if attachment["size"] > self.max_thumbnail_source_bytes:
+            return None
+
+        source = bytearray()
+        async for block in await self.open(attachment, 0, attachment["size"] - 1):
+            source += block
+        async with self._thumbnailing:
+            data = await asyncio.to_thread(render_thumbnail, bytes(source), size)
+        if data is None:
+            return None
+        try:
+            await self.thumbnails.insert_one({"sha256": attachment["sha256"], "size": size, "data": data,
+                                              "created_at": utcnow()})
+        except DuplicateKeyError:
+            pass
+        return data
+
+    async def sweep_expired(self) -> int:
+        """Drop uploads left unfinished past their expiry, and finished sessions kept for late retries"""
+        dropped = 0
+        async for upload in self.uploads.find({"expires_at": {"$lt": utcnow()}}, {"id": 1, "status": 1}):
+            if upload["status"] != COMPLETE:
+                await self.store.discard(upload["id"])
+                dropped += 1
+            await self.uploads.delete_one({"id": upload["id"]})
+        return dropped
+
+
+async def migrate_inline_attachments(db, store: AttachmentStore, sequence, batch_size: int = 50) -> int:
+    """Move base64 attachments still stored inside health records into the attachment store"""
+    migrated = 0
+    projection = {"id": 1, "user_id": 1, "title": 1, "attachments": 1}
+    async for record in db.health_records.find({"attachments": INLINE}, projection).batch_size(batch_size):
+        try:
+            references = await store.replace_inline(record["user_id"], record["attachments"], record.get("title") or "")
+        except (ValueError, UploadTooLarge) as e:
+            logger.error(f"Leaving the attachments of health record {record['id']} inline: {e}")
+            continue
+        await db.health_records.update_one(
+            {"id": record["id"]}, {"$set": {"attachments": references, **(await sequence.fields())}}
+        )
+        migrated += 1
+    return migrated
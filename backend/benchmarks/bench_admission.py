@@ -0,0 +1,179 @@
+"""Emergency alert latency while AI and bulk sync traffic saturates the server.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_admission [--flood 200] [--responders 4] [--seconds 15] [--memory]
+
+Boots the app in-process on the load test's seeded data, with the fake model
+answering symptom checks after --llm-latency seconds. A few responders send
+emergency alerts at a steady pace in each phase:
+
+1. quiet: nothing else is running (after --warmup seconds of the same);
+2. unprotected: --flood clients send uncached symptom checks and 100-record
+   sync uploads back to back (waiting out any Retry-After), with admission
+   control switched off;
+3. protected: the same flood with priority classes and bounded queues;
+4. rate_limited: as protected, with per-client token buckets as well.
+
+Each phase reports the emergency latency percentiles and what the flood got
+back (2xx, 503 shed by a full or expired queue, 429 over the client's rate).
+--memory uses mongomock-motor, which cannot run the $geoNear behind a new
+alert, so responders answer existing alerts instead. Its queries also run
+synchronously on the event loop (a 100-record sync is a few hundred ms of
+CPU there, and so is a periodic background job), which admission can shed
+around but not preempt, so memory numbers are noisy and only good for a
+rough comparison of the phases.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.common import report, summarize
+from benchmarks.fake_llm import FakeModel
+from benchmarks.load import Results, Session, client_address, use_in_memory_database
+
+# Responders are people: one alert per this many seconds each
+ALERT_INTERVAL = 0.1
+AI_SHARE = 0.7
+SYNC_RECORDS = 100
+SYNC_DESCRIPTION = "BP 124/82, pulse 76"
+# name, admission control on, rate limits on, flood running
+PHASES = [
+    ("quiet", True, False, False),
+    ("unprotected", False, False, True),
+    ("protected", True, False, True),
+    ("rate_limited", True, True, True),
+]
+
+
+async def emergency(s: Session, memory: bool) -> httpx.Response:
+    patient = s.patient()
+    if memory:
+        return await s.call("PUT", "/api/emergency-alerts/{alert_id}/respond", alert_id=s.rng.choice(s.data["alerts"]),
+                            params={"responder_id": s.rng.choice(s.data["asha"])})
+    return await s.call("POST", "/api/emergency-alert", json={
+        "user_id": patient["id"], "user_name": patient["name"], "user_phone": patient["phone"],
+        "location": patient["location"], "description": "Snake bite",
+    })
+
+
+async def uncached_symptom_check(s: Session) -> httpx.Response:
+    # A fresh symptom list every time, so each check waits on the model
+    return await s.call("POST", "/api/symptom-check", json={
+        "user_id": s.patient()["id"], "symptoms": s.rng.sample(s.data["symptoms"], 2) + [f"since {s.rng.random()}"],
+    })
+
+
+async def responder(session: Session, memory: bool, deadline: float, alerts: List[Tuple[int, float]]):
+    """Send an alert every ALERT_INTERVAL; latency counts from when it was due, so a stalled loop is not hidden"""
+    due = time.perf_counter()
+    while due < deadline:
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        response = await emergency(session, memory)
+        alerts.append((response.status_code, (time.perf_counter() - due) * 1000))
+        due += ALERT_INTERVAL
+
+
+async def bulk_sync(s: Session) -> httpx.Response:
+    user_id = s.patient()["id"]
+    body = "\n".join(json.dumps({
+        "user_id": user_id, "type": "vitals", "title": "Home visit vitals", "description": SYNC_DESCRIPTION,
+        "offline_id": str(uuid.UUID(int=s.rng.getrandbits(128), version=4)),
+    }) for _ in range(SYNC_RECORDS))
+    return await s.call("POST", "/api/health-records/sync/stream", content=body.encode(),
+                        headers={"content-type": "application/x-ndjson"})
+
+
+async def flooder(session: Session, deadline: float):
+    """Back to back requests, pausing only as long as a rejection's Retry-After asks, as the app does"""
+    while time.perf_counter() < deadline:
+        if session.rng.random() < AI_SHARE:
+            response = await uncached_symptom_check(session)
+        else:
+            response = await bulk_sync(session)
+        if response.status_code in (429, 503):
+            await asyncio.sleep(min(float(response.headers.get("retry-after", 1)), deadline - time.perf_counter()))
+
+
+def outcome(alerts: List[Tuple[int, float]], results: Results, seconds: float) -> Dict[str, Any]:
+    flood = {"2xx": 0, "503": 0, "429": 0, "other": 0}
+    for statuses in results.statuses.values():
+        for status, count in statuses.items():
+            key = "2xx" if status.startswith("2") else status if status in flood else "other"
+            flood[key] += count
+    return {"emergency": {**summarize([ms for _, ms in alerts]),
+                          "errors": sum(1 for status, _ in alerts if status >= 400)},
+            "flood": {**flood, "served_per_second": round(flood["2xx"] / seconds, 1)}}
+
+
+async def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_admission", description=__doc__.split("\n")[0])
+    parser.add_argument("--flood", type=int, default=200, help="concurrent AI/sync clients")
+    parser.add_argument("--responders", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=15, help="length of each phase")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured quiet seconds while startup jobs run")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--memory", action="store_true", help="use mongomock-motor instead of MongoDB")
+    args = parser.parse_args()
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("NOTIFICATION_PROVIDER", "fake")
+    os.environ["ADMISSION_TRUST_FORWARDED"] = "1"
+    if args.memory:
+        use_in_memory_database()
+    from benchmarks import seed
+    server = seed.server
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    fake = FakeModel(latency=args.llm_latency, jitter=args.llm_latency / 5)
+    server.get_generative_model = lambda model_name, system_instruction: fake
+
+    dataset = await seed.seed(server.db, server.sync_sequence, "small", 0)
+    await server.app.router.startup()
+    phases = {}
+    try:
+        if not args.memory:
+            await server.ensure_indexes(server.db)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            warmup = Session(client, dataset, random.Random("warmup"), Results(), client_address(0))
+            await responder(warmup, args.memory, time.perf_counter() + args.warmup, [])
+            for phase, enabled, rate_limits, flood in PHASES:
+                server.admission.enabled = enabled
+                server.admission.rate_limits = rate_limits
+                alerts, results = [], Results()
+                results.recording = True
+                deadline = time.perf_counter() + args.seconds
+                start = time.perf_counter()
+                await asyncio.gather(
+                    *(responder(Session(client, dataset, random.Random(f"r{i}"), Results(), client_address(i)),
+                                args.memory, deadline, alerts) for i in range(args.responders)),
+                    *(flooder(Session(client, dataset, random.Random(f"f{i}"), results, client_address(1000 + i)),
+                              deadline) for i in range(args.flood if flood else 0)),
+                )
+                phases[phase] = outcome(alerts, results, time.perf_counter() - start)
+                # Every phase starts from the same data, not the records the last flood synced
+                await server.db.health_records.delete_many({"description": SYNC_DESCRIPTION})
+    finally:
+        await server.app.router.shutdown()
+
+    report("admission", {
+        "flood_clients": args.flood,
+        "responders": args.responders,
+        "phase_seconds": args.seconds,
+        "llm_latency": args.llm_latency,
+        "database": "memory" if args.memory else "mongodb",
+        "phases": phases,
+        "admission": server.admission.stats(),
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""Exercise the AI governor against the fake model with injected latency and errors.
+
+    python -m benchmarks.bench_ai_governor
+"""
+import asyncio
+
+from ai_governor import AIGovernor, CircuitOpenError
+from benchmarks.common import Timer, report, summarize
+from benchmarks.fake_llm import FakeModel
+
+
+async def timed_call(governor, key, model):
+    with Timer() as t:
+        try:
+            await governor.call(key, lambda: model.generate_content_async(key))
+            outcome = "ok"
+        except CircuitOpenError:
+            outcome = "short_circuited"
+        except asyncio.TimeoutError:
+            outcome = "timed_out"
+        except RuntimeError:
+            outcome = "failed"
+    return outcome, t.ms
+
+
+async def burst(governor, model, keys):
+    with Timer() as wall:
+        results = await asyncio.gather(*(timed_call(governor, key, model) for key in keys))
+    outcomes = {}
+    for outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return {
+        "wall_ms": round(wall.ms, 2),
+        "outcomes": outcomes,
+        "provider_calls": model.calls,
+        "peak_concurrent_provider_calls": model.peak_concurrent,
+        "latency": summarize([ms for _, ms in results]),
+    }
+
+
+async def main():
+    results = {}
+
+    model = FakeModel(latency=0.05, jitter=0.01)
+    results["concurrency_limit"] = await burst(AIGovernor("bench", max_concurrency=8), model,
+                                               [f"prompt {i}" for i in range(200)])
+
+    model = FakeModel(latency=0.05)
+    results["coalescing"] = await burst(AIGovernor("bench"), model, ["fever, cough"] * 200)
+
+    model = FakeModel(latency=2.0)
+    results["deadline"] = await burst(AIGovernor("bench", timeout=0.2, failure_threshold=1000), model,
+                                      [f"prompt {i}" for i in range(50)])
+
+    model = FakeModel(latency=0.01, error_rate=1.0)
+    governor = AIGovernor("bench", failure_threshold=5, reset_timeout=60)
+    sequential = [await timed_call(governor, f"prompt {i}", model) for i in range(100)]
+    results["circuit_breaker"] = {
+        "provider_calls": model.calls,
+        "state": governor.state,
+        "short_circuited": sum(1 for outcome, _ in sequential if outcome == "short_circuited"),
+        "short_circuit_latency": summarize([ms for outcome, ms in sequential if outcome == "short_circuited"]),
+    }
+
+    report("ai_governor", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+"""Inline base64 attachments against chunked, resumable uploads.
+
+Run from the backend directory against a local MongoDB (set ATTACHMENT_DIR
+to measure the disk store instead of GridFS):
+
+    python -m benchmarks.bench_attachments [megabytes] [piece_kb]
+
+A file of the given size is sent three ways through the API: inline as a
+base64 data URL in a health record, as an upload of piece_kb pieces, and as
+an upload whose connection drops halfway through a piece and is resumed.
+Each reports the bytes put on the wire and the peak memory the server
+allocated; the three owners' copies should be stored as a single blob.
+Byte-range reads are timed on the file, and cold and cached thumbnails on
+an uploaded 12 MP photo.
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import sys
+import tracemalloc
+from typing import AsyncIterator
+
+import httpx
+from PIL import Image
+
+from benchmarks.common import Timer, report, summarize
+
+# The app under test must read and write the scratch database
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "arogya_bench")
+# One client sends every request; per-client rate limits would turn most of them away
+os.environ.setdefault("ADMISSION_RATE_LIMITS", "off")
+
+import server  # noqa: E402
+from attachments import ATTACHMENTS, BLOBS, PARTS, THUMBNAILS, UPLOADS  # noqa: E402
+
+# What a server sees per network read
+WIRE_CHUNK = 64 * 1024
+RANGE_READS = 200
+
+
+class Dropped(Exception):
+    """The connection went away mid-upload"""
+
+
+async def over_the_wire(data: bytes, drop_after: int = -1) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), WIRE_CHUNK):
+        if 0 <= drop_after <= start:
+            raise Dropped()
+        yield data[start:start + WIRE_CHUNK]
+
+
+async def measured(call):
+    """Run call and return (result, seconds, peak MB allocated while it ran)"""
+    tracemalloc.start()
+    try:
+        with Timer() as t:
+            result = await call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, round(t.ms / 1000, 3), round(peak / 2 ** 20, 1)
+
+
+async def upload(client: httpx.AsyncClient, owner_id: str, data: bytes, piece: int, content_type: str,
+                 drop_at: int = -1):
+    """Upload data in pieces; the piece holding byte drop_at loses its connection halfway. Returns bytes sent"""
+    response = await client.post("/api/attachments/uploads", json={
+        "owner_id": owner_id, "filename": "scan.bin", "content_type": content_type, "size": len(data),
+    })
+    upload_id, sent, offset = response.json()["id"], 0, 0
+    while offset < len(data):
+        body = data[offset:offset + piece]
+        dropping = offset <= drop_at < offset + len(body)
+        try:
+            response = await client.put(f"/api/attachments/uploads/{upload_id}",
+                                        content=over_the_wire(body, len(body) // 2 if dropping else -1),
+                                        headers={"Upload-Offset": str(offset)})
+            sent += len(body)
+            offset = response.json()["offset"]
+        except Dropped:
+            sent += len(body) // 2
+            drop_at = -1
+            response = await client.get(f"/api/attachments/uploads/{upload_id}")
+            offset = response.json()["offset"]
+    return response.json(), sent
+
+
+async def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    piece = int(sys.argv[2]) * 1024 if len(sys.argv) > 2 else 1024 * 1024
+    rng = random.Random(0)
+    data = rng.randbytes(int(megabytes * 2 ** 20))
+    db = server.db
+    for collection in (UPLOADS, PARTS, BLOBS, ATTACHMENTS, THUMBNAILS, "health_records"):
+        await db[collection].delete_many({})
+    await server.ensure_indexes(db)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Encoded up front so only the server's allocations are measured
+        inline = json.dumps({
+            "user_id": "patient_inline", "type": "test_result", "title": "scan", "description": "",
+            "attachments": ["data:application/octet-stream;base64," + base64.b64encode(data).decode()],
+        }).encode()
+        _, inline_seconds, inline_peak = await measured(lambda: client.post(
+            "/api/health-records", content=over_the_wire(inline), headers={"Content-Type": "application/json"}))
+        inline_bytes = len(inline)
+        del inline
+
+        (done, chunked_bytes), chunked_seconds, chunked_peak = await measured(
+            lambda: upload(client, "patient_chunked", data, piece, "application/octet-stream"))
+        attachment_id = done["attachment_id"]
+        (_, resumed_bytes), resumed_seconds, _ = await measured(
+            lambda: upload(client, "patient_resumed", data, piece, "application/octet-stream", len(data) // 2))
+        blobs = await db[BLOBS].count_documents({})
+        attachments = await db[ATTACHMENTS].count_documents({})
+
+        range_ms = []
+        for _ in range(RANGE_READS):
+            start = rng.randrange(len(data) - WIRE_CHUNK)
+            with Timer() as t:
+                response = await client.get(f"/api/attachments/{attachment_id}",
+                                            headers={"Range": f"bytes={start}-{start + WIRE_CHUNK - 1}"})
+            assert response.status_code == 206 and response.content == data[start:start + WIRE_CHUNK]
+            range_ms.append(t.ms)
+
+        photo = io.BytesIO()
+        Image.effect_noise((4000, 3000), 64).convert("RGB").save(photo, "JPEG", quality=90)
+        done, _ = await upload(client, "patient_photo", photo.getvalue(), piece, "image/jpeg")
+        thumbnail_ms = {}
+        for attempt in ("cold", "cached"):
+            with Timer() as t:
+                response = await client.get(f"/api/attachments/{done['attachment_id']}/thumbnail", params={"size": 256})
+            assert response.status_code == 200
+            thumbnail_ms[attempt] = round(t.ms, 2)
+
+    report("attachments", {
+        "file_mb": megabytes,
+        "piece_kb": piece // 1024,
+        "store": "disk" if server.ATTACHMENT_DIR else "gridfs",
+        "inline_base64": {"bytes_sent": inline_bytes, "seconds": inline_seconds, "server_peak_mb": inline_peak},
+        "chunked": {"bytes_sent": chunked_bytes, "seconds": chunked_seconds, "server_peak_mb": chunked_peak},
+        "dropped_halfway_and_resumed": {"bytes_sent": resumed_bytes, "seconds": resumed_seconds,
+                                        "bytes_sent_restarting_inline": inline_bytes + inline_bytes // 2},
+        "same_content_three_owners": {"blobs": blobs, "attachments": attachments},
+        "range_read_64kb": summarize(range_ms),
+        "thumbnail_12mp_jpeg_ms": thumbnail_ms,
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
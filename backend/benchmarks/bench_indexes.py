@@ -0,0 +1,113 @@
+"""Per-endpoint query latency on seeded data, before and after the declared indexes.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_indexes [records] [queries_per_endpoint]
+
+Defaults to 1,000,000 documents per collection and 200 queries per endpoint.
+"""
+import asyncio
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import Timer, bench_db, report, summarize
+from indexes import ensure_indexes
+
+BATCH = 10_000
+USERS_PER_RECORD = 20
+VILLAGES = [f"village_{i}" for i in range(500)]
+STATUSES = ["active", "responded", "resolved"]
+
+
+def seed_docs(collection, start, count, users, now):
+    for i in range(start, start + count):
+        user_id = f"user_{random.randrange(users)}"
+        when = now - timedelta(minutes=i)
+        if collection == "users":
+            yield {"id": f"user_{i}", "name": f"User {i}", "phone": "+91-9000000000",
+                   "village": random.choice(VILLAGES), "role": random.choice(["patient", "asha", "doctor"]),
+                   "created_at": when}
+        elif collection == "health_records":
+            yield {"id": str(uuid.uuid4()), "user_id": user_id, "type": "vitals", "title": "Vitals",
+                   "description": "Routine check", "date": when, "offline_id": str(uuid.uuid4())}
+        elif collection == "consultations":
+            yield {"id": str(uuid.uuid4()), "patient_id": user_id, "doctor_name": "Dr. Rao", "symptoms": "fever",
+                   "appointment_time": when, "room_id": f"room_{uuid.uuid4().hex[:8]}", "created_at": when}
+        elif collection == "asha_visits":
+            yield {"id": str(uuid.uuid4()), "asha_id": f"user_{random.randrange(users // 10 or 1)}",
+                   "patient_id": user_id, "patient_name": "Patient", "visit_type": "routine",
+                   "findings": "Normal", "action_taken": "None", "created_at": when}
+        elif collection == "emergency_alerts":
+            yield {"id": str(uuid.uuid4()), "user_id": user_id, "user_name": "Patient", "user_phone": "+91-9000000000",
+                   "location": {"lat": 0.0, "lng": 0.0}, "status": random.choice(STATUSES), "created_at": when}
+
+
+async def seed(db, records):
+    users = max(records // USERS_PER_RECORD, 10)
+    now = datetime.now(timezone.utc)
+    for name in ("users", "health_records", "consultations", "asha_visits", "emergency_alerts"):
+        await db[name].drop()
+        count = users if name == "users" else records
+        for start in range(0, count, BATCH):
+            await db[name].insert_many(list(seed_docs(name, start, min(BATCH, count - start), users, now)), ordered=False)
+    return users
+
+
+def endpoint_queries(users):
+    """Query builders mirroring the hot endpoints in server.py"""
+    def user():
+        return f"user_{random.randrange(users)}"
+
+    return {
+        "get_user": lambda db: db.users.find_one({"id": user()}),
+        "get_users?role&village": lambda db: db.users.find(
+            {"role": "asha", "village": random.choice(VILLAGES)}).to_list(1000),
+        "get_user_health_records": lambda db: db.health_records.find(
+            {"user_id": user()}).sort("date", -1).to_list(1000),
+        "sync_offline_records": lambda db: db.health_records.find(
+            {"offline_id": {"$in": [str(uuid.uuid4()) for _ in range(100)]}}, {"offline_id": 1}).to_list(None),
+        "get_user_consultations": lambda db: db.consultations.find(
+            {"patient_id": user()}).sort("appointment_time", -1).to_list(100),
+        "get_consultation_room": lambda db: db.consultations.find_one({"room_id": f"room_{uuid.uuid4().hex[:8]}"}),
+        "get_asha_visits": lambda db: db.asha_visits.find(
+            {"asha_id": f"user_{random.randrange(users // 10 or 1)}"}).sort("created_at", -1).to_list(100),
+        "get_patient_asha_visits": lambda db: db.asha_visits.find(
+            {"patient_id": user()}).sort("created_at", -1).to_list(100),
+        "get_emergency_alerts": lambda db: db.emergency_alerts.find(
+            {"status": "active"}).sort("created_at", -1).to_list(100),
+    }
+
+
+async def measure(db, queries, per_endpoint):
+    results = {}
+    for name, query in queries.items():
+        samples = []
+        for _ in range(per_endpoint):
+            with Timer() as t:
+                await query(db)
+            samples.append(t.ms)
+        results[name] = summarize(samples)
+    return results
+
+
+async def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    per_endpoint = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    db = bench_db()
+    users = await seed(db, records)
+    queries = endpoint_queries(users)
+
+    before = await measure(db, queries, per_endpoint)
+    await ensure_indexes(db)
+    after = await measure(db, queries, per_endpoint)
+
+    report("endpoint_indexes", {
+        "records_per_collection": records,
+        "endpoints": {name: {"before": before[name], "after": after[name]} for name in queries},
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
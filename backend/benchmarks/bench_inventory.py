@@ -0,0 +1,146 @@
+"""Medicine search over inventory line items vs scanning nested pharmacy documents.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_inventory [pharmacies] [skus] [queries]
+
+Defaults to 10,000 pharmacies each stocking all of a 2,000 SKU catalog
+(20M line items) and 200 searches. The legacy scan downloads every pharmacy
+document, so it only runs LEGACY_QUERIES times.
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import Timer, bench_db, report, summarize
+from indexes import INDEXES, ensure_indexes
+from inventory import INVENTORY, MedicineNameIndex, line_item, search_inventory, today
+
+BATCH = 10_000
+LEGACY_QUERIES = 5
+BASES = [
+    "paracetamol", "amoxicillin", "metformin", "aspirin", "ibuprofen", "azithromycin", "cetirizine",
+    "omeprazole", "pantoprazole", "amlodipine", "atorvastatin", "losartan", "salbutamol", "ciprofloxacin",
+    "doxycycline", "metronidazole", "albendazole", "ivermectin", "chloroquine", "artemether",
+    "ondansetron", "domperidone", "ranitidine", "diclofenac", "prednisolone", "dexamethasone",
+    "glimepiride", "insulin glargine", "enalapril", "furosemide", "ferrous sulphate", "folic acid",
+    "zinc sulphate", "ors", "cotrimoxazole", "levothyroxine", "montelukast", "fluconazole",
+    "clotrimazole", "hydrochlorothiazide",
+]
+FORMS = ["tablet", "capsule", "syrup", "injection", "suspension"]
+STRENGTHS = ["5mg", "10mg", "20mg", "50mg", "100mg", "250mg", "500mg", "650mg", "1g", "2mg"]
+
+
+def catalog(size: int):
+    names = [f"{base} {strength} {form}" for base in BASES for strength in STRENGTHS for form in FORMS]
+    return names[:size]
+
+
+def pharmacy(i: int):
+    return {"id": f"pharmacy_{i}", "name": f"Pharmacy {i}",
+            "coordinates": {"lat": random.uniform(17.5, 19.5), "lng": random.uniform(73.0, 75.5)}}
+
+
+def stock_fields():
+    expired = random.random() < 0.1
+    expiry = date.today() + timedelta(days=-30 if expired else random.randint(30, 900))
+    return {"stock": 0 if random.random() < 0.2 else random.randint(1, 200), "price": random.randint(5, 500),
+            "expiry": expiry.isoformat()}
+
+
+async def seed(db, pharmacies: int, names):
+    await db[INVENTORY].drop()
+    await db.pharmacies.drop()
+    batch = []
+    for i in range(pharmacies):
+        store = pharmacy(i)
+        stock = {name: stock_fields() for name in names}
+        # The legacy layout: every medicine nested in the pharmacy document
+        await db.pharmacies.insert_one({**store, "medicines": stock})
+        batch.extend(line_item(store, name, fields) for name, fields in stock.items())
+        if len(batch) >= BATCH:
+            await db[INVENTORY].insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db[INVENTORY].insert_many(batch, ordered=False)
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection == INVENTORY])
+
+
+def queries(names, count: int):
+    """Prefixes, exact names and one-letter typos of catalog medicines"""
+    picked = []
+    for _ in range(count):
+        base = random.choice(names).split()[0]
+        kind = random.choice(["prefix", "exact", "typo"])
+        if kind == "prefix":
+            picked.append(base[:4])
+        elif kind == "typo" and len(base) > 5:
+            cut = random.randrange(1, len(base) - 1)
+            picked.append(base[:cut] + base[cut + 1:])
+        else:
+            picked.append(base)
+    return picked
+
+
+async def legacy_search(db, query: str):
+    """Download every pharmacy and scan its nested medicines for a substring match"""
+    found = []
+    now = today()
+    async for store in db.pharmacies.find({}):
+        for name, fields in store.get("medicines", {}).items():
+            if query in name and fields["stock"] > 0 and fields["expiry"] >= now:
+                found.append((store["id"], name))
+    return found
+
+
+async def main():
+    pharmacies = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    skus = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    query_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    db = bench_db()
+    names = catalog(skus)
+    with Timer() as seeding:
+        await seed(db, pharmacies, names)
+
+    with Timer() as build:
+        index = MedicineNameIndex(await db[INVENTORY].distinct("medicine_name"))
+    start = time.perf_counter()
+    index.add("new medicine 10mg tablet")
+    add_ms = (time.perf_counter() - start) * 1000
+
+    lookup, indexed, matched = [], [], 0
+    for query in queries(names, query_count):
+        location = {"lat": random.uniform(17.5, 19.5), "lng": random.uniform(73.0, 75.5)}
+        with Timer() as total:
+            with Timer() as names_timer:
+                found_names = index.lookup(query)
+            results = await search_inventory(db[INVENTORY], found_names, location, 20)
+        lookup.append(names_timer.ms)
+        indexed.append(total.ms)
+        matched += bool(results)
+
+    legacy = []
+    for query in queries(names, LEGACY_QUERIES):
+        with Timer() as timer:
+            await legacy_search(db, query)
+        legacy.append(timer.ms)
+
+    report("medicine_search", {
+        "pharmacies": pharmacies,
+        "skus": len(names),
+        "line_items": pharmacies * len(names),
+        "seed_ms": round(seeding.ms, 1),
+        "name_index": {"names": len(index), "build_ms": round(build.ms, 2), "incremental_add_ms": round(add_ms, 4)},
+        "name_lookup": summarize(lookup),
+        "indexed_search": summarize(indexed),
+        "queries_with_results": matched,
+        "legacy_scan": summarize(legacy),
+    })
+    await db[INVENTORY].drop()
+    await db.pharmacies.drop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
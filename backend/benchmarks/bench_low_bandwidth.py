@@ -0,0 +1,171 @@
+"""Bytes on the wire and time-to-last-byte of the main app screens over slow links.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_low_bandwidth [documents_per_screen] [rounds]
+
+Each screen is requested in-process through the full middleware stack as a
+full response, compressed, with a sparse fieldset, and with the compact
+profile on top. Time-to-last-byte is modelled for every link in LINKS from
+the measured server time and the bytes sent: one round trip for the request,
+TCP slow start from a 10-segment window, and the link's bandwidth.
+"""
+import asyncio
+import math
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+
+from benchmarks.common import Timer, report, summarize
+
+# The app under test must read and write the scratch database
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "arogya_bench")
+# One client sends every request; per-client rate limits would turn most of them away
+os.environ.setdefault("ADMISSION_RATE_LIMITS", "off")
+
+import server  # noqa: E402
+from compression import brotli  # noqa: E402
+from server import ASHAVisit, Consultation, HealthRecord, MedicineRequest, Pharmacy, SymptomCheck  # noqa: E402
+
+PATIENT = "bench_patient"
+ASHA = "bench_asha"
+
+# name -> (downlink kbit/s, round trip ms)
+LINKS = {"gprs": (50, 700), "edge": (200, 400), "3g": (750, 200)}
+
+MSS = 1460
+TCP_IP_OVERHEAD = 40
+INITIAL_WINDOW = 10
+
+# Screen -> (path, fields the screen actually shows)
+SCREENS = {
+    "health_records": (f"/api/health-records/{PATIENT}", "title,type,date,doctor_name"),
+    "medicine_requests": (f"/api/medicine-requests/{PATIENT}", "status,medicines,booking_date,reserved_until"),
+    "symptom_checks": (f"/api/symptom-checks/{PATIENT}", "severity,assessment,created_at"),
+    "consultations": (f"/api/consultations/{PATIENT}", "doctor_name,appointment_time,status,room_id"),
+    "asha_visits": (f"/api/asha-visits/{ASHA}", "patient_name,visit_type,created_at,next_visit_date"),
+    "pharmacies": ("/api/pharmacies", "name,location,phone"),
+}
+
+NOTES = "Patient reports intermittent fever for three days with mild headache and body ache. " * 3
+
+
+def when(i: int) -> datetime:
+    return datetime(2026, 1, 1) - timedelta(hours=i)
+
+
+async def seed(db, count: int):
+    collections = ["health_records", "medicine_requests", "symptom_checks", "consultations", "asha_visits", "pharmacies"]
+    for name in collections:
+        await db[name].delete_many({})
+    docs = {
+        "health_records": [HealthRecord(
+            user_id=PATIENT, type="vitals", title=f"Home visit {i}", description=NOTES, doctor_name="Dr. Rao",
+            medications=[{"name": "paracetamol", "dose": "500mg", "frequency": "3x daily"}],
+            attachments=[f"uploads/{uuid.uuid4()}.jpg"], date=when(i)) for i in range(count)],
+        "medicine_requests": [MedicineRequest(
+            user_id=PATIENT, user_name="Bench Patient", user_phone="+91-9000000000",
+            medicines=[{"name": "paracetamol", "quantity": 2}, {"name": "ors", "quantity": 5}],
+            pharmacy_id="civil_hospital_pharmacy", status="completed", booking_date=when(i)) for i in range(count)],
+        "symptom_checks": [SymptomCheck(
+            user_id=PATIENT, symptoms=["fever", "headache"], assessment=NOTES, severity="medium",
+            recommendations=["Rest", "Drink fluids", "See a doctor if fever lasts"], referral_needed=False,
+            created_at=when(i)) for i in range(count)],
+        "consultations": [Consultation(
+            patient_id=PATIENT, doctor_name="Dr. Rao", symptoms=NOTES, appointment_time=when(i),
+            room_id=f"room_{i}", prescription=[{"name": "paracetamol", "dose": "500mg"}], diagnosis="Viral fever") for i in range(count)],
+        "asha_visits": [ASHAVisit(
+            asha_id=ASHA, patient_id=PATIENT, patient_name="Bench Patient", visit_type="routine",
+            findings=NOTES, action_taken="Counselled on hydration", vital_signs={"bp": "120/80", "pulse": 72},
+            created_at=when(i)) for i in range(count)],
+        "pharmacies": [Pharmacy(
+            name=f"Pharmacy {i}", location="Main road, near bus stand", phone="+91-9876543210",
+            coordinates={"lat": 18.5 + random.random(), "lng": 73.8 + random.random()}) for i in range(count)],
+    }
+    for name, models in docs.items():
+        records = []
+        for seq, model in enumerate(models):
+            record = model.dict()
+            record.update(sync_seq=seq, sync_ts=datetime.now())
+            records.append(record)
+        await db[name].insert_many(records)
+    await server.response_cache.invalidate("pharmacies")
+
+
+def wire_bytes(response: httpx.Response) -> int:
+    headers = sum(len(name) + len(value) + 4 for name, value in response.headers.raw) + len("HTTP/1.1 200 OK\r\n\r\n")
+    payload = headers + response.num_bytes_downloaded
+    return payload + math.ceil(payload / MSS) * TCP_IP_OVERHEAD
+
+
+def time_to_last_byte_ms(total_bytes: int, server_ms: float, kbps: int, rtt_ms: int) -> float:
+    segments, window, rounds = math.ceil(total_bytes / MSS), INITIAL_WINDOW, 0
+    while segments > 0:
+        segments -= window
+        window *= 2
+        rounds += 1
+    transfer_ms = total_bytes * 8 / kbps
+    return rtt_ms + server_ms + (rounds - 1) * rtt_ms + transfer_ms
+
+
+def variants():
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    best = encodings[-1]
+    yield "full", {}, "identity"
+    for encoding in encodings:
+        yield f"full_{encoding}", {}, encoding
+    yield f"fields_{best}", {"fields": True}, best
+    yield f"fields_compact_{best}", {"fields": True, "profile": "compact"}, best
+
+
+async def measure(client: httpx.AsyncClient, path: str, fields: str, options, encoding: str, count: int, rounds: int):
+    params = {"limit": count}
+    if options.get("fields"):
+        params["fields"] = fields
+    if options.get("profile"):
+        params["profile"] = options["profile"]
+    timings, response = [], None
+    for _ in range(rounds):
+        with Timer() as t:
+            response = await client.get(path, params=params, headers={"accept-encoding": encoding})
+            response.raise_for_status()
+        timings.append(t.ms)
+    server_ms = summarize(timings)["p50_ms"]
+    total = wire_bytes(response)
+    return {
+        "body_bytes": response.num_bytes_downloaded,
+        "wire_bytes": total,
+        "server_p50_ms": server_ms,
+        "time_to_last_byte_ms": {
+            link: round(time_to_last_byte_ms(total, server_ms, kbps, rtt), 1) for link, (kbps, rtt) in LINKS.items()
+        },
+    }
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    await seed(server.db, count)
+
+    results = {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for screen, (path, fields) in SCREENS.items():
+            results[screen] = {
+                name: await measure(client, path, fields, options, encoding, count, rounds)
+                for name, options, encoding in variants()
+            }
+            full = results[screen]["full"]["wire_bytes"]
+            for outcome in results[screen].values():
+                outcome["vs_full"] = round(outcome["wire_bytes"] / full, 3)
+
+    report("low_bandwidth", {"documents_per_screen": count, "rounds": rounds, "links": LINKS,
+                             "brotli_available": brotli is not None, "screens": results})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""Load test of the alert feed hub: idle and active subscribers on one worker.
+
+Runs in-process without a database. Run from the backend directory:
+
+    python -m benchmarks.bench_realtime [idle] [active] [events] [events_per_second]
+
+Defaults to 10,000 idle subscribers (listening to villages that get no
+alerts), 1,000 active ones and 1,000 events at 50 per second. One in fifty
+active subscribers reads slowly; the hub cuts those off when their queue
+fills, and they reconnect with their last event id. Every active subscriber
+must end up with every event, in order.
+"""
+import asyncio
+import resource
+import sys
+import time
+
+from benchmarks.common import report, summarize
+from realtime import RESET, Hub
+
+AREA = "rampur"
+SLOW_EVERY = 50
+
+
+async def consume(hub: Hub, events: int, slow_read_seconds: float, latencies, outcome):
+    """Read until the last event, reconnecting from the last seen id whenever the hub cuts us off"""
+    seen, last_id, reconnects = [], None, 0
+    subscription = hub.subscribe(area=AREA)
+    while len(seen) < events:
+        try:
+            event = await subscription.next()
+        except ConnectionResetError:
+            reconnects += 1
+            subscription = hub.subscribe(area=AREA, last_event_id=last_id)
+            continue
+        if event.type == RESET:
+            outcome["resets"] += 1
+            break
+        latencies.append((time.perf_counter() - event.data["sent_at"]) * 1000)
+        seen.append(event.data["n"])
+        last_id = event.id
+        if slow_read_seconds:
+            await asyncio.sleep(slow_read_seconds)
+    subscription.close()
+    outcome["reconnects"] += reconnects
+    if seen != list(range(events)):
+        outcome["incomplete"] += 1
+
+
+async def idle(hub: Hub, area: str):
+    subscription = hub.subscribe(area=area)
+    try:
+        await subscription.next()
+    finally:
+        subscription.close()
+
+
+async def main():
+    idle_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    active_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    events = int(sys.argv[3]) if len(sys.argv) > 3 else 1_000
+    rate = float(sys.argv[4]) if len(sys.argv) > 4 else 50.0
+    hub = Hub(history_size=events, queue_size=100)
+
+    idlers = [asyncio.create_task(idle(hub, f"village_{i % 500}")) for i in range(idle_count)]
+    latencies = {"normal": [], "slow": []}
+    outcome = {"reconnects": 0, "incomplete": 0, "resets": 0}
+    consumers = []
+    for i in range(active_count):
+        slow = i % SLOW_EVERY == 0
+        # Slow readers take half the publish rate, so they fall a queue behind and get cut off
+        consumers.append(asyncio.create_task(
+            consume(hub, events, 2 / rate if slow else 0, latencies["slow" if slow else "normal"], outcome)
+        ))
+    await asyncio.sleep(0)
+
+    publish_ms = []
+    start = time.perf_counter()
+    for n in range(events):
+        before = time.perf_counter()
+        hub.publish("alert.created", {"n": n, "sent_at": before}, area=AREA)
+        publish_ms.append((time.perf_counter() - before) * 1000)
+        # Keep to the target rate, letting consumers run in between
+        await asyncio.sleep(max(0.0, start + (n + 1) / rate - time.perf_counter()))
+    publishing = time.perf_counter() - start
+    await asyncio.gather(*consumers)
+    stats = hub.stats()
+
+    for task in idlers:
+        task.cancel()
+    await asyncio.gather(*idlers, return_exceptions=True)
+
+    report("alert_feed_hub", {
+        "idle_subscribers": idle_count,
+        "active_subscribers": active_count,
+        "slow_subscribers": len(range(0, active_count, SLOW_EVERY)),
+        "events": events,
+        "target_events_per_second": rate,
+        "achieved_events_per_second": round(events / publishing, 1),
+        "publish_fan_out": summarize(publish_ms),
+        "delivery_latency": summarize(latencies["normal"]),
+        "slow_subscriber_delivery_latency": summarize(latencies["slow"]),
+        "slow_consumer_reconnects": outcome["reconnects"],
+        "consumers_missing_events": outcome["incomplete"],
+        "resets": outcome["resets"],
+        "hub": stats,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Fire thousands of parallel bookings at scarce stock and check nothing is oversold.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_reservations [bookings] [concurrency] [stock_per_medicine]
+
+Defaults to 5,000 bookings, 500 in flight at a time, and 1,000 units of each
+of MEDICINES medicines. Each booking asks for one to three medicines, so
+multi-line bookings that hit an exhausted medicine must roll back cleanly.
+Exits non-zero when anything is oversold or the sweeper leaves stock held.
+"""
+import asyncio
+import random
+import sys
+import time
+import uuid
+
+from benchmarks.common import Timer, bench_db, report, summarize
+from indexes import INDEXES, ensure_indexes
+from inventory import INVENTORY, line_item
+from reservations import InsufficientStock, release_expired, reserve
+
+PHARMACY = {"id": "bench_pharmacy", "name": "Bench Pharmacy"}
+MEDICINES = ["paracetamol", "amoxicillin", "metformin", "ors", "zinc"]
+HOLD_SECONDS = 3600
+
+
+def make_booking():
+    names = random.sample(MEDICINES, random.randint(1, 3))
+    return {name: random.randint(1, 5) for name in names}
+
+
+async def seed(db, stock: int):
+    await db[INVENTORY].drop()
+    await db[INVENTORY].insert_many([line_item(PHARMACY, name, {"stock": stock}) for name in MEDICINES])
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection == INVENTORY])
+
+
+async def run(db, bookings, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    accepted, rejected, latencies = {}, 0, []
+
+    async def book(lines):
+        nonlocal rejected
+        request_id = str(uuid.uuid4())
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await reserve(db[INVENTORY], request_id, PHARMACY["id"], lines, HOLD_SECONDS)
+                accepted[request_id] = lines
+            except InsufficientStock:
+                rejected += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    with Timer() as wall:
+        await asyncio.gather(*(book(lines) for lines in bookings))
+    return accepted, rejected, latencies, wall.ms
+
+
+async def verify(db, stock: int, accepted):
+    """Every unit is either still in stock or held by exactly one accepted booking"""
+    problems = []
+    async for item in db[INVENTORY].find({}):
+        name = item["medicine_name"]
+        held = sum(hold["quantity"] for hold in item.get("holds", []))
+        booked = sum(lines.get(name, 0) for lines in accepted.values())
+        if booked > stock:
+            problems.append(f"{name}: {booked} sold of {stock}")
+        if item["stock"] < 0:
+            problems.append(f"{name}: negative stock {item['stock']}")
+        if item["stock"] + held != stock:
+            problems.append(f"{name}: stock {item['stock']} + held {held} != {stock}")
+        if held != booked:
+            problems.append(f"{name}: held {held} but accepted bookings hold {booked}")
+        holders = [hold["request_id"] for hold in item.get("holds", [])]
+        if len(holders) != len(set(holders)):
+            problems.append(f"{name}: a booking holds the line twice")
+    return problems
+
+
+async def main():
+    booking_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    stock = int(sys.argv[3]) if len(sys.argv) > 3 else 1_000
+    db = bench_db()
+    await seed(db, stock)
+
+    bookings = [make_booking() for _ in range(booking_count)]
+    accepted, rejected, latencies, wall_ms = await run(db, bookings, concurrency)
+    problems = await verify(db, stock, accepted)
+    left = {item["medicine_name"]: item["stock"] async for item in db[INVENTORY].find({})}
+
+    # Sweep as if every hold had run out, and check all stock comes back
+    with Timer() as sweep:
+        released = await release_expired(db[INVENTORY], grace_seconds=-(HOLD_SECONDS + 60), batch_size=len(MEDICINES))
+    restored = [item["stock"] async for item in db[INVENTORY].find({})]
+
+    report("medicine_reservations", {
+        "bookings": booking_count,
+        "concurrency": concurrency,
+        "stock_per_medicine": stock,
+        "accepted": len(accepted),
+        "rejected": rejected,
+        "bookings_per_second": round(booking_count / (wall_ms / 1000), 1),
+        "latency": summarize(latencies),
+        "stock_left": left,
+        "oversold": bool(problems),
+        "problems": problems,
+        "sweeper": {"released_bookings": len(released), "ms": round(sweep.ms, 2),
+                    "all_stock_restored": all(value == stock for value in restored)},
+    })
+    await db[INVENTORY].drop()
+    if problems or not all(value == stock for value in restored):
+        raise SystemExit(f"Reservation check failed: {problems or 'stock not restored after the sweep'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
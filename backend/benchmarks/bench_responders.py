@@ -0,0 +1,102 @@
+"""Time from emergency alert to first responder notification, old scan vs geo lookup.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_responders [responders] [alerts]
+
+Defaults to 100,000 registered responders and 200 alerts. Each notification
+is simulated with SMS_LATENCY_SECONDS of gateway latency.
+"""
+import asyncio
+import random
+import sys
+import time
+
+from benchmarks.common import bench_db, report, summarize
+from indexes import INDEXES, ensure_indexes
+from responders import find_nearest_responders, geo_point
+
+BATCH = 10_000
+RESPONDER_COUNT = 10
+SMS_LATENCY_SECONDS = 0.05
+# Roughly the districts around Pune
+LAT_RANGE = (17.5, 19.5)
+LNG_RANGE = (73.0, 75.5)
+VILLAGES = [f"village_{i}" for i in range(2000)]
+
+
+def random_location():
+    return {"lat": random.uniform(*LAT_RANGE), "lng": random.uniform(*LNG_RANGE)}
+
+
+async def seed(db, count):
+    users = db.users
+    await users.drop()
+    for start in range(0, count, BATCH):
+        docs = []
+        for i in range(start, min(start + BATCH, count)):
+            location = random_location()
+            docs.append({
+                "id": f"responder_{i}", "name": f"Responder {i}", "phone": f"+91-9{i:09d}",
+                "village": random.choice(VILLAGES), "role": random.choice(["asha", "doctor"]),
+                "location": location, "geo": geo_point(location), "is_available": random.random() < 0.8,
+            })
+        await users.insert_many(docs, ordered=False)
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection == "users"])
+
+
+async def send(phone, sent_at):
+    sent_at.append(time.perf_counter())
+    await asyncio.sleep(SMS_LATENCY_SECONDS)
+
+
+async def legacy_notify(users, location, sent_at):
+    """The original path: a regex scan for any ten responders, notified one by one"""
+    responders = await users.find({"role": {"$in": ["asha", "doctor"]}, "village": {"$regex": ".*"}}).to_list(10)
+    for responder in responders:
+        await send(responder.get("phone", ""), sent_at)
+    return responders
+
+
+async def geo_notify(users, location, sent_at):
+    responders = await find_nearest_responders(users, location, RESPONDER_COUNT)
+    await asyncio.gather(*(send(responder.get("phone", ""), sent_at) for responder in responders))
+    return responders
+
+
+async def run_case(users, notify, alerts):
+    first, last, nearest_km = [], [], []
+    for location in alerts:
+        sent_at = []
+        start = time.perf_counter()
+        responders = await notify(users, location, sent_at)
+        end = time.perf_counter()
+        if sent_at:
+            first.append((sent_at[0] - start) * 1000)
+        last.append((end - start) * 1000)
+        if responders and "distance_m" in responders[0]:
+            nearest_km.append(responders[0]["distance_m"] / 1000)
+    result = {"alert_to_first_notification": summarize(first), "alert_to_all_notified": summarize(last)}
+    if nearest_km:
+        result["mean_nearest_km"] = round(sum(nearest_km) / len(nearest_km), 3)
+    return result
+
+
+async def main():
+    responders = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    alert_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    db = bench_db()
+    users = db.users
+    await seed(db, responders)
+    alerts = [random_location() for _ in range(alert_count)]
+    report("emergency_responders", {
+        "responders": responders,
+        "alerts": alert_count,
+        "legacy": await run_case(users, legacy_notify, alerts),
+        "geo": await run_case(users, geo_notify, alerts),
+    })
+    await users.drop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+"""Supervisor dashboards from daily rollups against aggregating raw visits.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_rollups [visits] [asha_workers] [history_days] [workers]
+
+Seeds a year of ASHA visits spread over workers and villages, then:
+
+1. rebuilds the rollups from scratch with one worker and with `workers`
+   concurrent day slices;
+2. times dashboards over 28, 90 and 365 days per worker and per village,
+   read from the buckets, against a $group over the raw visits of the same
+   range, which is what answering them without rollups takes;
+3. times recording a visit with and without the rollup updates.
+"""
+import asyncio
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import Timer, bench_db, report, summarize
+from indexes import INDEXES, ensure_indexes
+from rollups import FOLLOWUPS, ROLLUPS, VisitRollups
+
+VISIT_TYPES = ["routine", "routine", "follow_up", "emergency"]
+ASHA_PER_VILLAGE = 3
+PATIENTS_PER_ASHA = 60
+BATCH = 10_000
+DASHBOARD_QUERIES = 100
+RECORDS = 500
+
+
+def make_visit(rng: random.Random, asha: int, now: datetime, history_days: int):
+    created_at = now - timedelta(seconds=rng.randrange(history_days * 86400))
+    patient = f"patient_{asha}_{rng.randrange(PATIENTS_PER_ASHA)}"
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)), "asha_id": f"asha_{asha}",
+        "patient_id": patient, "patient_name": patient, "village": f"village_{asha // ASHA_PER_VILLAGE}",
+        "visit_type": rng.choice(VISIT_TYPES), "findings": "stable", "action_taken": "advised rest",
+        "next_visit_date": created_at + timedelta(days=rng.randint(3, 30)) if rng.random() < 0.4 else None,
+        "vital_signs": {"bp": f"{rng.randint(100, 160)}/{rng.randint(60, 100)}", "pulse": rng.randint(60, 110),
+                        "temp_f": round(rng.uniform(97, 103), 1)},
+        "created_at": created_at,
+    }
+
+
+async def seed(db, visits: int, ashas: int, history_days: int, rng: random.Random):
+    for collection in ("asha_visits", ROLLUPS, FOLLOWUPS):
+        await db[collection].delete_many({})
+    now = datetime.now(timezone.utc)
+    batch = []
+    for _ in range(visits):
+        batch.append(make_visit(rng, rng.randrange(ashas), now, history_days))
+        if len(batch) >= BATCH:
+            await db.asha_visits.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.asha_visits.insert_many(batch, ordered=False)
+
+
+async def raw_dashboard(db, rollups: VisitRollups, field: str, key: str, days: int):
+    """Visits, patients and vitals per day straight from asha_visits"""
+    start = rollups.day_start(rollups.today() - timedelta(days=days - 1))
+    pipeline = [
+        {"$match": {field: key, "created_at": {"$gte": start}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": "+05:30"}},
+            "visits": {"$sum": 1}, "patients": {"$addToSet": "$patient_id"},
+            "pulse": {"$avg": "$vital_signs.pulse"}, "temp_f": {"$avg": "$vital_signs.temp_f"},
+        }},
+    ]
+    return await db.asha_visits.aggregate(pipeline).to_list(None)
+
+
+async def main():
+    visits = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    ashas = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    history_days = int(sys.argv[3]) if len(sys.argv) > 3 else 365
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    rng = random.Random(0)
+    db = bench_db()
+    rollups = VisitRollups(db)
+
+    with Timer() as seeding:
+        await seed(db, visits, ashas, history_days, rng)
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection in ("asha_visits", ROLLUPS, FOLLOWUPS)])
+    # Only the raw baseline reads visits by village; give it an index so the comparison is fair
+    await db.asha_visits.create_index([("village", 1), ("created_at", -1)])
+
+    rebuilds = {}
+    for concurrency in sorted({1, workers}):
+        await db[ROLLUPS].delete_many({})
+        await db[FOLLOWUPS].delete_many({})
+        with Timer() as t:
+            counts = await rollups.rebuild(workers=concurrency)
+        rebuilds[f"workers_{concurrency}"] = {**counts, "seconds": round(t.ms / 1000, 2),
+                                              "visits_per_second": round(counts["visits"] / (t.ms / 1000))}
+
+    dashboards = {}
+    villages = max(1, ashas // ASHA_PER_VILLAGE)
+    for scope, field, keys in (("asha", "asha_id", ashas), ("village", "village", villages)):
+        for days in (28, 90, 365):
+            from_rollups, from_visits = [], []
+            for _ in range(DASHBOARD_QUERIES):
+                key = f"{scope}_{rng.randrange(keys)}"
+                with Timer() as t:
+                    await rollups.dashboard(scope, key, days)
+                from_rollups.append(t.ms)
+                with Timer() as t:
+                    await raw_dashboard(db, rollups, field, key, days)
+                from_visits.append(t.ms)
+            dashboards[f"{scope}_{days}_days"] = {"rollups": summarize(from_rollups),
+                                                  "raw_visits": summarize(from_visits)}
+
+    now = datetime.now(timezone.utc)
+    recording = {"insert_only": [], "insert_and_rollups": []}
+    for i in range(RECORDS):
+        visit = make_visit(rng, rng.randrange(ashas), now, 1)
+        with Timer() as t:
+            await db.asha_visits.insert_one(visit)
+            if i % 2:
+                await rollups.record(visit, visit["village"])
+        recording["insert_and_rollups" if i % 2 else "insert_only"].append(t.ms)
+
+    report("rollups", {
+        "visits": visits,
+        "asha_workers": ashas,
+        "history_days": history_days,
+        "seed_seconds": round(seeding.ms / 1000, 1),
+        "rebuild": rebuilds,
+        "dashboards": dashboards,
+        "record_visit": {name: summarize(samples) for name, samples in recording.items()},
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,179 @@
+"""Free-slot search and conflict-free booking with 5,000 doctors and 1M appointments.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_scheduling [doctors] [appointments] [queries] [racers]
+
+Three parts:
+
+1. Rebuilding the slot index from MongoDB: schedules and appointments are
+   written to the scratch database and loaded the way the app does at startup.
+2. Searches on that index: "earliest 10 free slots" for one language and for
+   every doctor, interleaved with bookings of the slots found so the heaps
+   keep changing, plus the per-booking conflict check.
+3. Concurrent booking through the API: racers patients try to book the same
+   few slots at once. Each slot must go to exactly one of them, first with a
+   warm index and then with an index that missed those bookings, as another
+   worker's would; there only MongoDB's unique slot index stands in the way.
+"""
+import asyncio
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.common import Timer, report, summarize
+
+# The app under test must read and write the scratch database
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "arogya_bench")
+# One client sends every request; per-client rate limits would turn most of them away
+os.environ.setdefault("ADMISSION_RATE_LIMITS", "off")
+
+import server  # noqa: E402
+from scheduling import SCHEDULES, SlotIndex, from_epoch  # noqa: E402
+
+LANGUAGES = ["hi", "en", "pa", "bn", "te", "mr", "ta", "gu", "kn", "ml"]
+WEEK = {day: [["09:00", "13:00"], ["14:00", "18:00"]] for day in ("mon", "tue", "wed", "thu", "fri", "sat")}
+BATCH = 10_000
+RACE_SLOTS = 10
+
+
+def schedule_docs(doctors: int, rng: random.Random):
+    for i in range(doctors):
+        yield {
+            "doctor_id": f"doctor_{i}", "doctor_name": f"Dr. {i}",
+            "languages": rng.sample(LANGUAGES, rng.randint(1, 3)),
+            "slot_minutes": rng.choice([15, 20, 30]), "utc_offset_minutes": 330, "weekly": WEEK,
+            "updated_at": datetime.now(timezone.utc),
+        }
+
+
+async def seed(db, doctors: int, appointments: int, rng: random.Random) -> int:
+    """Write schedules and book appointments into free slots, busiest in the coming days"""
+    await db[SCHEDULES].delete_many({})
+    await db.consultations.delete_many({})
+    await db[SCHEDULES].insert_many(list(schedule_docs(doctors, rng)))
+
+    # Book through a scratch index so the stored appointments sit on real slots and never collide
+    scratch = SlotIndex()
+    await scratch.load(db)
+    now = int(time.time())
+    per_doctor = appointments // doctors
+    batch, written = [], 0
+    for calendar in scratch.calendars.values():
+        free = list(calendar.free_slots(now, now + scratch.horizon))
+        # Nearer slots fill up first, as they do in practice
+        weights = [1 / (1 + i / 50) for i in range(len(free))]
+        picked = set()
+        while len(picked) < min(per_doctor, len(free)):
+            picked.update(rng.choices(free, weights, k=per_doctor - len(picked)))
+        for start in picked:
+            batch.append({
+                "id": f"{calendar.doctor_id}:{start}", "patient_id": f"patient_{rng.randrange(10 ** 6)}",
+                "doctor_id": calendar.doctor_id, "doctor_name": calendar.name, "symptoms": "fever",
+                "appointment_time": from_epoch(start), "duration_minutes": calendar.slot_seconds // 60,
+                "status": "scheduled", "slot_active": True,
+            })
+            if len(batch) >= BATCH:
+                await db.consultations.insert_many(batch, ordered=False)
+                written += len(batch)
+                batch = []
+    if batch:
+        await db.consultations.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+def search_and_book(index: SlotIndex, queries: int, rng: random.Random):
+    """Alternate searches with bookings of what they found, timing each"""
+    timings = {"earliest_10_one_language": [], "earliest_10_any_doctor": [], "check_and_book": []}
+    for i in range(queries):
+        language = rng.choice(LANGUAGES) if i % 2 == 0 else None
+        with Timer() as t:
+            found = index.earliest(10, language)
+        timings["earliest_10_one_language" if language else "earliest_10_any_doctor"].append(t.ms)
+        if found and i % 4 == 0:
+            start, calendar = rng.choice(found)
+            with Timer() as t:
+                if index.check(calendar.doctor_id, start) is None:
+                    index.book(calendar.doctor_id, start, start + calendar.slot_seconds, f"bench_{i}")
+            timings["check_and_book"].append(t.ms)
+    return {name: summarize(samples) for name, samples in timings.items()}
+
+
+async def race(client: httpx.AsyncClient, slots, racers: int, tag: str):
+    """racers patients book the same slots at once; returns how many bookings each slot got"""
+    async def attempt(i: int):
+        start, calendar = slots[i % len(slots)]
+        response = await client.post("/api/consultations", json={
+            "patient_id": f"{tag}_{i}", "doctor_id": calendar.doctor_id, "symptoms": "fever",
+            "appointment_time": from_epoch(start).isoformat(),
+        })
+        return response.status_code
+
+    with Timer() as t:
+        statuses = await asyncio.gather(*(attempt(i) for i in range(racers)))
+    stored = {}
+    for start, calendar in slots:
+        stored[(calendar.doctor_id, start)] = await server.db.consultations.count_documents(
+            {"doctor_id": calendar.doctor_id, "appointment_time": from_epoch(start), "slot_active": True}
+        )
+    return {
+        "requests": racers, "slots": len(slots), "seconds": round(t.ms / 1000, 3),
+        "booked": statuses.count(200), "conflicts": statuses.count(409),
+        "other_statuses": sorted({status for status in statuses if status not in (200, 409)}),
+        "slots_booked_more_than_once": sum(1 for count in stored.values() if count > 1),
+    }
+
+
+async def main():
+    doctors = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    appointments = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+    queries = int(sys.argv[3]) if len(sys.argv) > 3 else 20_000
+    racers = int(sys.argv[4]) if len(sys.argv) > 4 else 1000
+    rng = random.Random(0)
+    db = server.db
+
+    await server.ensure_indexes(db)
+    with Timer() as seeding:
+        written = await seed(db, doctors, appointments, rng)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = SlotIndex()
+    with Timer() as loading:
+        await index.load(db)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    searches = search_and_book(index, queries, rng)
+
+    # The app's own index, loaded from the same data, for the API race
+    await server.slot_index.load(db)
+    stale = SlotIndex()
+    await stale.load(db)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        first = server.slot_index.earliest(RACE_SLOTS)
+        warm = await race(client, first, racers, "warm")
+        # Pretend the bookings above were made by another worker this one has not heard from
+        server.slot_index = stale
+        cold = await race(client, first, racers, "cold")
+
+    report("scheduling", {
+        "doctors": doctors,
+        "appointments": written,
+        "seed_seconds": round(seeding.ms / 1000, 1),
+        "index_load_seconds": round(loading.ms / 1000, 2),
+        "index_max_rss_growth_mb": round((rss_after - rss_before) / 1024, 1),
+        "index": index.stats(),
+        "searches": searches,
+        "race_with_warm_index": warm,
+        "race_with_stale_index": cold,
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
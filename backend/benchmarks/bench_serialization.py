@@ -0,0 +1,137 @@
+"""CPU time per 1,000 documents for each list endpoint: model path vs fast encoder.
+
+Runs without a database. Run from the backend directory:
+
+    python -m benchmarks.bench_serialization [documents] [rounds]
+
+The model path is what FastAPI does for `[Model(**doc) for doc in docs]`
+with a response_model: build the models, re-validate them against
+List[Model], and encode with JSONResponse. That both paths produce
+identical bytes is checked by tests/test_serialization.py. The fast path
+serves plain list pages only with FAST_RESPONSES=1.
+"""
+import asyncio
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.common import report
+from serialization import fast_encoder
+from server import (
+    ASHAVisit, Consultation, EmergencyAlert, HealthRecord, InventoryItem, MedicineRequest, Pharmacy,
+    SymptomCheck, User,
+)
+
+NOW = datetime(2026, 1, 1, 9, 30)
+
+
+def when(i: int) -> datetime:
+    # Mongo keeps millisecond precision and hands back naive UTC datetimes
+    return NOW - timedelta(minutes=i, milliseconds=i % 1000)
+
+
+def stored(model, fields, i: int):
+    """A document as the API would have written it, with the extras Mongo and the sync feed add"""
+    doc = model(**fields).dict()
+    doc.update(_id=ObjectId(), sync_seq=i, sync_ts=when(i))
+    return doc
+
+
+def sample(endpoint: str, i: int):
+    user_id = f"user_{i % 50}"
+    if endpoint == "get_users":
+        return stored(User, {"name": f"User {i}", "phone": "+91-9000000000", "village": "Rampur",
+                             "role": "asha", "location": {"lat": 18.52, "lng": 73.85}, "created_at": when(i)}, i)
+    if endpoint == "get_user_health_records":
+        return stored(HealthRecord, {"user_id": user_id, "type": "vitals", "title": "Home visit",
+                                     "description": "BP 120/80, pulse 72, no fever. " * 5,
+                                     "medications": [{"name": "paracetamol", "dose": "500mg"}],
+                                     "attachments": [f"file_{i}.jpg"], "date": when(i)}, i)
+    if endpoint == "get_user_medicine_requests":
+        return stored(MedicineRequest, {"user_id": user_id, "user_name": "Patient", "user_phone": "1",
+                                        "medicines": [{"name": "paracetamol", "quantity": 2}],
+                                        "pharmacy_id": "civil_hospital_pharmacy", "status": "reserved",
+                                        "booking_date": when(i), "reserved_until": when(i - 1440)}, i)
+    if endpoint == "get_user_symptom_checks":
+        return stored(SymptomCheck, {"user_id": user_id, "symptoms": ["fever", "cough"],
+                                     "assessment": "Likely viral fever. " * 4, "severity": "medium",
+                                     "recommendations": ["Rest", "Fluids"], "referral_needed": False,
+                                     "created_at": when(i)}, i)
+    if endpoint == "get_user_consultations":
+        return stored(Consultation, {"patient_id": user_id, "doctor_name": "Dr. Rao", "symptoms": "fever",
+                                     "appointment_time": when(i), "room_id": f"room_{i}", "created_at": when(i)}, i)
+    if endpoint == "get_emergency_alerts":
+        return stored(EmergencyAlert, {"user_id": user_id, "user_name": "Patient", "user_phone": "1",
+                                       "location": {"lat": 18.52, "lng": 73.85}, "created_at": when(i),
+                                       "responders_notified": [str(uuid.uuid4())]}, i)
+    if endpoint == "get_asha_visits":
+        return stored(ASHAVisit, {"asha_id": "asha_1", "patient_id": user_id, "patient_name": "Patient",
+                                  "visit_type": "routine", "findings": "Healthy, growth on track. " * 4,
+                                  "action_taken": "Counselled on nutrition", "created_at": when(i)}, i)
+    if endpoint == "get_pharmacies":
+        return stored(Pharmacy, {"name": f"Pharmacy {i}", "location": "Main road", "phone": "1",
+                                 "coordinates": {"lat": 18.5, "lng": 73.8}, "last_updated": when(i)}, i)
+    if endpoint == "get_pharmacy_inventory":
+        return stored(InventoryItem, {"id": f"p:{i}", "pharmacy_id": "p", "pharmacy_name": "Pharmacy",
+                                      "medicine_name": f"medicine {i}", "stock": random.randint(0, 99),
+                                      "price": random.choice([10, 12.5]), "updated_at": when(i)}, i)
+    raise ValueError(endpoint)
+
+
+ENDPOINTS = {
+    "get_users": User,
+    "get_user_health_records": HealthRecord,
+    "get_user_medicine_requests": MedicineRequest,
+    "get_user_symptom_checks": SymptomCheck,
+    "get_user_consultations": Consultation,
+    "get_emergency_alerts": EmergencyAlert,
+    "get_asha_visits": ASHAVisit,
+    "get_pharmacies": Pharmacy,
+    "get_pharmacy_inventory": InventoryItem,
+}
+
+
+async def model_path(model, field, docs) -> bytes:
+    content = await serialize_response(field=field, response_content=[model(**doc) for doc in docs])
+    return JSONResponse(content).body
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    results = {}
+    for endpoint, model in ENDPOINTS.items():
+        docs = [sample(endpoint, i) for i in range(count)]
+        field = create_response_field(name=f"Response_{endpoint}", type_=List[model])
+        encoder = fast_encoder(model)
+        # The fast path never sees fields outside the projection
+        projected = [{key: value for key, value in doc.items() if key in encoder.projection()} for doc in docs]
+
+        start = time.process_time()
+        for _ in range(rounds):
+            await model_path(model, field, docs)
+        slow = (time.process_time() - start) * 1e6 / rounds / count
+        start = time.process_time()
+        for _ in range(rounds):
+            encoder.encode_many(projected)
+        fast = (time.process_time() - start) * 1e6 / rounds / count
+        results[endpoint] = {
+            "model_path_cpu_ms_per_1k": round(slow, 3),
+            "fast_path_cpu_ms_per_1k": round(fast, 3),
+            "speedup": round(slow / fast, 1) if fast else None,
+            "fast_path_supported": encoder.supported,
+            "bytes": len(encoder.encode_many(projected)),
+        }
+    report("list_serialization", {"documents": count, "rounds": rounds, "endpoints": results})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+"""Outbreak detection over a stream of symptom checks.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_surveillance [checks] [villages] [outbreaks]
+
+Generates ten days of symptom checks drawn from the triage corpus, spread
+over the villages, and on the last day adds a fever and diarrhoea cluster
+to `outbreaks` of them. Then:
+
+1. counts them through the detector with canonical keys already known, and
+   with the triage engine matching every check first, in events/second;
+2. stores them, flushes the counters, and times restoring the checkpoint
+   and replaying the checks from MongoDB;
+3. reports which villages are alerting at the end against the injected
+   ones, and how many alerts were opened over the ten days;
+4. times answering "is this check part of a spike" by aggregating the raw
+   checks of its village and symptom over the window and the baseline,
+   which is what the detector saves on every check.
+"""
+import asyncio
+import json
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from benchmarks.common import ROOT_DIR, Timer, bench_db, report, summarize
+from indexes import INDEXES, ensure_indexes
+from surveillance import ALERTS, COUNTERS, OutbreakDetector
+from triage import TriageEngine
+
+CORPUS = Path(__file__).parent / "triage_corpus.jsonl"
+HISTORY_DAYS = 10
+OUTBREAK_SYMPTOMS = [["fever", "loose motions"], ["bukhar", "dast"], ["fever with vomiting and diarrhoea"]]
+BATCH = 10_000
+RESCAN_QUERIES = 200
+
+
+def generate(rng: random.Random, corpus, checks: int, villages: int, outbreaks: int, now: datetime):
+    """Symptom checks in time order, and the villages given an outbreak on the last day"""
+    start = now - timedelta(days=HISTORY_DAYS)
+    stream = []
+    for _ in range(checks):
+        stream.append({
+            "village": f"village_{rng.randrange(villages)}", "symptoms": rng.choice(corpus),
+            "created_at": start + timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400)),
+        })
+    struck = [f"village_{v}" for v in rng.sample(range(villages), min(outbreaks, villages))]
+    for village in struck:
+        for _ in range(rng.randint(15, 30)):
+            stream.append({"village": village, "symptoms": rng.choice(OUTBREAK_SYMPTOMS),
+                           "created_at": now - timedelta(seconds=rng.randrange(86400))})
+    stream.sort(key=lambda check: check["created_at"])
+    for i, check in enumerate(stream):
+        check.update(id=str(uuid.UUID(int=rng.getrandbits(128), version=4)), user_id=f"patient_{i % 5000}",
+                     assessment="", severity="low", recommendations=[], referral_needed=False)
+    return stream, struck
+
+
+def throughput(events: int, ms: float) -> int:
+    return round(events / (ms / 1000)) if ms else 0
+
+
+async def main():
+    checks = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    villages = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    outbreaks = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    rng = random.Random(0)
+    engine = TriageEngine.load(ROOT_DIR / "data" / "triage_rules.json")
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = [json.loads(line)["symptoms"] for line in f if line.strip()]
+    now = datetime.now(timezone.utc)
+    stream, struck = generate(rng, corpus, checks, villages, outbreaks, now)
+    with Timer() as matching:
+        for check in stream:
+            check["symptom_keys"] = engine.assess(check["symptoms"]).symptoms
+
+    detector = OutbreakDetector(None)
+    with Timer() as counting:
+        for check in stream:
+            detector.observe(check["village"], check["symptom_keys"], check["created_at"])
+    alerted = sorted({village for (village, _), counter in detector.windows.items() if counter.alert_id})
+    in_memory = detector.stats()
+
+    db = bench_db()
+    for collection in ("symptom_checks", COUNTERS, ALERTS):
+        await db[collection].delete_many({})
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection in ("symptom_checks", ALERTS)])
+    with Timer() as seeding:
+        for start in range(0, len(stream), BATCH):
+            await db.symptom_checks.insert_many([dict(check) for check in stream[start:start + BATCH]], ordered=False)
+
+    replaying = OutbreakDetector(db)
+    with Timer() as replay:
+        replayed = await replaying.replay(engine, until=now + timedelta(seconds=1))
+    with Timer() as flushing:
+        written = await replaying.flush(now)
+    restarted = OutbreakDetector(db)
+    with Timer() as restoring:
+        restored = await restarted.restore()
+    with Timer() as tail:
+        tail_read = await restarted.replay(engine, until=now + timedelta(seconds=1))
+
+    rescans, observes = [], []
+    # The same counts the detector keeps: the ring's span split into 24-hour windows
+    window_ms = 24 * 3600 * 1000
+    for check in rng.sample(stream, min(RESCAN_QUERIES, len(stream))):
+        for symptom in check["symptom_keys"][:1]:
+            at = check["created_at"]
+            pipeline = [
+                {"$match": {"village": check["village"], "symptom_keys": symptom,
+                            "created_at": {"$gt": at - detector.span, "$lte": at}}},
+                {"$group": {"_id": {"$floor": {"$divide": [{"$subtract": [at, "$created_at"]}, window_ms]}},
+                            "count": {"$sum": 1}}},
+            ]
+            with Timer() as t:
+                await db.symptom_checks.aggregate(pipeline).to_list(None)
+            rescans.append(t.ms)
+            with Timer() as t:
+                detector.observe(check["village"], [symptom], at)
+            observes.append(t.ms)
+
+    report("surveillance", {
+        "checks": len(stream),
+        "villages": villages,
+        "seed_seconds": round(seeding.ms / 1000, 1),
+        "events_per_second": {
+            "counting_canonical_keys": throughput(len(stream), counting.ms),
+            "triage_matching_and_counting": throughput(len(stream), counting.ms + matching.ms),
+            "replay_from_mongo": throughput(replayed, replay.ms),
+        },
+        "counters": in_memory["counters"],
+        "counter_bytes": in_memory["counter_bytes"],
+        "checkpoint": {"counters_written": written, "flush_ms": round(flushing.ms, 1),
+                       "counters_restored": restored, "restore_ms": round(restoring.ms, 1),
+                       "checks_read_after_restore": tail_read, "tail_replay_ms": round(tail.ms, 1)},
+        "outbreaks_injected": struck,
+        "villages_alerted": alerted,
+        "missed": sorted(set(struck) - set(alerted)),
+        "alerts_opened": in_memory["alerts_opened"],
+        "per_check_ms": {"detector": summarize(observes), "aggregate_raw_checks": summarize(rescans)},
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""Compare the per-record offline sync loop with the bulk sync engine.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_sync
+"""
+import asyncio
+import uuid
+
+from benchmarks.common import Timer, bench_db, report
+from sync import bulk_insert_offline
+
+SIZES = (10, 100, 5000)
+
+
+def make_records(count: int):
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": f"user_{i % 50}",
+            "type": "vitals",
+            "title": "Home visit vitals",
+            "description": "BP 120/80, pulse 72",
+            "medications": [],
+            "attachments": [],
+            "is_synced": True,
+            "offline_id": str(uuid.uuid4()),
+        }
+        for i in range(count)
+    ]
+
+
+async def legacy_sync(collection, records):
+    """The original loop: one find_one and one insert_one per record"""
+    for record in records:
+        if not await collection.find_one({"offline_id": record["offline_id"]}):
+            await collection.insert_one(dict(record))
+
+
+async def bulk_sync(collection, records):
+    await bulk_insert_offline(collection, [dict(record) for record in records])
+
+
+async def run_case(collection, sync, records):
+    await collection.drop()
+    await collection.create_index(
+        "offline_id", unique=True, partialFilterExpression={"offline_id": {"$type": "string"}}
+    )
+    with Timer() as first:
+        await sync(collection, records)
+    # A reconnecting tablet re-sends the whole queue; every record is now a duplicate
+    with Timer() as replay:
+        await sync(collection, records)
+    return {"first_upload_ms": round(first.ms, 2), "replay_ms": round(replay.ms, 2)}
+
+
+async def main():
+    collection = bench_db().bench_health_records
+    results = []
+    for size in SIZES:
+        records = make_records(size)
+        results.append({
+            "records": size,
+            "legacy": await run_case(collection, legacy_sync, records),
+            "bulk": await run_case(collection, bulk_sync, records),
+        })
+    await collection.drop()
+    report("health_records_sync", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""Patient history screen: five sequential list calls vs one timeline page.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_timeline [documents_per_collection] [page_size] [rounds]
+
+The five calls are what the app makes today, each with its endpoint's
+default cap. Latencies are measured in-process; the per-link figures add one
+round trip per call from the links of bench_low_bandwidth.
+"""
+import asyncio
+import random
+import sys
+from datetime import datetime, timedelta
+
+import httpx
+
+from benchmarks.bench_low_bandwidth import LINKS
+from benchmarks.common import Timer, report, summarize
+
+import server
+from server import TIMELINE_SOURCES
+
+PATIENT = "bench_timeline_patient"
+
+LEGACY_CALLS = [
+    f"/api/health-records/{PATIENT}",
+    f"/api/consultations/{PATIENT}",
+    f"/api/symptom-checks/{PATIENT}",
+    f"/api/asha-visits/patient/{PATIENT}",
+    f"/api/medicine-requests/{PATIENT}",
+]
+
+FIELDS = {
+    "health_record": dict(type="vitals", title="Home visit", description="BP 120/80, pulse 72"),
+    "consultation": dict(doctor_name="Dr. Rao", symptoms="fever"),
+    "symptom_check": dict(symptoms=["fever"], assessment="Likely viral", severity="low",
+                          recommendations=["Rest"], referral_needed=False),
+    "asha_visit": dict(asha_id="asha_1", patient_name="Patient", visit_type="routine", findings="Healthy",
+                       action_taken="None"),
+    "medicine_request": dict(user_name="Patient", user_phone="1", medicines=[{"name": "ors", "quantity": 1}],
+                             pharmacy_id="civil_hospital_pharmacy"),
+}
+
+
+async def seed(db, count: int):
+    start = datetime(2026, 1, 1)
+    for source in TIMELINE_SOURCES:
+        await db[source.collection].delete_many({source.owner_field: PATIENT})
+        docs = []
+        for i in range(count):
+            fields = {**FIELDS[source.kind], source.owner_field: PATIENT,
+                      source.time_field: start - timedelta(minutes=random.randint(0, 60 * 24 * 365))}
+            docs.append(source.model(**fields).dict())
+        await db[source.collection].insert_many(docs)
+
+
+async def timed(client: httpx.AsyncClient, paths, params, rounds: int):
+    samples, size = [], 0
+    for _ in range(rounds):
+        with Timer() as t:
+            size = 0
+            for path in paths:
+                response = await client.get(path, params=params)
+                response.raise_for_status()
+                size += len(response.content)
+        samples.append(t.ms)
+    return samples, size
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    await seed(server.db, count)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        legacy, legacy_bytes = await timed(client, LEGACY_CALLS, {}, rounds)
+        timeline, timeline_bytes = await timed(client, [f"/api/patients/{PATIENT}/timeline"], {"limit": page_size}, rounds)
+
+    legacy_ms, timeline_ms = summarize(legacy), summarize(timeline)
+    report("patient_timeline", {
+        "documents_per_collection": count,
+        "page_size": page_size,
+        "five_sequential_calls": {**legacy_ms, "bytes": legacy_bytes},
+        "timeline_first_page": {**timeline_ms, "bytes": timeline_bytes},
+        "with_round_trips_p50_ms": {
+            link: {
+                "five_sequential_calls": round(legacy_ms["p50_ms"] + len(LEGACY_CALLS) * rtt, 1),
+                "timeline_first_page": round(timeline_ms["p50_ms"] + rtt, 1),
+            }
+            for link, (_, rtt) in LINKS.items()
+        },
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""Accuracy and speed of the offline triage engine on the labeled corpus.
+
+    python -m benchmarks.bench_triage
+"""
+import json
+import time
+from pathlib import Path
+
+from benchmarks.common import ROOT_DIR, Timer, report
+from triage import TriageEngine
+
+CORPUS = Path(__file__).parent / "triage_corpus.jsonl"
+ROUNDS = 200
+
+
+def main():
+    with Timer() as load:
+        engine = TriageEngine.load(ROOT_DIR / "data" / "triage_rules.json")
+    with open(CORPUS, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    mistakes = []
+    for case in corpus:
+        result = engine.assess(case["symptoms"], case.get("context", ()))
+        if result.severity != case["severity"]:
+            mistakes.append({"symptoms": case["symptoms"], "context": case.get("context", []),
+                             "expected": case["severity"], "got": result.severity})
+    missed_emergencies = [m for m in mistakes if m["expected"] == "emergency"]
+
+    batch = [case["symptoms"] for case in corpus]
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        engine.assess_batch(batch)
+    elapsed = time.perf_counter() - start
+
+    report("triage", {
+        "cases": len(corpus),
+        "accuracy": round(1 - len(mistakes) / len(corpus), 4),
+        "missed_emergencies": missed_emergencies,
+        "mistakes": mistakes,
+        "compile_ms": round(load.ms, 2),
+        "us_per_request": round(elapsed / (ROUNDS * len(batch)) * 1e6, 2),
+        "us_per_symptom_string": round(elapsed / (ROUNDS * sum(len(b) for b in batch)) * 1e6, 2),
+    })
+
+
+if __name__ == "__main__":
+    main()
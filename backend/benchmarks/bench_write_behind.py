@@ -0,0 +1,90 @@
+"""Insert throughput of the group-commit writer against one insert per request.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.bench_write_behind [inserts] [max_batch] [delay_ms]
+
+Writes `inserts` symptom checks, with the app's indexes on the collection,
+from 1, 16, 128 and 512 concurrent writers (requests in flight), each
+inserting one check at a time:
+
+1. direct: a sequence reservation and an insert_one per check, as before;
+2. group_commit: through GroupCommitWriter with the given batch size and
+   delay.
+
+Reports inserts/second, per-insert latency and the batch sizes written.
+"""
+import asyncio
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from benchmarks.common import Timer, bench_db, report, summarize
+from indexes import INDEXES, ensure_indexes
+from sync import SyncSequence
+from write_behind import GroupCommitWriter
+
+WRITERS = (1, 16, 128, 512)
+COLLECTION = "symptom_checks"
+
+
+def make_check(i: int):
+    return {
+        "id": str(uuid.uuid4()), "user_id": f"patient_{i % 5000}", "symptoms": ["fever", "cough"],
+        "assessment": "Likely a viral fever", "severity": "low", "recommendations": ["Rest", "Fluids"],
+        "referral_needed": False, "created_at": datetime.now(timezone.utc), "village": f"village_{i % 500}",
+        "symptom_keys": ["fever", "cough"],
+    }
+
+
+async def run_case(db, insert, inserts: int, writers: int):
+    await db[COLLECTION].delete_many({})
+    remaining = [inserts]
+    latencies = []
+
+    async def writer():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            doc = make_check(remaining[0])
+            with Timer() as t:
+                await insert(COLLECTION, doc)
+            latencies.append(t.ms)
+
+    with Timer() as total:
+        await asyncio.gather(*(writer() for _ in range(writers)))
+    stored = await db[COLLECTION].count_documents({})
+    return {"inserts_per_second": round(inserts / (total.ms / 1000)), "stored": stored, "latency": summarize(latencies)}
+
+
+async def main():
+    inserts = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    max_batch = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    delay_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    db = bench_db()
+    await db[COLLECTION].drop()
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection == COLLECTION])
+    sequence = SyncSequence(db.bench_counters)
+
+    async def direct(collection, doc):
+        await sequence.stamp(doc)
+        await db[collection].insert_one(doc)
+
+    results = []
+    for writers in WRITERS:
+        writer = GroupCommitWriter(db, sequence, [COLLECTION], max_batch=max_batch, max_delay=delay_ms / 1000)
+        results.append({
+            "writers": writers,
+            "direct": await run_case(db, direct, inserts, writers),
+            "group_commit": {**await run_case(db, writer.insert, inserts, writers),
+                             "batches": writer.counters["batches"], "mean_batch": writer.stats()["mean_batch"],
+                             "backpressured": writer.counters["backpressured"]},
+        })
+        await writer.close()
+
+    await db[COLLECTION].drop()
+    await db.bench_counters.drop()
+    report("write_behind", {"inserts": inserts, "max_batch": max_batch, "delay_ms": delay_ms, "cases": results})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""Shared helpers for the benchmark scripts in this package."""
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+def bench_db():
+    """Return a scratch database so benchmarks never touch application data"""
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    return client[os.environ.get("BENCH_DB_NAME", "arogya_bench")]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+    }
+
+
+class Timer:
+    """Context manager measuring wall time in milliseconds"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self.start) * 1000
+
+
+def report(name: str, results: Any):
+    """Print results as JSON so runs can be diffed or collected by CI"""
+    print(json.dumps({"benchmark": name, "results": results}, indent=2, default=str))
@@ -0,0 +1,48 @@
+"""A local stand-in for the Gemini model with tunable latency and failure rate."""
+import asyncio
+import json
+import random
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Mimics GenerativeModel.generate_content_async without any network access"""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.concurrent = 0
+        self.peak_concurrent = 0
+
+    async def generate_content_async(self, prompt: str) -> FakeResponse:
+        self.calls += 1
+        self.concurrent += 1
+        self.peak_concurrent = max(self.peak_concurrent, self.concurrent)
+        try:
+            await asyncio.sleep(max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter)))
+            if self._random.random() < self.error_rate:
+                raise RuntimeError("injected provider error")
+            if prompt.startswith("Target language:"):
+                return FakeResponse(self._translate(prompt))
+            return FakeResponse("```json\n" + json.dumps({
+                "assessment": "Likely a common viral infection.",
+                "severity": "low",
+                "recommendations": ["Rest and drink fluids", "Visit the PHC if symptoms last 3 days"],
+                "referral_needed": False,
+            }) + "\n```")
+        finally:
+            self.concurrent -= 1
+
+    @staticmethod
+    def _translate(prompt: str) -> str:
+        """Answer a translation prompt with one tagged string per input text"""
+        header, _, texts = prompt.partition("\n")
+        language = header.split(":", 1)[1].strip()
+        return json.dumps([f"[{language}] {text}" for text in json.loads(texts)], ensure_ascii=False)
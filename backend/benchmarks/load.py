@@ -0,0 +1,595 @@
+"""Closed-loop load test of the whole API, with a per-route JSON report.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.load run [--scale small] [--concurrency 50] [--duration 60] [--out report.json]
+    python -m benchmarks.load compare baseline.json current.json [--threshold 0.1]
+
+`run` seeds the scratch database (see benchmarks.seed), boots the app
+in-process with its startup jobs and drives it through the full middleware
+stack with a fixed number of concurrent virtual users. Each one repeatedly
+picks an operation from the weighted mix in OPERATIONS (override weights with
+--mix name=weight,...); an operation is one or more requests, each timed and
+reported under its route template. The model is replaced by the fake in
+benchmarks.fake_llm with --llm-latency/--llm-jitter. --memory runs against
+mongomock-motor instead of MongoDB, skipping the $geoNear operations it
+cannot serve and keeping attachments in a temporary directory; its numbers
+are only good for comparing runs with each other.
+The live alert feed (WebSocket/SSE) is covered by bench_realtime instead.
+
+The same seed gives the same data and the same sequence of choices per
+virtual user, so two runs differ only by what changed in between. `compare`
+reports per-route p95 and throughput changes between two reports and exits
+non-zero if any route regressed by more than the threshold.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+from benchmarks.common import Timer, report, summarize
+from benchmarks.fake_llm import FakeModel
+
+# Small p95s are mostly noise; a change below this many ms is never a regression
+MIN_P95_DELTA_MS = 1.0
+
+UI_STRINGS = [
+    "Book a consultation", "Your medicines are ready for pickup", "Take one tablet after meals",
+    "Emergency alert sent", "Nearest pharmacy", "Symptoms", "Health records", "ASHA worker visit",
+]
+
+
+class Session:
+    """One virtual user: picks data at random and records every request it makes"""
+
+    def __init__(self, client: httpx.AsyncClient, dataset: Dict[str, Any], rng: random.Random, results: "Results",
+                 address: str = "10.0.0.1"):
+        self.client = client
+        self.data = dataset
+        self.rng = rng
+        self.results = results
+        # Each virtual user is its own client to per-client rate limits
+        self.address = address
+
+    async def call(self, method: str, route: str, params: Optional[Dict[str, Any]] = None, json: Any = None,
+                   content: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None, **path) -> httpx.Response:
+        with Timer() as t:
+            response = await self.client.request(method, route.format(**path), params=params, json=json,
+                                                 content=content,
+                                                 headers={"X-Forwarded-For": self.address, **(headers or {})})
+        self.results.record(f"{method} {route}", response.status_code, t.ms)
+        return response
+
+    def patient(self) -> Dict[str, Any]:
+        return self.rng.choice(self.data["patients"])
+
+    def pharmacy(self) -> str:
+        return self.rng.choice(self.data["pharmacies"])
+
+
+class Results:
+    def __init__(self):
+        self.recording = False
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(self, route: str, status: int, ms: float):
+        if not self.recording:
+            return
+        self.latencies.setdefault(route, []).append(ms)
+        counts = self.statuses.setdefault(route, {})
+        counts[str(status)] = counts.get(str(status), 0) + 1
+
+    def summary(self, seconds: float) -> Dict[str, Any]:
+        routes = {}
+        for route in sorted(self.latencies):
+            errors = sum(count for status, count in self.statuses[route].items() if int(status) >= 400)
+            routes[route] = {"rps": round(len(self.latencies[route]) / seconds, 2), "errors": errors,
+                             **summarize(self.latencies[route]), "statuses": self.statuses[route]}
+        everything = [ms for samples in self.latencies.values() for ms in samples]
+        total_errors = sum(route["errors"] for route in routes.values())
+        return {"total": {"rps": round(len(everything) / seconds, 2), "errors": total_errors, **summarize(everything)},
+                "routes": routes}
+
+
+# =============================================================================
+# OPERATIONS
+# =============================================================================
+
+async def get_user(s: Session):
+    await s.call("GET", "/api/users/{user_id}", user_id=s.patient()["id"])
+
+
+async def list_village_users(s: Session):
+    village = s.rng.choice(s.data["villages"])["name"]
+    params = {"village": village, "role": "asha"} if s.rng.random() < 0.5 else {"village": village}
+    await s.call("GET", "/api/users", params=params)
+
+
+async def create_user(s: Session):
+    village = s.rng.choice(s.data["villages"])
+    await s.call("POST", "/api/users", json={
+        "name": "New Patient", "phone": f"+91-8{s.rng.randrange(10 ** 9):09d}", "village": village["name"],
+        "language": "hi", "location": village["center"],
+    })
+
+
+async def update_responder_status(s: Session):
+    center = s.rng.choice(s.data["villages"])["center"]
+    await s.call("PUT", "/api/users/{user_id}/responder-status", user_id=s.rng.choice(s.data["asha"]), json={
+        "location": {"lat": center["lat"] + s.rng.uniform(-0.02, 0.02), "lng": center["lng"]},
+        "is_available": s.rng.random() < 0.9,
+    })
+
+
+def _record(s: Session, user_id: str, offline: bool = False) -> Dict[str, Any]:
+    record = {"user_id": user_id, "type": "vitals", "title": "Home visit vitals", "description": "BP 124/82, pulse 76"}
+    if offline:
+        record["offline_id"] = str(uuid.UUID(int=s.rng.getrandbits(128), version=4))
+    return record
+
+
+async def health_records(s: Session):
+    await s.call("GET", "/api/health-records/{user_id}", user_id=s.patient()["id"])
+
+
+async def create_health_record(s: Session):
+    await s.call("POST", "/api/health-records", json=_record(s, s.patient()["id"]))
+
+
+async def delete_health_record(s: Session):
+    response = await s.call("POST", "/api/health-records", json=_record(s, s.patient()["id"]))
+    if response.status_code == 200:
+        await s.call("DELETE", "/api/health-records/{record_id}", record_id=response.json()["id"])
+
+
+async def upload_attachment(s: Session):
+    data = s.rng.randbytes(48 * 1024)
+    response = await s.call("POST", "/api/attachments/uploads", json={
+        "owner_id": s.patient()["id"], "filename": "report.pdf", "content_type": "application/pdf", "size": len(data),
+    })
+    if response.status_code != 200:
+        return
+    upload_id = response.json()["id"]
+    half = len(data) // 2
+    for offset in (0, half):
+        response = await s.call("PUT", "/api/attachments/uploads/{upload_id}", content=data[offset:offset + half],
+                                headers={"Upload-Offset": str(offset)}, upload_id=upload_id)
+    if response.status_code == 200 and response.json()["attachment_id"]:
+        await s.call("GET", "/api/attachments/{attachment_id}", headers={"Range": "bytes=0-1023"},
+                     attachment_id=response.json()["attachment_id"])
+
+
+async def sync_upload(s: Session):
+    user_id = s.patient()["id"]
+    await s.call("POST", "/api/health-records/sync", json=[_record(s, user_id, offline=True) for _ in range(20)])
+
+
+async def sync_upload_stream(s: Session):
+    user_id = s.patient()["id"]
+    body = "\n".join(json.dumps(_record(s, user_id, offline=True)) for _ in range(100)).encode()
+    await s.call("POST", "/api/health-records/sync/stream", content=body,
+                 headers={"content-type": "application/x-ndjson"})
+
+
+async def sync_changes(s: Session):
+    await s.call("GET", "/api/sync/changes", params={"user_id": s.patient()["id"]})
+
+
+async def timeline(s: Session):
+    await s.call("GET", "/api/patients/{patient_id}/timeline", patient_id=s.patient()["id"])
+
+
+async def pharmacies(s: Session):
+    await s.call("GET", "/api/pharmacies")
+
+
+async def create_pharmacy(s: Session):
+    center = s.rng.choice(s.data["villages"])["center"]
+    await s.call("POST", "/api/pharmacies", json={
+        "id": f"pharmacy_load_{uuid.UUID(int=s.rng.getrandbits(128)).hex[:12]}", "name": "Jan Aushadhi Kendra",
+        "location": "Bus stand", "phone": "+91-9000000000", "coordinates": center,
+        "medicines": {name: {"stock": 100, "price": 20, "expiry": "2028-12-31"} for name in s.data["medicines"][:8]},
+    })
+
+
+async def inventory(s: Session):
+    await s.call("GET", "/api/pharmacies/{pharmacy_id}/inventory", pharmacy_id=s.pharmacy())
+
+
+async def update_inventory(s: Session):
+    await s.call("PUT", "/api/pharmacies/{pharmacy_id}/inventory/{medicine_name}", pharmacy_id=s.pharmacy(),
+                 medicine_name=s.rng.choice(s.data["medicines"]), json={"stock_delta": 5})
+
+
+async def medicine_availability(s: Session):
+    await s.call("GET", "/api/pharmacies/{pharmacy_id}/medicines/{medicine_name}", pharmacy_id=s.pharmacy(),
+                 medicine_name=s.rng.choice(s.data["medicines"]))
+
+
+async def medicine_search(s: Session):
+    await s.call("GET", "/api/medicines/search", params={"q": s.rng.choice(s.data["medicines"])[:5]})
+
+
+async def medicine_search_nearby(s: Session):
+    location = s.patient()["location"]
+    await s.call("GET", "/api/medicines/search", params={"q": s.rng.choice(s.data["medicines"])[:5],
+                                                         "lat": location["lat"], "lng": location["lng"], "max_km": 25})
+
+
+async def book_medicines(s: Session):
+    patient, pharmacy_id = s.patient(), s.pharmacy()
+    stocked = s.data["stocked"][pharmacy_id] or s.data["medicines"]
+    response = await s.call("POST", "/api/medicine-requests", json={
+        "user_id": patient["id"], "user_name": patient["name"], "user_phone": patient["phone"],
+        "pharmacy_id": pharmacy_id, "medicines": [{"name": s.rng.choice(stocked), "quantity": 1}],
+    })
+    if response.status_code == 200:
+        action = "pickup" if s.rng.random() < 0.7 else "cancel"
+        await s.call("POST", f"/api/medicine-requests/{{request_id}}/{action}", request_id=response.json()["id"])
+
+
+async def medicine_requests(s: Session):
+    await s.call("GET", "/api/medicine-requests/{user_id}", user_id=s.patient()["id"])
+
+
+async def symptom_check(s: Session):
+    await s.call("POST", "/api/symptom-check", json={
+        "user_id": s.patient()["id"], "symptoms": s.rng.sample(s.data["symptoms"], s.rng.randint(1, 3)),
+        "language": s.rng.choice(["en", "hi"]),
+    })
+
+
+async def symptom_checks(s: Session):
+    await s.call("GET", "/api/symptom-checks/{user_id}", user_id=s.patient()["id"])
+
+
+async def village_surveillance(s: Session):
+    if s.rng.random() < 0.5:
+        await s.call("GET", "/api/surveillance/villages/{village}", village=s.rng.choice(s.data["villages"])["name"])
+    else:
+        await s.call("GET", "/api/surveillance/alerts")
+
+
+async def book_consultation(s: Session):
+    when = datetime.now(timezone.utc) + timedelta(hours=s.rng.randint(1, 72))
+    await s.call("POST", "/api/consultations", json={
+        "patient_id": s.patient()["id"], "doctor_name": "Dr. Rao", "symptoms": "fever, cough",
+        "appointment_time": when.isoformat(),
+    })
+
+
+async def book_doctor_slot(s: Session):
+    language = s.rng.choice(["hi", "en", "pa"])
+    response = await s.call("GET", "/api/consultations/slots", params={"language": language, "limit": 50})
+    if response.status_code != 200 or not response.json():
+        return
+    slot = s.rng.choice(response.json())
+    response = await s.call("POST", "/api/consultations", json={
+        "patient_id": s.patient()["id"], "doctor_id": slot["doctor_id"], "symptoms": "fever, cough",
+        "appointment_time": slot["start"],
+    })
+    if response.status_code == 200 and s.rng.random() < 0.2:
+        await s.call("POST", "/api/consultations/{consultation_id}/cancel", consultation_id=response.json()["id"])
+
+
+async def consultations(s: Session):
+    await s.call("GET", "/api/consultations/{user_id}", user_id=s.patient()["id"])
+
+
+async def consultation_room(s: Session):
+    await s.call("GET", "/api/consultations/room/{room_id}", room_id=s.rng.choice(s.data["rooms"]))
+
+
+async def emergency_alert(s: Session):
+    patient = s.patient()
+    await s.call("POST", "/api/emergency-alert", json={
+        "user_id": patient["id"], "user_name": patient["name"], "user_phone": patient["phone"],
+        "location": patient["location"], "description": "Fell from a tractor",
+    })
+
+
+async def respond_to_alert(s: Session):
+    await s.call("PUT", "/api/emergency-alerts/{alert_id}/respond", alert_id=s.rng.choice(s.data["alerts"]),
+                 params={"responder_id": s.rng.choice(s.data["asha"])})
+
+
+async def emergency_alerts(s: Session):
+    await s.call("GET", "/api/emergency-alerts")
+
+
+async def asha_visit(s: Session):
+    patient = s.patient()
+    await s.call("POST", "/api/asha-visits", json={
+        "asha_id": s.rng.choice(s.data["asha"]), "patient_id": patient["id"], "patient_name": patient["name"],
+        "visit_type": "routine", "findings": "Stable", "action_taken": "Counselled on nutrition",
+        "vital_signs": {"bp": "118/78", "pulse": 70},
+    })
+
+
+async def asha_visits(s: Session):
+    await s.call("GET", "/api/asha-visits/{asha_id}", asha_id=s.rng.choice(s.data["asha"]))
+
+
+async def visit_dashboard(s: Session):
+    if s.rng.random() < 0.5:
+        await s.call("GET", "/api/dashboards/{scope}/{key}", scope="asha", key=s.rng.choice(s.data["asha"]))
+    else:
+        await s.call("GET", "/api/dashboards/{scope}/{key}", params={"days": 90}, scope="village",
+                     key=s.rng.choice(s.data["villages"])["name"])
+
+
+async def patient_asha_visits(s: Session):
+    await s.call("GET", "/api/asha-visits/patient/{patient_id}", patient_id=s.patient()["id"])
+
+
+def _ui_string(s: Session) -> str:
+    # One in five strings is new, so translation memory sees misses as well as hits
+    text = s.rng.choice(UI_STRINGS)
+    return f"{text} ({s.rng.randrange(10 ** 6)})" if s.rng.random() < 0.2 else text
+
+
+async def translate(s: Session):
+    await s.call("POST", "/api/translate", params={"text": _ui_string(s), "target_language": s.rng.choice(["hi", "pa"])})
+
+
+async def translate_batch(s: Session):
+    await s.call("POST", "/api/translate/batch", json={
+        "texts": [_ui_string(s) for _ in range(20)], "target_language": s.rng.choice(["hi", "pa", "bn"]),
+    })
+
+
+async def static_lists(s: Session):
+    await s.call("GET", s.rng.choice(["/api/languages", "/api/compact-keys"]))
+
+
+async def operational_stats(s: Session):
+    await s.call("GET", s.rng.choice([
+        "/api/ai/status", "/api/symptom-check/cache-stats", "/api/response-cache/stats",
+        "/api/notifications/stats", "/api/emergency-alerts/feed/stats", "/api/consultations/slots/stats",
+        "/api/surveillance/stats", "/api/admission/stats", "/api/write-behind/stats", "/api/health", "/api/metrics",
+    ]))
+
+
+class Operation(NamedTuple):
+    weight: float
+    run: Callable[[Session], Awaitable[None]]
+    geo: bool = False  # needs $geoNear, which the in-memory database lacks
+
+
+# Default mix: reads of one user's data dominate, as in the app
+OPERATIONS: Dict[str, Operation] = {
+    "get_user": Operation(8, get_user),
+    "list_village_users": Operation(2, list_village_users),
+    "create_user": Operation(1, create_user),
+    "update_responder_status": Operation(1, update_responder_status),
+    "health_records": Operation(10, health_records),
+    "create_health_record": Operation(3, create_health_record),
+    "delete_health_record": Operation(0.5, delete_health_record),
+    "upload_attachment": Operation(0.5, upload_attachment),
+    "sync_upload": Operation(1, sync_upload),
+    "sync_upload_stream": Operation(0.5, sync_upload_stream),
+    "sync_changes": Operation(6, sync_changes),
+    "timeline": Operation(6, timeline),
+    "pharmacies": Operation(3, pharmacies),
+    "create_pharmacy": Operation(0.2, create_pharmacy),
+    "inventory": Operation(3, inventory),
+    "update_inventory": Operation(1, update_inventory),
+    "medicine_availability": Operation(3, medicine_availability),
+    "medicine_search": Operation(2, medicine_search),
+    "medicine_search_nearby": Operation(2, medicine_search_nearby, geo=True),
+    "book_medicines": Operation(1, book_medicines),
+    "medicine_requests": Operation(4, medicine_requests),
+    "symptom_check": Operation(3, symptom_check),
+    "symptom_checks": Operation(4, symptom_checks),
+    "village_surveillance": Operation(0.5, village_surveillance),
+    "book_consultation": Operation(0.5, book_consultation),
+    "book_doctor_slot": Operation(1, book_doctor_slot),
+    "consultations": Operation(4, consultations),
+    "consultation_room": Operation(2, consultation_room),
+    "emergency_alert": Operation(0.5, emergency_alert, geo=True),
+    "respond_to_alert": Operation(0.5, respond_to_alert),
+    "emergency_alerts": Operation(3, emergency_alerts),
+    "asha_visit": Operation(2, asha_visit),
+    "asha_visits": Operation(4, asha_visits),
+    "patient_asha_visits": Operation(3, patient_asha_visits),
+    "visit_dashboard": Operation(1, visit_dashboard),
+    "translate": Operation(1, translate),
+    "translate_batch": Operation(0.5, translate_batch),
+    "static_lists": Operation(2, static_lists),
+    "operational_stats": Operation(1, operational_stats),
+}
+
+
+def parse_mix(spec: Optional[str], memory: bool) -> Dict[str, float]:
+    """Weights per operation: the defaults, overridden by a "name=weight,..." spec"""
+    weights = {name: op.weight for name, op in OPERATIONS.items()}
+    for part in filter(None, (spec or "").split(",")):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name.strip()!r}; choose from {', '.join(OPERATIONS)}")
+        weights[name.strip()] = float(weight)
+    if memory:
+        weights = {name: weight for name, weight in weights.items() if not OPERATIONS[name].geo}
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+# =============================================================================
+# RUN
+# =============================================================================
+
+def use_in_memory_database():
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("--memory needs the mongomock-motor package")
+    import motor.motor_asyncio
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    # GridFS needs a real MongoDB
+    os.environ.setdefault("ATTACHMENT_DIR", tempfile.mkdtemp(prefix="arogya_attachments_"))
+
+
+def client_address(index: int) -> str:
+    return f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+
+
+async def virtual_user(client: httpx.AsyncClient, dataset: Dict[str, Any], mix: Dict[str, float], rng: random.Random,
+                       results: Results, deadline: float, budget: Optional[List[int]], address: str = "10.0.0.1"):
+    session = Session(client, dataset, rng, results, address)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        if budget is not None:
+            if budget[0] <= 0:
+                return
+            budget[0] -= 1
+        await OPERATIONS[rng.choices(names, weights)[0]].run(session)
+
+
+async def run(args) -> Dict[str, Any]:
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("NOTIFICATION_PROVIDER", "fake")
+    # Virtual users tell the app who they are with X-Forwarded-For. They send back to back, far faster than a
+    # person, so per-client rate limits are off unless asked for; priority classes and queues still apply.
+    os.environ.setdefault("ADMISSION_TRUST_FORWARDED", "1")
+    os.environ.setdefault("ADMISSION_RATE_LIMITS", "off")
+    if args.memory:
+        use_in_memory_database()
+    # Imports the app, so only once the database client is settled
+    from benchmarks import seed
+    server = seed.server
+
+    # One log line per request would cost more than some of the routes being measured
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    fake = FakeModel(latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate, seed=args.seed)
+    server.get_generative_model = lambda model_name, system_instruction: fake
+    mix = parse_mix(args.mix, args.memory)
+
+    with Timer() as seeding:
+        dataset = await seed.seed(server.db, server.sync_sequence, args.scale, args.seed)
+    await server.app.router.startup()
+    try:
+        if not args.memory:
+            await server.ensure_indexes(server.db)
+        for name in dataset["medicines"]:
+            server.medicine_names.add(name)
+
+        results = Results()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=60) as client:
+            users = [(random.Random(f"{args.seed}:{i}"), client_address(i)) for i in range(args.concurrency)]
+            if args.warmup:
+                deadline = time.perf_counter() + args.warmup
+                await asyncio.gather(*(virtual_user(client, dataset, mix, rng, results, deadline, None, address)
+                                       for rng, address in users))
+
+            results.recording = True
+            budget = [args.requests] if args.requests else None
+            deadline = time.perf_counter() + (args.duration if not args.requests else float("inf"))
+            start = time.perf_counter()
+            await asyncio.gather(*(virtual_user(client, dataset, mix, rng, results, deadline, budget, address)
+                                   for rng, address in users))
+            elapsed = time.perf_counter() - start
+    finally:
+        await server.app.router.shutdown()
+
+    return {
+        "config": {
+            "scale": args.scale, "seed": args.seed, "concurrency": args.concurrency, "duration": args.duration,
+            "requests": args.requests, "warmup": args.warmup, "database": "memory" if args.memory else "mongodb",
+            "llm_latency": args.llm_latency, "llm_jitter": args.llm_jitter, "llm_error_rate": args.llm_error_rate,
+            "mix": mix,
+        },
+        "seeded_documents": dataset["counts"],
+        "seed_seconds": round(seeding.ms / 1000, 1),
+        "elapsed_seconds": round(elapsed, 2),
+        **results.summary(elapsed),
+        "fake_llm": {"calls": fake.calls, "peak_concurrent": fake.peak_concurrent},
+    }
+
+
+# =============================================================================
+# COMPARE
+# =============================================================================
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    """Per-route p95 and throughput changes; a route regresses when either worsens by more than threshold"""
+    rows, regressions = {}, []
+    old_routes, new_routes = baseline["results"]["routes"], current["results"]["routes"]
+    for route in sorted(set(old_routes) | set(new_routes)):
+        old, new = old_routes.get(route), new_routes.get(route)
+        if old is None or new is None:
+            rows[route] = {"only_in": "baseline" if new is None else "current"}
+            continue
+        p95_change = (new["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        rps_change = (new["rps"] - old["rps"]) / old["rps"] if old["rps"] else 0.0
+        row = {"p95_ms": [old["p95_ms"], new["p95_ms"]], "p95_change": round(p95_change, 3),
+               "rps": [old["rps"], new["rps"]], "rps_change": round(rps_change, 3),
+               "errors": [old["errors"], new["errors"]]}
+        reasons = []
+        if p95_change > threshold and new["p95_ms"] - old["p95_ms"] > MIN_P95_DELTA_MS:
+            reasons.append("p95")
+        if rps_change < -threshold:
+            reasons.append("throughput")
+        if new["errors"] / max(new["count"], 1) > old["errors"] / max(old["count"], 1) + threshold / 10:
+            reasons.append("errors")
+        if reasons:
+            row["regressed"] = reasons
+            regressions.append(route)
+        rows[route] = row
+    # Numbers from runs with a different scale, mix or concurrency are not comparable
+    same_config = baseline["results"]["config"] == current["results"]["config"]
+    return {"threshold": threshold, "same_config": same_config, "regressions": regressions, "routes": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    runner = commands.add_parser("run", help="seed, drive the API and report per route")
+    runner.add_argument("--scale", choices=["small", "medium", "large"], default="small")
+    runner.add_argument("--seed", type=int, default=0, help="random seed for the data and the request sequence")
+    runner.add_argument("--concurrency", type=int, default=50, help="virtual users")
+    runner.add_argument("--duration", type=float, default=60, help="seconds to measure for")
+    runner.add_argument("--requests", type=int, default=0, help="stop after this many operations instead")
+    runner.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before measuring")
+    runner.add_argument("--mix", help="operation weights, e.g. symptom_check=10,create_pharmacy=0")
+    runner.add_argument("--llm-latency", type=float, default=0.5, help="fake model latency in seconds")
+    runner.add_argument("--llm-jitter", type=float, default=0.1)
+    runner.add_argument("--llm-error-rate", type=float, default=0.0)
+    runner.add_argument("--memory", action="store_true", help="use mongomock-motor instead of MongoDB")
+    runner.add_argument("--out", help="also write the report to this file")
+
+    comparer = commands.add_parser("compare", help="compare two reports and fail on regressions")
+    comparer.add_argument("baseline")
+    comparer.add_argument("current")
+    comparer.add_argument("--threshold", type=float, default=0.1, help="allowed relative change, 0.1 = 10%%")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        outcome = compare(baseline, current, args.threshold)
+        report("load_compare", outcome)
+        sys.exit(1 if outcome["regressions"] else 0)
+
+    results = asyncio.run(run(args))
+    report("load", results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"benchmark": "load", "results": results}, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Seed the scratch database with realistic volumes for load tests.
+
+Run from the backend directory against a local MongoDB:
+
+    python -m benchmarks.seed [small|medium|large] [random_seed]
+
+Villages are spread over a region with patients, ASHA workers and doctors
+(with weekly working hours) living around each one; every patient gets a
+history of health records, visits, consultations, symptom checks and past
+bookings, and a share of them have raised alerts. The same scale and seed always produce the same data.
+Per-user documents are stamped for the sync feed just as the API writes them.
+"""
+import asyncio
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from benchmarks.common import Timer, report
+
+# The app under test must read and write the scratch database
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "arogya_bench")
+
+import server  # noqa: E402
+from inventory import save_line_items  # noqa: E402
+from responders import geo_point  # noqa: E402
+from scheduling import SCHEDULES  # noqa: E402
+from server import (  # noqa: E402
+    ASHAVisit, Consultation, DoctorSchedule, EmergencyAlert, HealthRecord, MedicineRequest, Pharmacy, SymptomCheck,
+    User,
+)
+
+# Counts are per village for people and places, per patient for their history
+SCALES: Dict[str, Dict[str, int]] = {
+    "small": dict(villages=20, patients=50, asha=2, doctors=1, pharmacies=1,
+                  records=4, visits=3, consultations=1, symptom_checks=2, bookings=1, alerts_per_100=5),
+    "medium": dict(villages=200, patients=100, asha=2, doctors=1, pharmacies=1,
+                   records=6, visits=4, consultations=2, symptom_checks=2, bookings=2, alerts_per_100=5),
+    "large": dict(villages=1000, patients=200, asha=3, doctors=1, pharmacies=2,
+                  records=8, visits=6, consultations=2, symptom_checks=3, bookings=2, alerts_per_100=5),
+}
+
+INSERT_BATCH = 5000
+HISTORY_DAYS = 365
+REGION = {"lat": 30.9, "lng": 75.8}
+
+MEDICINES = [
+    "paracetamol", "amoxicillin", "metformin", "aspirin", "ors", "ibuprofen", "cetirizine", "azithromycin",
+    "iron folic acid", "amlodipine", "omeprazole", "salbutamol", "zinc", "albendazole", "doxycycline",
+]
+SYMPTOMS = [
+    "fever", "cough", "headache", "body ache", "cold", "sore throat", "runny nose", "diarrhea", "vomiting",
+    "stomach pain", "rash", "fatigue", "dizziness", "joint pain", "back pain", "itching", "weakness",
+]
+RECORD_TYPES = ["vitals", "prescription", "test_result", "consultation"]
+VISIT_TYPES = ["routine", "follow_up", "routine", "emergency"]
+LANGUAGES = ["hi", "pa", "en", "bn", "mr"]
+WORKING_HOURS = {day: [["09:00", "13:00"], ["14:00", "17:00"]] for day in ("mon", "tue", "wed", "thu", "fri", "sat")}
+
+
+def _near(rng: random.Random, center: Dict[str, float], spread: float) -> Dict[str, float]:
+    return {"lat": round(center["lat"] + rng.uniform(-spread, spread), 6),
+            "lng": round(center["lng"] + rng.uniform(-spread, spread), 6)}
+
+
+def _phone(rng: random.Random) -> str:
+    return f"+91-9{rng.randrange(10 ** 9):09d}"
+
+
+def _when(rng: random.Random, now: datetime) -> datetime:
+    return now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+class _Writer:
+    """Buffers documents per collection and inserts them in large unordered batches"""
+
+    def __init__(self, db, sequence):
+        self.db = db
+        self.sequence = sequence
+        self.pending: Dict[str, List[Dict[str, Any]]] = {}
+        self.counts: Dict[str, int] = {}
+
+    async def add(self, collection: str, doc: Dict[str, Any]):
+        batch = self.pending.setdefault(collection, [])
+        batch.append(doc)
+        if len(batch) >= INSERT_BATCH:
+            await self.flush(collection)
+
+    async def flush(self, collection: str):
+        docs = self.pending.pop(collection, [])
+        if not docs:
+            return
+        if collection in server.SYNC_MODELS:
+            await self.sequence.stamp(*docs)
+        await self.db[collection].insert_many(docs, ordered=False)
+        self.counts[collection] = self.counts.get(collection, 0) + len(docs)
+
+    async def close(self):
+        for collection in list(self.pending):
+            await self.flush(collection)
+
+
+async def seed(db, sequence, scale: str = "small", random_seed: int = 0) -> Dict[str, Any]:
+    """Drop the scratch collections and fill them; returns the ids a load test needs"""
+    sizes = SCALES[scale]
+    rng = random.Random(random_seed)
+    now = datetime.now(timezone.utc)
+    for name in await db.list_collection_names():
+        await db[name].delete_many({})
+
+    writer = _Writer(db, sequence)
+    dataset: Dict[str, Any] = {"villages": [], "patients": [], "asha": [], "doctors": [], "pharmacies": [],
+                               "medicines": MEDICINES, "symptoms": SYMPTOMS, "stocked": {}, "alerts": [], "rooms": []}
+
+    for v in range(sizes["villages"]):
+        village = f"village_{v:04d}"
+        center = _near(rng, REGION, 1.5)
+        dataset["villages"].append({"name": village, "center": center})
+
+        asha_ids = []
+        for role, count in (("asha", sizes["asha"]), ("doctor", sizes["doctors"])):
+            for i in range(count):
+                location = _near(rng, center, 0.05)
+                user = User(id=_uuid(rng), name=f"{role.title()} {village} {i}", phone=_phone(rng), village=village,
+                            role=role, location=location, language=rng.choice(LANGUAGES))
+                await writer.add("users", {**user.dict(), "geo": geo_point(location)})
+                dataset["asha" if role == "asha" else "doctors"].append(user.id)
+                if role == "asha":
+                    asha_ids.append(user.id)
+                else:
+                    schedule = DoctorSchedule(doctor_id=user.id, doctor_name=user.name, weekly=WORKING_HOURS,
+                                              slot_minutes=rng.choice([15, 20, 30]),
+                                              languages=sorted({user.language, "en"}))
+                    await writer.add(SCHEDULES, schedule.dict())
+
+        pharmacy_ids = []
+        for i in range(sizes["pharmacies"]):
+            pharmacy = Pharmacy(id=f"pharmacy_{village}_{i}", name=f"{village.title()} Pharmacy {i}",
+                                location=f"Main road, {village}", phone=_phone(rng), coordinates=_near(rng, center, 0.02))
+            pharmacy_doc = {**pharmacy.dict(), "geo": geo_point(pharmacy.coordinates)}
+            await writer.add("pharmacies", pharmacy_doc)
+            stock = {name: {"stock": rng.randint(0, 500), "price": rng.randint(5, 200), "expiry": "2028-12-31"}
+                     for name in rng.sample(MEDICINES, k=rng.randint(6, len(MEDICINES)))}
+            await save_line_items(db.pharmacy_inventory, pharmacy_doc, stock)
+            writer.counts["pharmacy_inventory"] = writer.counts.get("pharmacy_inventory", 0) + len(stock)
+            pharmacy_ids.append(pharmacy.id)
+            dataset["pharmacies"].append(pharmacy.id)
+            dataset["stocked"][pharmacy.id] = [name for name, fields in stock.items() if fields["stock"] > 0]
+
+        for p in range(sizes["patients"]):
+            location = _near(rng, center, 0.05)
+            patient = User(id=_uuid(rng), name=f"Patient {village} {p}", phone=_phone(rng), village=village,
+                           language=rng.choice(LANGUAGES), location=location, emergency_contact=_phone(rng))
+            await writer.add("users", {**patient.dict(), "geo": geo_point(location)})
+            dataset["patients"].append({"id": patient.id, "name": patient.name, "phone": patient.phone,
+                                        "village": village, "location": location})
+
+            for _ in range(sizes["records"]):
+                record = HealthRecord(id=_uuid(rng), user_id=patient.id, type=rng.choice(RECORD_TYPES),
+                                      title="Home visit vitals", description="BP 120/80, pulse 72, temperature 98.6F",
+                                      doctor_name="Dr. Rao", date=_when(rng, now),
+                                      medications=[{"name": rng.choice(MEDICINES), "dose": "1-0-1", "days": 5}])
+                await writer.add("health_records", record.dict())
+            for _ in range(sizes["visits"]):
+                visit = ASHAVisit(id=_uuid(rng), asha_id=rng.choice(asha_ids), patient_id=patient.id,
+                                  patient_name=patient.name, visit_type=rng.choice(VISIT_TYPES),
+                                  findings="Stable, mild fever reported", action_taken="Advised fluids and rest",
+                                  vital_signs={"bp": "120/80", "pulse": 72, "temp_f": 98.6}, created_at=_when(rng, now))
+                await writer.add("asha_visits", visit.dict())
+            for _ in range(sizes["consultations"]):
+                consultation = Consultation(id=_uuid(rng), patient_id=patient.id, doctor_name="Dr. Rao",
+                                            symptoms=", ".join(rng.sample(SYMPTOMS, 2)), status="completed",
+                                            appointment_time=_when(rng, now), room_id=f"room_{rng.getrandbits(32):08x}")
+                await writer.add("consultations", consultation.dict())
+                dataset["rooms"].append(consultation.room_id)
+            for _ in range(sizes["symptom_checks"]):
+                check = SymptomCheck(id=_uuid(rng), user_id=patient.id, symptoms=rng.sample(SYMPTOMS, 2),
+                                     assessment="Likely a common viral infection.", severity="low",
+                                     recommendations=["Rest and drink fluids"], created_at=_when(rng, now))
+                await writer.add("symptom_checks", check.dict())
+            for _ in range(sizes["bookings"]):
+                booked = _when(rng, now)
+                booking = MedicineRequest(id=_uuid(rng), user_id=patient.id, user_name=patient.name,
+                                          user_phone=patient.phone, pharmacy_id=rng.choice(pharmacy_ids),
+                                          medicines=[{"name": rng.choice(MEDICINES), "quantity": rng.randint(1, 3)}],
+                                          status="completed", booking_date=booked, pickup_date=booked + timedelta(hours=5))
+                await writer.add("medicine_requests", booking.dict())
+            if rng.randrange(100) < sizes["alerts_per_100"]:
+                alert = EmergencyAlert(id=_uuid(rng), user_id=patient.id, user_name=patient.name,
+                                       user_phone=patient.phone, location=location, created_at=_when(rng, now),
+                                       status=rng.choice(["active", "responded", "resolved"]))
+                await writer.add("emergency_alerts", {**alert.dict(), "village": village})
+                dataset["alerts"].append(alert.id)
+
+    await writer.close()
+    dataset["counts"] = writer.counts
+    return dataset
+
+
+async def main():
+    scale = sys.argv[1] if len(sys.argv) > 1 else "small"
+    random_seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    with Timer() as t:
+        dataset = await seed(server.db, server.sync_sequence, scale, random_seed)
+    report("seed", {"scale": scale, "random_seed": random_seed, "seconds": round(t.ms / 1000, 1),
+                    "documents": dataset["counts"]})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
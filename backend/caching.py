@@ -0,0 +1,135 @@
+"""In-process LRU caches, optionally backed by a shared Mongo collection."""
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from pymongo import ReplaceOne
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Size-bounded LRU with an optional per-entry time to live"""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING or (entry[1] is not None and entry[1] < time.monotonic()):
+            if entry is not _MISSING:
+                del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class TwoTierCache:
+    """An in-process LRU in front of a Mongo collection shared by every worker.
+
+    Entries are stored as {_id: key, value, created_at}; with ttl_seconds set,
+    a TTL index on created_at lets Mongo expire them.
+    """
+
+    def __init__(self, collection, maxsize: int, ttl_seconds: Optional[int] = None):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(maxsize, ttl=ttl_seconds)
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def ensure_indexes(self) -> None:
+        if self.ttl_seconds:
+            await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+
+    async def get(self, key: str) -> Any:
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        doc = await self.collection.find_one({"_id": key}, {"value": 1})
+        if doc is None:
+            self.misses += 1
+            return None
+        self.shared_hits += 1
+        self.local.set(key, doc["value"])
+        return doc["value"]
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Look up many keys with at most one round trip for the local misses"""
+        found = {}
+        remote = []
+        for key in keys:
+            value = self.local.get(key, _MISSING)
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        if remote:
+            async for doc in self.collection.find({"_id": {"$in": remote}}, {"value": 1}):
+                found[doc["_id"]] = doc["value"]
+                self.local.set(doc["_id"], doc["value"])
+                self.shared_hits += 1
+            self.misses += sum(1 for key in remote if key not in found)
+        return found
+
+    async def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+        await self.collection.replace_one(
+            {"_id": key},
+            {"value": value, "created_at": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+
+    async def set_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        now = datetime.now(timezone.utc)
+        for key, value in items.items():
+            self.local.set(key, value)
+        await self.collection.bulk_write(
+            [ReplaceOne({"_id": key}, {"value": value, "created_at": now}, upsert=True) for key, value in items.items()],
+            ordered=False,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        local = self.local.stats()
+        lookups = local["hits"] + self.shared_hits + self.misses
+        return {
+            "local": local,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((local["hits"] + self.shared_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,147 @@
+"""Negotiated brotli/gzip compression of API responses.
+
+Picks the best encoding the client accepts (brotli when the package is
+installed, else gzip) for JSON, NDJSON and text bodies of at least
+minimum_size bytes. Streamed bodies are compressed chunk by chunk and flushed
+after every chunk, so NDJSON lines still reach the client as they are read.
+"""
+import zlib
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Coding -> q-value from an Accept-Encoding header"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """The supported coding with the highest q-value; brotli wins ties"""
+    accepted = accepted_encodings(accept_encoding)
+    best, best_q = None, 0.0
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._gzip = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress data and flush it so the client can decode everything sent so far"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._gzip.compress(data) + self._gzip.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._gzip.compress(data) + self._gzip.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses for clients that send Accept-Encoding"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 512, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self).send)
+
+
+class _CompressingSend:
+    def __init__(self, send: Send, encoding: str, options: CompressionMiddleware):
+        self._send = send
+        self.encoding = encoding
+        self.options = options
+        self.start: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+
+    def _decide(self, body: bytes, more_body: bool) -> Tuple[bool, MutableHeaders]:
+        headers = MutableHeaders(raw=self.start["headers"])
+        content_type = headers.get("content-type", "")
+        if not content_type.startswith(COMPRESSIBLE_TYPES) or "content-encoding" in headers:
+            return False, headers
+        # Byte ranges index the identity body; encoding it would shift every offset
+        if "accept-ranges" in headers or "content-range" in headers:
+            return False, headers
+        headers.add_vary_header("Accept-Encoding")
+        if self.start["status"] < 200 or self.start["status"] in (204, 304):
+            return False, headers
+        return more_body or len(body) >= self.options.minimum_size, headers
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk shows whether it is worth compressing
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.start is not None:
+            compress, headers = self._decide(body, more_body)
+            if compress:
+                self.compressor = _Compressor(self.encoding, self.options.gzip_level, self.options.brotli_quality)
+                headers["content-encoding"] = self.encoding
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # Same representation, different bytes: the ETag can only be weak
+                    headers["etag"] = "W/" + etag
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = self.compressor.finish(body)
+                    headers["content-length"] = str(len(body))
+                    self.compressor = None
+                else:
+                    body = self.compressor.chunk(body)
+            await self._send(self.start)
+            self.start = None
+            await self._send({**message, "body": body})
+            return
+
+        if self.compressor is not None:
+            body = self.compressor.chunk(body) if more_body else self.compressor.finish(body)
+        await self._send({**message, "body": body})
@@ -0,0 +1,191 @@
+"""Declared indexes for every query pattern the API serves, and a COLLSCAN audit."""
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel
+
+from attachments import ATTACHMENTS, BLOBS, PARTS, THUMBNAILS, UPLOADS
+from inventory import INVENTORY
+from notifications import OUTBOX
+from rollups import FOLLOWUPS, ROLLUPS
+from scheduling import SCHEDULES
+from surveillance import ALERTS
+from sync import SYNC_COLLECTIONS, TOMBSTONES
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: List[Tuple[str, int]]
+    options: Optional[Dict[str, Any]] = None
+
+
+class QueryShape(NamedTuple):
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("users", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("users", [("role", ASCENDING), ("village", ASCENDING), ("id", ASCENDING)]),
+    IndexSpec("users", [("village", ASCENDING), ("id", ASCENDING)]),
+    # Emergency alerts look up the nearest responders with $geoNear on the GeoJSON point
+    IndexSpec("users", [("geo", GEOSPHERE), ("role", ASCENDING)]),
+    IndexSpec("health_records", [("user_id", ASCENDING), ("date", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("health_records", [("id", ASCENDING)]),
+    # Unique offline_id makes concurrent sync uploads of the same record idempotent
+    IndexSpec("health_records", [("offline_id", ASCENDING)],
+              {"unique": True, "partialFilterExpression": {"offline_id": {"$type": "string"}}}),
+    IndexSpec("pharmacies", [("id", ASCENDING)], {"unique": True}),
+    # One line item per (pharmacy, medicine); the id is "<pharmacy_id>:<medicine_name>"
+    IndexSpec(INVENTORY, [("id", ASCENDING)], {"unique": True}),
+    IndexSpec(INVENTORY, [("pharmacy_id", ASCENDING), ("medicine_name", ASCENDING), ("id", ASCENDING)]),
+    IndexSpec(INVENTORY, [("medicine_name", ASCENDING), ("stock", DESCENDING), ("expiry", ASCENDING)]),
+    IndexSpec(INVENTORY, [("geo", GEOSPHERE), ("medicine_name", ASCENDING), ("stock", ASCENDING)]),
+    # The reservation sweeper looks for holds whose pickup window has passed
+    IndexSpec(INVENTORY, [("holds.expires_at", ASCENDING)], {"sparse": True}),
+    IndexSpec("medicine_requests", [("user_id", ASCENDING), ("booking_date", DESCENDING), ("id", DESCENDING)]),
+    # Pickups, cancellations and the reservation sweeper close bookings by id
+    IndexSpec("medicine_requests", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("symptom_checks", [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    # The outbreak detector replays the checks after its last checkpoint
+    IndexSpec("symptom_checks", [("created_at", ASCENDING)]),
+    IndexSpec(ALERTS, [("id", ASCENDING)], {"unique": True}),
+    IndexSpec(ALERTS, [("status", ASCENDING), ("opened_at", DESCENDING)]),
+    IndexSpec(ALERTS, [("village", ASCENDING), ("status", ASCENDING), ("opened_at", DESCENDING)]),
+    IndexSpec("consultations", [("patient_id", ASCENDING), ("appointment_time", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("consultations", [("room_id", ASCENDING)]),
+    IndexSpec("consultations", [("id", ASCENDING)]),
+    # At most one active booking per doctor and slot; cancelling clears slot_active and frees it
+    IndexSpec("consultations", [("doctor_id", ASCENDING), ("appointment_time", ASCENDING)],
+              {"unique": True, "partialFilterExpression": {"slot_active": True}}),
+    # Slot index refreshes read consultations stamped since the last refresh
+    IndexSpec("consultations", [("sync_ts", ASCENDING)]),
+    IndexSpec(SCHEDULES, [("doctor_id", ASCENDING)], {"unique": True}),
+    IndexSpec(SCHEDULES, [("updated_at", ASCENDING)]),
+    IndexSpec("emergency_alerts", [("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("emergency_alerts", [("id", ASCENDING)]),
+    # Attachments: upload sessions and their parts, one blob per content hash, one attachment per owner and hash
+    IndexSpec(UPLOADS, [("id", ASCENDING)], {"unique": True}),
+    IndexSpec(UPLOADS, [("expires_at", ASCENDING)]),
+    IndexSpec(PARTS, [("upload_id", ASCENDING), ("offset", ASCENDING)], {"unique": True}),
+    IndexSpec(BLOBS, [("sha256", ASCENDING)], {"unique": True}),
+    IndexSpec(ATTACHMENTS, [("id", ASCENDING)], {"unique": True}),
+    IndexSpec(ATTACHMENTS, [("owner_id", ASCENDING), ("sha256", ASCENDING)], {"unique": True}),
+    IndexSpec(THUMBNAILS, [("sha256", ASCENDING), ("size", ASCENDING)], {"unique": True}),
+    IndexSpec("asha_visits", [("asha_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("asha_visits", [("patient_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    # Rollup rebuilds read visits in day slices
+    IndexSpec("asha_visits", [("created_at", ASCENDING)]),
+    # Dashboards read a run of daily buckets; overdue follow-ups are a due_at range per worker or village
+    IndexSpec(ROLLUPS, [("scope", ASCENDING), ("key", ASCENDING), ("day", ASCENDING)]),
+    IndexSpec(FOLLOWUPS, [("asha_id", ASCENDING), ("due_at", ASCENDING)]),
+    IndexSpec(FOLLOWUPS, [("village", ASCENDING), ("due_at", ASCENDING)]),
+    # The change feed reads each per-user collection by owner in sequence order
+    *[
+        IndexSpec(collection, [(owner, ASCENDING), ("sync_seq", ASCENDING)])
+        for collection, owners in SYNC_COLLECTIONS.items()
+        for owner in owners
+    ],
+    IndexSpec(TOMBSTONES, [("owners", ASCENDING), ("sync_seq", ASCENDING)]),
+    # Dispatchers claim due messages most urgent first, and take over expired leases
+    IndexSpec(OUTBOX, [("status", ASCENDING), ("priority", ASCENDING), ("available_at", ASCENDING)]),
+    IndexSpec(OUTBOX, [("status", ASCENDING), ("available_at", ASCENDING)]),
+    IndexSpec(OUTBOX, [("status", ASCENDING), ("lease_until", ASCENDING)]),
+    IndexSpec(OUTBOX, [("lease_owner", ASCENDING)]),
+    # Delivered messages are kept for 30 days
+    IndexSpec(OUTBOX, [("sent_at", ASCENDING)], {"expireAfterSeconds": 30 * 24 * 3600}),
+]
+
+# One representative query per endpoint, checked against its plan in debug mode
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("get_user", "users", {"id": "x"}),
+    QueryShape("get_users_by_role", "users", {"role": "asha"}),
+    QueryShape("get_users_by_village", "users", {"village": "x"}),
+    QueryShape("get_users_by_role_and_village", "users", {"role": "asha", "village": "x"}),
+    QueryShape("notify_emergency_responders", "users",
+               {"geo": {"$nearSphere": {"$geometry": {"type": "Point", "coordinates": [73.85, 18.52]}, "$maxDistance": 2000}},
+                "role": {"$in": ["asha", "doctor"]}}),
+    QueryShape("get_user_health_records", "health_records", {"user_id": "x"}, [("date", DESCENDING)]),
+    QueryShape("sync_offline_records", "health_records", {"offline_id": {"$in": ["x"]}}),
+    QueryShape("check_medicine_availability", INVENTORY, {"id": "x:paracetamol"}),
+    QueryShape("get_pharmacy_inventory", INVENTORY, {"pharmacy_id": "x"}, [("medicine_name", ASCENDING)]),
+    QueryShape("search_medicines", INVENTORY,
+               {"medicine_name": {"$in": ["paracetamol"]}, "stock": {"$gt": 0}, "expiry": {"$gte": "2026-01-01"}},
+               [("medicine_name", ASCENDING), ("stock", DESCENDING)]),
+    QueryShape("get_user_medicine_requests", "medicine_requests", {"user_id": "x"}, [("booking_date", DESCENDING)]),
+    QueryShape("close_booking", "medicine_requests", {"id": "x", "status": "reserved", "reserved_until": {"$gt": 0}}),
+    QueryShape("sweep_expired_bookings", "medicine_requests", {"id": {"$in": ["x"]}, "status": "reserved"}),
+    QueryShape("get_user_symptom_checks", "symptom_checks", {"user_id": "x"}, [("created_at", DESCENDING)]),
+    QueryShape("replay_symptom_checks", "symptom_checks", {"created_at": {"$gt": 0, "$lt": 1}},
+               [("created_at", ASCENDING)]),
+    QueryShape("get_outbreak_alerts", ALERTS, {"status": "open"}, [("opened_at", DESCENDING)]),
+    QueryShape("get_village_outbreak_alerts", ALERTS, {"village": "x", "status": "open"}, [("opened_at", DESCENDING)]),
+    QueryShape("get_user_consultations", "consultations", {"patient_id": "x"}, [("appointment_time", DESCENDING)]),
+    QueryShape("get_consultation_room", "consultations", {"room_id": "x"}),
+    QueryShape("cancel_consultation", "consultations", {"id": "x", "status": "scheduled"}),
+    QueryShape("refresh_slot_index", "consultations", {"sync_ts": {"$gte": 0}, "doctor_id": {"$type": "string"}}),
+    QueryShape("get_working_hours", SCHEDULES, {"doctor_id": "x"}),
+    QueryShape("get_attachment", ATTACHMENTS, {"id": "x"}),
+    QueryShape("get_attachment_upload", UPLOADS, {"id": "x"}),
+    QueryShape("read_upload_parts", PARTS, {"upload_id": "x"}, [("offset", ASCENDING)]),
+    QueryShape("find_attachment_blob", BLOBS, {"sha256": "x"}),
+    QueryShape("get_thumbnail", THUMBNAILS, {"sha256": "x", "size": 256}),
+    QueryShape("sweep_attachment_uploads", UPLOADS, {"expires_at": {"$lt": 0}}),
+    QueryShape("get_emergency_alerts", "emergency_alerts", {"status": "active"}, [("created_at", DESCENDING)]),
+    QueryShape("respond_to_emergency", "emergency_alerts", {"id": "x"}),
+    QueryShape("get_asha_visits", "asha_visits", {"asha_id": "x"}, [("created_at", DESCENDING)]),
+    QueryShape("get_patient_asha_visits", "asha_visits", {"patient_id": "x"}, [("created_at", DESCENDING)]),
+    QueryShape("get_visit_dashboard", ROLLUPS, {"scope": "asha", "key": "x", "day": {"$gte": "2025-01-01"}}),
+    QueryShape("get_overdue_followups", FOLLOWUPS, {"asha_id": "x", "due_at": {"$lt": 0}}, [("due_at", ASCENDING)]),
+    QueryShape("get_sync_changes", "health_records", {"$or": [{"user_id": "x"}], "sync_seq": {"$gt": 0}}, [("sync_seq", ASCENDING)]),
+    QueryShape("claim_notifications", OUTBOX, {"status": "pending", "available_at": {"$lte": 0}},
+               [("priority", ASCENDING), ("available_at", ASCENDING)]),
+]
+
+
+async def ensure_indexes(db, specs: List[IndexSpec] = INDEXES) -> Dict[str, List[str]]:
+    """Create every declared index; existing ones are a no-op. Returns created index names per collection"""
+    by_collection: Dict[str, List[IndexModel]] = {}
+    for spec in specs:
+        by_collection.setdefault(spec.collection, []).append(IndexModel(spec.keys, **(spec.options or {})))
+
+    created = {}
+    for collection, models in by_collection.items():
+        try:
+            created[collection] = await db[collection].create_indexes(models)
+        except Exception as e:
+            # One conflicting definition should not keep the other collections unindexed
+            logger.error(f"Error creating indexes on {collection}: {e}")
+    return created
+
+
+async def audit_query_plans(db, shapes: List[QueryShape] = QUERY_SHAPES) -> List[str]:
+    """Explain each query shape and return the names of those whose winning plan is a COLLSCAN"""
+    collscans = []
+    for shape in shapes:
+        command: Dict[str, Any] = {"find": shape.collection, "filter": shape.filter}
+        if shape.sort:
+            command["sort"] = dict(shape.sort)
+        try:
+            explained = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        except Exception as e:
+            logger.error(f"Error explaining {shape.name}: {e}")
+            continue
+        if "COLLSCAN" in _plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {})):
+            collscans.append(shape.name)
+            logger.warning(f"Query {shape.name} on {shape.collection} falls back to COLLSCAN: {shape.filter}")
+    return collscans
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
@@ -0,0 +1,157 @@
+"""Pharmacy stock as (pharmacy_id, medicine_name) line items, and medicine name search."""
+import bisect
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from pymongo import UpdateOne
+
+from responders import geo_point
+from text_match import FuzzyIndex, normalize_text
+
+INVENTORY = "pharmacy_inventory"
+# Line items without an expiry date never expire; ISO dates compare correctly as strings
+NO_EXPIRY = "9999-12-31"
+
+
+def medicine_key(name: str) -> str:
+    return normalize_text(name)
+
+
+def inventory_id(pharmacy_id: str, medicine_name: str) -> str:
+    return f"{pharmacy_id}:{medicine_key(medicine_name)}"
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def in_stock(as_of: Optional[str] = None) -> Dict[str, Any]:
+    """Filter for line items that can be sold today"""
+    return {"stock": {"$gt": 0}, "expiry": {"$gte": as_of or today()}}
+
+
+def line_item(pharmacy: Dict[str, Any], medicine_name: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Inventory document for one medicine, carrying the pharmacy name and location it is searched by"""
+    item = {
+        "id": inventory_id(pharmacy["id"], medicine_name),
+        "pharmacy_id": pharmacy["id"],
+        "pharmacy_name": pharmacy.get("name", ""),
+        "medicine_name": medicine_key(medicine_name),
+        "stock": int(fields.get("stock", 0)),
+        "price": fields.get("price"),
+        "expiry": fields.get("expiry") or NO_EXPIRY,
+        "updated_at": datetime.now(timezone.utc),
+    }
+    point = geo_point(pharmacy.get("coordinates"))
+    if point:
+        item["geo"] = point
+    return item
+
+
+async def save_line_items(collection, pharmacy: Dict[str, Any], medicines: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Upsert one line item per medicine of a pharmacy's nested stock dict"""
+    items = [line_item(pharmacy, name, fields) for name, fields in medicines.items()]
+    if items:
+        await collection.bulk_write(
+            [UpdateOne({"id": item["id"]}, {"$set": item}, upsert=True) for item in items], ordered=False
+        )
+    return items
+
+
+async def add_missing_line_items(collection, pharmacy: Dict[str, Any], medicines: Dict[str, Dict[str, Any]]) -> None:
+    """Insert line items a pharmacy does not stock yet, leaving the stock of the ones it has alone"""
+    items = [line_item(pharmacy, name, fields) for name, fields in medicines.items()]
+    if items:
+        await collection.bulk_write(
+            [UpdateOne({"id": item["id"]}, {"$setOnInsert": item}, upsert=True) for item in items], ordered=False
+        )
+
+
+async def migrate_nested_inventory(db, batch_size: int = 100) -> int:
+    """Move stock still stored as a nested medicines dict on pharmacy documents into line items"""
+    migrated = 0
+    async for pharmacy in db.pharmacies.find({"medicines": {"$exists": True}}).batch_size(batch_size):
+        items = await save_line_items(db[INVENTORY], pharmacy, pharmacy.get("medicines") or {})
+        await db.pharmacies.update_one({"id": pharmacy["id"]}, {"$unset": {"medicines": ""}})
+        migrated += len(items)
+    return migrated
+
+
+class MedicineNameIndex:
+    """In-memory lookup from what a user typed to known medicine names.
+
+    Names starting with the query come first, then names where every query
+    word starts a word of the name. Only when both find nothing are query
+    words matched by edit distance. Names are only ever added, so the index
+    is maintained incrementally as stock is written.
+    """
+
+    def __init__(self, names: Iterable[str] = (), max_distance: int = 2):
+        self._names: List[str] = []
+        self._words: List[str] = []
+        self._names_by_word: Dict[str, Set[str]] = {}
+        self._fuzzy = FuzzyIndex((), max_distance=max_distance)
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str) -> None:
+        name = medicine_key(name)
+        position = bisect.bisect_left(self._names, name)
+        if not name or (position < len(self._names) and self._names[position] == name):
+            return
+        self._names.insert(position, name)
+        for word in name.split():
+            if word not in self._names_by_word:
+                self._names_by_word[word] = set()
+                bisect.insort(self._words, word)
+                self._fuzzy.add(word)
+            self._names_by_word[word].add(name)
+
+    def _prefixed(self, ordered: List[str], prefix: str) -> Iterable[str]:
+        for i in range(bisect.bisect_left(ordered, prefix), len(ordered)):
+            if not ordered[i].startswith(prefix):
+                break
+            yield ordered[i]
+
+    def _word_names(self, word: str, fuzzy: bool) -> Set[str]:
+        names: Set[str] = set()
+        for known in self._prefixed(self._words, word):
+            names |= self._names_by_word[known]
+        if not names and fuzzy and len(word) >= 4 and word.isalpha():
+            # Short words tolerate one typo, longer ones two
+            for _, known in self._fuzzy.matches(word, 1 if len(word) < 6 else 2):
+                names |= self._names_by_word[known]
+        return names
+
+    def lookup(self, query: str, limit: int = 50) -> List[str]:
+        query = medicine_key(query)
+        if not query:
+            return []
+        found = list(self._prefixed(self._names, query))
+        words = query.split()
+        # Every query word must match a word of the name, by prefix or else by edit distance
+        matched = set.intersection(*(self._word_names(word, fuzzy=False) for word in words))
+        if not matched and not found:
+            matched = set.intersection(*(self._word_names(word, fuzzy=True) for word in words))
+        return (found + sorted(matched.difference(found)))[:limit]
+
+
+async def search_inventory(collection, names: List[str], location: Optional[Dict[str, float]], limit: int,
+                           max_distance_m: Optional[float] = None) -> List[Dict[str, Any]]:
+    """In-stock, unexpired line items for the given names, nearest pharmacy first when a location is given"""
+    if not names:
+        return []
+    query = {"medicine_name": {"$in": names}, **in_stock()}
+    point = geo_point(location)
+    if point is None:
+        cursor = collection.find(query, {"_id": 0}).sort([("medicine_name", 1), ("stock", -1)]).limit(limit)
+        return await cursor.to_list(limit)
+
+    near = {"near": point, "key": "geo", "distanceField": "distance_m", "spherical": True, "query": query}
+    if max_distance_m:
+        near["maxDistance"] = max_distance_m
+    pipeline = [{"$geoNear": near}, {"$limit": limit}, {"$project": {"_id": 0, "geo": 0}}]
+    return await collection.aggregate(pipeline).to_list(limit)
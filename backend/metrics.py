@@ -0,0 +1,253 @@
+"""Request, MongoDB and AI call instrumentation, exported in Prometheus text format.
+
+MetricsMiddleware times every HTTP request and records its payload sizes
+per route template. While a request runs, a RequestStats object sits in a
+context variable; Motor copies the context into its worker threads, so
+MongoCommandListener can add each command's time to the request that issued
+it, and ai_span does the same for model calls. Each response carries the
+split as a Server-Timing header and as per-route histograms.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+INF = 'le="+Inf"'
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> ([count per bucket], sum, count)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, INF)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_duration = registry.histogram("http_request_duration_seconds", "Time to the last response byte", ("method", "route"))
+http_request_size = registry.histogram("http_request_size_bytes", "Request body size", ("method", "route"), SIZE_BUCKETS)
+http_response_size = registry.histogram("http_response_size_bytes", "Response body size as sent", ("method", "route"), SIZE_BUCKETS)
+http_mongo_time = registry.histogram("http_request_mongo_seconds", "MongoDB time spent per request", ("method", "route"))
+http_ai_time = registry.histogram("http_request_ai_seconds", "AI model time spent per request", ("method", "route"))
+mongo_duration = registry.histogram("mongodb_command_duration_seconds", "MongoDB command round trips",
+                                    ("collection", "command"), MONGO_BUCKETS)
+mongo_failures = registry.counter("mongodb_command_failures_total", "Failed MongoDB commands", ("collection", "command"))
+ai_duration = registry.histogram("ai_call_duration_seconds", "AI model calls", ("operation", "outcome"))
+
+
+class RequestStats:
+    """Where one request's time went; updated from Motor's threads"""
+
+    __slots__ = ("mongo_seconds", "mongo_commands", "ai_seconds", "lock")
+
+    def __init__(self):
+        self.mongo_seconds = 0.0
+        self.mongo_commands = 0
+        self.ai_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add_mongo(self, seconds: float) -> None:
+        with self.lock:
+            self.mongo_seconds += seconds
+            self.mongo_commands += 1
+
+    def add_ai(self, seconds: float) -> None:
+        with self.lock:
+            self.ai_seconds += seconds
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every command per collection and charges it to the request that issued it"""
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[int, object], Tuple[str, Optional[RequestStats]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _collection(event: monitoring.CommandStartedEvent) -> str:
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        return target if isinstance(target, str) else "-"
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        with self._lock:
+            self._inflight[(event.request_id, event.connection_id)] = (self._collection(event), current_request.get())
+
+    def _finish(self, event, failed: bool) -> None:
+        with self._lock:
+            collection, stats = self._inflight.pop((event.request_id, event.connection_id), ("-", None))
+        seconds = event.duration_micros / 1_000_000
+        mongo_duration.observe(seconds, collection, event.command_name)
+        if failed:
+            mongo_failures.inc(collection, event.command_name)
+        if stats is not None:
+            stats.add_mongo(seconds)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, failed=True)
+
+
+@contextmanager
+def ai_span(operation: str) -> Iterator[None]:
+    """Time an AI model call and charge it to the current request"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        seconds = time.perf_counter() - start
+        ai_duration.observe(seconds, operation, outcome)
+        stats = current_request.get()
+        if stats is not None:
+            stats.add_ai(seconds)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, payload sizes and the Mongo/AI split per route"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status, sizes = "500", {"request": 0, "response": 0}
+
+        async def counting_receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def timing_send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                MutableHeaders(raw=message["headers"]).append("server-timing", (
+                    f'mongo;dur={stats.mongo_seconds * 1000:.1f};desc="{stats.mongo_commands} commands", '
+                    f"ai;dur={stats.ai_seconds * 1000:.1f}, app;dur={elapsed_ms:.1f}"
+                ))
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, timing_send)
+        finally:
+            current_request.reset(token)
+            route = scope.get("route")
+            # Route templates, not raw paths, so per-user URLs do not each become a series
+            labels = (scope["method"], getattr(route, "path", "unmatched"))
+            http_requests.inc(*labels, status)
+            http_duration.observe(time.perf_counter() - start, *labels)
+            http_request_size.observe(sizes["request"], *labels)
+            http_response_size.observe(sizes["response"], *labels)
+            http_mongo_time.observe(stats.mongo_seconds, *labels)
+            http_ai_time.observe(stats.ai_seconds, *labels)
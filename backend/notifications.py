@@ -0,0 +1,335 @@
+"""Durable notification outbox in Mongo and the async dispatcher that drains it."""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from pymongo import UpdateMany, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+OUTBOX = "notification_outbox"
+
+# Lower numbers are claimed first
+EMERGENCY = 0
+ROUTINE = 10
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def _utc(value: datetime) -> datetime:
+    # Motor returns naive datetimes unless the client is tz_aware; they are UTC either way
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class TokenBucket:
+    """Allows rate operations per second on average, with bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class NotificationProvider(ABC):
+    """Delivers one message on a channel; send() raises to ask for a retry"""
+
+    name = "base"
+    rate_per_second = 10.0
+    burst = 10
+
+    @abstractmethod
+    async def send(self, message: Dict[str, Any]) -> None:
+        ...
+
+
+class LogProvider(NotificationProvider):
+    """Writes messages to the log instead of delivering them; the default until a gateway is configured"""
+
+    name = "log"
+    rate_per_second = 100.0
+    burst = 100
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        logger.info(f"{message['channel'].upper()} to {message['to']}: {message['body']}")
+
+
+class FakeProvider(NotificationProvider):
+    """Records deliveries in memory, with optional latency and random failures, for tests and benchmarks"""
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, rate_per_second: float = 1000.0,
+                 burst: int = 1000, seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.sent: List[Dict[str, Any]] = []
+        self._random = random.Random(seed)
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            raise ConnectionError("fake provider failure")
+        self.sent.append(message)
+
+
+class Outbox:
+    """Messages waiting for delivery, claimed by dispatchers under a time-limited lease.
+
+    Documents look like {_id, channel, to, body, priority, status, attempts,
+    available_at, lease_owner, lease_until, created_at, sent_at, last_error}.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def _message(self, channel: str, to: str, body: str, priority: int, now: datetime) -> Dict[str, Any]:
+        return {
+            "_id": str(uuid.uuid4()),
+            "channel": channel,
+            "to": to,
+            "body": body,
+            "priority": priority,
+            "status": PENDING,
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now,
+        }
+
+    async def enqueue(self, channel: str, to: str, body: str, priority: int = ROUTINE) -> str:
+        message = self._message(channel, to, body, priority, datetime.now(timezone.utc))
+        await self.collection.insert_one(message)
+        return message["_id"]
+
+    async def enqueue_many(self, messages: List[Tuple[str, str, str, int]]) -> List[str]:
+        """Queue (channel, to, body, priority) tuples with one insert"""
+        now = datetime.now(timezone.utc)
+        docs = [self._message(channel, to, body, priority, now) for channel, to, body, priority in messages]
+        if docs:
+            await self.collection.insert_many(docs, ordered=False)
+        return [doc["_id"] for doc in docs]
+
+    async def claim(self, batch_size: int, lease_seconds: float,
+                    max_attempts: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Lease up to batch_size due messages, most urgent first.
+
+        Messages still marked sending after their lease ran out belong to a
+        dispatcher that died or hung mid-batch and are claimable again. The
+        lost lease counts as an attempt, so a message that takes down every
+        dispatcher sending it fails after max_attempts like any other.
+        """
+        now = datetime.now(timezone.utc)
+        due = {"status": PENDING, "available_at": {"$lte": now}}
+        expired = {"status": SENDING, "lease_until": {"$lte": now}}
+        if max_attempts is not None:
+            abandoned = await self.collection.update_many(
+                {**expired, "attempts": {"$gte": max_attempts - 1}},
+                {"$set": {"status": FAILED, "last_error": "lease expired before the send finished"},
+                 "$inc": {"attempts": 1}, "$unset": {"lease_owner": "", "lease_until": ""}},
+            )
+            if abandoned.modified_count:
+                logger.warning(f"Gave up on {abandoned.modified_count} notifications whose leases kept expiring")
+        candidates = await self.collection.find({"$or": [due, expired]}, {"_id": 1}).sort(
+            [("priority", 1), ("available_at", 1)]
+        ).limit(batch_size).to_list(batch_size)
+        if not candidates:
+            return []
+
+        # Another dispatcher may take some candidates first; the lease owner tells us which ones we got
+        lease_owner = str(uuid.uuid4())
+        ids = {"_id": {"$in": [doc["_id"] for doc in candidates]}}
+        lease = {"status": SENDING, "lease_owner": lease_owner, "lease_until": now + timedelta(seconds=lease_seconds)}
+        # Expired leases first: once leased, a due message is no longer pending and cannot match twice
+        await self.collection.update_many({"$and": [ids, expired]}, {"$set": lease, "$inc": {"attempts": 1}})
+        await self.collection.update_many({"$and": [ids, due]}, {"$set": lease})
+        claimed = await self.collection.find({"lease_owner": lease_owner, "status": SENDING}).to_list(batch_size)
+        return sorted(claimed, key=lambda doc: (doc["priority"], doc["available_at"]))
+
+    async def settle(self, sent: List[Dict[str, Any]],
+                     retries: List[Tuple[Dict[str, Any], str, Optional[float]]]) -> None:
+        """Mark sent messages delivered and reschedule (message, error, delay) retries; a None delay gives up.
+
+        Every update is conditional on the lease we claimed with: a message
+        whose lease ran out may already be leased, or even sent, by another
+        dispatcher, and its outcome is theirs to record.
+        """
+        now = datetime.now(timezone.utc)
+        sent_by_owner: Dict[str, List[Any]] = {}
+        for message in sent:
+            sent_by_owner.setdefault(message["lease_owner"], []).append(message["_id"])
+        operations = [UpdateMany(
+            {"_id": {"$in": ids}, "status": SENDING, "lease_owner": lease_owner},
+            {"$set": {"status": SENT, "sent_at": now}, "$unset": {"lease_owner": "", "lease_until": ""}},
+        ) for lease_owner, ids in sent_by_owner.items()]
+        for message, error, delay in retries:
+            fields = {"last_error": error, "attempts": message["attempts"] + 1}
+            if delay is None:
+                fields["status"] = FAILED
+            else:
+                fields.update(status=PENDING, available_at=now + timedelta(seconds=delay))
+            operations.append(UpdateOne(
+                {"_id": message["_id"], "lease_owner": message["lease_owner"]},
+                {"$set": fields, "$unset": {"lease_owner": "", "lease_until": ""}},
+            ))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def stats(self) -> Dict[str, Any]:
+        statuses = (PENDING, SENDING, SENT, FAILED)
+        counts = await asyncio.gather(*(self.collection.count_documents({"status": status}) for status in statuses))
+        now = datetime.now(timezone.utc)
+        oldest = await self.collection.find(
+            {"status": PENDING, "available_at": {"$lte": now}}, {"available_at": 1}
+        ).sort("available_at", 1).limit(1).to_list(1)
+        return {
+            **dict(zip(statuses, counts)),
+            # How long the oldest due message has been waiting for a dispatcher
+            "queue_lag_seconds": round((now - _utc(oldest[0]["available_at"])).total_seconds(), 3) if oldest else 0.0,
+        }
+
+
+class NotificationDispatcher:
+    """A pool of workers that claim outbox batches and deliver them through per-channel providers.
+
+    Each provider has its own token bucket. Failed sends are retried with
+    exponential backoff and jitter until max_attempts, then marked failed.
+    A send that has not finished after send_timeout counts as failed, well
+    before the lease runs out and another dispatcher could claim the message.
+    """
+
+    def __init__(self, outbox: Outbox, providers: Dict[str, NotificationProvider], workers: int = 4,
+                 batch_size: int = 50, lease_seconds: float = 60.0, poll_interval: float = 1.0,
+                 max_attempts: int = 5, base_backoff: float = 2.0, max_backoff: float = 300.0,
+                 send_timeout: float = 20.0):
+        if send_timeout >= lease_seconds:
+            raise ValueError(f"send_timeout ({send_timeout}s) must be shorter than lease_seconds ({lease_seconds}s)")
+        self.outbox = outbox
+        self.providers = providers
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.send_timeout = send_timeout
+        self._buckets = {channel: TokenBucket(provider.rate_per_second, provider.burst)
+                         for channel, provider in providers.items()}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._sent_times: Deque[float] = deque()
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self.counters = {"sent": 0, "retried": 0, "failed": 0}
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._stopping = False
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # wait_for can swallow a cancel that lands as the wakeup fires, so workers also check the flag
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self) -> None:
+        """Tell idle workers new messages are queued instead of letting them wait for the next poll"""
+        self._wakeup.set()
+
+    async def _work(self) -> None:
+        while not self._stopping:
+            try:
+                batch = await self.outbox.claim(self.batch_size, self.lease_seconds, self.max_attempts)
+            except Exception as e:
+                logger.error(f"Error claiming notifications: {e}")
+                batch = []
+            if batch:
+                await self.dispatch(batch)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def dispatch(self, batch: List[Dict[str, Any]]) -> None:
+        """Deliver one claimed batch concurrently and record every outcome in a single write"""
+        results = await asyncio.gather(*(self._deliver(message) for message in batch), return_exceptions=True)
+        sent, retries = [], []
+        now = time.monotonic()
+        for message, error in zip(batch, results):
+            if error is None:
+                sent.append(message)
+                self._sent_times.append(now)
+                self._latencies.append((datetime.now(timezone.utc) - _utc(message["created_at"])).total_seconds())
+                continue
+            attempts = message["attempts"] + 1
+            permanent = isinstance(error, LookupError) or attempts >= self.max_attempts
+            delay = None if permanent else self._backoff(attempts)
+            self.counters["failed" if permanent else "retried"] += 1
+            logger.warning(f"Notification {message['_id']} attempt {attempts} failed: {error}")
+            retries.append((message, str(error), delay))
+        self.counters["sent"] += len(sent)
+        self._trim_sent_times(now)
+        await self.outbox.settle(sent, retries)
+
+    async def _deliver(self, message: Dict[str, Any]) -> None:
+        provider = self.providers.get(message["channel"])
+        if provider is None:
+            raise LookupError(f"No provider for channel {message['channel']}")
+        await self._buckets[message["channel"]].acquire()
+        try:
+            await asyncio.wait_for(provider.send(message), self.send_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"{provider.name} did not answer within {self.send_timeout}s") from None
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _trim_sent_times(self, now: float) -> None:
+        while self._sent_times and now - self._sent_times[0] > 60:
+            self._sent_times.popleft()
+
+    async def stats(self) -> Dict[str, Any]:
+        self._trim_sent_times(time.monotonic())
+        latencies = sorted(self._latencies)
+        return {
+            "workers": len(self._tasks),
+            "providers": {channel: provider.name for channel, provider in self.providers.items()},
+            **self.counters,
+            "sent_per_second_1m": round(len(self._sent_times) / 60, 3),
+            "delivery_latency_p50_seconds": round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+            "delivery_latency_max_seconds": round(latencies[-1], 3) if latencies else 0.0,
+            "outbox": await self.outbox.stats(),
+        }
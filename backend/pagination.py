@@ -0,0 +1,109 @@
+"""Keyset (cursor) pagination and NDJSON streaming for list endpoints."""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from serialization import FAST_RESPONSES, FastEncoder, fast_encoder, shaped_encoder
+
+NDJSON = "application/x-ndjson"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def encode_cursor(sort_value: Any, doc_id: str) -> str:
+    if isinstance(sort_value, datetime):
+        value = {"dt": sort_value.isoformat()}
+    else:
+        value = {"v": sort_value}
+    raw = json.dumps([value, doc_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """Turn a cursor back into (sort_value, id); raises ValueError if it is malformed"""
+    try:
+        value, doc_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        sort_value = datetime.fromisoformat(value["dt"]) if "dt" in value else value["v"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(doc_id, str):
+        raise ValueError("invalid cursor")
+    return sort_value, doc_id
+
+
+def keyset_filter(query: Dict[str, Any], sort_field: str, direction: int, after: Optional[str]) -> Dict[str, Any]:
+    """Restrict query to documents that sort after the cursor on (sort_field, id)"""
+    if not after:
+        return query
+    sort_value, doc_id = decode_cursor(after)
+    op = "$gt" if direction > 0 else "$lt"
+    if sort_field == "id":
+        keyset = {"id": {op: doc_id}}
+    else:
+        keyset = {"$or": [{sort_field: {op: sort_value}}, {sort_field: sort_value, "id": {op: doc_id}}]}
+    return {"$and": [query, keyset]} if query else keyset
+
+
+def sort_spec(sort_field: str, direction: int) -> List[Tuple[str, int]]:
+    return [(sort_field, direction)] if sort_field == "id" else [(sort_field, direction), ("id", direction)]
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+async def fetch_page(collection, query, sort_field: str, direction: int, limit: int, after: Optional[str],
+                     projection: Optional[Dict[str, int]] = None):
+    """Return (docs, next_cursor) for one page; next_cursor is None on the last page"""
+    if projection is not None:
+        # The cursor is built from the last document's sort key and id, whatever the client asked for
+        projection = {**projection, sort_field: 1, "id": 1}
+    cursor = collection.find(keyset_filter(query, sort_field, direction, after), projection)
+    docs = await cursor.sort(sort_spec(sort_field, direction)).limit(limit + 1).to_list(limit + 1)
+    if len(docs) <= limit:
+        return docs, None
+    last = docs[limit - 1]
+    return docs[:limit], encode_cursor(last.get(sort_field), last["id"])
+
+
+def ndjson_response(collection, query, sort_field: str, direction: int, model: Type[BaseModel],
+                    limit: Optional[int], after: Optional[str], encoder: Optional[FastEncoder] = None) -> StreamingResponse:
+    """Stream matching documents straight from the Motor cursor, one JSON object per line"""
+    cursor = collection.find(keyset_filter(query, sort_field, direction, after), encoder and encoder.projection())
+    cursor = cursor.sort(sort_spec(sort_field, direction)).batch_size(STREAM_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    async def lines():
+        async for doc in cursor:
+            yield encoder.encode_one(doc) + b"\n" if encoder else model(**doc).json() + "\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON)
+
+
+async def list_page(request: Request, response: Response, collection, query: Dict[str, Any],
+                    sort_field: str, direction: int, model: Type[BaseModel],
+                    limit: Optional[int], after: Optional[str], default_limit: int):
+    """Serve a list endpoint as a cursor-paginated JSON page, or as NDJSON when the client asks for it"""
+    try:
+        encoder = shaped_encoder(request, model) or (fast_encoder(model) if FAST_RESPONSES else None)
+        if wants_ndjson(request):
+            return ndjson_response(collection, query, sort_field, direction, model, limit, after, encoder)
+        docs, next_cursor = await fetch_page(collection, query, sort_field, direction, limit or default_limit, after,
+                                             encoder and encoder.projection())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if encoder:
+        # Already in response_model's shape: skip FastAPI's validation and encoding pass
+        response = Response(content=encoder.encode_many(docs), media_type="application/json")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response if encoder else [model(**doc) for doc in docs]
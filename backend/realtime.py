@@ -0,0 +1,163 @@
+"""In-process pub/sub hub pushing events to WebSocket and SSE subscribers.
+
+Each subscriber has a bounded queue. One that falls a full queue behind is
+cut off rather than slowing publishers down; it reconnects with the id of
+the last event it got and is replayed what it missed from the hub's recent
+history. Event ids are "<boot>:<seq>", so an id from before a restart (or
+older than the history) gets a "reset" event telling the client to reload.
+
+The hub only reaches subscribers of its own process; with several workers
+each publishing worker must be the one holding the connections.
+"""
+import asyncio
+import math
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+RESET = "reset"
+
+_CLOSED = object()
+
+
+def _distance_km(a: Dict[str, float], b: Dict[str, float]) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (a["lat"], a["lng"], b["lat"], b["lng"]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+class Event:
+    __slots__ = ("id", "seq", "type", "data", "area", "location", "roles")
+
+    def __init__(self, id: str, seq: int, type: str, data: Dict[str, Any], area: Optional[str],
+                 location: Optional[Dict[str, float]], roles: Optional[Set[str]]):
+        self.id = id
+        self.seq = seq
+        self.type = type
+        self.data = data
+        self.area = area
+        self.location = location
+        self.roles = roles
+
+    def message(self) -> Dict[str, Any]:
+        return {"id": self.id, "type": self.type, "data": self.data}
+
+
+class Subscription:
+    """One connected client: its filters and its bounded queue of events"""
+
+    def __init__(self, hub: "Hub", area: Optional[str], role: Optional[str],
+                 near: Optional[Dict[str, float]], radius_km: Optional[float], queue_size: int):
+        self.hub = hub
+        self.area = area
+        self.role = role
+        self.near = near
+        self.radius_km = radius_km
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.backlog: Deque[Event] = deque()
+        self.overflowed = False
+
+    def matches(self, event: Event) -> bool:
+        if event.type == RESET:
+            return True
+        if self.area is not None and event.area != self.area:
+            return False
+        if self.role is not None and event.roles is not None and self.role not in event.roles:
+            return False
+        if self.near is not None and self.radius_km is not None:
+            if event.location is None or _distance_km(self.near, event.location) > self.radius_km:
+                return False
+        return True
+
+    def _offer(self, event: Event) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            # Drop everything queued so the client resumes from the last event it actually received
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_CLOSED)
+            self.hub.unsubscribe(self)
+            return False
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """The next event; None on timeout. Raises ConnectionResetError once the hub cut this subscriber off"""
+        if self.backlog:
+            return self.backlog.popleft()
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is _CLOSED:
+            raise ConnectionResetError("subscriber fell too far behind")
+        return event
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """Fans published events out to matching subscriptions"""
+
+    def __init__(self, history_size: int = 1000, queue_size: int = 100):
+        self.boot = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self.history: Deque[Event] = deque(maxlen=history_size)
+        self.last_seq = 0
+        # Subscriptions by area; None holds those listening to every area
+        self._by_area: Dict[Optional[str], Set[Subscription]] = {}
+        self.counters = {"published": 0, "delivered": 0, "overflowed": 0, "resets": 0, "replayed": 0}
+
+    def publish(self, type: str, data: Dict[str, Any], area: Optional[str] = None,
+                location: Optional[Dict[str, float]] = None, roles: Optional[Set[str]] = None) -> Event:
+        self.last_seq += 1
+        event = Event(f"{self.boot}:{self.last_seq}", self.last_seq, type, data, area, location, roles)
+        self.history.append(event)
+        self.counters["published"] += 1
+        targets = list(self._by_area.get(None, ()))
+        if area is not None:
+            targets.extend(self._by_area.get(area, ()))
+        for subscription in targets:
+            if subscription.matches(event) and subscription._offer(event):
+                self.counters["delivered"] += 1
+        return event
+
+    def subscribe(self, area: Optional[str] = None, role: Optional[str] = None,
+                  near: Optional[Dict[str, float]] = None, radius_km: Optional[float] = None,
+                  last_event_id: Optional[str] = None) -> Subscription:
+        """Register a subscription, first replaying what it missed since last_event_id"""
+        subscription = Subscription(self, area, role, near, radius_km, self.queue_size)
+        if last_event_id:
+            subscription.backlog.extend(self._missed(subscription, last_event_id))
+        self._by_area.setdefault(area, set()).add(subscription)
+        return subscription
+
+    def _missed(self, subscription: Subscription, last_event_id: str) -> List[Event]:
+        boot, _, seq = last_event_id.partition(":")
+        oldest = self.history[0].seq if self.history else self.last_seq + 1
+        if boot != self.boot or not seq.isdigit() or not oldest - 1 <= int(seq) <= self.last_seq:
+            # Events were lost to a restart or aged out of the history: the client must reload
+            self.counters["resets"] += 1
+            return [Event(f"{self.boot}:{self.last_seq}", self.last_seq, RESET, {}, None, None, None)]
+        missed = [event for event in self.history if event.seq > int(seq) and subscription.matches(event)]
+        self.counters["replayed"] += len(missed)
+        return missed
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._by_area.get(subscription.area)
+        if subscribers is None or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._by_area[subscription.area]
+        if subscription.overflowed:
+            self.counters["overflowed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self._by_area.values()),
+            "history": len(self.history),
+            **self.counters,
+        }
@@ -0,0 +1,112 @@
+"""Atomic stock reservations on pharmacy inventory line items.
+
+A reservation decrements each line item's stock with one conditional update
+that also records a hold {request_id, quantity, expires_at} on the item, so
+stock and holds can never disagree. Picking up an order drops the holds;
+cancelling or letting them expire gives the stock back.
+"""
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo import UpdateOne
+
+from inventory import inventory_id, today
+
+
+class InsufficientStock(Exception):
+    """A line of the booking cannot be covered by sellable stock"""
+
+    def __init__(self, medicine_name: str):
+        super().__init__(f"Not enough stock of {medicine_name}")
+        self.medicine_name = medicine_name
+
+
+def held_quantity(item: Optional[Dict[str, Any]]) -> int:
+    """Units of a line item held for bookings that are not picked up yet"""
+    return sum(hold["quantity"] for hold in (item or {}).get("holds") or [])
+
+
+def same_holds(item: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Query clause that only matches while the line item has the holds read in item"""
+    holds = (item or {}).get("holds") or []
+    return {"holds": holds} if holds else {"holds.0": {"$exists": False}}
+
+
+async def _take(inventory, request_id: str, pharmacy_id: str, medicine_name: str, quantity: int,
+                expires_at: datetime) -> bool:
+    result = await inventory.update_one(
+        {
+            "id": inventory_id(pharmacy_id, medicine_name),
+            "stock": {"$gte": quantity},
+            "expiry": {"$gte": today()},
+            # A retried reservation must not hold the same line twice
+            "holds.request_id": {"$ne": request_id},
+        },
+        {
+            "$inc": {"stock": -quantity},
+            "$push": {"holds": {"request_id": request_id, "quantity": quantity, "expires_at": expires_at}},
+        },
+    )
+    return result.modified_count == 1
+
+
+async def reserve(inventory, request_id: str, pharmacy_id: str, lines: Dict[str, int],
+                  hold_seconds: float) -> datetime:
+    """Hold every line of a booking or none of them; returns when the holds expire"""
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=hold_seconds)
+    names = list(lines)
+    taken = await asyncio.gather(
+        *(_take(inventory, request_id, pharmacy_id, name, lines[name], expires_at) for name in names)
+    )
+    if all(taken):
+        return expires_at
+
+    await release(inventory, request_id, pharmacy_id, {name: lines[name] for name, ok in zip(names, taken) if ok})
+    raise InsufficientStock(next(name for name, ok in zip(names, taken) if not ok))
+
+
+async def release(inventory, request_id: str, pharmacy_id: str, lines: Dict[str, int]) -> None:
+    """Give held stock back; lines whose hold is already gone are left alone"""
+    if not lines:
+        return
+    await inventory.bulk_write([
+        UpdateOne(
+            {"id": inventory_id(pharmacy_id, name), "holds.request_id": request_id},
+            {"$inc": {"stock": quantity}, "$pull": {"holds": {"request_id": request_id}}},
+        )
+        for name, quantity in lines.items()
+    ], ordered=False)
+
+
+async def commit(inventory, request_id: str, pharmacy_id: str, lines: Dict[str, int]) -> None:
+    """Drop the holds of a picked-up booking; its stock stays sold"""
+    if not lines:
+        return
+    await inventory.update_many(
+        {"id": {"$in": [inventory_id(pharmacy_id, name) for name in lines]}, "holds.request_id": request_id},
+        {"$pull": {"holds": {"request_id": request_id}}},
+    )
+
+
+async def release_expired(inventory, grace_seconds: float = 60.0, batch_size: int = 500) -> List[str]:
+    """Return stock of holds that expired more than grace_seconds ago; returns their request ids.
+
+    The grace period keeps the sweeper away from a pickup that was accepted
+    just before its hold expired.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=grace_seconds)
+    operations = []
+    request_ids: Set[str] = set()
+    async for item in inventory.find({"holds.expires_at": {"$lte": cutoff}}, {"id": 1, "holds": 1}).limit(batch_size):
+        for hold in item["holds"]:
+            if hold["expires_at"].replace(tzinfo=timezone.utc) > cutoff:
+                continue
+            request_ids.add(hold["request_id"])
+            operations.append(UpdateOne(
+                {"id": item["id"], "holds": {"$elemMatch": {"request_id": hold["request_id"], "expires_at": {"$lte": cutoff}}}},
+                {"$inc": {"stock": hold["quantity"]}, "$pull": {"holds": {"request_id": hold["request_id"]}}},
+            ))
+    if operations:
+        await inventory.bulk_write(operations, ordered=False)
+    return sorted(request_ids)
@@ -0,0 +1,54 @@
+"""Nearest-responder lookup for emergency alerts over GeoJSON user locations."""
+from typing import Any, Dict, List, Optional, Sequence
+
+RESPONDER_ROLES = ["asha", "doctor"]
+# Rings searched in turn until enough responders are found, in metres
+SEARCH_RADII_METERS = (2_000, 10_000, 50_000, 200_000)
+RESPONDER_PROJECTION = {"_id": 0, "id": 1, "name": 1, "phone": 1, "role": 1, "village": 1}
+
+
+def geo_point(location: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """GeoJSON Point for a {lat, lng} location, or None if it is missing or out of range"""
+    try:
+        lat, lng = float(location["lat"]), float(location["lng"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def available_responders(roles: Sequence[str] = RESPONDER_ROLES) -> Dict[str, Any]:
+    # Users created before availability existed have no is_available field and count as available
+    return {"role": {"$in": list(roles)}, "is_available": {"$ne": False}}
+
+
+async def find_nearest_responders(users, location: Optional[Dict[str, Any]], k: int,
+                                  radii: Sequence[int] = SEARCH_RADII_METERS,
+                                  roles: Sequence[str] = RESPONDER_ROLES) -> List[Dict[str, Any]]:
+    """Up to k available responders nearest to location, each with its distance_m.
+
+    Small rings are tried first so a dense area is answered from a few index
+    cells; the last ring bounds how far away a responder may be.
+    """
+    point = geo_point(location)
+    if point is None:
+        return []
+    responders: List[Dict[str, Any]] = []
+    for radius in radii:
+        pipeline = [
+            {"$geoNear": {
+                "near": point,
+                "key": "geo",
+                "distanceField": "distance_m",
+                "maxDistance": radius,
+                "spherical": True,
+                "query": available_responders(roles),
+            }},
+            {"$limit": k},
+            {"$project": {**RESPONDER_PROJECTION, "distance_m": 1}},
+        ]
+        responders = await users.aggregate(pipeline).to_list(k)
+        if len(responders) >= k:
+            break
+    return responders
@@ -0,0 +1,149 @@
+"""Read-through cache of encoded GET responses with ETags and namespace invalidation.
+
+Entries live under "<namespace>:<version>:<key>". A write bumps its
+namespace's version, which orphans every older entry at once; orphans age
+out through their TTL or the LRU bound. A namespace can be scoped, as in
+"consultations:<room_id>", so a write orphans only that scope's entries;
+scopes take the TTL of the namespace they belong to. With several uvicorn workers the
+versions must be shared, so use the Redis backend there; the local backend
+is only coherent within one process.
+"""
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from caching import LRUCache
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional: only needed for RESPONSE_CACHE_URL=redis://...
+    aioredis = None
+
+
+class LocalBackend:
+    """In-process stand-in for the shared backend"""
+
+    def __init__(self, maxsize: int):
+        self.entries = LRUCache(maxsize)
+        self.versions: Dict[str, int] = {}
+
+    async def version(self, namespace: str) -> int:
+        return self.versions.get(namespace, 0)
+
+    async def bump(self, namespace: str) -> None:
+        self.versions[namespace] = self.versions.get(namespace, 0) + 1
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.entries.set(key, value, ttl=ttl)
+
+
+class RedisBackend:
+    """Shared across workers; size is bounded by the server's maxmemory policy"""
+
+    def __init__(self, url: str, prefix: str = "response_cache:"):
+        if aioredis is None:
+            raise RuntimeError("RESPONSE_CACHE_URL is set but the redis package is not installed")
+        self.redis = aioredis.from_url(url)
+        self.prefix = prefix
+
+    async def version(self, namespace: str) -> int:
+        return int(await self.redis.get(f"{self.prefix}version:{namespace}") or 0)
+
+    async def bump(self, namespace: str) -> None:
+        await self.redis.incr(f"{self.prefix}version:{namespace}")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.redis.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+
+def encode_json(content: Any) -> bytes:
+    """The same bytes FastAPI's JSONResponse would send for content"""
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ResponseCache:
+    """Caches the encoded body, headers and ETag of GET handlers, per namespace and route TTL.
+
+    Query parameters named in vary change the representation (e.g. ?fields=),
+    so they are part of every cache key.
+    """
+
+    def __init__(self, backend, ttls: Dict[str, float], default_ttl: float = 60.0, vary: Iterable[str] = ()):
+        self.backend = backend
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.vary = tuple(vary)
+        self.counters = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+    async def invalidate(self, *namespaces: str) -> None:
+        for namespace in namespaces:
+            await self.backend.bump(namespace)
+            self.counters["invalidations"] += 1
+
+    async def _load(self, cache_key: str) -> Optional[Tuple[Dict[str, str], bytes]]:
+        entry = await self.backend.get(cache_key)
+        if entry is None:
+            return None
+        meta, _, body = entry.partition(b"\n")
+        return json.loads(meta), body
+
+    async def respond(self, request: Request, namespace: str, key: str,
+                      produce: Callable[[Response], Awaitable[Any]]) -> Response:
+        """Serve a cached response, or call produce(response) and cache what it returns.
+
+        produce gets a scratch Response so it can set headers (e.g. a next-page
+        cursor) that are cached with the body; it may also return a ready Response.
+        Errors raised by produce are not cached.
+        """
+        variant = "&".join(f"{name}={request.query_params.get(name, '')}" for name in self.vary)
+        cache_key = f"{namespace}:{await self.backend.version(namespace)}:{key}"
+        if variant:
+            cache_key += f"?{variant}"
+        cached = await self._load(cache_key)
+        if cached is None:
+            self.counters["misses"] += 1
+            scratch = Response()
+            content = await produce(scratch)
+            if isinstance(content, Response):
+                body, scratch = content.body, content
+            else:
+                body = encode_json(content)
+            headers = {name: value for name, value in scratch.headers.items() if name.startswith("x-")}
+            headers["etag"] = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            meta = json.dumps(headers).encode()
+            ttl = self.ttls.get(namespace.partition(":")[0], self.default_ttl)
+            await self.backend.set(cache_key, meta + b"\n" + body, ttl)
+        else:
+            self.counters["hits"] += 1
+            headers, body = cached
+
+        headers = {**headers, "cache-control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+            self.counters["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "backend": type(self.backend).__name__,
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
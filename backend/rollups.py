@@ -0,0 +1,325 @@
+"""Daily rollups of ASHA home visits per worker and per village, and open follow-ups.
+
+Every visit updates two buckets, {scope: "asha"|"village", key, day}, with
+one upserting update each: visit counts by type, the patients seen, how many
+follow-ups were booked, and count/sum/min/max of each numeric vital sign
+("120/80" blood pressures split into systolic and diastolic). Days are
+calendar days at utc_offset_minutes, so a dashboard over N days reads N
+buckets however many visits they hold.
+
+A patient's open follow-up is the next_visit_date of their latest visit; a
+later visit without one closes it, leaving the patient's entry without a
+due_at so that an older visit arriving late cannot reopen it. Follow-ups
+live in their own collection, keyed by patient, so overdue ones are an
+index range on due_at.
+
+rebuild() recomputes buckets from the raw visits in parallel day slices,
+using the same update documents applied in memory, and replaces what is
+stored. Past days are settled; a visit recorded on the current day while
+its slice is being replaced can be missed until the next rebuild.
+"""
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS = "visit_rollups"
+FOLLOWUPS = "asha_followups"
+SCOPES = ("asha", "village")
+
+# A visit contributes at most this many vital signs, so a bucket's size stays bounded
+MAX_VITALS = 16
+BLOOD_PRESSURE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)\s*$")
+VISIT_PROJECTION = {"_id": 0, "id": 1, "asha_id": 1, "patient_id": 1, "patient_name": 1, "visit_type": 1,
+                    "next_visit_date": 1, "vital_signs": 1, "created_at": 1, "village": 1}
+UNKNOWN_VILLAGE = "unknown"
+WRITE_BATCH = 1000
+
+
+def field_name(name: str) -> str:
+    """A user-supplied key made safe for a dotted Mongo path"""
+    return re.sub(r"[^a-z0-9]+", "_", str(name).lower()).strip("_")[:40] or "other"
+
+
+def as_utc(moment: datetime) -> datetime:
+    # Motor hands back naive datetimes that are UTC
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+def numeric_vitals(vital_signs: Dict[str, Any]) -> Dict[str, float]:
+    """Numeric readings of a visit's vital signs by field name"""
+    readings: Dict[str, float] = {}
+    for name, value in vital_signs.items():
+        if len(readings) >= MAX_VITALS:
+            break
+        key = field_name(name)
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            readings[key] = float(value)
+        elif isinstance(value, str):
+            pressure = BLOOD_PRESSURE.match(value)
+            if pressure:
+                readings[f"{key}_systolic"] = float(pressure.group(1))
+                readings[f"{key}_diastolic"] = float(pressure.group(2))
+                continue
+            try:
+                readings[key] = float(value)
+            except ValueError:
+                pass
+    return readings
+
+
+def bucket_update(visit: Dict[str, Any], scope: str, key: str, day: str) -> Dict[str, Any]:
+    """The upsert one visit applies to its (scope, key, day) bucket"""
+    increments: Dict[str, float] = {
+        "visits": 1,
+        f"visit_types.{field_name(visit['visit_type'])}": 1,
+        "followups_scheduled": 1 if visit.get("next_visit_date") else 0,
+    }
+    lowest, highest = {}, {}
+    for name, value in numeric_vitals(visit.get("vital_signs") or {}).items():
+        increments[f"vitals.{name}.count"] = 1
+        increments[f"vitals.{name}.sum"] = value
+        lowest[f"vitals.{name}.min"] = value
+        highest[f"vitals.{name}.max"] = value
+    update: Dict[str, Any] = {
+        "$setOnInsert": {"scope": scope, "key": key, "day": day},
+        "$inc": increments,
+        "$addToSet": {"patients": visit["patient_id"]},
+    }
+    # Mongo rejects empty operators
+    if lowest:
+        update["$min"] = lowest
+        update["$max"] = highest
+    return update
+
+
+def apply_update(doc: Dict[str, Any], update: Dict[str, Any]) -> None:
+    """Apply a bucket_update to a bucket held in memory, as Mongo would"""
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            *parents, leaf = path.split(".")
+            target = doc
+            for part in parents:
+                target = target.setdefault(part, {})
+            if operator == "$setOnInsert":
+                target.setdefault(leaf, value)
+            elif operator == "$inc":
+                target[leaf] = target.get(leaf, 0) + value
+            elif operator == "$min":
+                target[leaf] = min(target.get(leaf, value), value)
+            elif operator == "$max":
+                target[leaf] = max(target.get(leaf, value), value)
+            elif operator == "$addToSet":
+                members = target.setdefault(leaf, [])
+                if value not in members:
+                    members.append(value)
+
+
+def bucket_id(scope: str, key: str, day: str) -> str:
+    return f"{scope}:{key}:{day}"
+
+
+class VisitRollups:
+    """Maintains and reads the daily visit buckets and open follow-ups"""
+
+    def __init__(self, db, utc_offset_minutes: int = 330):
+        self.db = db
+        self.visits = db.asha_visits
+        self.rollups = db[ROLLUPS]
+        self.followups = db[FOLLOWUPS]
+        self.offset = timedelta(minutes=utc_offset_minutes)
+
+    def day_of(self, moment: datetime) -> str:
+        return (as_utc(moment) + self.offset).date().isoformat()
+
+    def today(self) -> date:
+        return (datetime.now(timezone.utc) + self.offset).date()
+
+    def day_start(self, day: date) -> datetime:
+        """The UTC instant a local calendar day begins"""
+        return datetime(day.year, day.month, day.day, tzinfo=timezone.utc) - self.offset
+
+    def _bucket_writes(self, visit: Dict[str, Any], village: str) -> List[Tuple[str, Dict[str, Any]]]:
+        day = self.day_of(visit["created_at"])
+        return [
+            (bucket_id(scope, key, day), bucket_update(visit, scope, key, day))
+            for scope, key in (("asha", visit["asha_id"]), ("village", village))
+        ]
+
+    async def record(self, visit: Dict[str, Any], village: Optional[str]) -> None:
+        """Fold a newly stored visit into its buckets and its patient's follow-up"""
+        writes = self._bucket_writes(visit, village or UNKNOWN_VILLAGE)
+        await self.rollups.bulk_write([UpdateOne({"_id": _id}, update, upsert=True) for _id, update in writes],
+                                      ordered=False)
+        await self._track_followup(visit, village or UNKNOWN_VILLAGE)
+
+    def _followup_write(self, visit: Dict[str, Any], village: str):
+        visited_at = as_utc(visit["created_at"])
+        # Only the patient's latest visit decides; an older one arriving late changes nothing
+        not_newer = {"_id": visit["patient_id"], "last_visit_at": {"$lte": visited_at}}
+        followup = {"patient_id": visit["patient_id"], "last_visit_at": visited_at, "visit_id": visit["id"]}
+        if visit.get("next_visit_date"):
+            followup.update(patient_name=visit["patient_name"], asha_id=visit["asha_id"], village=village,
+                            due_at=as_utc(visit["next_visit_date"]))
+        # Closed is no due_at rather than no entry, so the latest visit's time is still there to compare with
+        return ReplaceOne(not_newer, followup, upsert=True)
+
+    async def _track_followup(self, visit: Dict[str, Any], village: str) -> None:
+        try:
+            await self.followups.bulk_write([self._followup_write(visit, village)])
+        except BulkWriteError as e:
+            # The upsert found a newer visit's follow-up under this patient
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        except DuplicateKeyError:
+            pass
+
+    async def dashboard(self, scope: str, key: str, days: int, end: Optional[date] = None,
+                        overdue_limit: int = 20) -> Dict[str, Any]:
+        """Per-day and per-week numbers for the days up to end, plus open follow-ups"""
+        end = end or self.today()
+        first = end - timedelta(days=days - 1)
+        stored = {}
+        query = {"scope": scope, "key": key, "day": {"$gte": first.isoformat(), "$lte": end.isoformat()}}
+        async for bucket in self.rollups.find(query, {"_id": 0, "scope": 0, "key": 0}):
+            stored[bucket["day"]] = bucket
+
+        series, weeks, all_patients, totals = [], {}, set(), {"visits": 0, "followups_scheduled": 0, "visit_types": {}}
+        for n in range(days):
+            day = first + timedelta(days=n)
+            bucket = stored.get(day.isoformat(), {})
+            patients = set(bucket.get("patients", ()))
+            series.append({
+                "day": day.isoformat(),
+                "visits": bucket.get("visits", 0),
+                "unique_patients": len(patients),
+                "followups_scheduled": bucket.get("followups_scheduled", 0),
+                "visit_types": bucket.get("visit_types", {}),
+                "vitals": {
+                    name: {"mean": round(v["sum"] / v["count"], 2), "min": v["min"], "max": v["max"],
+                           "count": v["count"]}
+                    for name, v in bucket.get("vitals", {}).items()
+                },
+            })
+            week_start = (day - timedelta(days=day.weekday())).isoformat()
+            week = weeks.setdefault(week_start, {"week_start": week_start, "visits": 0, "patients": set()})
+            week["visits"] += series[-1]["visits"]
+            week["patients"] |= patients
+            all_patients |= patients
+            totals["visits"] += series[-1]["visits"]
+            totals["followups_scheduled"] += series[-1]["followups_scheduled"]
+            for visit_type, count in series[-1]["visit_types"].items():
+                totals["visit_types"][visit_type] = totals["visit_types"].get(visit_type, 0) + count
+        totals["unique_patients"] = len(all_patients)
+
+        return {
+            "scope": scope, "key": key, "from": first.isoformat(), "to": end.isoformat(),
+            "totals": totals,
+            "weeks": [{"week_start": w["week_start"], "visits": w["visits"], "unique_patients": len(w["patients"])}
+                      for w in weeks.values()],
+            "days": series,
+            "followups": await self.open_followups(scope, key, overdue_limit),
+        }
+
+    async def open_followups(self, scope: str, key: str, overdue_limit: int) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        owner = {"asha_id" if scope == "asha" else "village": key}
+        overdue = {**owner, "due_at": {"$lt": now}}
+        return {
+            "overdue": await self.followups.count_documents(overdue),
+            "due_next_7_days": await self.followups.count_documents(
+                {**owner, "due_at": {"$gte": now, "$lt": now + timedelta(days=7)}}),
+            "most_overdue": await self.followups.find(overdue, {"_id": 0}).sort("due_at", ASCENDING)
+                                                .to_list(overdue_limit),
+        }
+
+    async def rebuild(self, workers: int = 4, slice_days: int = 7, batch_size: int = 2000) -> Dict[str, int]:
+        """Recompute every bucket and follow-up from the stored visits"""
+        oldest = await self.visits.find_one({}, {"created_at": 1}, sort=[("created_at", ASCENDING)])
+        if not oldest:
+            return {"visits": 0, "buckets": 0, "followups": 0}
+        first = date.fromisoformat(self.day_of(oldest["created_at"]))
+        last = self.today()
+        slices = []
+        while first <= last:
+            slices.append((first, min(first + timedelta(days=slice_days), last + timedelta(days=1))))
+            first += timedelta(days=slice_days)
+
+        villages: Dict[str, str] = {}
+        running = asyncio.Semaphore(workers)
+        counted = {"visits": 0, "buckets": 0}
+
+        async def rebuild_slice(start: date, stop: date):
+            async with running:
+                buckets: Dict[str, Dict[str, Any]] = {}
+                query = {"created_at": {"$gte": self.day_start(start), "$lt": self.day_start(stop)}}
+                async for batch in _batches(self.visits.find(query, VISIT_PROJECTION).batch_size(batch_size),
+                                            batch_size):
+                    await self._resolve_villages(batch, villages)
+                    for visit in batch:
+                        for _id, update in self._bucket_writes(visit, villages[visit["patient_id"]]):
+                            apply_update(buckets.setdefault(_id, {}), update)
+                    counted["visits"] += len(batch)
+                writes = [ReplaceOne({"_id": _id}, bucket, upsert=True) for _id, bucket in buckets.items()]
+                for n in range(0, len(writes), WRITE_BATCH):
+                    await self.rollups.bulk_write(writes[n:n + WRITE_BATCH], ordered=False)
+                counted["buckets"] += len(buckets)
+
+        # The current day goes last so it is replaced as close to the live updates as possible
+        await asyncio.gather(*(rebuild_slice(start, stop) for start, stop in slices[:-1]))
+        await rebuild_slice(*slices[-1])
+        return {**counted, "followups": await self.rebuild_followups(villages, batch_size)}
+
+    async def rebuild_followups(self, villages: Dict[str, str], batch_size: int = 2000) -> int:
+        """Reset each patient's follow-up from their latest visit"""
+        pipeline = [
+            {"$sort": {"patient_id": 1, "created_at": -1}},
+            {"$group": {"_id": "$patient_id", **{
+                field: {"$first": f"${field}"} for field in VISIT_PROJECTION if field != "_id"
+            }}},
+        ]
+        written = 0
+        cursor = self.visits.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+        async for batch in _batches(cursor, batch_size):
+            await self._resolve_villages(batch, villages)
+            writes = [self._followup_write(visit, villages[visit["patient_id"]]) for visit in batch]
+            try:
+                await self.followups.bulk_write(writes, ordered=False)
+            except BulkWriteError as e:
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    raise
+            written += sum(1 for visit in batch if visit.get("next_visit_date"))
+        return written
+
+    async def _resolve_villages(self, visits: List[Dict[str, Any]], villages: Dict[str, str]) -> None:
+        """Fill villages with the home village of each visited patient; visits recorded by the API carry it"""
+        missing = set()
+        for visit in visits:
+            if visit.get("village"):
+                villages[visit["patient_id"]] = visit["village"]
+            elif visit["patient_id"] not in villages:
+                missing.add(visit["patient_id"])
+        if missing:
+            async for user in self.db.users.find({"id": {"$in": list(missing)}}, {"id": 1, "village": 1}):
+                villages[user["id"]] = user.get("village") or UNKNOWN_VILLAGE
+            for patient_id in missing:
+                villages.setdefault(patient_id, UNKNOWN_VILLAGE)
+
+
+async def _batches(cursor, size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,365 @@
+"""Doctor working hours and an in-memory index of booked consultation slots.
+
+Each doctor has a weekly working-hours template cut into fixed-length slots,
+and a calendar of booked intervals kept as sorted start/end lists. Every
+doctor's earliest free slot is filed in one heap per language (and one for
+all doctors), so "the next N free slots" only touches the doctors at the top
+of the heap. Entries are replaced rather than updated: a heap entry is live
+only while it still equals its doctor's earliest free slot, and the stale
+ones are dropped as they surface.
+
+The index is a cache. MongoDB's unique index on active (doctor_id,
+appointment_time) pairs decides which of two concurrent bookings wins, and
+bookings made by other workers arrive through refresh(), which reads
+consultations by their sync stamp.
+"""
+import heapq
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+DAY = 86400
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+SCHEDULES = "doctor_schedules"
+SLOT_TAKEN = "Slot is already booked"
+
+# Bookings stay in the index for a day after they start, then age out on the next rebuild
+SLOT_HISTORY_SECONDS = DAY
+
+BOOKING_PROJECTION = {"_id": 0, "id": 1, "doctor_id": 1, "appointment_time": 1, "duration_minutes": 1, "slot_active": 1}
+
+
+def to_epoch(value: datetime) -> int:
+    """Seconds since the epoch; naive datetimes are UTC, as Motor returns them"""
+    return int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+
+
+def from_epoch(seconds: int) -> datetime:
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def _clock_minutes(value: str) -> int:
+    hours, _, minutes = value.partition(":")
+    if not (hours.isdigit() and minutes.isdigit()) or int(minutes) > 59:
+        raise ValueError(f"{value!r} is not an HH:MM time")
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_weekly(weekly: Dict[str, List[List[str]]], slot_minutes: int) -> Dict[int, List[Tuple[int, int]]]:
+    """{"mon": [["09:00", "13:00"], ...]} -> {0: [(32400, 46800), ...]} in seconds after local midnight.
+
+    Raises ValueError for unknown days, malformed times, windows shorter than
+    one slot and windows that overlap.
+    """
+    windows: Dict[int, List[Tuple[int, int]]] = {}
+    for day, ranges in weekly.items():
+        if day not in WEEKDAYS:
+            raise ValueError(f"unknown weekday {day!r}; use {', '.join(WEEKDAYS)}")
+        parsed = []
+        for window in ranges:
+            if len(window) != 2:
+                raise ValueError("working hours are [start, end] pairs")
+            begin, end = _clock_minutes(window[0]), _clock_minutes(window[1])
+            if end > 24 * 60 or end - begin < slot_minutes:
+                raise ValueError(f"{window[0]}-{window[1]} does not fit a {slot_minutes} minute slot")
+            parsed.append((begin * 60, end * 60))
+        parsed.sort()
+        if any(previous[1] > current[0] for previous, current in zip(parsed, parsed[1:])):
+            raise ValueError(f"working hours on {day} overlap")
+        if parsed:
+            windows[WEEKDAYS.index(day)] = parsed
+    return windows
+
+
+class DoctorCalendar:
+    """One doctor's working-hours template and booked intervals"""
+
+    __slots__ = ("doctor_id", "name", "languages", "slot_seconds", "offset", "windows",
+                 "starts", "ends", "holders", "next_free")
+
+    def __init__(self, doctor_id: str):
+        self.doctor_id = doctor_id
+        self.name = ""
+        self.languages: Tuple[str, ...] = ()
+        self.slot_seconds = 15 * 60
+        self.offset = 0
+        self.windows: Dict[int, List[Tuple[int, int]]] = {}
+        # Booked intervals never overlap, so both lists are sorted
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.holders: Dict[int, str] = {}
+        self.next_free: Optional[int] = None
+
+    def fits(self, start: int) -> bool:
+        """Whether start begins one of the template's slots"""
+        local = start + self.offset
+        second = local % DAY
+        for begin, end in self.windows.get((local // DAY + 3) % 7, ()):
+            if begin <= second and second + self.slot_seconds <= end and (second - begin) % self.slot_seconds == 0:
+                return True
+        return False
+
+    def busy_until(self, start: int, end: int) -> Optional[int]:
+        """End of the booking overlapping [start, end), or None if that interval is free"""
+        i = bisect_right(self.ends, start)
+        if i < len(self.starts) and self.starts[i] < end:
+            return self.ends[i]
+        return None
+
+    def free_slots(self, after: int, until: int) -> Iterator[int]:
+        """Free slot starts from after (inclusive) to until (exclusive), earliest first"""
+        step = self.slot_seconds
+        day = (after + self.offset) // DAY
+        while day * DAY - self.offset < until:
+            midnight = day * DAY - self.offset
+            # 1970-01-01 was a Thursday
+            for begin, end in self.windows.get((day + 3) % 7, ()):
+                slot = midnight + begin
+                if slot < after:
+                    slot += -(-(after - slot) // step) * step
+                while slot + step <= midnight + end:
+                    if slot >= until:
+                        return
+                    taken_until = self.busy_until(slot, slot + step)
+                    if taken_until is None:
+                        yield slot
+                        slot += step
+                    else:
+                        slot += -(-(taken_until - slot) // step) * step
+            day += 1
+
+    def book(self, start: int, end: int, holder: str) -> bool:
+        """Hold [start, end) for holder; False if it overlaps someone else's booking"""
+        if self.busy_until(start, end) is not None:
+            return self.holders.get(start) == holder
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.holders[start] = holder
+        return True
+
+    def release(self, start: int, holder: str) -> bool:
+        """Free the booking at start if holder still holds it"""
+        i = bisect_left(self.starts, start)
+        if i == len(self.starts) or self.starts[i] != start or self.holders.get(start) != holder:
+            return False
+        del self.starts[i], self.ends[i], self.holders[start]
+        return True
+
+    def prune(self, before: int) -> None:
+        """Forget bookings that ended before a time"""
+        i = bisect_right(self.ends, before)
+        for start in self.starts[:i]:
+            self.holders.pop(start, None)
+        del self.starts[:i], self.ends[:i]
+
+
+class SlotIndex:
+    """Free-slot search and conflict checks over every doctor's calendar"""
+
+    def __init__(self, horizon_days: int = 60, clock=time.time):
+        self.horizon = horizon_days * DAY
+        self.clock = clock
+        self.calendars: Dict[str, DoctorCalendar] = {}
+        # Language (None for every doctor) -> heap of (earliest free slot, doctor_id)
+        self._heaps: Dict[Optional[str], List[Tuple[int, str]]] = {}
+        self.refreshed_at: Optional[datetime] = None
+        self.counters = {"searches": 0, "bookings": 0, "conflicts": 0, "releases": 0, "refreshed": 0}
+
+    def _calendar(self, doctor_id: str) -> DoctorCalendar:
+        calendar = self.calendars.get(doctor_id)
+        if calendar is None:
+            calendar = self.calendars[doctor_id] = DoctorCalendar(doctor_id)
+        return calendar
+
+    def _refile(self, calendar: DoctorCalendar, now: int, force: bool = False) -> None:
+        """Recompute a doctor's earliest free slot and file it in its heaps if it moved"""
+        next_free = next(calendar.free_slots(now, now + self.horizon), None)
+        if next_free == calendar.next_free and not force:
+            return
+        calendar.next_free = next_free
+        if next_free is None:
+            return
+        for key in (None, *calendar.languages):
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, (next_free, calendar.doctor_id))
+            if len(heap) > 4 * len(self.calendars) + 64:
+                self._compact(key)
+
+    def _compact(self, key: Optional[str]) -> None:
+        live = {(slot, doctor_id) for slot, doctor_id in self._heaps[key] if self._live(key, slot, doctor_id)}
+        self._heaps[key] = list(live)
+        heapq.heapify(self._heaps[key])
+
+    def _live(self, key: Optional[str], slot: int, doctor_id: str) -> bool:
+        calendar = self.calendars.get(doctor_id)
+        return (calendar is not None and calendar.next_free == slot
+                and (key is None or key in calendar.languages))
+
+    def set_working_hours(self, doctor_id: str, name: str, languages: Iterable[str], slot_minutes: int,
+                          utc_offset_minutes: int, weekly: Dict[str, List[List[str]]], refile: bool = True) -> None:
+        """Install or replace a doctor's template; raises ValueError if it is malformed"""
+        windows = parse_weekly(weekly, slot_minutes)
+        calendar = self._calendar(doctor_id)
+        calendar.name = name
+        calendar.languages = tuple(sorted({language.lower() for language in languages}))
+        calendar.slot_seconds = slot_minutes * 60
+        calendar.offset = utc_offset_minutes * 60
+        calendar.windows = windows
+        if refile:
+            # Force: the doctor may have joined the heaps of new languages
+            self._refile(calendar, int(self.clock()), force=True)
+
+    def check(self, doctor_id: str, start: int) -> Optional[str]:
+        """Why start cannot be booked with this doctor, or None if it can"""
+        calendar = self.calendars.get(doctor_id)
+        if calendar is None or not calendar.windows:
+            return "Doctor has no working hours"
+        if start < self.clock():
+            return "Slot is in the past"
+        if not calendar.fits(start):
+            return "Not one of the doctor's slots"
+        if calendar.busy_until(start, start + calendar.slot_seconds) is not None:
+            return SLOT_TAKEN
+        return None
+
+    def slot_seconds(self, doctor_id: str) -> int:
+        return self._calendar(doctor_id).slot_seconds
+
+    def book(self, doctor_id: str, start: int, end: int, holder: str, refile: bool = True) -> bool:
+        """Mark [start, end) as taken by holder; False on a conflict with another booking"""
+        calendar = self._calendar(doctor_id)
+        if not calendar.book(start, end, holder):
+            self.counters["conflicts"] += 1
+            return False
+        self.counters["bookings"] += 1
+        if refile and calendar.next_free is not None and start < calendar.next_free + calendar.slot_seconds \
+                and end > calendar.next_free:
+            self._refile(calendar, int(self.clock()))
+        return True
+
+    def release(self, doctor_id: str, start: int, holder: str) -> None:
+        calendar = self.calendars.get(doctor_id)
+        if calendar is not None and calendar.release(start, holder):
+            self.counters["releases"] += 1
+            self._refile(calendar, int(self.clock()))
+
+    def earliest(self, count: int, language: Optional[str] = None,
+                 after: Optional[int] = None) -> List[Tuple[int, DoctorCalendar]]:
+        """The count earliest free (start, doctor) slots, optionally only with doctors speaking language"""
+        self.counters["searches"] += 1
+        now = int(self.clock())
+        start = max(now, after or now)
+        until = now + self.horizon
+        key = language.lower() if language else None
+        heap = self._heaps.get(key, [])
+        popped: List[Tuple[int, str]] = []
+        frontier: List[Tuple[int, str, Iterator[int]]] = []
+        found: List[Tuple[int, DoctorCalendar]] = []
+        taken = set()
+
+        while len(found) < count:
+            head = self._head(key, heap, now, taken)
+            # On a tie take the merged slot first: thousands of doctors can share the same earliest slot
+            if head is not None and (not frontier or head[0] < frontier[0][0]):
+                # This doctor's free slots may come next: take them into the merge
+                heapq.heappop(heap)
+                popped.append(head)
+                taken.add(head[1])
+                slots = self.calendars[head[1]].free_slots(max(head[0], start), until)
+                first = next(slots, None)
+                if first is not None:
+                    heapq.heappush(frontier, (first, head[1], slots))
+                continue
+            if not frontier:
+                break
+            slot, doctor_id, slots = heapq.heappop(frontier)
+            found.append((slot, self.calendars[doctor_id]))
+            following = next(slots, None)
+            if following is not None:
+                heapq.heappush(frontier, (following, doctor_id, slots))
+
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return found
+
+    def _head(self, key: Optional[str], heap: List[Tuple[int, str]], now: int, taken) -> Optional[Tuple[int, str]]:
+        """The heap's top live entry, after dropping stale ones and refiling doctors whose slot has passed"""
+        while heap:
+            slot, doctor_id = heap[0]
+            if doctor_id in taken or not self._live(key, slot, doctor_id):
+                heapq.heappop(heap)
+            elif slot < now:
+                heapq.heappop(heap)
+                self._refile(self.calendars[doctor_id], now)
+            else:
+                return heap[0]
+        return None
+
+    async def load(self, db) -> None:
+        """Rebuild from the stored templates and the active bookings still ahead"""
+        refreshed_at = datetime.now(timezone.utc)
+        self.calendars.clear()
+        self._heaps.clear()
+        async for schedule in db[SCHEDULES].find({}, {"_id": 0}):
+            self._apply_schedule(schedule, refile=False)
+        since = datetime.now(timezone.utc) - timedelta(seconds=SLOT_HISTORY_SECONDS)
+        async for doc in db.consultations.find({"slot_active": True, "appointment_time": {"$gte": since}},
+                                               BOOKING_PROJECTION):
+            self._apply_booking(doc, refile=False)
+        now = int(self.clock())
+        for calendar in self.calendars.values():
+            self._refile(calendar, now, force=True)
+        self.refreshed_at = refreshed_at
+
+    async def refresh(self, db, settle_seconds: float) -> int:
+        """Apply templates and bookings changed since the last refresh, including other workers' writes"""
+        if self.refreshed_at is None:
+            await self.load(db)
+            return 0
+        refreshed_at = datetime.now(timezone.utc)
+        # Writes are stamped before they land; re-reading a settle window catches the late ones
+        since = self.refreshed_at - timedelta(seconds=settle_seconds)
+        applied = 0
+        async for schedule in db[SCHEDULES].find({"updated_at": {"$gte": since}}, {"_id": 0}):
+            self._apply_schedule(schedule, refile=True)
+            applied += 1
+        async for doc in db.consultations.find({"sync_ts": {"$gte": since}, "doctor_id": {"$type": "string"}},
+                                               BOOKING_PROJECTION):
+            self._apply_booking(doc)
+            applied += 1
+        now = int(self.clock())
+        for calendar in self.calendars.values():
+            calendar.prune(now - SLOT_HISTORY_SECONDS)
+        self.refreshed_at = refreshed_at
+        self.counters["refreshed"] += applied
+        return applied
+
+    def _apply_schedule(self, schedule: Dict[str, Any], refile: bool) -> None:
+        try:
+            self.set_working_hours(schedule["doctor_id"], schedule.get("doctor_name", ""), schedule.get("languages", []),
+                                   schedule["slot_minutes"], schedule.get("utc_offset_minutes", 0),
+                                   schedule.get("weekly", {}), refile=refile)
+        except (KeyError, ValueError):
+            # Templates are validated on the way in; a hand-edited bad one just drops the doctor from search
+            pass
+
+    def _apply_booking(self, doc: Dict[str, Any], refile: bool = True) -> None:
+        start = to_epoch(doc["appointment_time"])
+        if doc.get("slot_active"):
+            duration = doc.get("duration_minutes")
+            end = start + (duration * 60 if duration else self.slot_seconds(doc["doctor_id"]))
+            self.book(doc["doctor_id"], start, end, doc["id"], refile=refile)
+        else:
+            self.release(doc["doctor_id"], start, doc["id"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "doctors": len(self.calendars),
+            "with_working_hours": sum(1 for calendar in self.calendars.values() if calendar.windows),
+            "booked_slots": sum(len(calendar.starts) for calendar in self.calendars.values()),
+            "languages": sorted(key for key in self._heaps if key is not None),
+            **self.counters,
+        }
+
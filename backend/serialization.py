@@ -0,0 +1,288 @@
+"""Fast JSON encoding of stored documents for list endpoints.
+
+The normal path builds a model per document, then FastAPI dumps, re-validates
+and encodes it again through response_model. Documents written by this API
+already have the model's shape, so FastEncoder checks each field's type with
+a cheap converter, fills defaults, and encodes the result in one orjson call.
+Anything a converter cannot vouch for goes through the model instead, which
+keeps the output byte-for-byte what FastAPI would have sent.
+
+Clients on slow links can also shape list and document reads:
+?fields=a,b keeps only those fields (plus id), read from Mongo through a
+projection, and ?profile=compact renames fields to the short keys in
+COMPACT_KEYS and sends timestamps as epoch seconds.
+"""
+import json
+import math
+import os
+import typing
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Type
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, create_model
+from pydantic_core import PydanticUndefined
+
+try:
+    import orjson
+except ImportError:  # optional: without it documents are encoded through their models
+    orjson = None
+
+# FAST_RESPONSES=1 serves plain list pages through FastEncoder; off by default, lists go through the models.
+# ?fields= and ?profile= always use it, since the models cannot produce those shapes.
+FAST_RESPONSES = os.environ.get("FAST_RESPONSES", "0") == "1"
+
+FIELDS_PARAM = "fields"
+PROFILE_PARAM = "profile"
+COMPACT = "compact"
+
+# Field name -> key sent in the compact profile; fields not listed keep their name
+COMPACT_KEYS = {
+    "id": "i",
+    "user_id": "u",
+    "user_name": "un",
+    "user_phone": "up",
+    "patient_id": "pi",
+    "patient_name": "pn",
+    "asha_id": "ai",
+    "doctor_id": "di",
+    "doctor_name": "dn",
+    "pharmacy_id": "ph",
+    "pharmacy_name": "phn",
+    "name": "n",
+    "phone": "p",
+    "village": "v",
+    "language": "lg",
+    "role": "r",
+    "emergency_contact": "ec",
+    "location": "l",
+    "coordinates": "co",
+    "is_available": "av",
+    "type": "t",
+    "title": "ti",
+    "description": "d",
+    "medications": "md",
+    "attachments": "at",
+    "is_synced": "sy",
+    "offline_id": "o",
+    "medicines": "m",
+    "medicine_name": "mn",
+    "stock": "s",
+    "price": "pr",
+    "expiry": "ex",
+    "status": "st",
+    "symptoms": "sm",
+    "assessment": "as",
+    "severity": "sv",
+    "recommendations": "rc",
+    "referral_needed": "rn",
+    "consultation_type": "ct",
+    "room_id": "ri",
+    "prescription": "rx",
+    "diagnosis": "dg",
+    "alert_type": "al",
+    "responders_notified": "rs",
+    "visit_type": "vt",
+    "findings": "f",
+    "action_taken": "ac",
+    "vital_signs": "vs",
+    "created_at": "c",
+    "updated_at": "ua",
+    "last_updated": "lu",
+    "date": "dt",
+    "booking_date": "bd",
+    "pickup_date": "pd",
+    "reserved_until": "ru",
+    "appointment_time": "ap",
+    "next_visit_date": "nv",
+}
+
+
+class _Mismatch(Exception):
+    pass
+
+
+def _identity(value):
+    return value
+
+
+def _check(*types):
+    def convert(value):
+        if type(value) not in types:
+            raise _Mismatch
+        return value
+    return convert
+
+
+def _int(value):
+    if type(value) is not int or not -2 ** 63 <= value < 2 ** 64:
+        raise _Mismatch
+    return value
+
+
+def _float(value):
+    if type(value) is int:
+        value = float(value)
+    elif type(value) is not float:
+        raise _Mismatch
+    # json.dumps and orjson agree on every float outside exponent notation
+    if value != 0 and not (1e-4 <= abs(value) < 1e16) or not math.isfinite(value):
+        raise _Mismatch
+    return value
+
+
+def _datetime(value):
+    # Motor returns naive UTC datetimes; aware ones would get a "Z" from pydantic and "+00:00" from orjson
+    if type(value) is not datetime or value.tzinfo is not None:
+        raise _Mismatch
+    return value
+
+
+def converter(annotation) -> Optional[Callable[[Any], Any]]:
+    """A function checking/coercing a stored value as the model would, or None if unsupported"""
+    if annotation is Any:
+        return _identity
+    if annotation is str:
+        return _check(str)
+    if annotation is bool:
+        return _check(bool)
+    if annotation is int:
+        return _int
+    if annotation is float:
+        return _float
+    if annotation is datetime:
+        return _datetime
+
+    origin, args = typing.get_origin(annotation), typing.get_args(annotation)
+    if origin is typing.Union and len(args) == 2 and type(None) in args:
+        inner = converter(args[0] if args[1] is type(None) else args[1])
+        if inner is None:
+            return None
+        return lambda value: None if value is None else inner(value)
+    if origin is list:
+        inner = converter(args[0]) if args else _identity
+        if inner is None:
+            return None
+
+        def convert_list(value):
+            if type(value) is not list:
+                raise _Mismatch
+            return value if inner is _identity else [inner(item) for item in value]
+        return convert_list
+    if origin is dict:
+        key_type, value_type = args if args else (str, Any)
+        inner = converter(value_type)
+        if key_type is not str or inner is None:
+            return None
+
+        def convert_dict(value):
+            if type(value) is not dict or any(type(key) is not str for key in value):
+                raise _Mismatch
+            return value if inner is _identity else {key: inner(item) for key, item in value.items()}
+        return convert_dict
+    return None
+
+
+def _epoch(value):
+    """Seconds since the epoch for datetimes (naive ones are UTC, as Motor returns them)"""
+    if isinstance(value, datetime):
+        return int((value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp())
+    return value
+
+
+def _dumps_like_fastapi(content: Any) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class FastEncoder:
+    """Encodes stored documents of one model to the JSON FastAPI would produce for the model"""
+
+    def __init__(self, model: Type[BaseModel], compact: bool = False):
+        self.model = model
+        self.compact = compact
+        self.fields = []
+        self.supported = orjson is not None
+        for name, field in model.model_fields.items():
+            convert = converter(field.annotation)
+            if convert is None or field.alias:
+                self.supported = False
+            elif compact:
+                convert = (lambda inner: lambda value: _epoch(inner(value)))(convert)
+            # Required fields and factory defaults cannot be filled in without the model
+            default = PydanticUndefined if field.default_factory else field.default
+            key = COMPACT_KEYS.get(name, name) if compact else name
+            self.fields.append((name, key, convert, default))
+
+    def projection(self) -> Dict[str, int]:
+        """Mongo projection for exactly the model's fields"""
+        return {"_id": 0, **{name: 1 for name, _, _, _ in self.fields}}
+
+    def _fast(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        out = {}
+        for name, key, convert, default in self.fields:
+            value = doc.get(name, PydanticUndefined)
+            if value is PydanticUndefined:
+                if default is PydanticUndefined:
+                    raise _Mismatch
+                value = default
+            out[key] = convert(value)
+        return out
+
+    def _through_model(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.compact:
+            return self.model(**doc).model_dump(mode="json")
+        dumped = self.model(**doc).model_dump()
+        return jsonable_encoder({key: _epoch(dumped[name]) for name, key, _, _ in self.fields})
+
+    def encode_one(self, doc: Dict[str, Any]) -> bytes:
+        if self.supported:
+            try:
+                return orjson.dumps(self._fast(doc))
+            except (_Mismatch, TypeError):
+                pass
+        return _dumps_like_fastapi(self._through_model(doc))
+
+    def encode_many(self, docs: Iterable[Dict[str, Any]]) -> bytes:
+        return b"[" + b",".join(self.encode_one(doc) for doc in docs) + b"]"
+
+
+@lru_cache(maxsize=None)
+def fast_encoder(model: Type[BaseModel], compact: bool = False) -> FastEncoder:
+    return FastEncoder(model, compact)
+
+
+@lru_cache(maxsize=1024)
+def sparse_model(model: Type[BaseModel], fields: FrozenSet[str]) -> Type[BaseModel]:
+    """model cut down to fields, keeping each field's type and default"""
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (field.annotation, field) for name, field in model.model_fields.items() if name in fields},
+    )
+
+
+def requested_fields(request: Request, model: Type[BaseModel]) -> Optional[FrozenSet[str]]:
+    """The ?fields= sparse fieldset (always with id), or None for every field; raises ValueError on unknown names"""
+    raw = request.query_params.get(FIELDS_PARAM)
+    if not raw:
+        return None
+    fields = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = fields - set(model.model_fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    if "id" in model.model_fields:
+        fields.add("id")
+    return frozenset(fields)
+
+
+def shaped_encoder(request: Request, model: Type[BaseModel]) -> Optional[FastEncoder]:
+    """Encoder for the fields and profile a client asked for, or None if it asked for neither"""
+    profile = request.query_params.get(PROFILE_PARAM)
+    if profile not in (None, "", "full", COMPACT):
+        raise ValueError(f"Unknown profile: {profile}")
+    fields = requested_fields(request, model)
+    compact = profile == COMPACT
+    if fields is None and not compact:
+        return None
+    return fast_encoder(sparse_model(model, fields) if fields is not None else model, compact)
@@ -1,29 +1,84 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request, Response, Query, WebSocket
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone, timedelta
-# from emergentintegrations.llm.chat import LlmChat, UserMessage
+from datetime import date, datetime, timezone, timedelta
 import google.generativeai as genai
 import json
 import asyncio
 import base64
+import hashlib
+import time
+from urllib.parse import quote
+from ai_governor import CLOSED, AIGovernor
+from caching import TwoTierCache
+from triage import TriageEngine, TriageResult
+from indexes import audit_query_plans, ensure_indexes
+from responders import RESPONDER_PROJECTION, RESPONDER_ROLES, available_responders, find_nearest_responders, geo_point
+from inventory import (
+    NO_EXPIRY, MedicineNameIndex, add_missing_line_items, inventory_id, line_item, medicine_key, migrate_nested_inventory,
+    save_line_items, search_inventory, today,
+)
+from reservations import InsufficientStock, commit, held_quantity, release, release_expired, reserve, same_holds
+from notifications import EMERGENCY, ROUTINE, FakeProvider, LogProvider, NotificationDispatcher, Outbox
+from pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, list_page, wants_ndjson
+from response_cache import LocalBackend, RedisBackend, ResponseCache, etag_matches
+from timeline import TimelineSource, fetch_timeline
+from realtime import Hub
+from rollups import ROLLUPS, SCOPES, VisitRollups
+from surveillance import ALERTS, OutbreakDetector
+from attachments import (
+    UPLOAD_OFFSET_HEADER, AttachmentStore, DigestMismatch, DiskStore, GridFSStore, OffsetMismatch,
+    RangeNotSatisfiable, UploadNotFound, UploadTooLarge, migrate_inline_attachments, parse_range,
+)
+from scheduling import SCHEDULES, SLOT_TAKEN, SlotIndex, from_epoch, parse_weekly, to_epoch
+from serialization import COMPACT_KEYS, FIELDS_PARAM, PROFILE_PARAM, shaped_encoder
+from compression import CompressionMiddleware
+from admission import AI, BULK, DEFAULT_POLICIES, AdmissionController, AdmissionMiddleware
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, MongoCommandListener, ai_span, registry
+from sync import (
+    TOMBSTONES, INSERTED, REJECTED, LineTooLong, SyncSequence, backfill_sync_sequence,
+    bulk_insert_offline, decode_token, encode_token, fetch_changes, iter_ndjson, record_tombstone,
+)
+from write_behind import GroupCommitWriter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Offline triage rules, compiled once at startup
+triage_engine = TriageEngine.load(ROOT_DIR / "data" / "triage_rules.json")
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandListener()])
 db = client[os.environ['DB_NAME']]
 
+# Change counter behind the offline delta-pull feed
+sync_sequence = SyncSequence(db.counters)
+
+# Opt-in group commit for the append-only collections named in WRITE_BEHIND_COLLECTIONS (e.g. "symptom_checks,
+# asha_visits,health_records"): concurrent inserts are written together once a batch fills or the delay passes
+write_behind = GroupCommitWriter(
+    db,
+    sync_sequence,
+    [name.strip() for name in os.environ.get("WRITE_BEHIND_COLLECTIONS", "").split(",") if name.strip()],
+    max_batch=int(os.environ.get("WRITE_BEHIND_MAX_BATCH", "200")),
+    max_delay=float(os.environ.get("WRITE_BEHIND_DELAY_MS", "5")) / 1000,
+    max_inflight=int(os.environ.get("WRITE_BEHIND_MAX_INFLIGHT", "4")),
+    max_pending=int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "5000")),
+)
+
 # Create the main app without a prefix
 app = FastAPI(title="ArogyaCircle - Rural Healthcare Platform")
 
@@ -33,6 +88,132 @@ api_router = APIRouter(prefix="/api")
 # Security
 security = HTTPBearer()
 
+# Offline sync uploads are written to Mongo in batches of this many records
+SYNC_BATCH_SIZE = int(os.environ.get("SYNC_BATCH_SIZE", "500"))
+# Longest record line of an NDJSON sync upload; larger attachments go through the resumable upload API
+SYNC_MAX_LINE_BYTES = int(os.environ.get("SYNC_MAX_LINE_MB", "16")) * 1024 * 1024
+# Changes younger than this are held back so a resume token never skips an in-flight write
+SYNC_SETTLE_SECONDS = float(os.environ.get("SYNC_SETTLE_SECONDS", "2"))
+
+# Explain every declared query shape after index creation and log COLLSCANs
+MONGO_EXPLAIN_DEBUG = os.environ.get("MONGO_EXPLAIN_DEBUG", "").lower() in ("1", "true", "yes")
+
+# AI symptom assessments are shared between patients reporting the same symptoms
+symptom_cache = TwoTierCache(
+    db.symptom_cache,
+    maxsize=int(os.environ.get("SYMPTOM_CACHE_SIZE", "2048")),
+    ttl_seconds=int(os.environ.get("SYMPTOM_CACHE_TTL_SECONDS", "86400")),
+)
+
+# Translations are remembered per (source text hash, target language) with no expiry
+translation_memory = TwoTierCache(db.translation_memory, maxsize=int(os.environ.get("TRANSLATION_CACHE_SIZE", "10000")))
+TRANSLATION_BATCH_SIZE = int(os.environ.get("TRANSLATION_BATCH_SIZE", "200"))
+TRANSLATION_PACKS_DIR = Path(os.environ.get("TRANSLATION_PACKS_DIR", ROOT_DIR / "data" / "translations"))
+
+# Every outbound AI call shares one concurrency limit, deadline and circuit breaker
+ai_governor = AIGovernor(
+    "gemini",
+    max_concurrency=int(os.environ.get("AI_MAX_CONCURRENCY", "8")),
+    timeout=float(os.environ.get("AI_TIMEOUT_SECONDS", "8")),
+    failure_threshold=int(os.environ.get("AI_FAILURE_THRESHOLD", "5")),
+    reset_timeout=float(os.environ.get("AI_RESET_TIMEOUT_SECONDS", "30")),
+)
+
+# Free consultation slots are offered this many days ahead; other workers' bookings are picked up every refresh
+slot_index = SlotIndex(horizon_days=int(os.environ.get("SLOT_HORIZON_DAYS", "60")))
+SLOT_REFRESH_SECONDS = float(os.environ.get("SLOT_REFRESH_SECONDS", "15"))
+
+# Attachment bytes go to GridFS, or under ATTACHMENT_DIR when set (a single host only)
+ATTACHMENT_DIR = os.environ.get("ATTACHMENT_DIR")
+attachment_store = AttachmentStore(
+    db,
+    DiskStore(Path(ATTACHMENT_DIR)) if ATTACHMENT_DIR else GridFSStore(db),
+    max_bytes=int(os.environ.get("ATTACHMENT_MAX_MB", "50")) * 1024 * 1024,
+    upload_ttl_seconds=float(os.environ.get("ATTACHMENT_UPLOAD_TTL_HOURS", "24")) * 3600,
+)
+ATTACHMENT_SWEEP_SECONDS = int(os.environ.get("ATTACHMENT_SWEEP_SECONDS", "600"))
+
+# Supervisor dashboards read daily visit buckets; days are calendar days at this UTC offset (IST by default)
+visit_rollups = VisitRollups(db, utc_offset_minutes=int(os.environ.get("ROLLUP_UTC_OFFSET_MINUTES", "330")))
+# Buckets are rebuilt from all visits at startup when there are none yet, or always with ROLLUP_REBUILD=1
+ROLLUP_REBUILD = os.environ.get("ROLLUP_REBUILD", "").lower() in ("1", "true", "yes")
+ROLLUP_REBUILD_WORKERS = int(os.environ.get("ROLLUP_REBUILD_WORKERS", "4"))
+
+# Symptom checks are counted per village and symptom; a 24-hour spike over the prior baseline raises an outbreak alert
+outbreak_detector = OutbreakDetector(
+    db,
+    window_hours=int(os.environ.get("OUTBREAK_WINDOW_HOURS", "24")),
+    baseline_windows=int(os.environ.get("OUTBREAK_BASELINE_WINDOWS", "7")),
+    z_threshold=float(os.environ.get("OUTBREAK_Z_THRESHOLD", "3")),
+    min_cases=int(os.environ.get("OUTBREAK_MIN_CASES", "5")),
+)
+OUTBREAK_CHECKPOINT_SECONDS = int(os.environ.get("OUTBREAK_CHECKPOINT_SECONDS", "60"))
+
+# How many of the nearest available responders each emergency alert goes to
+EMERGENCY_RESPONDER_COUNT = int(os.environ.get("EMERGENCY_RESPONDER_COUNT", "10"))
+
+# SMS goes through a durable outbox; NOTIFICATION_PROVIDER=fake keeps deliveries in memory for tests
+notification_outbox = Outbox(db.notification_outbox)
+notification_dispatcher = NotificationDispatcher(
+    notification_outbox,
+    {"sms": FakeProvider() if os.environ.get("NOTIFICATION_PROVIDER") == "fake" else LogProvider()},
+    workers=int(os.environ.get("NOTIFICATION_WORKERS", "4")),
+    batch_size=int(os.environ.get("NOTIFICATION_BATCH_SIZE", "50")),
+    max_attempts=int(os.environ.get("NOTIFICATION_MAX_ATTEMPTS", "5")),
+    send_timeout=float(os.environ.get("NOTIFICATION_SEND_TIMEOUT_SECONDS", "20")),
+)
+
+# Medicine names known to the search endpoint, kept current as stock is written
+medicine_names = MedicineNameIndex()
+MEDICINE_INDEX_REFRESH_SECONDS = int(os.environ.get("MEDICINE_INDEX_REFRESH_SECONDS", "300"))
+
+# Booked stock is held this long for pickup before the sweeper returns it
+RESERVATION_HOLD_SECONDS = float(os.environ.get("RESERVATION_HOLD_HOURS", "24")) * 3600
+RESERVATION_SWEEP_SECONDS = int(os.environ.get("RESERVATION_SWEEP_SECONDS", "60"))
+# A shelf count is retried this often when bookings keep changing the holds it is counted against
+STOCK_COUNT_ATTEMPTS = 3
+
+# GET responses of rarely changing data, invalidated per namespace by the matching writes.
+# Set RESPONSE_CACHE_URL=redis://... when running several workers so they share invalidations.
+RESPONSE_CACHE_URL = os.environ.get("RESPONSE_CACHE_URL")
+response_cache = ResponseCache(
+    RedisBackend(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL
+    else LocalBackend(maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", "5000"))),
+    ttls={"users": 300, "pharmacies": 300, "consultations": 600, "emergency_alerts": 10, "languages": 86400},
+    vary=(FIELDS_PARAM, PROFILE_PARAM),
+)
+
+# The health check reports the database as unreachable when a ping takes longer than this
+HEALTH_PING_TIMEOUT_SECONDS = float(os.environ.get("HEALTH_PING_TIMEOUT_SECONDS", "2"))
+
+# Live emergency alert feed; each worker pushes to the WebSocket/SSE clients connected to it
+alert_hub = Hub(
+    history_size=int(os.environ.get("ALERT_FEED_HISTORY", "1000")),
+    queue_size=int(os.environ.get("ALERT_FEED_QUEUE_SIZE", "100")),
+)
+ALERT_FEED_HEARTBEAT_SECONDS = float(os.environ.get("ALERT_FEED_HEARTBEAT_SECONDS", "15"))
+
+# Requests run by priority class (emergency > clinical writes > reads > AI > bulk sync); all but emergencies share
+# ADMISSION_CAPACITY slots and lower classes get 503 + Retry-After when saturated. Behind a proxy, set
+# ADMISSION_TRUST_FORWARDED=1 so per-client rate limits key on X-Forwarded-For.
+admission = AdmissionController(
+    {
+        **DEFAULT_POLICIES,
+        AI: DEFAULT_POLICIES[AI]._replace(limit=int(os.environ.get("ADMISSION_AI_LIMIT", "16"))),
+        BULK: DEFAULT_POLICIES[BULK]._replace(limit=int(os.environ.get("ADMISSION_BULK_LIMIT", "4"))),
+    },
+    capacity=int(os.environ.get("ADMISSION_CAPACITY", "96")),
+    rate_limits=os.environ.get("ADMISSION_RATE_LIMITS", "on").lower() not in ("0", "off", "false", "no"),
+    enabled=os.environ.get("ADMISSION_CONTROL", "on").lower() not in ("0", "off", "false", "no"),
+)
+ADMISSION_TRUST_FORWARDED = os.environ.get("ADMISSION_TRUST_FORWARDED", "").lower() in ("1", "true", "yes")
+
+# Responses of at least this many bytes are gzip/brotli compressed for clients that accept it
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "512"))
+
+# Keeps references to fire-and-forget startup jobs so they are not garbage collected
+background_jobs = set()
+
 # =============================================================================
 # MODELS
 # =============================================================================
@@ -45,6 +226,8 @@ class User(BaseModel):
     language: str = "en"
     role: str = "patient"  # patient, asha, doctor
     emergency_contact: Optional[str] = None
+    location: Optional[Dict[str, float]] = None  # lat, lng
+    is_available: bool = True  # ASHA workers and doctors taking emergency alerts
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class UserCreate(BaseModel):
@@ -54,6 +237,11 @@ class UserCreate(BaseModel):
     language: str = "en"
     role: str = "patient"
     emergency_contact: Optional[str] = None
+    location: Optional[Dict[str, float]] = None
+
+class ResponderStatusUpdate(BaseModel):
+    location: Optional[Dict[str, float]] = None
+    is_available: Optional[bool] = None
 
 class HealthRecord(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -63,7 +251,7 @@ class HealthRecord(BaseModel):
     description: str
     doctor_name: Optional[str] = None
     medications: List[Dict[str, Any]] = []
-    attachments: List[str] = []
+    attachments: List[str] = []  # attachment ids
     date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     is_synced: bool = True
     offline_id: Optional[str] = None
@@ -79,14 +267,65 @@ class HealthRecordCreate(BaseModel):
     is_synced: bool = True
     offline_id: Optional[str] = None
 
+class AttachmentUploadCreate(BaseModel):
+    owner_id: str
+    filename: str
+    content_type: str = "application/octet-stream"
+    size: int = Field(..., ge=1)
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")
+
+class AttachmentUpload(BaseModel):
+    id: str
+    owner_id: str
+    filename: str
+    content_type: str
+    size: int
+    offset: int
+    status: str  # uploading, finalizing, complete
+    attachment_id: Optional[str] = None
+    expires_at: datetime
+
+class Attachment(BaseModel):
+    id: str
+    owner_id: str
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    created_at: datetime
+
 class Pharmacy(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     location: str
     phone: str
-    medicines: Dict[str, Dict[str, Any]] = {}  # medicine_name: {stock, price, expiry}
+    coordinates: Optional[Dict[str, float]] = None  # lat, lng
     last_updated: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class PharmacyCreate(Pharmacy):
+    # Stored as pharmacy_inventory line items, not on the pharmacy; read them from /pharmacies/{id}/inventory
+    medicines: Dict[str, Dict[str, Any]] = {}  # medicine_name: {stock, price, expiry}
+
+class InventoryItem(BaseModel):
+    id: str
+    pharmacy_id: str
+    pharmacy_name: str
+    medicine_name: str
+    stock: int = 0
+    price: Optional[float] = None
+    expiry: str = NO_EXPIRY  # YYYY-MM-DD
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class InventoryUpdate(BaseModel):
+    # Counted on the shelf, units held for bookings included; the stored stock is what is left to sell
+    stock: Optional[int] = Field(None, ge=0)
+    stock_delta: Optional[int] = None
+    price: Optional[float] = None
+    expiry: Optional[str] = None
+
+class MedicineSearchResult(InventoryItem):
+    distance_km: Optional[float] = None
+
 class MedicineRequest(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -94,8 +333,9 @@ class MedicineRequest(BaseModel):
     user_phone: str
     medicines: List[Dict[str, Any]]
     pharmacy_id: str
-    status: str = "pending"  # pending, confirmed, ready, completed
+    status: str = "pending"  # pending, reserved, completed, cancelled, expired
     booking_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    reserved_until: Optional[datetime] = None
     pickup_date: Optional[datetime] = None
 
 class MedicineRequestCreate(BaseModel):
@@ -115,17 +355,37 @@ class Consultation(BaseModel):
     prescription: List[Dict[str, Any]] = []
     status: str = "scheduled"  # scheduled, ongoing, completed, cancelled
     appointment_time: datetime
+    duration_minutes: Optional[int] = None  # set when booked into a doctor's slot
     consultation_type: str = "video"  # video, audio, chat
     room_id: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ConsultationCreate(BaseModel):
     patient_id: str
-    doctor_name: str
+    doctor_id: Optional[str] = None  # books one of the doctor's free slots
+    doctor_name: Optional[str] = None
     symptoms: str
     appointment_time: datetime
     consultation_type: str = "video"
 
+class WorkingHours(BaseModel):
+    weekly: Dict[str, List[List[str]]]  # "mon".."sun": [["09:00", "13:00"], ["14:00", "17:00"]] in local time
+    slot_minutes: int = Field(15, ge=5, le=240)
+    utc_offset_minutes: int = Field(330, ge=-720, le=840)  # IST
+    languages: List[str] = []  # defaults to the doctor's own language
+
+class DoctorSchedule(WorkingHours):
+    doctor_id: str
+    doctor_name: str
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class FreeSlot(BaseModel):
+    doctor_id: str
+    doctor_name: str
+    languages: List[str]
+    start: datetime
+    end: datetime
+
 class SymptomCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -140,6 +400,7 @@ class SymptomCheckCreate(BaseModel):
     user_id: str
     symptoms: List[str]
     additional_info: Optional[str] = None
+    language: str = "en"
 
 class EmergencyAlert(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -183,28 +444,75 @@ class ASHAVisitCreate(BaseModel):
     next_visit_date: Optional[datetime] = None
     vital_signs: Dict[str, Any] = {}
 
+# Response models for the collections served by the change feed
+SYNC_MODELS = {
+    "health_records": HealthRecord,
+    "consultations": Consultation,
+    "symptom_checks": SymptomCheck,
+    "medicine_requests": MedicineRequest,
+    "asha_visits": ASHAVisit,
+    "emergency_alerts": EmergencyAlert,
+}
+
 # =============================================================================
 # AUTHENTICATION & USERS
 # =============================================================================
 
+def validated_geo(location: Dict[str, float]) -> Dict[str, Any]:
+    """GeoJSON point stored alongside a lat/lng location for the geo indexes"""
+    point = geo_point(location)
+    if point is None:
+        raise HTTPException(status_code=400, detail="location needs lat in [-90, 90] and lng in [-180, 180]")
+    return point
+
 @api_router.post("/users", response_model=User)
 async def create_user(user: UserCreate):
     """Create a new user (patient, ASHA worker, or doctor)"""
     user_dict = user.dict()
     user_obj = User(**user_dict)
-    await db.users.insert_one(user_obj.dict())
+    user_doc = user_obj.dict()
+    if user.location is not None:
+        user_doc["geo"] = validated_geo(user.location)
+    await db.users.insert_one(user_doc)
+    await response_cache.invalidate("users")
     return user_obj
 
 @api_router.get("/users/{user_id}", response_model=User)
-async def get_user(user_id: str):
+async def get_user(request: Request, user_id: str):
     """Get user details by ID"""
-    user = await db.users.find_one({"id": user_id})
+    async def load(_):
+        try:
+            encoder = shaped_encoder(request, User)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        user = await db.users.find_one({"id": user_id}, encoder and encoder.projection())
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        if encoder:
+            return Response(content=encoder.encode_one(user), media_type="application/json")
+        return User(**user)
+
+    return await response_cache.respond(request, "users", user_id, load)
+
+@api_router.put("/users/{user_id}/responder-status", response_model=User)
+async def update_responder_status(user_id: str, update: ResponderStatusUpdate):
+    """Update where a responder is and whether they can take emergency alerts"""
+    fields: Dict[str, Any] = {}
+    if update.location is not None:
+        fields.update(location=update.location, geo=validated_geo(update.location))
+    if update.is_available is not None:
+        fields["is_available"] = update.is_available
+    if not fields:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    user = await db.users.find_one_and_update({"id": user_id}, {"$set": fields}, return_document=ReturnDocument.AFTER)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    await response_cache.invalidate("users")
     return User(**user)
 
 @api_router.get("/users", response_model=List[User])
-async def get_users(role: Optional[str] = None, village: Optional[str] = None):
+async def get_users(request: Request, response: Response, role: Optional[str] = None, village: Optional[str] = None,
+                    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
     """Get all users, optionally filtered by role or village"""
     query = {}
     if role:
@@ -212,8 +520,7 @@ async def get_users(role: Optional[str] = None, village: Optional[str] = None):
     if village:
         query["village"] = village
     
-    users = await db.users.find(query).to_list(1000)
-    return [User(**user) for user in users]
+    return await list_page(request, response, db.users, query, "id", 1, User, limit, after, default_limit=1000)
 
 # =============================================================================
 # HEALTH RECORDS (OFFLINE-FIRST EHR)
@@ -224,126 +531,549 @@ async def create_health_record(record: HealthRecordCreate):
     """Create a new health record with offline sync support"""
     record_dict = record.dict()
     record_obj = HealthRecord(**record_dict)
-    await db.health_records.insert_one(record_obj.dict())
+    try:
+        await store_inline_attachments(record_obj)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid attachment: {e}")
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    await insert_synced("health_records", record_obj.dict())
     return record_obj
 
+async def store_inline_attachments(record_obj: HealthRecord):
+    """Replace base64 attachments sent by older clients with ids of stored attachments"""
+    record_obj.attachments = await attachment_store.replace_inline(record_obj.user_id, record_obj.attachments,
+                                                                   record_obj.title)
+
 @api_router.get("/health-records/{user_id}", response_model=List[HealthRecord])
-async def get_user_health_records(user_id: str):
+async def get_user_health_records(request: Request, response: Response, user_id: str,
+                                  limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
     """Get all health records for a user"""
-    records = await db.health_records.find({"user_id": user_id}).sort("date", -1).to_list(1000)
-    return [HealthRecord(**record) for record in records]
+    return await list_page(request, response, db.health_records, {"user_id": user_id}, "date", -1, HealthRecord,
+                           limit, after, default_limit=1000)
+
+@api_router.delete("/health-records/{record_id}")
+async def delete_health_record(record_id: str):
+    """Delete a health record and leave a tombstone for offline clients"""
+    record = await db.health_records.find_one_and_delete({"id": record_id})
+    if not record:
+        raise HTTPException(status_code=404, detail="Health record not found")
+    await record_tombstone(db, sync_sequence, "health_records", record)
+    return {"message": "Health record deleted"}
 
 @api_router.post("/health-records/sync")
-async def sync_offline_records(records: List[HealthRecordCreate]):
+async def sync_offline_records(records: List[Any]):
     """Sync offline health records to cloud"""
     synced_records = []
-    for record_data in records:
-        if record_data.offline_id:
-            # Check if already synced
-            existing = await db.health_records.find_one({"offline_id": record_data.offline_id})
-            if not existing:
-                record_dict = record_data.dict()
-                record_obj = HealthRecord(**record_dict)
-                await db.health_records.insert_one(record_obj.dict())
-                synced_records.append(record_obj)
-    
-    return {"synced_count": len(synced_records), "records": synced_records}
+    results = []
+    for start in range(0, len(records), SYNC_BATCH_SIZE):
+        batch_results, batch_records = await _sync_record_batch(records[start:start + SYNC_BATCH_SIZE])
+        results.extend(batch_results)
+        synced_records.extend(batch_records)
+
+    return {"synced_count": len(synced_records), "records": synced_records, "results": results}
+
+@api_router.post("/health-records/sync/stream")
+async def sync_offline_records_stream(request: Request):
+    """Sync a newline-delimited JSON stream of offline health records in bounded batches"""
+    results = []
+    batch = []
+    try:
+        async for raw in iter_ndjson(request.stream(), SYNC_MAX_LINE_BYTES):
+            batch.append(raw)
+            if len(batch) >= SYNC_BATCH_SIZE:
+                results.extend((await _sync_record_batch(batch))[0])
+                batch = []
+    except LineTooLong as e:
+        # Batches before the line are stored; offline_ids make the retry safe
+        raise HTTPException(status_code=413, detail=str(e))
+    if batch:
+        results.extend((await _sync_record_batch(batch))[0])
+
+    synced_count = sum(1 for result in results if result["status"] == INSERTED)
+    return {"synced_count": synced_count, "results": results}
+
+async def _sync_record_batch(raw_records: List[Any]):
+    """Validate a batch of offline records and bulk insert the ones not seen before"""
+    results = []
+    candidates = []
+    for raw in raw_records:
+        offline_id = raw.get("offline_id") if isinstance(raw, dict) else None
+        try:
+            record_obj = HealthRecord(**HealthRecordCreate(**raw).dict())
+        except (TypeError, ValidationError) as e:
+            results.append({"offline_id": offline_id, "status": REJECTED, "error": _describe_invalid_record(e)})
+            continue
+        if not record_obj.offline_id:
+            results.append({"offline_id": None, "status": REJECTED, "error": "offline_id is required"})
+            continue
+        try:
+            await store_inline_attachments(record_obj)
+        except (ValueError, UploadTooLarge) as e:
+            results.append({"offline_id": offline_id, "status": REJECTED, "error": f"attachments: {e}"})
+            continue
+        candidates.append((len(results), record_obj))
+        results.append({"offline_id": record_obj.offline_id})
+
+    docs = [record_obj.dict() for _, record_obj in candidates]
+    await sync_sequence.stamp(*docs)
+    statuses = await bulk_insert_offline(db.health_records, docs)
+
+    synced_records = []
+    for (slot, record_obj), status in zip(candidates, statuses):
+        results[slot]["status"] = status
+        if status == INSERTED:
+            results[slot]["id"] = record_obj.id
+            synced_records.append(record_obj)
+    return results, synced_records
+
+def _describe_invalid_record(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        first = error.errors()[0]
+        return f"{'.'.join(str(part) for part in first['loc'])}: {first['msg']}"
+    return "record must be a JSON object"
+
+# =============================================================================
+# ATTACHMENTS (RESUMABLE UPLOADS)
+# =============================================================================
+
+@api_router.post("/attachments/uploads", response_model=AttachmentUpload)
+async def start_attachment_upload(upload: AttachmentUploadCreate, response: Response):
+    """Open a resumable upload; PUT the bytes to it with an Upload-Offset header"""
+    try:
+        started = await attachment_store.start(upload.owner_id, upload.filename, upload.content_type, upload.size,
+                                               upload.sha256)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    response.headers[UPLOAD_OFFSET_HEADER] = str(started["offset"])
+    return started
+
+@api_router.get("/attachments/uploads/{upload_id}", response_model=AttachmentUpload)
+async def get_attachment_upload(upload_id: str, response: Response):
+    """How far an upload got, to resume it from there"""
+    try:
+        upload = await attachment_store.status(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    response.headers[UPLOAD_OFFSET_HEADER] = str(upload["offset"])
+    return upload
+
+@api_router.put("/attachments/uploads/{upload_id}", response_model=AttachmentUpload)
+async def upload_attachment_bytes(request: Request, response: Response, upload_id: str,
+                                  upload_offset: int = Header(..., alias=UPLOAD_OFFSET_HEADER, ge=0)):
+    """Append the request body at Upload-Offset; the last byte turns the upload into an attachment"""
+    try:
+        upload = await attachment_store.receive(upload_id, upload_offset, request.stream())
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except OffsetMismatch as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={UPLOAD_OFFSET_HEADER: str(e.offset)})
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DigestMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    response.headers[UPLOAD_OFFSET_HEADER] = str(upload["offset"])
+    return upload
+
+@api_router.delete("/attachments/uploads/{upload_id}")
+async def abort_attachment_upload(upload_id: str):
+    """Give up on an upload and drop the bytes received so far"""
+    try:
+        await attachment_store.abort(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"message": "Upload aborted"}
+
+async def get_attachment_or_404(attachment_id: str) -> Dict[str, Any]:
+    attachment = await attachment_store.get(attachment_id)
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return attachment
+
+def attachment_headers(attachment: Dict[str, Any]) -> Dict[str, str]:
+    # Content never changes under an id; only images and PDFs are shown inline
+    disposition = "inline" if attachment["content_type"].startswith(("image/", "application/pdf")) else "attachment"
+    return {
+        "ETag": f'"{attachment["sha256"]}"',
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Content-Disposition": f"{disposition}; filename*=UTF-8''{quote(attachment['filename'])}",
+        "X-Content-Type-Options": "nosniff",
+    }
+
+@api_router.get("/attachments/{attachment_id}/info", response_model=Attachment)
+async def get_attachment_info(attachment_id: str):
+    """Name, type, size and hash of an attachment"""
+    return await get_attachment_or_404(attachment_id)
+
+@api_router.get("/attachments/{attachment_id}/thumbnail")
+async def get_attachment_thumbnail(request: Request, attachment_id: str, size: int = Query(256, ge=16, le=1024)):
+    """A JPEG preview of an image attachment"""
+    attachment = await get_attachment_or_404(attachment_id)
+    size = attachment_store.thumbnail_size(size)
+    headers = {**attachment_headers(attachment), "ETag": f'"{attachment["sha256"]}-{size}"'}
+    headers["Content-Disposition"] = "inline"
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    thumbnail = await attachment_store.thumbnail(attachment, size)
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="No thumbnail for this attachment")
+    return Response(content=thumbnail, media_type="image/jpeg", headers=headers)
+
+@api_router.get("/attachments/{attachment_id}")
+async def download_attachment(request: Request, attachment_id: str):
+    """Stream an attachment; a single byte range is answered with 206 Partial Content"""
+    attachment = await get_attachment_or_404(attachment_id)
+    headers = {**attachment_headers(attachment), "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    size = attachment["size"]
+    byte_range = None
+    # If-Range: resume only when the client's partial copy is of this very content
+    if request.headers.get("if-range", headers["ETag"]) == headers["ETag"]:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            raise HTTPException(status_code=416, detail="Range not satisfiable",
+                                headers={"Content-Range": f"bytes */{size}"})
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    try:
+        body = await attachment_store.open(attachment, start, end)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Attachment content is missing")
+    return StreamingResponse(body, status_code=206 if byte_range else 200, media_type=attachment["content_type"],
+                             headers=headers)
+
+# =============================================================================
+# OFFLINE SYNC FEED
+# =============================================================================
+
+@api_router.get("/sync/changes")
+async def get_sync_changes(user_id: str, since: Optional[str] = None, limit: int = Query(500, ge=1, le=1000)):
+    """Get everything created, changed or deleted for a user since a resume token"""
+    try:
+        since_seq = decode_token(since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    docs, last_seq, has_more = await fetch_changes(db, user_id, since_seq, limit, SYNC_SETTLE_SECONDS)
+    changes = []
+    for doc in docs:
+        collection = doc.pop("_collection")
+        if collection == TOMBSTONES:
+            changes.append({"collection": doc["collection"], "op": "delete", "id": doc["doc_id"], "seq": doc["sync_seq"]})
+        else:
+            model = SYNC_MODELS[collection]
+            changes.append({"collection": collection, "op": "upsert", "id": doc["id"], "seq": doc["sync_seq"], "doc": model(**doc)})
+
+    return {"changes": changes, "next_token": encode_token(last_seq), "has_more": has_more}
 
 # =============================================================================
 # PHARMACY INVENTORY & BOOKING
 # =============================================================================
 
-@api_router.post("/pharmacies", response_model=Pharmacy)
-async def create_pharmacy(pharmacy: Pharmacy):
+async def save_pharmacy(pharmacy: PharmacyCreate):
+    """Store a pharmacy and turn its nested medicines dict into inventory line items"""
+    pharmacy_doc = pharmacy.dict(exclude={"medicines"})
+    if pharmacy.coordinates is not None:
+        pharmacy_doc["geo"] = validated_geo(pharmacy.coordinates)
+    await db.pharmacies.insert_one(pharmacy_doc)
+    items = await save_line_items(db.pharmacy_inventory, pharmacy_doc, pharmacy.medicines)
+    for item in items:
+        medicine_names.add(item["medicine_name"])
+    await response_cache.invalidate("pharmacies")
+
+@api_router.post("/pharmacies", response_model=PharmacyCreate)
+async def create_pharmacy(pharmacy: PharmacyCreate):
     """Create or update pharmacy information"""
-    await db.pharmacies.insert_one(pharmacy.dict())
+    await save_pharmacy(pharmacy)
     return pharmacy
 
 @api_router.get("/pharmacies", response_model=List[Pharmacy])
-async def get_pharmacies():
-    """Get all pharmacies with current inventory"""
-    pharmacies = await db.pharmacies.find().to_list(100)
-    return [Pharmacy(**pharmacy) for pharmacy in pharmacies]
+async def get_pharmacies(request: Request, response: Response,
+                         limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
+    """Get all pharmacies; their stock is listed under /pharmacies/{id}/inventory"""
+    if wants_ndjson(request):
+        return await list_page(request, response, db.pharmacies, {}, "id", 1, Pharmacy, limit, after, default_limit=100)
+    return await response_cache.respond(
+        request, "pharmacies", f"list:{limit}:{after}",
+        lambda scratch: list_page(request, scratch, db.pharmacies, {}, "id", 1, Pharmacy, limit, after, default_limit=100)
+    )
+
+@api_router.get("/pharmacies/{pharmacy_id}/inventory", response_model=List[InventoryItem])
+async def get_pharmacy_inventory(request: Request, response: Response, pharmacy_id: str,
+                                 limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
+    """Get a pharmacy's stock line items, by medicine name"""
+    return await list_page(request, response, db.pharmacy_inventory, {"pharmacy_id": pharmacy_id}, "medicine_name", 1,
+                           InventoryItem, limit, after, default_limit=500)
+
+@api_router.put("/pharmacies/{pharmacy_id}/inventory/{medicine_name}", response_model=InventoryItem)
+async def update_inventory(pharmacy_id: str, medicine_name: str, update: InventoryUpdate):
+    """Set or adjust the stock, price or expiry of one medicine at a pharmacy.
+
+    stock is the count on the shelf; the returned stock excludes units held for bookings awaiting pickup.
+    """
+    if update.stock is not None and update.stock_delta is not None:
+        raise HTTPException(status_code=400, detail="Give either stock or stock_delta, not both")
+    if update.expiry is not None:
+        try:
+            date.fromisoformat(update.expiry)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="expiry must be a YYYY-MM-DD date")
+    pharmacy = await db.pharmacies.find_one({"id": pharmacy_id}, {"_id": 0, "id": 1, "name": 1, "coordinates": 1})
+    if not pharmacy:
+        raise HTTPException(status_code=404, detail="Pharmacy not found")
+
+    new_item = line_item(pharmacy, medicine_name, {})
+    fields = {key: value for key, value in update.dict(exclude={"stock_delta"}).items() if value is not None}
+    fields["updated_at"] = new_item.pop("updated_at")
+    changes: Dict[str, Any] = {"$set": fields}
+    query: Dict[str, Any] = {"id": new_item["id"]}
+    if update.stock_delta is not None:
+        changes["$inc"] = {"stock": update.stock_delta}
+        new_item.pop("stock")
+        if update.stock_delta < 0:
+            # Never let an adjustment take stock below zero
+            query["stock"] = {"$gte": -update.stock_delta}
+    for key in fields:
+        new_item.pop(key, None)
+    changes["$setOnInsert"] = new_item
+
+    # A decrement only applies to stock that exists; anything else may create the line item
+    upsert = update.stock_delta is None or update.stock_delta >= 0
+    item = None
+    for _ in range(STOCK_COUNT_ATTEMPTS):
+        if update.stock is not None:
+            # Held units are still on the shelf: a recount must not free them, or their release would add them twice
+            current = await db.pharmacy_inventory.find_one({"id": new_item["id"]}, {"holds": 1})
+            held = held_quantity(current)
+            if update.stock < held:
+                raise HTTPException(status_code=409, detail=f"{held} units are held for bookings awaiting pickup")
+            fields["stock"] = update.stock - held
+            query = {"id": new_item["id"], **(same_holds(current) if current else {})}
+            upsert = current is None
+        try:
+            item = await db.pharmacy_inventory.find_one_and_update(
+                query, changes, upsert=upsert, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            if update.stock is not None:
+                # A concurrent write created the line item first; count against its holds
+                continue
+            # A concurrent write created the line item first; apply ours to it
+            item = await db.pharmacy_inventory.find_one_and_update(query, changes, return_document=ReturnDocument.AFTER)
+        # A count that missed only because a booking changed the holds meanwhile is tried again
+        if item is not None or update.stock is None:
+            break
+    if item is None:
+        raise HTTPException(status_code=409, detail="Not enough stock for this adjustment" if update.stock is None
+                            else "Stock was booked while it was being counted, try again")
+    medicine_names.add(item["medicine_name"])
+    return InventoryItem(**item)
 
 @api_router.get("/pharmacies/{pharmacy_id}/medicines/{medicine_name}")
 async def check_medicine_availability(pharmacy_id: str, medicine_name: str):
     """Check if a specific medicine is available at a pharmacy"""
-    pharmacy = await db.pharmacies.find_one({"id": pharmacy_id})
-    if not pharmacy:
-        raise HTTPException(status_code=404, detail="Pharmacy not found")
-    
-    medicine = pharmacy.get("medicines", {}).get(medicine_name.lower())
-    if not medicine:
+    item = await db.pharmacy_inventory.find_one({"id": inventory_id(pharmacy_id, medicine_name)}, {"_id": 0})
+    if not item:
+        if not await db.pharmacies.find_one({"id": pharmacy_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Pharmacy not found")
         return {"available": False, "stock": 0}
-    
-    return {"available": medicine["stock"] > 0, **medicine}
+
+    sellable = item["stock"] > 0 and item["expiry"] >= today()
+    return {"available": sellable, "stock": item["stock"], "price": item.get("price"), "expiry": item["expiry"]}
+
+@api_router.get("/medicines/search")
+async def search_medicines(q: str = Query(..., min_length=2), lat: Optional[float] = None, lng: Optional[float] = None,
+                           max_km: Optional[float] = Query(None, gt=0), limit: int = Query(20, ge=1, le=200)):
+    """Find pharmacies with a medicine in stock, nearest first when lat/lng are given"""
+    names = medicine_names.lookup(q)
+    location = {"lat": lat, "lng": lng} if lat is not None and lng is not None else None
+    items = await search_inventory(db.pharmacy_inventory, names, location, limit,
+                                   max_distance_m=max_km * 1000 if max_km else None)
+    results = []
+    for item in items:
+        distance_m = item.pop("distance_m", None)
+        results.append(MedicineSearchResult(
+            **item, distance_km=round(distance_m / 1000, 3) if distance_m is not None else None
+        ))
+    return {"query": q, "matched_names": names, "results": results}
+
+def booking_lines(medicines: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Quantity per medicine of a booking; repeated medicines are added up"""
+    lines: Dict[str, int] = {}
+    for medicine in medicines:
+        name = medicine_key(str(medicine.get("name", "")))
+        try:
+            quantity = int(medicine.get("quantity", 1))
+        except (TypeError, ValueError):
+            quantity = 0
+        if not name or quantity < 1:
+            raise HTTPException(status_code=400, detail="Each medicine needs a name and a positive quantity")
+        lines[name] = lines.get(name, 0) + quantity
+    if not lines:
+        raise HTTPException(status_code=400, detail="No medicines to book")
+    return lines
 
 @api_router.post("/medicine-requests", response_model=MedicineRequest)
-async def book_medicines(request: MedicineRequestCreate, background_tasks: BackgroundTasks):
-    """Book medicines at a pharmacy"""
+async def book_medicines(request: MedicineRequestCreate):
+    """Book medicines at a pharmacy, holding the stock until pickup"""
+    lines = booking_lines(request.medicines)
+    if not await db.pharmacies.find_one({"id": request.pharmacy_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Pharmacy not found")
+
     request_dict = request.dict()
-    request_obj = MedicineRequest(**request_dict)
-    await db.medicine_requests.insert_one(request_obj.dict())
-    
-    # Simulate SMS notification (you would integrate with a real SMS service)
-    background_tasks.add_task(send_sms_notification, request_obj.user_phone, 
-                            f"Medicine booking confirmed. Booking ID: {request_obj.id[:8]}")
-    
+    request_obj = MedicineRequest(**request_dict, status="reserved")
+    try:
+        request_obj.reserved_until = await reserve(
+            db.pharmacy_inventory, request_obj.id, request.pharmacy_id, lines, RESERVATION_HOLD_SECONDS
+        )
+    except InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await insert_synced("medicine_requests", request_obj.dict())
+    except Exception:
+        await release(db.pharmacy_inventory, request_obj.id, request.pharmacy_id, lines)
+        raise
+
+    await send_sms_notification(
+        request_obj.user_phone,
+        f"Medicine booking confirmed. Booking ID: {request_obj.id[:8]}. "
+        f"Please collect by {request_obj.reserved_until:%d %b %H:%M} UTC."
+    )
+
     return request_obj
 
+async def close_booking(request_id: str, status: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Move a reserved booking to its final status, or explain why it cannot be"""
+    now = datetime.now(timezone.utc)
+    booking = await db.medicine_requests.find_one_and_update(
+        {"id": request_id, "status": "reserved", "reserved_until": {"$gt": now}},
+        {"$set": {"status": status, **fields, **(await sync_sequence.fields())}},
+        return_document=ReturnDocument.AFTER
+    )
+    if booking:
+        return booking
+    existing = await db.medicine_requests.find_one({"id": request_id}, {"status": 1})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Medicine request not found")
+    state = "expired" if existing["status"] == "reserved" else existing["status"]
+    raise HTTPException(status_code=409, detail=f"Medicine request is {state}")
+
+@api_router.post("/medicine-requests/{request_id}/pickup", response_model=MedicineRequest)
+async def pickup_medicines(request_id: str):
+    """Hand a reserved booking over; its held stock becomes sold"""
+    booking = await close_booking(request_id, "completed", {"pickup_date": datetime.now(timezone.utc)})
+    await commit(db.pharmacy_inventory, request_id, booking["pharmacy_id"], booking_lines(booking["medicines"]))
+    return MedicineRequest(**booking)
+
+@api_router.post("/medicine-requests/{request_id}/cancel", response_model=MedicineRequest)
+async def cancel_medicine_request(request_id: str):
+    """Cancel a reserved booking and return its stock"""
+    booking = await close_booking(request_id, "cancelled", {})
+    await release(db.pharmacy_inventory, request_id, booking["pharmacy_id"], booking_lines(booking["medicines"]))
+    return MedicineRequest(**booking)
+
 @api_router.get("/medicine-requests/{user_id}", response_model=List[MedicineRequest])
-async def get_user_medicine_requests(user_id: str):
+async def get_user_medicine_requests(request: Request, response: Response, user_id: str,
+                                     limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
     """Get all medicine requests for a user"""
-    requests = await db.medicine_requests.find({"user_id": user_id}).sort("booking_date", -1).to_list(100)
-    return [MedicineRequest(**req) for req in requests]
+    return await list_page(request, response, db.medicine_requests, {"user_id": user_id}, "booking_date", -1,
+                           MedicineRequest, limit, after, default_limit=100)
 
 # =============================================================================
 # AI SYMPTOM CHECKER
 # =============================================================================
 
-@api_router.post("/symptom-check", response_model=SymptomCheck)
-async def perform_symptom_check(symptom_data: SymptomCheckCreate):
-    """AI-powered symptom assessment optimized for rural healthcare"""
-    try:
-        # 1. Configure the API key from your .env file
-        api_key = os.environ.get("GOOGLE_API_KEY") # Or use "EMERGENT_LLM_KEY" if you didn't rename it
-        if not api_key:
-            raise HTTPException(status_code=500, detail="AI service API key not configured")
-        genai.configure(api_key=api_key)
-
-        # 2. Define the system prompt for the AI model
-        system_prompt = """You are a medical AI assistant specialized in rural healthcare in India.
+SYMPTOM_SYSTEM_PROMPT = """You are a medical AI assistant specialized in rural healthcare in India.
         Provide symptom assessment focused on common rural health issues. Always recommend consulting
         with a doctor for serious symptoms. Be culturally sensitive and use simple language.
         Respond in JSON format with: assessment, severity (low/medium/high/emergency),
         recommendations (list), and referral_needed (boolean)."""
 
-        # 3. Initialize the model with the system prompt
-        model = genai.GenerativeModel(
-            model_name='gemini-1.5-flash',
-            system_instruction=system_prompt
+_generative_models: Dict[Any, Any] = {}
+
+def get_generative_model(model_name: str, system_instruction: str):
+    """Configure Gemini once and reuse one model client per model and system prompt"""
+    key = (model_name, system_instruction)
+    if key not in _generative_models:
+        api_key = os.environ.get("GOOGLE_API_KEY") # Or use "EMERGENT_LLM_KEY" if you didn't rename it
+        if not api_key:
+            raise HTTPException(status_code=500, detail="AI service API key not configured")
+        genai.configure(api_key=api_key)
+        _generative_models[key] = genai.GenerativeModel(
+            model_name=model_name,
+            system_instruction=system_instruction
         )
+    return _generative_models[key]
 
-        symptoms_text = ", ".join(symptom_data.symptoms)
-        additional_info = symptom_data.additional_info or ""
-        user_prompt = f"Patient symptoms: {symptoms_text}. Additional information: {additional_info}. Please provide a medical assessment suitable for rural healthcare context."
+def get_symptom_model():
+    return get_generative_model('gemini-1.5-flash', SYMPTOM_SYSTEM_PROMPT)
+
+def symptom_cache_key(symptoms: List[str], additional_info: Optional[str], language: str) -> str:
+    """Canonical key: the same symptoms in any order, case or spacing share one entry"""
+    canonical = {
+        "symptoms": sorted({" ".join(symptom.lower().split()) for symptom in symptoms} - {""}),
+        "additional_info": " ".join((additional_info or "").lower().split()),
+        "language": language.lower(),
+    }
+    return hashlib.sha256(json.dumps(canonical, ensure_ascii=False).encode()).hexdigest()
 
-        # 4. Send the prompt asynchronously and get the response
+async def assess_symptoms_with_ai(symptom_data: SymptomCheckCreate, cache_key: str) -> Dict[str, Any]:
+    """Ask the model for an assessment and cache it when it is well formed"""
+    model = get_symptom_model()
+
+    symptoms_text = ", ".join(symptom_data.symptoms)
+    additional_info = symptom_data.additional_info or ""
+    user_prompt = f"Patient symptoms: {symptoms_text}. Additional information: {additional_info}. Please provide a medical assessment suitable for rural healthcare context."
+    if symptom_data.language != "en":
+        user_prompt += f" Write the assessment and recommendations in the language with code '{symptom_data.language}'."
+
+    # Send the prompt asynchronously and get the response
+    with ai_span("symptom_assessment"):
         response = await model.generate_content_async(user_prompt)
 
-        # 5. Parse the AI response text
-        try:
-            # The response now includes formatting, so we clean it
-            cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-            ai_result = json.loads(cleaned_response)
-        except Exception as json_error:
-            # Fallback if JSON parsing fails
-            ai_result = {
-                "assessment": response.text[:500],
-                "severity": "medium",
-                "recommendations": ["Consult with healthcare provider", "Monitor symptoms"],
-                "referral_needed": True
-            }
+    # Parse the AI response text
+    try:
+        # The response now includes formatting, so we clean it
+        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
+        ai_result = json.loads(cleaned_response)
+    except Exception as json_error:
+        # Fallback if JSON parsing fails
+        return {
+            "assessment": response.text[:500],
+            "severity": "medium",
+            "recommendations": ["Consult with healthcare provider", "Monitor symptoms"],
+            "referral_needed": True
+        }
+
+    # Only well-formed assessments are worth reusing for other patients
+    await symptom_cache.set(cache_key, ai_result)
+    return ai_result
+
+@api_router.post("/symptom-check", response_model=SymptomCheck)
+async def perform_symptom_check(symptom_data: SymptomCheckCreate):
+    """AI-powered symptom assessment optimized for rural healthcare"""
+    triage = triage_engine.assess(symptom_data.symptoms, context=[symptom_data.additional_info])
+    if triage.severity == "emergency":
+        # Obvious emergencies never wait on the model
+        symptom_check = triage_symptom_check(
+            symptom_data, triage,
+            f"Emergency warning signs detected: {', '.join(triage.red_flags)}. Seek medical care immediately."
+        )
+        await store_symptom_check(symptom_check, triage)
+        return symptom_check
+
+    try:
+        cache_key = symptom_cache_key(symptom_data.symptoms, symptom_data.additional_info, symptom_data.language)
+        ai_result = await symptom_cache.get(cache_key)
+
+        if ai_result is None:
+            # Patients submitting the same symptoms at the same moment share one model call
+            ai_result = await ai_governor.call(f"symptom:{cache_key}", lambda: assess_symptoms_with_ai(symptom_data, cache_key))
 
         # Create symptom check record
         symptom_check = SymptomCheck(
@@ -355,128 +1085,324 @@ async def perform_symptom_check(symptom_data: SymptomCheckCreate):
             referral_needed=ai_result.get("referral_needed", True)
         )
 
-        await db.symptom_checks.insert_one(symptom_check.dict())
+        await store_symptom_check(symptom_check, triage)
         return symptom_check
 
-    except Exception as e:
-        # The existing offline fallback logic remains the same
-        severity = "medium"
-        if any(symptom.lower() in ["chest pain", "difficulty breathing", "severe bleeding", "unconscious"]
-               for symptom in symptom_data.symptoms):
-            severity = "emergency"
-        elif any(symptom.lower() in ["fever", "headache", "cough"]
-                for symptom in symptom_data.symptoms):
-            severity = "low"
-
-        symptom_check = SymptomCheck(
-            user_id=symptom_data.user_id,
-            symptoms=symptom_data.symptoms,
-            assessment="Basic symptom assessment completed offline. Please consult with healthcare provider.",
-            severity=severity,
-            recommendations=["Consult with nearest healthcare provider", "Monitor symptoms carefully"],
-            referral_needed=True
-        )
-
-        await db.symptom_checks.insert_one(symptom_check.dict())
-        return symptom_check
-        
     except Exception as e:
         # Offline fallback for symptom checking
-        severity = "medium"
-        if any(symptom.lower() in ["chest pain", "difficulty breathing", "severe bleeding", "unconscious"] 
-               for symptom in symptom_data.symptoms):
-            severity = "emergency"
-        elif any(symptom.lower() in ["fever", "headache", "cough"] 
-                for symptom in symptom_data.symptoms):
-            severity = "low"
-        
-        symptom_check = SymptomCheck(
-            user_id=symptom_data.user_id,
-            symptoms=symptom_data.symptoms,
-            assessment="Basic symptom assessment completed offline. Please consult with healthcare provider.",
-            severity=severity,
-            recommendations=["Consult with nearest healthcare provider", "Monitor symptoms carefully"],
-            referral_needed=True
+        symptom_check = triage_symptom_check(
+            symptom_data, triage,
+            "Basic symptom assessment completed offline. Please consult with healthcare provider."
         )
-        
-        await db.symptom_checks.insert_one(symptom_check.dict())
+        await store_symptom_check(symptom_check, triage)
         return symptom_check
 
+async def store_symptom_check(symptom_check: SymptomCheck, triage: TriageResult):
+    """Save a symptom check with the patient's village and canonical symptoms, and count it for outbreak surveillance"""
+    patient = await db.users.find_one({"id": symptom_check.user_id}, {"village": 1})
+    village = patient.get("village") if patient else None
+    await insert_synced("symptom_checks", {**symptom_check.dict(), "village": village, "symptom_keys": triage.symptoms})
+    try:
+        await outbreak_detector.record(village, triage.symptoms, symptom_check.created_at)
+    except Exception as e:
+        # The check is stored; the next restart replays it
+        logger.error(f"Error counting symptom check {symptom_check.id} for surveillance: {e}")
+
+def triage_symptom_check(symptom_data: SymptomCheckCreate, triage: TriageResult, assessment: str) -> SymptomCheck:
+    """Build a symptom check from the offline triage engine"""
+    return SymptomCheck(
+        user_id=symptom_data.user_id,
+        symptoms=symptom_data.symptoms,
+        assessment=assessment,
+        severity=triage.severity,
+        recommendations=triage.recommendations,
+        referral_needed=True
+    )
+
+@api_router.get("/ai/status")
+async def get_ai_status():
+    """Circuit state and call counters of the AI governor"""
+    return ai_governor.stats()
+
+@api_router.get("/symptom-check/cache-stats")
+async def get_symptom_cache_stats():
+    """Hit and miss rates of the symptom assessment cache"""
+    return symptom_cache.stats()
+
 @api_router.get("/symptom-checks/{user_id}", response_model=List[SymptomCheck])
-async def get_user_symptom_checks(user_id: str):
+async def get_user_symptom_checks(request: Request, response: Response, user_id: str,
+                                  limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
     """Get symptom check history for a user"""
-    checks = await db.symptom_checks.find({"user_id": user_id}).sort("created_at", -1).to_list(100)
-    return [SymptomCheck(**check) for check in checks]
+    return await list_page(request, response, db.symptom_checks, {"user_id": user_id}, "created_at", -1,
+                           SymptomCheck, limit, after, default_limit=100)
 
 # =============================================================================
 # TELEMEDICINE CONSULTATIONS
 # =============================================================================
 
+@api_router.put("/doctors/{doctor_id}/working-hours", response_model=DoctorSchedule)
+async def set_working_hours(doctor_id: str, hours: WorkingHours):
+    """Set a doctor's weekly working hours, which their bookable slots are cut from"""
+    try:
+        parse_weekly(hours.weekly, hours.slot_minutes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    doctor = await db.users.find_one({"id": doctor_id, "role": "doctor"}, {"_id": 0, "name": 1, "language": 1})
+    if not doctor:
+        raise HTTPException(status_code=404, detail="Doctor not found")
+
+    hours_dict = hours.dict()
+    hours_dict["languages"] = hours.languages or [doctor.get("language", "en")]
+    schedule = DoctorSchedule(**hours_dict, doctor_id=doctor_id, doctor_name=doctor["name"])
+    await db[SCHEDULES].replace_one({"doctor_id": doctor_id}, schedule.dict(), upsert=True)
+    slot_index.set_working_hours(doctor_id, schedule.doctor_name, schedule.languages, schedule.slot_minutes,
+                                 schedule.utc_offset_minutes, schedule.weekly)
+    return schedule
+
+@api_router.get("/doctors/{doctor_id}/working-hours", response_model=DoctorSchedule)
+async def get_working_hours(doctor_id: str):
+    """Get a doctor's weekly working hours"""
+    schedule = await db[SCHEDULES].find_one({"doctor_id": doctor_id}, {"_id": 0})
+    if not schedule:
+        raise HTTPException(status_code=404, detail="No working hours set for this doctor")
+    return DoctorSchedule(**schedule)
+
+def require_slot_index():
+    if slot_index.refreshed_at is None:
+        raise HTTPException(status_code=503, detail="Doctor schedules are still loading, try again shortly")
+
+@api_router.get("/consultations/slots", response_model=List[FreeSlot])
+async def find_free_slots(language: Optional[str] = None, limit: int = Query(10, ge=1, le=100),
+                          after: Optional[datetime] = None):
+    """Earliest free consultation slots across all doctors, optionally only doctors speaking a language"""
+    require_slot_index()
+    slots = slot_index.earliest(limit, language, to_epoch(after) if after else None)
+    return [
+        FreeSlot(doctor_id=calendar.doctor_id, doctor_name=calendar.name, languages=list(calendar.languages),
+                 start=from_epoch(start), end=from_epoch(start + calendar.slot_seconds))
+        for start, calendar in slots
+    ]
+
+@api_router.get("/consultations/slots/stats")
+async def get_slot_index_stats():
+    """Doctors, booked slots and search counters of the free-slot index"""
+    return slot_index.stats()
+
 @api_router.post("/consultations", response_model=Consultation)
 async def book_consultation(consultation: ConsultationCreate):
-    """Book a telemedicine consultation"""
+    """Book a telemedicine consultation; with a doctor_id it takes one of that doctor's free slots"""
     consultation_dict = consultation.dict()
     # Generate unique room ID for video calls
     consultation_dict["room_id"] = f"room_{uuid.uuid4().hex[:8]}"
+    if consultation.doctor_id:
+        consultation_obj = await book_doctor_slot(consultation_dict)
+    elif consultation.doctor_name:
+        consultation_obj = Consultation(**consultation_dict)
+        await insert_synced("consultations", consultation_obj.dict())
+    else:
+        raise HTTPException(status_code=400, detail="Give a doctor_id or a doctor_name")
+    # Nothing cached can mention a room that did not exist until now, so there is nothing to invalidate
+    return consultation_obj
+
+async def book_doctor_slot(consultation_dict: Dict[str, Any]) -> Consultation:
+    """Hold the slot in this worker's index, then let the unique slot index settle races with other workers"""
+    require_slot_index()
+    doctor_id = consultation_dict["doctor_id"]
+    start = to_epoch(consultation_dict["appointment_time"])
+    problem = slot_index.check(doctor_id, start)
+    if problem:
+        raise HTTPException(status_code=409 if problem == SLOT_TAKEN else 400, detail=problem)
+
+    calendar = slot_index.calendars[doctor_id]
+    consultation_dict.update(doctor_name=calendar.name or consultation_dict["doctor_name"],
+                             appointment_time=from_epoch(start), duration_minutes=calendar.slot_seconds // 60)
     consultation_obj = Consultation(**consultation_dict)
-    await db.consultations.insert_one(consultation_obj.dict())
+    end = start + calendar.slot_seconds
+    # No await since the check, so no other request in this worker can have taken the slot
+    slot_index.book(doctor_id, start, end, consultation_obj.id)
+    try:
+        await insert_synced("consultations", {**consultation_obj.dict(), "slot_active": True})
+    except DuplicateKeyError:
+        # Another worker booked it first: file their booking in place of ours
+        slot_index.release(doctor_id, start, consultation_obj.id)
+        winner = await db.consultations.find_one({"doctor_id": doctor_id, "appointment_time": from_epoch(start),
+                                                  "slot_active": True}, {"_id": 0, "id": 1})
+        if winner:
+            slot_index.book(doctor_id, start, end, winner["id"])
+        raise HTTPException(status_code=409, detail=SLOT_TAKEN)
+    except Exception:
+        slot_index.release(doctor_id, start, consultation_obj.id)
+        raise
     return consultation_obj
 
 @api_router.get("/consultations/{user_id}", response_model=List[Consultation])
-async def get_user_consultations(user_id: str):
+async def get_user_consultations(request: Request, response: Response, user_id: str,
+                                 limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
     """Get all consultations for a user"""
-    consultations = await db.consultations.find({"patient_id": user_id}).sort("appointment_time", -1).to_list(100)
-    return [Consultation(**consultation) for consultation in consultations]
+    return await list_page(request, response, db.consultations, {"patient_id": user_id}, "appointment_time", -1,
+                           Consultation, limit, after, default_limit=100)
 
 @api_router.get("/consultations/room/{room_id}")
-async def get_consultation_room(room_id: str):
+async def get_consultation_room(request: Request, room_id: str):
     """Get consultation room details for video call"""
-    consultation = await db.consultations.find_one({"room_id": room_id})
-    if not consultation:
-        raise HTTPException(status_code=404, detail="Consultation room not found")
-    
-    return {
-        "room_id": room_id,
-        "consultation": Consultation(**consultation),
-        "webrtc_config": {
-            "iceServers": [
-                {"urls": "stun:stun.l.google.com:19302"},
-                {"urls": "stun:stun1.l.google.com:19302"}
-            ]
+    async def load(_):
+        consultation = await db.consultations.find_one({"room_id": room_id})
+        if not consultation:
+            raise HTTPException(status_code=404, detail="Consultation room not found")
+
+        return {
+            "room_id": room_id,
+            "consultation": Consultation(**consultation),
+            "webrtc_config": {
+                "iceServers": [
+                    {"urls": "stun:stun.l.google.com:19302"},
+                    {"urls": "stun:stun1.l.google.com:19302"}
+                ]
+            }
         }
-    }
+
+    return await response_cache.respond(request, f"consultations:{room_id}", room_id, load)
+
+@api_router.post("/consultations/{consultation_id}/cancel", response_model=Consultation)
+async def cancel_consultation(consultation_id: str):
+    """Cancel a scheduled consultation, freeing its doctor's slot"""
+    consultation = await db.consultations.find_one_and_update(
+        {"id": consultation_id, "status": "scheduled"},
+        {"$set": {"status": "cancelled", "slot_active": False, **(await sync_sequence.fields())}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not consultation:
+        existing = await db.consultations.find_one({"id": consultation_id}, {"status": 1})
+        if not existing:
+            raise HTTPException(status_code=404, detail="Consultation not found")
+        raise HTTPException(status_code=409, detail=f"Consultation is {existing['status']}")
+    if consultation.get("doctor_id"):
+        slot_index.release(consultation["doctor_id"], to_epoch(consultation["appointment_time"]), consultation_id)
+    if consultation.get("room_id"):
+        # Only the room of this patient and doctor changed; other rooms stay cached
+        await response_cache.invalidate(f"consultations:{consultation['room_id']}")
+    return Consultation(**consultation)
 
 # =============================================================================
 # EMERGENCY RESPONSE
 # =============================================================================
 
 @api_router.post("/emergency-alert", response_model=EmergencyAlert)
-async def create_emergency_alert(alert: EmergencyAlertCreate, background_tasks: BackgroundTasks):
+async def create_emergency_alert(alert: EmergencyAlertCreate):
     """Create emergency alert and notify responders"""
     alert_dict = alert.dict()
     alert_obj = EmergencyAlert(**alert_dict)
-    await db.emergency_alerts.insert_one(alert_obj.dict())
+    patient = await db.users.find_one({"id": alert.user_id}, {"village": 1})
+    village = patient.get("village") if patient else None
+    await insert_synced("emergency_alerts", {**alert_obj.dict(), "village": village})
     
-    # Notify emergency responders
-    background_tasks.add_task(notify_emergency_responders, alert_obj)
+    # Responder messages are in the outbox before we answer, so a restart cannot lose them
+    alert_obj.responders_notified = await notify_emergency_responders(alert_obj, village)
+    await response_cache.invalidate("emergency_alerts")
+    alert_hub.publish("alert.created", jsonable_encoder(alert_obj), area=village, location=alert_obj.location,
+                      roles=set(RESPONDER_ROLES))
     
     return alert_obj
 
 @api_router.get("/emergency-alerts")
-async def get_emergency_alerts(status: str = "active"):
+async def get_emergency_alerts(request: Request, response: Response, status: str = "active",
+                               limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
     """Get emergency alerts for responders"""
-    alerts = await db.emergency_alerts.find({"status": status}).sort("created_at", -1).to_list(100)
-    return [EmergencyAlert(**alert) for alert in alerts]
+    if wants_ndjson(request):
+        return await list_page(request, response, db.emergency_alerts, {"status": status}, "created_at", -1,
+                               EmergencyAlert, limit, after, default_limit=100)
+    return await response_cache.respond(
+        request, "emergency_alerts", f"{status}:{limit}:{after}",
+        lambda scratch: list_page(request, scratch, db.emergency_alerts, {"status": status}, "created_at", -1,
+                                  EmergencyAlert, limit, after, default_limit=100)
+    )
+
+def alert_feed_filters(village: Optional[str], role: Optional[str], lat: Optional[float], lng: Optional[float],
+                       radius_km: Optional[float]) -> Dict[str, Any]:
+    """Alert feed subscription filters: village, responder role and/or distance from a point"""
+    near = {"lat": lat, "lng": lng} if lat is not None and lng is not None else None
+    if radius_km is not None and near is None:
+        raise HTTPException(status_code=400, detail="radius_km needs lat and lng")
+    return {"area": village, "role": role, "near": near, "radius_km": radius_km}
+
+@api_router.websocket("/emergency-alerts/ws")
+async def emergency_alert_socket(websocket: WebSocket, village: Optional[str] = None, role: Optional[str] = None,
+                                 lat: Optional[float] = None, lng: Optional[float] = None,
+                                 radius_km: Optional[float] = None, last_event_id: Optional[str] = None):
+    """Push alert events as JSON messages; reconnect with last_event_id to get what was missed"""
+    await websocket.accept()
+    try:
+        filters = alert_feed_filters(village, role, lat, lng, radius_km)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    subscription = alert_hub.subscribe(**filters, last_event_id=last_event_id)
+
+    async def push():
+        while True:
+            await websocket.send_json((await subscription.next()).message())
+
+    async def until_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = {asyncio.create_task(push()), asyncio.create_task(until_disconnect())}
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if any(isinstance(task.exception(), ConnectionResetError) for task in done):
+            # Too far behind: the client reconnects and resumes from its last event
+            await websocket.close(code=1013)
+    finally:
+        subscription.close()
+
+@api_router.get("/emergency-alerts/stream")
+async def emergency_alert_stream(request: Request, village: Optional[str] = None, role: Optional[str] = None,
+                                 lat: Optional[float] = None, lng: Optional[float] = None,
+                                 radius_km: Optional[float] = None, last_event_id: Optional[str] = None):
+    """Server-sent events fallback of the alert feed; resumes from the Last-Event-ID header"""
+    filters = alert_feed_filters(village, role, lat, lng, radius_km)
+    resume_from = request.headers.get("last-event-id") or last_event_id
+
+    async def events():
+        subscription = alert_hub.subscribe(**filters, last_event_id=resume_from)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await subscription.next(ALERT_FEED_HEARTBEAT_SECONDS)
+                except ConnectionResetError:
+                    return
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@api_router.get("/emergency-alerts/feed/stats")
+async def get_alert_feed_stats():
+    """Subscribers, fan-out and resume counters of the live alert feed"""
+    return alert_hub.stats()
 
 @api_router.put("/emergency-alerts/{alert_id}/respond")
 async def respond_to_emergency(alert_id: str, responder_id: str):
     """Mark emergency alert as responded"""
-    result = await db.emergency_alerts.update_one(
+    alert = await db.emergency_alerts.find_one_and_update(
         {"id": alert_id},
-        {"$set": {"status": "responded"}, "$push": {"responders_notified": responder_id}}
+        {"$set": {"status": "responded", **(await sync_sequence.fields())},
+         "$push": {"responders_notified": responder_id}},
+        return_document=ReturnDocument.AFTER
     )
-    if result.modified_count == 0:
+    if not alert:
         raise HTTPException(status_code=404, detail="Emergency alert not found")
+    await response_cache.invalidate("emergency_alerts")
+    alert_hub.publish("alert.responded", {**jsonable_encoder(EmergencyAlert(**alert)), "responder_id": responder_id},
+                      area=alert.get("village"), location=alert.get("location"))
     return {"message": "Emergency response logged"}
 
 # =============================================================================
@@ -488,50 +1414,176 @@ async def record_asha_visit(visit: ASHAVisitCreate):
     """Record ASHA worker home visit"""
     visit_dict = visit.dict()
     visit_obj = ASHAVisit(**visit_dict)
-    await db.asha_visits.insert_one(visit_obj.dict())
+    patient = await db.users.find_one({"id": visit_obj.patient_id}, {"village": 1})
+    village = patient.get("village") if patient else None
+    doc = {**visit_obj.dict(), "village": village}
+    await insert_synced("asha_visits", doc)
+    try:
+        await visit_rollups.record(doc, village)
+    except Exception as e:
+        # The visit is stored; a rollup rebuild picks it up
+        logger.error(f"Error updating visit rollups for {visit_obj.id}: {e}")
     return visit_obj
 
 @api_router.get("/asha-visits/{asha_id}", response_model=List[ASHAVisit])
-async def get_asha_visits(asha_id: str):
+async def get_asha_visits(request: Request, response: Response, asha_id: str,
+                          limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
     """Get all visits by an ASHA worker"""
-    visits = await db.asha_visits.find({"asha_id": asha_id}).sort("created_at", -1).to_list(100)
-    return [ASHAVisit(**visit) for visit in visits]
+    return await list_page(request, response, db.asha_visits, {"asha_id": asha_id}, "created_at", -1,
+                           ASHAVisit, limit, after, default_limit=100)
 
 @api_router.get("/asha-visits/patient/{patient_id}", response_model=List[ASHAVisit])
-async def get_patient_asha_visits(patient_id: str):
+async def get_patient_asha_visits(request: Request, response: Response, patient_id: str,
+                                  limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None):
     """Get all ASHA visits for a patient"""
-    visits = await db.asha_visits.find({"patient_id": patient_id}).sort("created_at", -1).to_list(100)
-    return [ASHAVisit(**visit) for visit in visits]
+    return await list_page(request, response, db.asha_visits, {"patient_id": patient_id}, "created_at", -1,
+                           ASHAVisit, limit, after, default_limit=100)
+
+# =============================================================================
+# SUPERVISOR DASHBOARDS
+# =============================================================================
+
+@api_router.get("/dashboards/{scope}/{key}")
+async def get_visit_dashboard(scope: str, key: str, days: int = Query(28, ge=1, le=366), end: Optional[date] = None,
+                              overdue_limit: int = Query(20, ge=0, le=200)):
+    """Visits per day and week, vital sign trends and open follow-ups for an ASHA worker or a village"""
+    if scope not in SCOPES:
+        raise HTTPException(status_code=404, detail=f"Dashboards are per {' or '.join(SCOPES)}")
+    return await visit_rollups.dashboard(scope, key, days, end, overdue_limit)
+
+# =============================================================================
+# OUTBREAK SURVEILLANCE
+# =============================================================================
+
+@api_router.get("/surveillance/alerts")
+async def get_outbreak_alerts(village: Optional[str] = None, status: Optional[str] = "open",
+                              limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE)):
+    """Outbreak alerts, newest first"""
+    query = {key: value for key, value in (("village", village), ("status", status)) if value}
+    return await db[ALERTS].find(query, {"_id": 0}).sort("opened_at", -1).to_list(limit)
+
+@api_router.get("/surveillance/villages/{village}")
+async def get_village_surveillance(village: str):
+    """Current window count, baseline and alert threshold of each symptom reported in a village"""
+    return {"village": village, "window_hours": outbreak_detector.window,
+            "symptoms": outbreak_detector.village(village)}
+
+@api_router.get("/surveillance/stats")
+async def get_surveillance_stats():
+    """Counter memory, throughput and alert counts of the outbreak detector"""
+    return outbreak_detector.stats()
+
+# =============================================================================
+# PATIENT TIMELINE
+# =============================================================================
+
+TIMELINE_SOURCES = [
+    TimelineSource("health_record", "health_records", "user_id", "date", HealthRecord),
+    TimelineSource("consultation", "consultations", "patient_id", "appointment_time", Consultation),
+    TimelineSource("symptom_check", "symptom_checks", "user_id", "created_at", SymptomCheck),
+    TimelineSource("asha_visit", "asha_visits", "patient_id", "created_at", ASHAVisit),
+    TimelineSource("medicine_request", "medicine_requests", "user_id", "booking_date", MedicineRequest),
+]
+
+@api_router.get("/patients/{patient_id}/timeline")
+async def get_patient_timeline(response: Response, patient_id: str, limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+                               after: Optional[str] = None):
+    """Get a patient's records, consultations, symptom checks, visits and bookings as one newest-first list"""
+    try:
+        entries, next_cursor = await fetch_timeline(db, TIMELINE_SOURCES, patient_id, limit, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return entries
 
 # =============================================================================
 # TRANSLATION & MULTILINGUAL SUPPORT
 # =============================================================================
 
+TRANSLATION_SYSTEM_PROMPT = """You translate short texts for a rural healthcare app in India.
+        Keep the medical meaning exact and use simple, everyday words. You receive a target language
+        and a JSON array of strings. Respond only with a JSON array of the translations, in the same
+        order and with the same number of items."""
+
+class TranslationBatchRequest(BaseModel):
+    texts: List[str] = Field(..., max_length=1000)
+    target_language: str
+
+def translation_key(text: str, target_language: str) -> str:
+    """Translation memory key: the source text hash plus the target language"""
+    return f"{target_language.lower()}:{hashlib.sha256(text.encode()).hexdigest()}"
+
+async def translate_with_ai(texts: List[str], target_language: str) -> List[str]:
+    """Translate a group of strings in one model call"""
+    model = get_generative_model('gemini-2.0-flash', TRANSLATION_SYSTEM_PROMPT)
+    prompt = f"Target language: {target_language}\n{json.dumps(texts, ensure_ascii=False)}"
+    with ai_span("translation"):
+        response = await model.generate_content_async(prompt)
+
+    cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
+    translations = json.loads(cleaned_response)
+    if (not isinstance(translations, list) or len(translations) != len(texts)
+            or not all(isinstance(translation, str) for translation in translations)):
+        raise ValueError("Model returned a malformed translation list")
+    return [translation.strip() for translation in translations]
+
+async def translate_texts(texts: List[str], target_language: str):
+    """Translate through the translation memory, sending only the misses to the model"""
+    keys = {text: translation_key(text, target_language) for text in texts}
+    known = await translation_memory.get_many(set(keys.values()))
+    misses = [text for text in dict.fromkeys(texts) if keys[text] not in known]
+    from_memory = len(keys) - len(misses)
+
+    translated = {}
+    for start in range(0, len(misses), TRANSLATION_BATCH_SIZE):
+        group = misses[start:start + TRANSLATION_BATCH_SIZE]
+        # JSON keeps string boundaries, so ["a\nb"] and ["a", "b"] never share one in-flight call
+        group_hash = hashlib.sha256(json.dumps(group).encode()).hexdigest()
+        try:
+            results = await ai_governor.call(f"translate:{target_language}:{group_hash}",
+                                             lambda: translate_with_ai(group, target_language))
+            if len(results) != len(group):
+                raise ValueError(f"{len(results)} translations for {len(group)} strings")
+        except Exception as e:
+            # Untranslated strings fall back to the original text and are not remembered
+            logger.warning(f"Translation to {target_language} unavailable: {e}")
+            continue
+        translated.update({keys[text]: result for text, result in zip(group, results)})
+
+    await translation_memory.set_many(translated)
+    known.update(translated)
+    translations = [known.get(keys[text], text) for text in texts]
+    return translations, {"from_memory": from_memory, "from_model": len(translated), "untranslated": len(misses) - len(translated)}
+
 @api_router.post("/translate")
 async def translate_text(text: str, target_language: str):
     """Translate text to target language using AI"""
-    try:
-        llm_key = os.environ.get("EMERGENT_LLM_KEY")
-        if not llm_key:
-            return {"translated_text": text}  # Return original if AI unavailable
-        
-        chat = LlmChat(
-            api_key=llm_key,
-            session_id=f"translate_{datetime.now().timestamp()}",
-            system_message=f"Translate the following text to {target_language}. Only respond with the translated text, nothing else."
-        ).with_model("gemini", "gemini-2.0-flash")
-        
-        user_message = UserMessage(text=text)
-        response = await chat.send_message(user_message)
-        
-        return {"translated_text": response.strip()}
-        
-    except Exception as e:
-        return {"translated_text": text}  # Fallback to original text
+    translations, _ = await translate_texts([text], target_language)
+    return {"translated_text": translations[0]}
+
+@api_router.post("/translate/batch")
+async def translate_batch(request: TranslationBatchRequest):
+    """Translate many strings at once; only strings missing from translation memory reach the model"""
+    translations, counts = await translate_texts(request.texts, request.target_language)
+    return {"target_language": request.target_language, "translations": translations, **counts}
+
+async def load_translation_packs(packs_dir: Path) -> int:
+    """Preload <language>.json files mapping source text to translation into translation memory"""
+    loaded = 0
+    for path in sorted(packs_dir.glob("*.json")):
+        with open(path, encoding="utf-8") as f:
+            pack = json.load(f)
+        await translation_memory.set_many({translation_key(source, path.stem): target for source, target in pack.items()})
+        loaded += len(pack)
+    return loaded
 
 @api_router.get("/languages")
-async def get_supported_languages():
+async def get_supported_languages(request: Request):
     """Get list of supported languages"""
+    return await response_cache.respond(request, "languages", "all", lambda _: supported_languages())
+
+async def supported_languages():
     return {
         "languages": [
             {"code": "en", "name": "English", "native_name": "English"},
@@ -551,54 +1603,116 @@ async def get_supported_languages():
 # UTILITIES & HELPERS
 # =============================================================================
 
-async def send_sms_notification(phone: str, message: str):
-    """Send SMS notification (mock implementation for free alternative)"""
-    # In a real implementation, you would integrate with a free SMS service
-    # For now, we'll just log the message
-    print(f"SMS to {phone}: {message}")
-    # You could integrate with services like:
-    # - Twilio's free tier
-    # - Your local telecom provider's API
-    # - Government SMS gateway for rural healthcare
-
-async def notify_emergency_responders(alert: EmergencyAlert):
-    """Notify emergency responders about an alert"""
-    # Find nearby ASHA workers and healthcare providers
-    responders = await db.users.find({
-        "role": {"$in": ["asha", "doctor"]},
-        "village": {"$regex": ".*"}  # You would implement geo-based matching
-    }).to_list(10)
-    
-    for responder in responders:
-        # Send notification (SMS/push notification)
-        await send_sms_notification(
-            responder.get("phone", ""),
-            f"EMERGENCY ALERT: {alert.user_name} needs help at location {alert.location}. Alert ID: {alert.id[:8]}"
-        )
+async def insert_synced(collection: str, doc: Dict[str, Any]):
+    """Insert into a per-user collection, stamped with the next change-feed sequence"""
+    await write_behind.insert(collection, doc)
+
+async def send_sms_notification(phone: str, message: str, priority: int = ROUTINE):
+    """Queue an SMS in the notification outbox for the dispatcher to deliver"""
+    await notification_outbox.enqueue("sms", phone, message, priority)
+    notification_dispatcher.wake()
+
+async def notify_emergency_responders(alert: EmergencyAlert, village: Optional[str]) -> List[str]:
+    """Notify the nearest available emergency responders about an alert"""
+    responders = await find_nearest_responders(db.users, alert.location, EMERGENCY_RESPONDER_COUNT)
+    if not responders and village is not None:
+        # No geolocated responder in range: fall back to the patient's village
+        responders = await db.users.find(
+            {**available_responders(), "village": village}, RESPONDER_PROJECTION
+        ).to_list(EMERGENCY_RESPONDER_COUNT)
+
+    message = f"EMERGENCY ALERT: {alert.user_name} needs help at location {alert.location}. Alert ID: {alert.id[:8]}"
+    await notification_outbox.enqueue_many(
+        [("sms", responder.get("phone", ""), message, EMERGENCY) for responder in responders]
+    )
+    notification_dispatcher.wake()
+    notified = [responder["id"] for responder in responders]
+    await db.emergency_alerts.update_one(
+        {"id": alert.id},
+        {"$set": {"responders_notified": notified, **(await sync_sequence.fields())}}
+    )
+    return notified
+
+@api_router.get("/compact-keys")
+async def get_compact_keys():
+    """Short keys used by ?profile=compact, so clients can map them back to field names"""
+    return COMPACT_KEYS
+
+@api_router.get("/response-cache/stats")
+async def get_response_cache_stats():
+    """Hit rate and invalidations of the GET response cache"""
+    return response_cache.stats()
+
+@api_router.get("/admission/stats")
+async def get_admission_stats():
+    """Running and queued requests per priority class, and requests turned away"""
+    return admission.stats()
+
+@api_router.get("/write-behind/stats")
+async def get_write_behind_stats():
+    """Group-commit batches written and documents still buffered"""
+    return write_behind.stats()
+
+@api_router.get("/notifications/stats")
+async def notification_stats():
+    """Outbox depth, queue lag and dispatcher throughput"""
+    return await notification_dispatcher.stats()
+
+def ai_status() -> Dict[str, str]:
+    """Whether symptom checks can reach Gemini: a key is configured and the circuit is not open"""
+    circuit = ai_governor.state
+    if not os.environ.get("GOOGLE_API_KEY"):
+        status = "unavailable"
+    elif circuit == CLOSED:
+        status = "available"
+    else:
+        # Open, or half open with only a probe let through: checks fall back to offline triage
+        status = "degraded"
+    return {"status": status, "circuit": circuit}
 
 @api_router.get("/health")
-async def health_check():
-    """API health check"""
+async def health_check(response: Response):
+    """API health check; pings MongoDB and reports the round trip"""
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.command("ping"), HEALTH_PING_TIMEOUT_SECONDS)
+        database = {"status": "connected", "ping_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        database = {"status": "unreachable", "error": str(e) or type(e).__name__}
+        response.status_code = 503
     return {
-        "status": "healthy",
+        "status": "healthy" if database["status"] == "connected" else "unhealthy",
         "timestamp": datetime.now(timezone.utc),
         "services": {
-            "database": "connected",
-            "ai": "available" if os.environ.get("EMERGENT_LLM_KEY") else "unavailable"
+            "database": database,
+            "ai": ai_status()
         }
     }
 
+@api_router.get("/metrics")
+async def get_metrics():
+    """Request, MongoDB and AI call metrics in Prometheus text format"""
+    return Response(content=registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Inside CORS, so browsers can read the Retry-After of a rejected request
+app.add_middleware(AdmissionMiddleware, controller=admission, trust_forwarded=ADMISSION_TRUST_FORWARDED)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, UPLOAD_OFFSET_HEADER, "Content-Range", "Accept-Ranges", "Retry-After"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -606,32 +1720,236 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    """Build the declared indexes in the background so startup is not held up"""
+    async def build():
+        await ensure_indexes(db)
+        await symptom_cache.ensure_indexes()
+        if MONGO_EXPLAIN_DEBUG:
+            collscans = await audit_query_plans(db)
+            logger.info(f"Query plan audit finished, {len(collscans)} COLLSCAN queries: {collscans}")
+
+    job = asyncio.create_task(build())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def start_sync_backfill():
+    """Stamp pre-existing documents so the change feed can serve them"""
+    async def backfill():
+        try:
+            stamped = await backfill_sync_sequence(db, sync_sequence)
+            if stamped:
+                logger.info(f"Stamped {stamped} existing documents for the sync feed")
+        except Exception as e:
+            logger.error(f"Error backfilling sync sequence: {e}")
+
+    job = asyncio.create_task(backfill())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def preload_translation_packs():
+    """Load bundled language packs into translation memory"""
+    try:
+        loaded = await load_translation_packs(TRANSLATION_PACKS_DIR)
+        if loaded:
+            logger.info(f"Preloaded {loaded} translations from {TRANSLATION_PACKS_DIR}")
+    except Exception as e:
+        logger.error(f"Error loading translation packs: {e}")
+
+@app.on_event("startup")
+async def start_inventory_index():
+    """Move legacy nested stock into line items, then keep the medicine name index fresh"""
+    async def maintain():
+        try:
+            migrated = await migrate_nested_inventory(db)
+            if migrated:
+                logger.info(f"Moved {migrated} nested pharmacy stock entries into inventory line items")
+        except Exception as e:
+            logger.error(f"Error migrating pharmacy inventory: {e}")
+        # Other workers add names too; a periodic refresh picks those up
+        while True:
+            try:
+                for name in await db.pharmacy_inventory.distinct("medicine_name"):
+                    medicine_names.add(name)
+            except Exception as e:
+                logger.error(f"Error refreshing medicine name index: {e}")
+            await asyncio.sleep(MEDICINE_INDEX_REFRESH_SECONDS)
+
+    job = asyncio.create_task(maintain())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def start_reservation_sweeper():
+    """Return the stock of bookings that were never picked up"""
+    async def sweep():
+        while True:
+            try:
+                expired = await release_expired(db.pharmacy_inventory)
+                if expired:
+                    await db.medicine_requests.update_many(
+                        {"id": {"$in": expired}, "status": "reserved"},
+                        {"$set": {"status": "expired", **(await sync_sequence.fields())}}
+                    )
+                    logger.info(f"Released stock of {len(expired)} expired medicine reservations")
+            except Exception as e:
+                logger.error(f"Error releasing expired reservations: {e}")
+            await asyncio.sleep(RESERVATION_SWEEP_SECONDS)
+
+    job = asyncio.create_task(sweep())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def start_attachment_maintenance():
+    """Move base64 attachments out of stored health records, then drop abandoned uploads"""
+    async def maintain():
+        try:
+            migrated = await migrate_inline_attachments(db, attachment_store, sync_sequence)
+            if migrated:
+                logger.info(f"Moved inline attachments of {migrated} health records into the attachment store")
+        except Exception as e:
+            logger.error(f"Error migrating inline attachments: {e}")
+        while True:
+            try:
+                dropped = await attachment_store.sweep_expired()
+                if dropped:
+                    logger.info(f"Dropped {dropped} expired attachment uploads")
+            except Exception as e:
+                logger.error(f"Error sweeping expired attachment uploads: {e}")
+            await asyncio.sleep(ATTACHMENT_SWEEP_SECONDS)
+
+    job = asyncio.create_task(maintain())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def start_rollup_backfill():
+    """Build the dashboard buckets from visit history on first start, or when asked to"""
+    async def backfill():
+        try:
+            if not ROLLUP_REBUILD and await db[ROLLUPS].find_one({}, {"_id": 1}):
+                return
+            counts = await visit_rollups.rebuild(workers=ROLLUP_REBUILD_WORKERS)
+            logger.info(f"Rebuilt visit rollups: {counts}")
+        except Exception as e:
+            logger.error(f"Error rebuilding visit rollups: {e}")
+
+    job = asyncio.create_task(backfill())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def start_outbreak_detector():
+    """Load surveillance checkpoints, replay the symptom checks after them, then checkpoint periodically"""
+    # Checks served from here on are counted live, so the replay stops short of them
+    live_since = datetime.now(timezone.utc)
+
+    async def maintain():
+        try:
+            restored = await outbreak_detector.restore()
+            replayed = await outbreak_detector.replay(triage_engine, until=live_since)
+            logger.info(f"Outbreak detector restored {restored} counters and replayed {replayed} symptom checks")
+        except Exception as e:
+            logger.error(f"Error replaying symptom checks for surveillance: {e}")
+        while True:
+            await asyncio.sleep(OUTBREAK_CHECKPOINT_SECONDS)
+            try:
+                await outbreak_detector.expire()
+                await outbreak_detector.flush()
+            except Exception as e:
+                logger.error(f"Error checkpointing the outbreak detector: {e}")
+
+    job = asyncio.create_task(maintain())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def start_slot_index():
+    """Build the free-slot index from stored schedules and bookings, then pick up other workers' changes"""
+    async def maintain():
+        while True:
+            try:
+                await slot_index.refresh(db, SYNC_SETTLE_SECONDS)
+            except Exception as e:
+                logger.error(f"Error refreshing the slot index: {e}")
+            await asyncio.sleep(SLOT_REFRESH_SECONDS)
+
+    job = asyncio.create_task(maintain())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def start_admission_monitor():
+    """Track event loop lag for admission control"""
+    job = asyncio.create_task(admission.monitor())
+    background_jobs.add(job)
+    job.add_done_callback(background_jobs.discard)
+
+@app.on_event("startup")
+async def start_notification_dispatcher():
+    notification_dispatcher.start()
+
+@app.on_event("shutdown")
+async def flush_write_behind():
+    """Write buffered inserts before the database client closes"""
+    await write_behind.close()
+
+@app.on_event("shutdown")
+async def flush_outbreak_detector():
+    try:
+        await outbreak_detector.flush()
+    except Exception as e:
+        logger.error(f"Error checkpointing the outbreak detector: {e}")
+
+@app.on_event("shutdown")
+async def stop_notification_dispatcher():
+    await notification_dispatcher.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
 
 # Initialize sample data on startup
+# The pharmacy the app books medicines at, stocking every medicine in its catalogue (frontend SAMPLE_DATA.medicines)
+SAMPLE_PHARMACY_ID = "civil_hospital_pharmacy"
+SAMPLE_MEDICINES = {
+    "paracetamol": {"stock": 150, "price": 10, "expiry": "2027-12-31"},
+    "amoxicillin": {"stock": 75, "price": 45, "expiry": "2027-10-15"},
+    "metformin": {"stock": 120, "price": 25, "expiry": "2027-11-20"},
+    "aspirin": {"stock": 200, "price": 8, "expiry": "2027-09-30"},
+    "cetirizine": {"stock": 90, "price": 15, "expiry": "2028-01-31"},
+    "omeprazole": {"stock": 60, "price": 35, "expiry": "2027-12-15"},
+    "losartan": {"stock": 40, "price": 55, "expiry": "2028-03-31"},
+    "insulin": {"stock": 25, "price": 180, "expiry": "2027-06-30"},
+}
+
 @app.on_event("startup")
 async def initialize_sample_data():
     """Initialize sample data for demo purposes"""
     try:
-        # Check if data already exists
-        user_count = await db.users.count_documents({})
-        if user_count == 0:
+        # Seeded once the pharmacy exists, whether or not anyone has signed up since
+        pharmacy = await db.pharmacies.find_one({"id": SAMPLE_PHARMACY_ID}, {"_id": 0})
+        if pharmacy is None:
             # Create sample pharmacy
-            sample_pharmacy = Pharmacy(
+            sample_pharmacy = PharmacyCreate(
+                id=SAMPLE_PHARMACY_ID,
                 name="Civil Hospital Pharmacy",
                 location="Civil Hospital, Village Center",
                 phone="+91-9876543210",
-                medicines={
-                    "paracetamol": {"stock": 50, "price": 10, "expiry": "2025-12-31"},
-                    "amoxicillin": {"stock": 30, "price": 45, "expiry": "2025-10-15"},
-                    "metformin": {"stock": 25, "price": 25, "expiry": "2025-11-20"},
-                    "aspirin": {"stock": 40, "price": 8, "expiry": "2025-09-30"}
-                }
+                medicines=SAMPLE_MEDICINES
             )
-            await db.pharmacies.insert_one(sample_pharmacy.dict())
-            
-            logger.info("Sample data initialized")
+            try:
+                await save_pharmacy(sample_pharmacy)
+                logger.info("Sample data initialized")
+            except DuplicateKeyError:
+                # Another worker seeded it first
+                pass
+        else:
+            # Demo databases seeded before the pharmacy stocked everything the app offers
+            await add_missing_line_items(db.pharmacy_inventory, pharmacy, SAMPLE_MEDICINES)
     except Exception as e:
         logger.error(f"Error initializing sample data: {e}")
\ No newline at end of file
@@ -0,0 +1,359 @@
+"""Outbreak surveillance over symptom checks with per-(village, symptom) sliding windows.
+
+Each symptom check is counted once per canonical symptom key the triage
+engine found in it, under the patient's village. A counter is a ring of
+hourly buckets long enough to hold the current window, a guard gap and the
+baseline windows before it (EARS C2: the current 24 hours against the seven
+24-hour windows that end two windows earlier). The window sum and the
+baseline's mean and standard deviation are recomputed only when a counter
+moves into a new hour, so counting an event is a few integer updates.
+
+A window whose count is at least min_cases and more than z_threshold
+standard deviations over its baseline mean opens an alert; the deviation
+is taken as at least the square root of the mean, as for Poisson counts.
+The alert is resolved once the window falls back under the threshold.
+
+Counters are flushed to Mongo as checkpoints together with the newest
+check time they include. On startup the checkpoints are loaded and only
+the symptom checks after that time are replayed; each counter also skips
+the events its own checkpoint already holds. Counters are per worker
+process: each counts the checks it serves and replays.
+"""
+import math
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DeleteOne, UpdateOne
+
+COUNTERS = "outbreak_counters"
+ALERTS = "outbreak_alerts"
+WATERMARK_ID = "_watermark"
+BUCKET_SECONDS = 3600
+CHECK_PROJECTION = {"_id": 0, "id": 1, "user_id": 1, "symptoms": 1, "symptom_keys": 1, "village": 1, "created_at": 1}
+REPLAY_BATCH = 2000
+
+
+def as_utc(moment: datetime) -> datetime:
+    # Motor hands back naive datetimes that are UTC
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+def bucket_of(moment: datetime) -> int:
+    """Hours since the epoch"""
+    return int(as_utc(moment).timestamp()) // BUCKET_SECONDS
+
+
+def counter_id(village: str, symptom: str) -> str:
+    return f"{village}|{symptom}"
+
+
+class WindowCounter:
+    """Hourly event counts of one (village, symptom) pair over the ring's span"""
+
+    __slots__ = ("counts", "head", "current", "mean", "std", "threshold", "through", "checkpoint", "alert_id", "peak",
+                 "dirty")
+
+    def __init__(self, ring: int, head: int = 0, counts: Optional[bytes] = None):
+        # Two bytes an hour: no village reports 65535 cases of a symptom in one hour
+        self.counts = array("H", bytes(counts)) if counts else array("H", [0]) * ring
+        self.head = head  # the newest hour in the ring
+        self.current = 0
+        self.mean = 0.0
+        self.std = 0.0
+        self.threshold = math.inf
+        self.through: Optional[datetime] = None  # newest check time counted
+        self.checkpoint: Optional[datetime] = None  # through, as restored; the replay skips checks up to it
+        self.alert_id: Optional[str] = None
+        self.peak = 0
+        self.dirty = False
+
+
+class OutbreakDetector:
+    """Sliding-window symptom counts per village, checkpointed to Mongo, alerting on spikes"""
+
+    def __init__(self, db, window_hours: int = 24, guard_windows: int = 2, baseline_windows: int = 7,
+                 z_threshold: float = 3.0, min_cases: int = 5, std_floor: float = 1.0):
+        self.db = db
+        self.window = window_hours
+        self.guard_windows = guard_windows
+        self.baseline_windows = baseline_windows
+        self.ring = window_hours * (1 + guard_windows + baseline_windows)
+        self.z_threshold = z_threshold
+        self.min_cases = min_cases
+        self.std_floor = std_floor
+        self.windows: Dict[Tuple[str, str], WindowCounter] = {}
+        self.watermark: Optional[datetime] = None  # every check up to here is in a flushed checkpoint
+        self._newest: Optional[datetime] = None
+        self._replaying = False
+        self.counters = {"events": 0, "no_village": 0, "counted": 0, "skipped": 0, "too_old": 0, "alerts_opened": 0,
+                         "alerts_resolved": 0, "replayed": 0, "flushes": 0}
+        self._busy_seconds = 0.0
+
+    @property
+    def span(self) -> timedelta:
+        return timedelta(seconds=self.ring * BUCKET_SECONDS)
+
+    # -- counting ---------------------------------------------------------------
+
+    def _recompute(self, counter: WindowCounter) -> None:
+        # Oldest hour first, so every window is one slice
+        split = counter.head % self.ring + 1
+        hours = counter.counts[split:] + counter.counts[:split]
+        window = self.window
+        counter.current = sum(hours[-window:])
+        baseline = [sum(hours[i * window:(i + 1) * window]) for i in range(self.baseline_windows)]
+        mean = sum(baseline) / len(baseline)
+        std = math.sqrt(sum((x - mean) ** 2 for x in baseline) / max(1, len(baseline) - 1))
+        counter.mean, counter.std = mean, std
+        # Counts are roughly Poisson; a quiet baseline's sample deviation understates how much they vary
+        spread = max(std, math.sqrt(mean), self.std_floor)
+        counter.threshold = max(self.min_cases, mean + self.z_threshold * spread)
+
+    def _advance(self, counter: WindowCounter, bucket: int) -> None:
+        if bucket <= counter.head:
+            return
+        if bucket - counter.head >= self.ring:
+            counter.counts = array("H", [0]) * self.ring
+        else:
+            for hour in range(counter.head + 1, bucket + 1):
+                counter.counts[hour % self.ring] = 0
+        counter.head = bucket
+        counter.dirty = True
+        self._recompute(counter)
+
+    def observe(self, village: Optional[str], symptoms: Iterable[str], at: datetime) -> List[Dict[str, Any]]:
+        """Count one symptom check; returns the alerts it opened or resolved"""
+        started = time.perf_counter()
+        self.counters["events"] += 1
+        changes = []
+        if village:
+            at = as_utc(at)
+            bucket = bucket_of(at)
+            for symptom in set(symptoms):
+                change = self._count(village, symptom, bucket, at)
+                if change:
+                    changes.append(change)
+            if self._newest is None or at > self._newest:
+                self._newest = at
+        else:
+            self.counters["no_village"] += 1
+        self._busy_seconds += time.perf_counter() - started
+        return changes
+
+    def _count(self, village: str, symptom: str, bucket: int, at: datetime) -> Optional[Dict[str, Any]]:
+        counter = self.windows.get((village, symptom))
+        if counter is None:
+            counter = self.windows[(village, symptom)] = WindowCounter(self.ring, bucket)
+            self._recompute(counter)
+        elif counter.checkpoint is not None and at <= counter.checkpoint:
+            # Already in this counter's checkpoint
+            self.counters["skipped"] += 1
+            return None
+        self._advance(counter, bucket)
+        age = counter.head - bucket
+        if age >= self.ring:
+            self.counters["too_old"] += 1
+            return None
+        counter.counts[bucket % self.ring] += 1
+        counter.dirty = True
+        if counter.through is None or at > counter.through:
+            counter.through = at
+        self.counters["counted"] += 1
+        if age < self.window:
+            counter.current += 1
+        else:
+            # A late event landed in the baseline
+            self._recompute(counter)
+        return self._evaluate(village, symptom, counter)
+
+    def _evaluate(self, village: str, symptom: str, counter: WindowCounter) -> Optional[Dict[str, Any]]:
+        if counter.alert_id is None:
+            if counter.current >= counter.threshold:
+                counter.alert_id = f"{village}:{symptom}:{counter.head}"
+                counter.peak = counter.current
+                counter.dirty = True
+                self.counters["alerts_opened"] += 1
+                return self._alert(village, symptom, counter, "open")
+        elif counter.current > counter.peak:
+            counter.peak = counter.current
+            counter.dirty = True
+        elif counter.current < counter.threshold:
+            change = self._alert(village, symptom, counter, "resolved")
+            counter.alert_id = None
+            counter.dirty = True
+            self.counters["alerts_resolved"] += 1
+            return change
+        return None
+
+    def _alert(self, village: str, symptom: str, counter: WindowCounter, status: str) -> Dict[str, Any]:
+        window_end = datetime.fromtimestamp((counter.head + 1) * BUCKET_SECONDS, timezone.utc)
+        return {
+            "id": counter.alert_id, "village": village, "symptom": symptom, "status": status,
+            "window_start": window_end - timedelta(hours=self.window), "window_end": window_end,
+            "count": counter.current, "peak": counter.peak, "baseline_mean": round(counter.mean, 2),
+            "baseline_std": round(counter.std, 2), "threshold": round(counter.threshold, 2),
+        }
+
+    # -- alerts -----------------------------------------------------------------
+
+    async def publish(self, changes: List[Dict[str, Any]]) -> None:
+        """Store opened alerts and mark resolved ones; replays of the same alert are idempotent"""
+        now = datetime.now(timezone.utc)
+        writes = []
+        for change in changes:
+            if change["status"] == "open":
+                opened = {key: value for key, value in change.items() if key != "id"}
+                writes.append(UpdateOne({"id": change["id"]}, {"$setOnInsert": {**opened, "opened_at": now}},
+                                        upsert=True))
+            else:
+                writes.append(UpdateOne({"id": change["id"], "status": "open"}, {"$set": {
+                    "status": "resolved", "resolved_at": now, "peak": change["peak"],
+                    "window_end": change["window_end"],
+                }}))
+        if writes:
+            await self.db[ALERTS].bulk_write(writes, ordered=True)
+
+    async def record(self, village: Optional[str], symptoms: Iterable[str], at: datetime) -> List[Dict[str, Any]]:
+        changes = self.observe(village, symptoms, at)
+        await self.publish(changes)
+        return changes
+
+    async def expire(self, now: Optional[datetime] = None) -> int:
+        """Move alerting counters up to now so alerts of villages that went quiet resolve"""
+        bucket = bucket_of(now or datetime.now(timezone.utc))
+        changes = []
+        for (village, symptom), counter in self.windows.items():
+            if counter.alert_id is not None:
+                self._advance(counter, bucket)
+                change = self._evaluate(village, symptom, counter)
+                if change:
+                    changes.append(change)
+        await self.publish(changes)
+        return len(changes)
+
+    # -- checkpoints ------------------------------------------------------------
+
+    async def restore(self) -> int:
+        """Load the flushed counters; returns how many"""
+        self.windows.clear()
+        async for doc in self.db[COUNTERS].find({}):
+            if doc["_id"] == WATERMARK_ID:
+                self.watermark = as_utc(doc["through"]) if doc.get("through") else None
+                continue
+            if doc.get("ring") != self.ring:
+                # Window settings changed; the replay rebuilds what it can
+                continue
+            counter = WindowCounter(self.ring, doc["head"], doc["counts"])
+            counter.through = counter.checkpoint = as_utc(doc["through"]) if doc.get("through") else None
+            counter.alert_id = doc.get("alert_id")
+            counter.peak = doc.get("peak", 0)
+            self._recompute(counter)
+            self.windows[(doc["village"], doc["symptom"])] = counter
+        self._newest = self.watermark
+        return len(self.windows)
+
+    async def flush(self, now: Optional[datetime] = None) -> int:
+        """Write changed counters, drop ones with nothing left in the ring, then advance the watermark"""
+        newest = self._newest
+        bucket = bucket_of(now or datetime.now(timezone.utc))
+        writes = []
+        for (village, symptom), counter in list(self.windows.items()):
+            if bucket - counter.head >= self.ring and counter.alert_id is None:
+                del self.windows[(village, symptom)]
+                writes.append(DeleteOne({"_id": counter_id(village, symptom)}))
+            elif counter.dirty:
+                counter.dirty = False
+                writes.append(UpdateOne({"_id": counter_id(village, symptom)}, {"$set": {
+                    "village": village, "symptom": symptom, "ring": self.ring, "head": counter.head,
+                    "counts": counter.counts.tobytes(), "through": counter.through,
+                    "alert_id": counter.alert_id, "peak": counter.peak,
+                }}, upsert=True))
+        try:
+            for start in range(0, len(writes), REPLAY_BATCH):
+                await self.db[COUNTERS].bulk_write(writes[start:start + REPLAY_BATCH], ordered=False)
+        except Exception:
+            for counter in self.windows.values():
+                counter.dirty = True
+            raise
+        # Live checks during a replay are newer than the ones it has still to count
+        if newest is not None and newest != self.watermark and not self._replaying:
+            await self.db[COUNTERS].update_one({"_id": WATERMARK_ID}, {"$set": {"through": newest}}, upsert=True)
+            self.watermark = newest
+        self.counters["flushes"] += 1
+        return len(writes)
+
+    # -- replay -----------------------------------------------------------------
+
+    async def replay(self, triage_engine, until: datetime, since: Optional[datetime] = None) -> int:
+        """Count the symptom checks after the watermark (or since) and before until; returns how many were read.
+
+        Checks stored before the detector existed carry neither village nor
+        canonical symptom keys; those are looked up and re-matched here.
+        """
+        horizon = as_utc(until) - self.span
+        start = max(as_utc(since or self.watermark or horizon), horizon)
+        query = {"created_at": {"$gt": start, "$lt": until}}
+        cursor = self.db.symptom_checks.find(query, CHECK_PROJECTION).sort("created_at", ASCENDING)
+        read, batch = 0, []
+        self._replaying = True
+        try:
+            async for check in cursor:
+                batch.append(check)
+                if len(batch) >= REPLAY_BATCH:
+                    read += await self._replay_batch(triage_engine, batch)
+                    batch = []
+            if batch:
+                read += await self._replay_batch(triage_engine, batch)
+        finally:
+            self._replaying = False
+            for counter in self.windows.values():
+                counter.checkpoint = None
+        self.counters["replayed"] += read
+        return read
+
+    async def _replay_batch(self, triage_engine, checks: List[Dict[str, Any]]) -> int:
+        missing = {check["user_id"] for check in checks if "village" not in check}
+        villages: Dict[str, Optional[str]] = {}
+        if missing:
+            async for user in self.db.users.find({"id": {"$in": list(missing)}}, {"id": 1, "village": 1}):
+                villages[user["id"]] = user.get("village")
+        changes = []
+        for check in checks:
+            village = check["village"] if "village" in check else villages.get(check["user_id"])
+            keys = check.get("symptom_keys")
+            if keys is None:
+                keys = triage_engine.assess(check.get("symptoms") or []).symptoms
+            changes += self.observe(village, keys, check["created_at"])
+        await self.publish(changes)
+        return len(checks)
+
+    # -- reporting --------------------------------------------------------------
+
+    def village(self, village: str, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Current window, baseline and threshold of each symptom counted in a village, busiest first"""
+        bucket = bucket_of(now or datetime.now(timezone.utc))
+        rows = []
+        for (name, symptom), counter in self.windows.items():
+            if name != village:
+                continue
+            self._advance(counter, bucket)
+            rows.append({
+                "symptom": symptom, "count": counter.current, "baseline_mean": round(counter.mean, 2),
+                "baseline_std": round(counter.std, 2), "threshold": round(counter.threshold, 2),
+                "alert_id": counter.alert_id,
+            })
+        return sorted(rows, key=lambda row: (-row["count"], row["symptom"]))
+
+    def stats(self) -> Dict[str, Any]:
+        events = self.counters["events"]
+        return {
+            "counters": len(self.windows),
+            "counter_bytes": sum(counter.counts.itemsize * len(counter.counts) for counter in self.windows.values()),
+            "open_alerts": sum(1 for counter in self.windows.values() if counter.alert_id is not None),
+            "window_hours": self.window,
+            "watermark": self.watermark,
+            "events_per_second": round(events / self._busy_seconds) if self._busy_seconds else None,
+            **self.counters,
+        }
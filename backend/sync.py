@@ -0,0 +1,214 @@
+"""Offline client sync: bulk, idempotent uploads and the incremental change feed."""
+import asyncio
+import base64
+import binascii
+import json
+from datetime import datetime, timezone, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY_ERROR = 11000
+
+INSERTED = "inserted"
+DUPLICATE = "duplicate"
+REJECTED = "rejected"
+
+# Per-user collections served by the change feed, with the fields that name their owners
+SYNC_COLLECTIONS: Dict[str, Tuple[str, ...]] = {
+    "health_records": ("user_id",),
+    "consultations": ("patient_id",),
+    "symptom_checks": ("user_id",),
+    "medicine_requests": ("user_id",),
+    "asha_visits": ("asha_id", "patient_id"),
+    "emergency_alerts": ("user_id",),
+}
+TOMBSTONES = "sync_tombstones"
+
+
+async def bulk_insert_offline(collection, docs: List[Dict[str, Any]]) -> List[str]:
+    """Insert docs keyed by offline_id in two round trips, returning one status per doc"""
+    statuses: List[str] = [INSERTED] * len(docs)
+    if not docs:
+        return statuses
+
+    # 1. One $in lookup for every offline_id that is already stored
+    offline_ids = list({doc["offline_id"] for doc in docs})
+    seen = set()
+    async for existing in collection.find({"offline_id": {"$in": offline_ids}}, {"offline_id": 1, "_id": 0}):
+        seen.add(existing["offline_id"])
+
+    # 2. Drop stored ids and repeats inside the batch itself
+    fresh, fresh_index = [], []
+    for i, doc in enumerate(docs):
+        if doc["offline_id"] in seen:
+            statuses[i] = DUPLICATE
+            continue
+        seen.add(doc["offline_id"])
+        fresh.append(doc)
+        fresh_index.append(i)
+
+    # 3. One unordered insert; the unique index catches records raced in by another request
+    if fresh:
+        try:
+            await collection.insert_many(fresh, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                i = fresh_index[error["index"]]
+                statuses[i] = DUPLICATE if error.get("code") == DUPLICATE_KEY_ERROR else REJECTED
+
+    return statuses
+
+
+class LineTooLong(Exception):
+    """An NDJSON line longer than the stream allows"""
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes], max_line: int) -> AsyncIterator[Any]:
+    """Decode a newline-delimited JSON byte stream one line at a time; raises LineTooLong past max_line bytes"""
+    pending = bytearray()
+    async for chunk in chunks:
+        *lines, rest = chunk.split(b"\n")
+        for line in lines:
+            pending += line
+            if len(pending) > max_line:
+                raise LineTooLong(f"A line is longer than {max_line} bytes")
+            if pending.strip():
+                yield _decode_line(bytes(pending))
+            pending.clear()
+        pending += rest
+        # Checked per chunk, so a line without an end is cut off before it outgrows max_line by more than a chunk
+        if len(pending) > max_line:
+            raise LineTooLong(f"A line is longer than {max_line} bytes")
+    if pending.strip():
+        yield _decode_line(bytes(pending))
+
+
+def _decode_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+# =============================================================================
+# CHANGE FEED
+# =============================================================================
+
+class SyncSequence:
+    """Monotonic change counter shared by every worker through a counters document"""
+
+    def __init__(self, counters):
+        self.counters = counters
+
+    async def reserve(self, count: int = 1) -> int:
+        """Reserve count consecutive sequence numbers and return the first one"""
+        doc = await self.counters.find_one_and_update(
+            {"_id": "sync_seq"},
+            {"$inc": {"value": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["value"] - count + 1
+
+    async def stamp(self, *docs: Dict[str, Any]) -> None:
+        """Give each doc the next sequence number before it is written"""
+        if not docs:
+            return
+        first = await self.reserve(len(docs))
+        now = datetime.now(timezone.utc)
+        for offset, doc in enumerate(docs):
+            doc["sync_seq"] = first + offset
+            doc["sync_ts"] = now
+
+    async def fields(self) -> Dict[str, Any]:
+        """$set fields that move an updated document to the head of the feed"""
+        doc: Dict[str, Any] = {}
+        await self.stamp(doc)
+        return doc
+
+
+def encode_token(seq: int) -> str:
+    raw = json.dumps({"v": 1, "seq": seq}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token: Optional[str]) -> int:
+    """Turn a resume token back into a sequence number; raises ValueError if it is malformed"""
+    if not token:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        seq = json.loads(raw)["seq"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("invalid sync token")
+    if not isinstance(seq, int) or seq < 0:
+        raise ValueError("invalid sync token")
+    return seq
+
+
+async def record_tombstone(db, sequence: SyncSequence, collection: str, doc: Dict[str, Any]) -> None:
+    """Remember a deletion so clients that synced the document can drop it"""
+    tombstone = {
+        "collection": collection,
+        "doc_id": doc["id"],
+        "owners": [doc[field] for field in SYNC_COLLECTIONS[collection] if doc.get(field)],
+    }
+    await sequence.stamp(tombstone)
+    await db[TOMBSTONES].insert_one(tombstone)
+
+
+async def fetch_changes(db, user_id: str, since: int, limit: int, settle_seconds: float) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """Return (changes, last_seq, has_more) for documents owned by user_id written after since.
+
+    Sequence numbers are reserved before the write lands, so a low number can
+    commit after a higher one. The page stops at the first change younger than
+    settle_seconds, which keeps the returned token from skipping past writes
+    that are still in flight.
+    """
+    async def read(name: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        cursor = db[name].find({**query, "sync_seq": {"$gt": since}}, {"_id": 0})
+        docs = await cursor.sort("sync_seq", 1).to_list(limit + 1)
+        for doc in docs:
+            doc["_collection"] = name
+        return docs
+
+    reads = [
+        read(name, {"$or": [{field: user_id} for field in owners]})
+        for name, owners in SYNC_COLLECTIONS.items()
+    ]
+    reads.append(read(TOMBSTONES, {"owners": user_id}))
+    merged = sorted((doc for docs in await asyncio.gather(*reads) for doc in docs), key=lambda doc: doc["sync_seq"])
+
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settle_seconds)
+    page = []
+    for doc in merged[:limit]:
+        stamped_at = doc.get("sync_ts")
+        if stamped_at is not None and stamped_at.tzinfo is None:
+            stamped_at = stamped_at.replace(tzinfo=timezone.utc)
+        if stamped_at is not None and stamped_at > cutoff:
+            break
+        page.append(doc)
+
+    last_seq = page[-1]["sync_seq"] if page else since
+    return page, last_seq, len(page) < len(merged)
+
+
+async def backfill_sync_sequence(db, sequence: SyncSequence, batch_size: int = 1000) -> int:
+    """Stamp documents written before the change feed existed; returns how many were stamped"""
+    stamped = 0
+    for name in list(SYNC_COLLECTIONS):
+        while True:
+            docs = await db[name].find({"sync_seq": {"$exists": False}}, {"_id": 1}).to_list(batch_size)
+            if not docs:
+                break
+            await sequence.stamp(*docs)
+            await db[name].bulk_write(
+                [UpdateOne({"_id": doc["_id"], "sync_seq": {"$exists": False}},
+                           {"$set": {"sync_seq": doc["sync_seq"], "sync_ts": doc["sync_ts"]}})
+                 for doc in docs],
+                ordered=False,
+            )
+            stamped += len(docs)
+    return stamped
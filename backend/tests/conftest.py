@@ -0,0 +1,36 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+# The app's modules import each other by bare name, as when run from the backend directory
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture(scope="session")
+def server():
+    """The app module on an in-memory MongoDB (mongomock-motor); startup jobs are not run"""
+    pytest.importorskip("mongomock_motor")
+    from benchmarks.load import use_in_memory_database
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "arogya_test")
+    os.environ.setdefault("NOTIFICATION_PROVIDER", "fake")
+    # One test client sends every request; per-client rate limits would turn most of them away
+    os.environ.setdefault("ADMISSION_RATE_LIMITS", "off")
+    use_in_memory_database()
+    import server
+    return server
+
+
+def call(server, method: str, path: str, **kwargs) -> httpx.Response:
+    """Send one request to the app in-process"""
+    async def send():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, **kwargs)
+
+    return asyncio.run(send())
@@ -0,0 +1,161 @@
+import asyncio
+
+import httpx
+import pytest
+
+from admission import (
+    AI, CLINICAL, DEFAULT_POLICIES, EMERGENCY, READ, AdmissionController, AdmissionMiddleware, ClassPolicy,
+    Rejected,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def controller(timeout=5.0, queue=8, max_lag=None, **kwargs):
+    """Two shared classes over one shared slot, and an emergency class outside it"""
+    return AdmissionController({
+        EMERGENCY: ClassPolicy(limit=4, queue=8, timeout=timeout, shared=False),
+        CLINICAL: ClassPolicy(limit=1, queue=queue, timeout=timeout),
+        AI: ClassPolicy(limit=1, queue=queue, timeout=timeout, max_lag=max_lag),
+    }, capacity=1, **kwargs)
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_freed_slot_goes_to_the_highest_priority_waiter():
+    async def scenario():
+        admission = controller()
+        await admission.acquire(AI)
+        order = []
+
+        async def wait(name):
+            await admission.acquire(name)
+            order.append(name)
+
+        # The AI request queued first, but clinical work is served first
+        ai = asyncio.create_task(wait(AI))
+        await settle()
+        clinical = asyncio.create_task(wait(CLINICAL))
+        await settle()
+        admission.release(AI)
+        await settle()
+        assert order == [CLINICAL]
+        admission.release(CLINICAL)
+        await asyncio.gather(ai, clinical)
+        assert order == [CLINICAL, AI]
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_shed_at_once():
+    async def scenario():
+        admission = controller(queue=1)
+        await admission.acquire(AI)
+        waiting = asyncio.create_task(admission.acquire(AI))
+        await settle()
+        with pytest.raises(Rejected) as rejected:
+            await admission.acquire(AI)
+        assert (rejected.value.status, rejected.value.reason) == (503, "queue_full")
+        assert rejected.value.retry_after > 0
+        admission.release(AI)
+        await waiting
+
+    asyncio.run(scenario())
+
+
+def test_request_still_queued_at_the_deadline_is_shed():
+    async def scenario():
+        admission = controller(timeout=0.01)
+        await admission.acquire(CLINICAL)
+        with pytest.raises(Rejected) as rejected:
+            await admission.acquire(AI)
+        assert (rejected.value.status, rejected.value.reason) == (503, "queue_timeout")
+        assert admission.stats()["classes"][AI]["queued"] == 0
+        # The slot it never got is not leaked
+        admission.release(CLINICAL)
+        await admission.acquire(AI)
+
+    asyncio.run(scenario())
+
+
+def test_lagging_loop_holds_classes_with_a_max_lag():
+    async def scenario():
+        admission = controller(max_lag=0.2)
+        admission.loop_lag = 0.5
+        held = asyncio.create_task(admission.acquire(AI))
+        await settle()
+        assert not held.done()
+        # Emergencies have no max_lag and start regardless
+        await admission.acquire(EMERGENCY)
+
+        admission.loop_lag = 0.0
+        admission.release(EMERGENCY)
+        await asyncio.wait_for(held, 1)
+
+    asyncio.run(scenario())
+
+
+def test_token_bucket_refills_at_the_class_rate():
+    clock = Clock()
+    admission = AdmissionController(clock=clock)
+    policy = DEFAULT_POLICIES[AI]
+    assert all(admission.check_rate("10.0.0.1", AI) == 0 for _ in range(policy.burst))
+    assert admission.check_rate("10.0.0.1", AI) == pytest.approx(1 / policy.rate)
+    # Other clients have buckets of their own
+    assert admission.check_rate("10.0.0.2", AI) == 0
+
+    clock.now += 1 / policy.rate
+    assert admission.check_rate("10.0.0.1", AI) == 0
+    assert admission.check_rate("10.0.0.1", AI) > 0
+
+
+async def ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def send_all(admission, requests):
+    async def run():
+        transport = httpx.ASGITransport(app=AdmissionMiddleware(ok, admission))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.request(method, path) for method, path in requests]
+
+    return asyncio.run(run())
+
+
+def test_client_over_its_rate_gets_429_with_retry_after():
+    admission = AdmissionController(clock=Clock())
+    burst = DEFAULT_POLICIES[AI].burst
+    responses = send_all(admission, [("POST", "/api/symptom-check")] * (burst + 1))
+    assert [response.status_code for response in responses] == [200] * burst + [429]
+    assert responses[-1].headers["retry-after"] == str(int(1 / DEFAULT_POLICIES[AI].rate))
+
+
+def test_emergency_routes_are_never_rate_limited():
+    admission = AdmissionController(clock=Clock())
+    responses = send_all(admission, [("POST", "/api/emergency-alert"), ("GET", "/api/emergency-alerts"),
+                                     ("PUT", "/api/emergency-alerts/a1/respond")] * 50)
+    assert {response.status_code for response in responses} == {200}
+    assert admission.classify("GET", "/api/users") == READ
+
+
+def test_shed_request_gets_503_with_retry_after():
+    async def scenario():
+        admission = controller(queue=0)
+        await admission.acquire(CLINICAL)
+        transport = httpx.ASGITransport(app=AdmissionMiddleware(ok, admission))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/symptom-check")
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
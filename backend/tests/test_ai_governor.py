@@ -0,0 +1,152 @@
+import asyncio
+import uuid
+
+import pytest
+
+from ai_governor import CLOSED, HALF_OPEN, OPEN, AIGovernor, CircuitOpenError
+from benchmarks.fake_llm import FakeModel
+from conftest import call
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def ask(governor: AIGovernor, model: FakeModel, key: str):
+    return governor.call(key, lambda: model.generate_content_async(key))
+
+
+def test_identical_inflight_prompts_share_one_call():
+    model = FakeModel(latency=0.05)
+    governor = AIGovernor("fake")
+
+    async def run():
+        return await asyncio.gather(*(ask(governor, model, "fever, cough") for _ in range(10)))
+
+    responses = asyncio.run(run())
+    assert model.calls == 1
+    assert len({id(response) for response in responses}) == 1
+    assert governor.counters["coalesced"] == 9
+
+
+def test_semaphore_caps_concurrent_calls():
+    model = FakeModel(latency=0.02)
+    governor = AIGovernor("fake", max_concurrency=3)
+
+    async def run():
+        await asyncio.gather(*(ask(governor, model, f"prompt {i}") for i in range(12)))
+
+    asyncio.run(run())
+    assert model.calls == 12
+    assert model.peak_concurrent == 3
+
+
+def test_deadline_raises_timeout():
+    governor = AIGovernor("fake", timeout=0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(ask(governor, FakeModel(latency=1.0), "slow"))
+    assert governor.counters["timed_out"] == 1
+
+
+def test_breaker_opens_short_circuits_and_closes_after_probe():
+    clock = Clock()
+    model = FakeModel(latency=0, error_rate=1.0)
+    governor = AIGovernor("fake", failure_threshold=3, reset_timeout=30, clock=clock)
+
+    async def run():
+        for i in range(3):
+            with pytest.raises(RuntimeError):
+                await ask(governor, model, f"failing {i}")
+        assert governor.state == OPEN
+
+        # Open: callers fail fast without reaching the model
+        with pytest.raises(CircuitOpenError):
+            await ask(governor, model, "while open")
+        assert model.calls == 3
+        assert governor.counters["short_circuited"] == 1
+
+        # Half open: one probe goes through, concurrent callers are still turned away
+        clock.now += 30
+        assert governor.state == HALF_OPEN
+        model.error_rate = 0.0
+        model.latency = 0.02
+        probe = asyncio.ensure_future(ask(governor, model, "probe"))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError):
+            await ask(governor, model, "during probe")
+        await probe
+        assert governor.state == CLOSED
+        await ask(governor, model, "after probe")
+
+    asyncio.run(run())
+    assert model.calls == 5
+
+
+def test_failed_probe_opens_the_breaker_again():
+    clock = Clock()
+    model = FakeModel(latency=0, error_rate=1.0)
+    governor = AIGovernor("fake", failure_threshold=1, reset_timeout=30, clock=clock)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await ask(governor, model, "first")
+        clock.now += 30
+        with pytest.raises(RuntimeError):
+            await ask(governor, model, "probe")
+        assert governor.state == OPEN
+
+    asyncio.run(run())
+
+
+def test_symptom_check_past_the_deadline_uses_offline_triage(server, monkeypatch):
+    model = FakeModel(latency=1.0)
+    governor = AIGovernor("gemini", timeout=0.05)
+    monkeypatch.setattr(server, "get_generative_model", lambda model_name, system_instruction: model)
+    monkeypatch.setattr(server, "ai_governor", governor)
+
+    response = call(server, "POST", "/api/symptom-check", json={
+        "user_id": "patient_1", "symptoms": ["fever", "cough"], "additional_info": str(uuid.uuid4()),
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["assessment"].startswith("Basic symptom assessment completed offline")
+    assert body["severity"] == "low"
+    assert governor.counters["timed_out"] == 1
+
+
+def test_symptom_check_with_open_breaker_skips_the_model(server, monkeypatch):
+    model = FakeModel(latency=0)
+    governor = AIGovernor("gemini", failure_threshold=1, reset_timeout=30, clock=Clock())
+    governor._record_failure()
+    monkeypatch.setattr(server, "get_generative_model", lambda model_name, system_instruction: model)
+    monkeypatch.setattr(server, "ai_governor", governor)
+
+    response = call(server, "POST", "/api/symptom-check", json={
+        "user_id": "patient_1", "symptoms": ["headache"], "additional_info": str(uuid.uuid4()),
+    })
+    assert response.status_code == 200
+    assert response.json()["assessment"].startswith("Basic symptom assessment completed offline")
+    assert model.calls == 0
+
+
+def test_health_reports_ai_degraded_while_the_breaker_is_open(server, monkeypatch):
+    clock = Clock()
+    governor = AIGovernor("gemini", failure_threshold=1, reset_timeout=30, clock=clock)
+    monkeypatch.setattr(server, "ai_governor", governor)
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+
+    def ai():
+        return call(server, "GET", "/api/health").json()["services"]["ai"]
+
+    assert ai() == {"status": "available", "circuit": CLOSED}
+    governor._record_failure()
+    assert ai() == {"status": "degraded", "circuit": OPEN}
+    clock.now = 30
+    assert ai() == {"status": "degraded", "circuit": HALF_OPEN}
+
+    monkeypatch.delenv("GOOGLE_API_KEY")
+    assert ai()["status"] == "unavailable"
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import os
+import uuid
+
+import pytest
+
+from attachments import (
+    ATTACHMENTS, BLOBS, COMPLETE, UPLOAD_OFFSET_HEADER, UPLOADING, UPLOADS, AttachmentStore, DiskStore,
+)
+from conftest import call
+
+DATA = os.urandom(1000)
+
+
+@pytest.fixture
+def store(server, monkeypatch, tmp_path):
+    """Attachments kept under a temporary directory (mongomock has no GridFS), with no blobs stored yet"""
+    for collection in (UPLOADS, BLOBS, ATTACHMENTS):
+        asyncio.run(server.db[collection].delete_many({}))
+    attachment_store = AttachmentStore(server.db, DiskStore(tmp_path), max_bytes=1024 * 1024, upload_ttl_seconds=3600)
+    monkeypatch.setattr(server, "attachment_store", attachment_store)
+    return attachment_store
+
+
+def start(server, data=DATA, owner_id=None, sha256=None):
+    response = call(server, "POST", "/api/attachments/uploads", json={
+        "owner_id": owner_id or f"patient_{uuid.uuid4().hex[:8]}", "filename": "report.pdf",
+        "content_type": "application/pdf", "size": len(data), "sha256": sha256,
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def put(server, upload, offset, data):
+    return call(server, "PUT", f"/api/attachments/uploads/{upload['id']}", content=data,
+                headers={UPLOAD_OFFSET_HEADER: str(offset)})
+
+
+def download(server, attachment_id, **headers):
+    return call(server, "GET", f"/api/attachments/{attachment_id}", headers=headers)
+
+
+def test_piece_past_the_stored_bytes_is_409_with_the_offset(server, store):
+    upload = start(server)
+    assert put(server, upload, 0, DATA[:300]).headers[UPLOAD_OFFSET_HEADER] == "300"
+
+    response = put(server, upload, 500, DATA[500:])
+    assert response.status_code == 409
+    assert response.headers[UPLOAD_OFFSET_HEADER] == "300"
+
+
+def test_upload_resumes_after_a_dropped_body(server, store):
+    upload = start(server)
+
+    async def dropped():
+        yield DATA[:200]
+        yield DATA[200:450]
+        raise ConnectionResetError("client went away")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(store.receive(upload["id"], 0, dropped()))
+    status = call(server, "GET", f"/api/attachments/uploads/{upload['id']}")
+    assert status.headers[UPLOAD_OFFSET_HEADER] == "450"
+    assert status.json()["status"] == UPLOADING
+
+    response = put(server, upload, 450, DATA[450:])
+    assert response.status_code == 200
+    assert response.json()["status"] == COMPLETE
+    assert download(server, response.json()["attachment_id"]).content == DATA
+
+
+def test_overlapping_retries_store_each_byte_once(server, store):
+    upload = start(server)
+    assert put(server, upload, 0, DATA[:600]).json()["offset"] == 600
+    # A retry of a piece that partly arrived before
+    response = put(server, upload, 400, DATA[400:])
+    assert response.json()["status"] == COMPLETE
+    # And a late retry of a piece of the finished upload
+    late = put(server, upload, 0, DATA[:600])
+    assert late.status_code == 200
+    assert late.json()["attachment_id"] == response.json()["attachment_id"]
+    assert download(server, response.json()["attachment_id"]).content == DATA
+
+
+def test_same_content_is_stored_once_across_owners(server, store):
+    data = os.urandom(700)
+    sha256 = hashlib.sha256(data).hexdigest()
+    first = put(server, start(server, data), 0, data).json()
+    second = put(server, start(server, data), 0, data).json()
+
+    assert first["attachment_id"] != second["attachment_id"]
+    assert asyncio.run(server.db[BLOBS].count_documents({"sha256": sha256})) == 1
+    assert len(list(store.store.blobs.iterdir())) == 1
+    assert download(server, second["attachment_id"]).content == data
+
+    # An owner announcing content they already stored gets it back without sending it again
+    owner_id = call(server, "GET", f"/api/attachments/{first['attachment_id']}/info").json()["owner_id"]
+    again = start(server, data, owner_id=owner_id, sha256=sha256)
+    assert again["status"] == COMPLETE
+    assert again["attachment_id"] == first["attachment_id"]
+
+
+def test_bytes_not_matching_the_declared_sha256_are_422(server, store):
+    upload = start(server, sha256=hashlib.sha256(b"something else").hexdigest())
+    response = put(server, upload, 0, DATA)
+    assert response.status_code == 422
+    assert call(server, "GET", f"/api/attachments/uploads/{upload['id']}").status_code == 404
+    assert list(store.store.uploads.iterdir()) == []
+
+
+def test_ranges_and_if_range(server, store):
+    attachment_id = put(server, start(server), 0, DATA).json()["attachment_id"]
+    etag = download(server, attachment_id).headers["etag"]
+
+    partial = download(server, attachment_id, range="bytes=100-199")
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == "bytes 100-199/1000"
+    assert partial.content == DATA[100:200]
+
+    suffix = download(server, attachment_id, range="bytes=-10")
+    assert suffix.status_code == 206
+    assert suffix.content == DATA[-10:]
+
+    resumed = download(server, attachment_id, range="bytes=900-", **{"if-range": etag})
+    assert resumed.status_code == 206
+    assert resumed.content == DATA[900:]
+
+    # A partial copy of other content gets the whole attachment instead
+    changed = download(server, attachment_id, range="bytes=900-", **{"if-range": '"other"'})
+    assert changed.status_code == 200
+    assert changed.content == DATA
+
+    beyond = download(server, attachment_id, range="bytes=1000-")
+    assert beyond.status_code == 416
+    assert beyond.headers["content-range"] == "bytes */1000"
@@ -0,0 +1,21 @@
+from indexes import INDEXES, QUERY_SHAPES
+
+
+def filter_fields(query):
+    fields = set()
+    for name, value in query.items():
+        if name in ("$or", "$and"):
+            for clause in value:
+                fields |= filter_fields(clause)
+        else:
+            fields.add(name)
+    return fields
+
+
+def test_every_query_shape_has_an_index_led_by_one_of_its_fields():
+    uncovered = [
+        shape.name for shape in QUERY_SHAPES
+        if not any(spec.collection == shape.collection and spec.keys[0][0] in filter_fields(shape.filter)
+                   for spec in INDEXES)
+    ]
+    assert uncovered == []
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import re
+import uuid
+from pathlib import Path
+
+from conftest import call
+from inventory import medicine_key
+from reservations import release, reserve
+
+
+def new_pharmacy(server, medicines):
+    pharmacy_id = f"pharmacy_{uuid.uuid4().hex[:8]}"
+    response = call(server, "POST", "/api/pharmacies", json={
+        "id": pharmacy_id, "name": "Test Pharmacy", "location": "Main road", "phone": "+91-9000000000",
+        "medicines": medicines,
+    })
+    assert response.status_code == 200
+    return pharmacy_id
+
+
+def stock_of(server, pharmacy_id, name):
+    return call(server, "GET", f"/api/pharmacies/{pharmacy_id}/medicines/{name}").json()["stock"]
+
+
+def test_recount_keeps_held_units_held(server):
+    pharmacy_id = new_pharmacy(server, {"ors": {"stock": 10}})
+    inventory = server.db.pharmacy_inventory
+    asyncio.run(reserve(inventory, "booking_1", pharmacy_id, {"ors": 4}, 3600))
+    assert stock_of(server, pharmacy_id, "ors") == 6
+
+    # The pharmacist counts 9 on the shelf, the 4 held ones included
+    response = call(server, "PUT", f"/api/pharmacies/{pharmacy_id}/inventory/ors", json={"stock": 9})
+    assert response.status_code == 200
+    assert response.json()["stock"] == 5
+
+    # Letting the booking go puts its units back once, on top of the count
+    asyncio.run(release(inventory, "booking_1", pharmacy_id, {"ors": 4}))
+    assert stock_of(server, pharmacy_id, "ors") == 9
+
+
+def test_recount_below_held_units_is_rejected(server):
+    pharmacy_id = new_pharmacy(server, {"zinc": {"stock": 5}})
+    asyncio.run(reserve(server.db.pharmacy_inventory, "booking_2", pharmacy_id, {"zinc": 3}, 3600))
+
+    response = call(server, "PUT", f"/api/pharmacies/{pharmacy_id}/inventory/zinc", json={"stock": 2})
+    assert response.status_code == 409
+    assert stock_of(server, pharmacy_id, "zinc") == 2
+
+
+def test_count_of_a_new_medicine_creates_it(server):
+    pharmacy_id = new_pharmacy(server, {})
+    response = call(server, "PUT", f"/api/pharmacies/{pharmacy_id}/inventory/cetirizine", json={"stock": 12})
+    assert response.status_code == 200
+    assert response.json()["stock"] == 12
+
+
+def test_stock_delta_still_refuses_to_go_negative(server):
+    pharmacy_id = new_pharmacy(server, {"ors": {"stock": 2}})
+    response = call(server, "PUT", f"/api/pharmacies/{pharmacy_id}/inventory/ors", json={"stock_delta": -3})
+    assert response.status_code == 409
+    assert stock_of(server, pharmacy_id, "ors") == 2
+
+
+def test_pharmacy_list_does_not_report_stock(server):
+    # Stock lives in line items; an empty medicines dict would read as "out of everything"
+    pharmacy_id = new_pharmacy(server, {"ors": {"stock": 3}})
+    pharmacies = call(server, "GET", "/api/pharmacies", params={"limit": 200}).json()
+    listed = next(pharmacy for pharmacy in pharmacies if pharmacy["id"] == pharmacy_id)
+    assert "medicines" not in listed
+    assert call(server, "GET", f"/api/pharmacies/{pharmacy_id}/inventory").json()[0]["stock"] == 3
+
+
+def app_catalogue():
+    """Medicines the frontend's pharmacy view offers, read from SAMPLE_DATA in App.js"""
+    app_js = Path(__file__).resolve().parents[2] / "frontend" / "src" / "App.js"
+    source = app_js.read_text(encoding="utf-8")
+    medicines = source[source.index("medicines: ["):]
+    medicines = medicines[:medicines.index("]")]
+    return re.findall(r"name: '([^']+)'", medicines)
+
+
+def test_sample_pharmacy_stocks_the_whole_app_catalogue(server):
+    catalogue = app_catalogue()
+    assert {medicine_key(name) for name in catalogue} <= set(server.SAMPLE_MEDICINES)
+
+    # A demo database seeded before the catalogue was stocked in full gets the rest at startup
+    asyncio.run(server.db.pharmacies.delete_many({"id": server.SAMPLE_PHARMACY_ID}))
+    asyncio.run(server.db.pharmacy_inventory.delete_many({"pharmacy_id": server.SAMPLE_PHARMACY_ID}))
+    asyncio.run(server.db.users.insert_one({"id": f"user_{uuid.uuid4().hex[:8]}", "name": "Existing user"}))
+    call(server, "POST", "/api/pharmacies", json={
+        "id": server.SAMPLE_PHARMACY_ID, "name": "Civil Hospital Pharmacy", "location": "Civil Hospital",
+        "phone": "+91-9876543210", "medicines": {"paracetamol": {"stock": 7, "price": 10, "expiry": "2027-12-31"}},
+    })
+    asyncio.run(server.initialize_sample_data())
+    assert stock_of(server, server.SAMPLE_PHARMACY_ID, "paracetamol") == 7
+
+    # The app books its whole cart there
+    response = call(server, "POST", "/api/medicine-requests", json={
+        "user_id": "patient_1", "user_name": "Asha", "user_phone": "+91-9000000001",
+        "pharmacy_id": server.SAMPLE_PHARMACY_ID, "medicines": [{"name": name, "quantity": 1} for name in catalogue],
+    })
+    assert response.status_code == 200, response.text
+
+
+def test_restart_before_anyone_signs_up_tops_up_the_sample_pharmacy(server, caplog):
+    db = server.db
+    asyncio.run(db.pharmacies.delete_many({"id": server.SAMPLE_PHARMACY_ID}))
+    asyncio.run(db.pharmacy_inventory.delete_many({"pharmacy_id": server.SAMPLE_PHARMACY_ID}))
+    # The app keeps one unique index on id; the in-memory collection needs it too
+    asyncio.run(db.pharmacies.create_index("id", unique=True))
+    users = asyncio.run(db.users.find({}).to_list(None))
+    asyncio.run(db.users.delete_many({}))
+    try:
+        asyncio.run(server.initialize_sample_data())
+        asyncio.run(db.pharmacy_inventory.delete_many({"pharmacy_id": server.SAMPLE_PHARMACY_ID,
+                                                       "medicine_name": "insulin"}))
+        with caplog.at_level(logging.ERROR):
+            asyncio.run(server.initialize_sample_data())
+    finally:
+        if users:
+            asyncio.run(db.users.insert_many(users))
+    assert "Error initializing sample data" not in caplog.text
+    assert asyncio.run(db.pharmacies.count_documents({"id": server.SAMPLE_PHARMACY_ID})) == 1
+    assert stock_of(server, server.SAMPLE_PHARMACY_ID, "insulin") == server.SAMPLE_MEDICINES["insulin"]["stock"]
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from notifications import FAILED, PENDING, SENDING, SENT, NotificationDispatcher, NotificationProvider, Outbox
+
+
+def test_provider_without_send_cannot_be_built():
+    class Silent(NotificationProvider):
+        name = "silent"
+
+    with pytest.raises(TypeError):
+        Silent()
+
+
+def test_expired_lease_cannot_mark_a_reclaimed_message_sent(server):
+    outbox = Outbox(server.db.test_notification_outbox)
+
+    async def scenario():
+        await outbox.collection.delete_many({})
+        await outbox.enqueue("sms", "+91-9000000001", "Your medicines are ready")
+        # The first dispatcher stalls past its lease and a second one claims the message
+        (stale,) = await outbox.claim(10, lease_seconds=0)
+        await asyncio.sleep(0.01)
+        (current,) = await outbox.claim(10, lease_seconds=60)
+        assert current["lease_owner"] != stale["lease_owner"]
+
+        await outbox.settle([stale], [])
+        assert (await outbox.collection.find_one({}))["status"] == SENDING
+        await outbox.settle([current], [])
+        assert (await outbox.collection.find_one({}))["status"] == SENT
+
+    asyncio.run(scenario())
+
+
+def test_lost_leases_count_as_attempts_until_the_message_fails(server):
+    outbox = Outbox(server.db.test_notification_outbox)
+
+    async def scenario():
+        await outbox.collection.delete_many({})
+        await outbox.enqueue("sms", "+91-9000000001", "Your medicines are ready")
+        # Every dispatcher that claims it dies before settling
+        attempts = []
+        for _ in range(3):
+            (message,) = await outbox.claim(10, lease_seconds=0, max_attempts=3)
+            attempts.append(message["attempts"])
+            await asyncio.sleep(0.01)
+        assert await outbox.claim(10, lease_seconds=0, max_attempts=3) == []
+        return attempts, await outbox.collection.find_one({})
+
+    attempts, message = asyncio.run(scenario())
+    assert attempts == [0, 1, 2]
+    assert message["status"] == FAILED
+    assert message["attempts"] == 3
+    assert "lease_owner" not in message
+
+
+def test_hung_send_is_retried_before_its_lease_runs_out(server):
+    class Hanging(NotificationProvider):
+        name = "hanging"
+
+        async def send(self, message):
+            await asyncio.sleep(60)
+
+    outbox = Outbox(server.db.test_notification_outbox)
+    dispatcher = NotificationDispatcher(outbox, {"sms": Hanging()}, lease_seconds=1.0, send_timeout=0.05)
+
+    async def scenario():
+        await outbox.collection.delete_many({})
+        await outbox.enqueue("sms", "+91-9000000001", "Your medicines are ready")
+        batch = await outbox.claim(10, dispatcher.lease_seconds, dispatcher.max_attempts)
+        await asyncio.wait_for(dispatcher.dispatch(batch), 1.0)
+        return await outbox.collection.find_one({})
+
+    message = asyncio.run(scenario())
+    assert message["status"] == PENDING
+    assert message["attempts"] == 1
+    assert "did not answer within" in message["last_error"]
+
+
+def test_send_timeout_must_be_shorter_than_the_lease():
+    with pytest.raises(ValueError):
+        NotificationDispatcher(Outbox(None), {}, lease_seconds=10, send_timeout=10)
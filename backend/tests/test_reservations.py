@@ -0,0 +1,61 @@
+import asyncio
+import random
+
+import pytest
+
+from benchmarks import bench_reservations as storm
+from inventory import INVENTORY
+from reservations import InsufficientStock, release, release_expired, reserve
+
+STOCK = 40
+
+
+@pytest.fixture
+def db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["arogya_test"]
+
+
+def test_booking_storm_never_oversells(db):
+    random.seed(0)
+    bookings = [storm.make_booking() for _ in range(400)]
+
+    async def run():
+        await storm.seed(db, STOCK)
+        accepted, rejected, _, _ = await storm.run(db, bookings, concurrency=100)
+        return accepted, rejected, await storm.verify(db, STOCK, accepted)
+
+    accepted, rejected, problems = asyncio.run(run())
+    assert problems == []
+    assert rejected > 0, "the storm should exhaust some medicine"
+    assert len(accepted) + rejected == len(bookings)
+    for name in storm.MEDICINES:
+        assert sum(lines.get(name, 0) for lines in accepted.values()) <= STOCK
+
+
+def test_rejected_booking_releases_the_lines_it_took(db):
+    async def run():
+        await storm.seed(db, 5)
+        with pytest.raises(InsufficientStock):
+            await reserve(db[INVENTORY], "too_much", storm.PHARMACY["id"], {"paracetamol": 2, "zinc": 6}, 60)
+        return {item["medicine_name"]: (item["stock"], item.get("holds", [])) async for item in db[INVENTORY].find({})}
+
+    left = asyncio.run(run())
+    assert left["paracetamol"] == (5, [])
+    assert left["zinc"] == (5, [])
+
+
+def test_release_and_expiry_return_stock_once(db):
+    pharmacy_id = storm.PHARMACY["id"]
+
+    async def run():
+        await storm.seed(db, 10)
+        await reserve(db[INVENTORY], "a", pharmacy_id, {"ors": 4}, 60)
+        await reserve(db[INVENTORY], "b", pharmacy_id, {"ors": 3}, 60)
+        await release(db[INVENTORY], "a", pharmacy_id, {"ors": 4})
+        await release(db[INVENTORY], "a", pharmacy_id, {"ors": 4})
+        released = await release_expired(db[INVENTORY], grace_seconds=-120)
+        item = await db[INVENTORY].find_one({"medicine_name": "ors"})
+        return released, item["stock"], item["holds"]
+
+    assert asyncio.run(run()) == (["b"], 10, [])
@@ -0,0 +1,96 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.bench_rollups import make_visit
+from rollups import FOLLOWUPS, ROLLUPS, VisitRollups
+
+NOW = datetime.now(timezone.utc)
+
+
+@pytest.fixture
+def rollups():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["arogya_test"]
+    return VisitRollups(db)
+
+
+def visit(patient_id: str, days_ago: int, due_in_days=None):
+    created_at = NOW - timedelta(days=days_ago)
+    return {
+        "id": f"{patient_id}_{days_ago}", "asha_id": "asha_1", "patient_id": patient_id, "patient_name": patient_id,
+        "village": "village_1", "visit_type": "routine", "vital_signs": {"pulse": 72}, "created_at": created_at,
+        "next_visit_date": created_at + timedelta(days=due_in_days) if due_in_days is not None else None,
+    }
+
+
+async def dashboards(rollups: VisitRollups):
+    return [await rollups.dashboard(scope, key, days=60) for scope, key in
+            (("asha", "asha_0"), ("asha", "asha_1"), ("village", "village_0"))]
+
+
+def split_means(dashboards):
+    """Vitals means apart from the rest; float sums taken in another order can round 0.01 apart"""
+    means = []
+    for dashboard in dashboards:
+        for day in dashboard["days"]:
+            for vital in day["vitals"].values():
+                means.append(vital.pop("mean"))
+    return means
+
+
+async def followups(rollups: VisitRollups):
+    return await rollups.followups.find({}, {"_id": 0}).sort("patient_id").to_list(None)
+
+
+def test_recording_visits_matches_rebuilding_from_them(rollups):
+    rng = random.Random(7)
+    visits = [make_visit(rng, rng.randrange(3), NOW, 60) for _ in range(300)]
+
+    async def scenario():
+        await rollups.visits.insert_many([dict(v) for v in visits])
+        # Recorded out of order, as visits synced late from the field arrive
+        for v in rng.sample(visits, len(visits)):
+            await rollups.record(v, v["village"])
+        recorded = await dashboards(rollups), await followups(rollups)
+
+        await rollups.db[ROLLUPS].delete_many({})
+        await rollups.db[FOLLOWUPS].delete_many({})
+        counts = await rollups.rebuild(workers=2, slice_days=10)
+        return recorded, (await dashboards(rollups), await followups(rollups)), counts
+
+    recorded, rebuilt, counts = asyncio.run(scenario())
+    assert split_means(recorded[0]) == pytest.approx(split_means(rebuilt[0]), abs=0.011)
+    assert recorded == rebuilt
+    assert counts["visits"] == len(visits)
+    assert recorded[0][0]["totals"]["visits"] > 0
+    assert counts["followups"] == sum(1 for f in rebuilt[1] if "due_at" in f)
+
+
+def test_late_older_visit_does_not_move_a_newer_followup(rollups):
+    async def scenario():
+        await rollups.record(visit("p1", days_ago=2, due_in_days=10), "village_1")
+        await rollups.record(visit("p1", days_ago=5, due_in_days=3), "village_1")
+        await rollups.record(visit("p1", days_ago=6), "village_1")
+        return await rollups.followups.find_one({"_id": "p1"})
+
+    followup = asyncio.run(scenario())
+    assert followup["visit_id"] == "p1_2"
+    assert abs(followup["due_at"].replace(tzinfo=timezone.utc) - (NOW + timedelta(days=8))) < timedelta(seconds=1)
+
+
+def test_late_older_visit_does_not_reopen_a_closed_followup(rollups):
+    async def scenario():
+        await rollups.record(visit("p1", days_ago=9, due_in_days=3), "village_1")
+        await rollups.record(visit("p1", days_ago=2), "village_1")
+        await rollups.record(visit("p1", days_ago=5, due_in_days=1), "village_1")
+        return (await rollups.followups.find_one({"_id": "p1"}),
+                await rollups.open_followups("asha", "asha_1", overdue_limit=20))
+
+    followup, open_followups = asyncio.run(scenario())
+    assert followup["visit_id"] == "p1_2"
+    assert "due_at" not in followup
+    assert open_followups["overdue"] == 0
+    assert open_followups["due_next_7_days"] == 0
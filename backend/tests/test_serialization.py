@@ -0,0 +1,59 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi.utils import create_response_field
+
+from conftest import call
+
+
+def model_and_fast_bodies(model, docs):
+    from benchmarks.bench_serialization import model_path
+    from serialization import fast_encoder
+
+    field = create_response_field(name=f"Response_{model.__name__}", type_=List[model])
+    encoder = fast_encoder(model)
+    # The fast path never sees fields outside the projection
+    projected = [{key: value for key, value in doc.items() if key in encoder.projection()} for doc in docs]
+    return asyncio.run(model_path(model, field, docs)), encoder.encode_many(projected)
+
+
+def test_fast_encoder_sends_the_bytes_the_models_would(server):
+    from benchmarks.bench_serialization import ENDPOINTS, sample
+
+    for endpoint, model in ENDPOINTS.items():
+        slow, fast = model_and_fast_bodies(model, [sample(endpoint, i) for i in range(200)])
+        assert fast == slow, endpoint
+
+
+def test_values_the_fast_path_cannot_vouch_for_go_through_the_model(server):
+    from benchmarks.bench_serialization import sample
+
+    docs = [sample("get_pharmacy_inventory", i) for i in range(4)]
+    docs[0]["price"] = 1e20
+    docs[1]["price"] = 0.00001
+    docs[2]["updated_at"] = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    docs[3]["medicine_name"] = "पैरासिटामोल"
+    slow, fast = model_and_fast_bodies(server.InventoryItem, docs)
+    assert fast == slow
+
+
+def test_fast_responses_flag_does_not_change_a_list_page(server, monkeypatch):
+    import pagination
+
+    patient_id = f"patient_{uuid.uuid4().hex[:8]}"
+    for hour in (9, 10, 11):
+        assert call(server, "POST", "/api/consultations", json={
+            "patient_id": patient_id, "doctor_name": "Dr. Rao", "symptoms": "Fever",
+            "appointment_time": f"2027-02-01T{hour:02d}:00:00Z",
+        }).status_code == 200
+
+    bodies = []
+    for enabled in (False, True):
+        monkeypatch.setattr(pagination, "FAST_RESPONSES", enabled)
+        response = call(server, "GET", f"/api/consultations/{patient_id}")
+        assert response.status_code == 200
+        bodies.append(response.content)
+    assert bodies[0] == bodies[1]
+    assert len(bodies[0]) > 2
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from surveillance import ALERTS, COUNTERS, WATERMARK_ID, OutbreakDetector
+
+START = datetime(2027, 3, 1, 6, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["arogya_test"]
+
+
+def test_spike_opens_an_alert_that_expire_resolves_once_quiet(db):
+    detector = OutbreakDetector(db, min_cases=5)
+
+    async def scenario():
+        opened = []
+        for n in range(6):
+            opened += await detector.record("pune", ["fever", "cough"] if n < 2 else ["fever"],
+                                            START + timedelta(minutes=n))
+        still_open = await detector.expire(START + timedelta(hours=12))
+        resolved = await detector.expire(START + timedelta(hours=25))
+        return opened, still_open, resolved, await db[ALERTS].find({}, {"_id": 0}).to_list(None)
+
+    opened, still_open, resolved, alerts = asyncio.run(scenario())
+    assert [(change["symptom"], change["status"], change["count"]) for change in opened] == [("fever", "open", 5)]
+    assert still_open == 0
+    assert resolved == 1
+    assert len(alerts) == 1
+    assert alerts[0]["status"] == "resolved"
+    assert alerts[0]["peak"] == 6
+    assert detector.stats()["open_alerts"] == 0
+
+
+def test_restore_and_replay_count_each_check_once(db):
+    checks = [
+        {"id": f"check_{n}", "user_id": "patient", "village": "pune" if n % 3 else "nashik",
+         "symptoms": [], "symptom_keys": ["fever"] if n % 2 else ["fever", "cough"],
+         "created_at": START + timedelta(minutes=20 * n)}
+        for n in range(40)
+    ]
+
+    async def scenario():
+        await db.symptom_checks.insert_many([dict(check) for check in checks])
+        first = OutbreakDetector(db)
+        for check in checks[:15]:
+            await first.record(check["village"], check["symptom_keys"], check["created_at"])
+        await first.flush(now=checks[14]["created_at"])
+        watermark = first.watermark
+        for check in checks[15:25]:
+            await first.record(check["village"], check["symptom_keys"], check["created_at"])
+        await first.flush(now=checks[24]["created_at"])
+        # The process stopped after writing its counters and before moving the watermark past them
+        await db[COUNTERS].update_one({"_id": WATERMARK_ID}, {"$set": {"through": watermark}})
+        for check in checks[25:]:
+            await first.record(check["village"], check["symptom_keys"], check["created_at"])
+
+        second = OutbreakDetector(db)
+        await second.restore()
+        replayed = await second.replay(None, until=checks[-1]["created_at"] + timedelta(seconds=1))
+        return first, second, replayed
+
+    first, second, replayed = asyncio.run(scenario())
+    assert replayed == 25
+    assert second.counters["skipped"] > 0
+    assert set(second.windows) == set(first.windows)
+    for key, counter in first.windows.items():
+        assert second.windows[key].counts == counter.counts, key
+        assert second.windows[key].current == counter.current, key
@@ -0,0 +1,49 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from conftest import call
+from sync import LineTooLong, iter_ndjson
+
+
+def decode(chunks, max_line=1024):
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [item async for item in iter_ndjson(stream(), max_line)]
+
+    return asyncio.run(collect())
+
+
+def test_lines_split_across_chunks_are_joined():
+    assert decode([b'{"a": 1}\n{"b"', b': 2}\n\n', b'not json\n{"c": 3}']) == [{"a": 1}, {"b": 2}, None, {"c": 3}]
+
+
+@pytest.mark.parametrize("chunks", [
+    [b'{"a": "' + b"x" * 40 + b'"}\n'],
+    [b'{"a": "', b"x" * 20, b"x" * 20, b'"}'],
+    [b"x" * 20] * 1000,
+])
+def test_line_past_the_limit_is_refused(chunks):
+    with pytest.raises(LineTooLong):
+        decode(chunks, max_line=32)
+
+
+def test_sync_stream_with_an_oversized_line_is_413(server, monkeypatch):
+    monkeypatch.setattr(server, "SYNC_MAX_LINE_BYTES", 1024)
+    record = {"user_id": "patient_1", "type": "vitals", "title": "Home visit",
+              "description": "BP 120/80", "offline_id": str(uuid.uuid4())}
+    body = json.dumps(record) + "\n" + json.dumps({**record, "description": "x" * 2000})
+
+    response = call(server, "POST", "/api/health-records/sync/stream", content=body.encode(),
+                    headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 413
+
+    response = call(server, "POST", "/api/health-records/sync/stream", content=json.dumps(record).encode(),
+                    headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json()["synced_count"] == 1, response.json()
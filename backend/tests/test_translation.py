@@ -0,0 +1,38 @@
+import asyncio
+import uuid
+
+from ai_governor import AIGovernor
+from benchmarks.fake_llm import FakeModel
+
+
+def test_groups_joining_to_the_same_text_are_not_merged(server, monkeypatch):
+    model = FakeModel(latency=0.05)
+    monkeypatch.setattr(server, "get_generative_model", lambda model_name, system_instruction: model)
+    monkeypatch.setattr(server, "ai_governor", AIGovernor("gemini"))
+    language = f"lang-{uuid.uuid4().hex[:8]}"
+
+    async def both():
+        return await asyncio.gather(server.translate_texts(["a\nb"], language),
+                                    server.translate_texts(["a", "b"], language))
+
+    (joined, _), (split, _) = asyncio.run(both())
+    assert model.calls == 2
+    assert joined == [f"[{language}] a\nb"]
+    assert split == [f"[{language}] a", f"[{language}] b"]
+    # And translation memory serves the same answers afterwards
+    assert asyncio.run(server.translate_texts(["a\nb", "a"], language))[0] == joined + split[:1]
+
+
+def test_short_translation_list_is_not_remembered(server, monkeypatch):
+    async def one_short(texts, target_language):
+        return [f"[{target_language}] {text}" for text in texts[:-1]]
+
+    monkeypatch.setattr(server, "translate_with_ai", one_short)
+    monkeypatch.setattr(server, "ai_governor", AIGovernor("gemini"))
+    language = f"lang-{uuid.uuid4().hex[:8]}"
+
+    translations, counts = asyncio.run(server.translate_texts(["fever", "cough"], language))
+    assert translations == ["fever", "cough"]
+    assert counts["untranslated"] == 2
+    keys = {server.translation_key(text, language) for text in ("fever", "cough")}
+    assert asyncio.run(server.translation_memory.get_many(keys)) == {}
@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from triage import TriageEngine
+
+BACKEND = Path(__file__).parent.parent
+CORPUS = BACKEND / "benchmarks" / "triage_corpus.jsonl"
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return TriageEngine.load(BACKEND / "data" / "triage_rules.json")
+
+
+def load_corpus():
+    with open(CORPUS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.mark.parametrize("case", load_corpus(), ids=lambda case: " | ".join(case["symptoms"] + case.get("context", [])))
+def test_corpus_severity(engine, case):
+    assert engine.assess(case["symptoms"], case.get("context", ())).severity == case["severity"]
+
+
+@pytest.mark.parametrize("context", [
+    "no chest pain, no breathing difficulty",
+    "denies chest pain",
+    "without any chest pain",
+    "seene mein dard nahi hai",
+    "सीने में दर्द नहीं है",
+])
+def test_denied_red_flag_is_not_an_emergency(engine, context):
+    result = engine.assess(["fever"], context=[context])
+    assert result.red_flags == []
+    assert result.symptoms == ["fever"]
+
+
+@pytest.mark.parametrize("context, red_flag", [
+    ("no relief from chest pain", "chest pain"),
+    ("no fever but chest pain since morning", "chest pain"),
+    ("not responding since an hour", "unconscious"),
+])
+def test_affirmed_red_flag_in_context_is_an_emergency(engine, context, red_flag):
+    result = engine.assess(["headache"], context=[context])
+    assert result.severity == "emergency"
+    assert red_flag in result.red_flags
+
+
+def test_structured_symptoms_are_not_negated(engine):
+    # A symptom the patient picked is reported as given, whatever its wording
+    assert "dehydration" in engine.assess(["no urine"]).symptoms
@@ -0,0 +1,31 @@
+import asyncio
+import gc
+import logging
+
+from sync import SyncSequence
+from write_behind import GroupCommitWriter
+
+
+def test_error_of_a_cancelled_insert_is_logged_not_lost(server, caplog):
+    db = server.db
+    unretrieved = []
+
+    async def scenario():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        await db.test_write_behind.delete_many({})
+        await db.test_write_behind.insert_one({"id": "taken"})
+        writer = GroupCommitWriter(db, SyncSequence(db.test_write_behind_counters), ["test_write_behind"],
+                                   max_delay=0.05)
+        caller = asyncio.create_task(writer.insert("test_write_behind", {"id": "taken"}))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await writer.close()
+        await asyncio.sleep(0)
+
+    # The app keeps one unique index on id; the in-memory collection needs it too
+    asyncio.run(db.test_write_behind.create_index("id", unique=True))
+    with caplog.at_level(logging.WARNING, logger="write_behind"):
+        asyncio.run(scenario())
+        gc.collect()
+    assert "Insert abandoned by its caller failed" in caplog.text
+    assert unretrieved == []
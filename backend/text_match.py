@@ -0,0 +1,138 @@
+"""String matching primitives: Aho-Corasick multi-pattern search and an edit-distance index."""
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_DROPPED = {"'", "’", "‌", "‍"}  # apostrophes and zero-width (non-)joiners
+
+
+def normalize_text(text: str) -> str:
+    """NFKC, casefold, punctuation to spaces and collapsed whitespace"""
+    chars = []
+    for char in unicodedata.normalize("NFKC", text).casefold():
+        if char in _DROPPED:
+            continue
+        category = unicodedata.category(char)
+        chars.append(" " if category[0] in "PSZC" else char)
+    return " ".join("".join(chars).split())
+
+
+class AhoCorasick:
+    """Automaton that finds every occurrence of a fixed set of patterns in one pass over the text"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._link()
+
+    def _add(self, pattern: str) -> None:
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text: str) -> List[Tuple[int, int, int]]:
+        """Return (start, end, pattern_index) for every match, overlapping ones included"""
+        matches = []
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in out[node]:
+                matches.append((i + 1 - len(patterns[index]), i + 1, index))
+        return matches
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal-string-alignment distance, returning limit + 1 as soon as it is exceeded"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    """Finds dictionary words within a small edit distance (symmetric delete / SymSpell).
+
+    Every word is indexed under all strings reachable by deleting up to
+    max_distance characters, so a lookup only hashes the query's own
+    deletions instead of comparing against the whole vocabulary.
+    """
+
+    def __init__(self, words: Iterable[str], max_distance: int = 1):
+        self.max_distance = max_distance
+        self.words: Set[str] = set()
+        self._deletes: Dict[str, Set[str]] = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        if word in self.words:
+            return
+        self.words.add(word)
+        for variant in self._variants(word):
+            self._deletes.setdefault(variant, set()).add(word)
+
+    def _variants(self, word: str) -> Set[str]:
+        variants = {word}
+        frontier = {word}
+        for _ in range(self.max_distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+            variants |= frontier
+        return variants
+
+    def matches(self, word: str, max_distance: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Return (distance, word) pairs sorted by distance, then alphabetically"""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if word in self.words:
+            return [(0, word)]
+        candidates: Set[str] = set()
+        for variant in self._variants(word):
+            candidates |= self._deletes.get(variant, set())
+        scored = []
+        for candidate in candidates:
+            distance = edit_distance(word, candidate, limit)
+            if distance <= limit:
+                scored.append((distance, candidate))
+        return sorted(scored)
+
+    def closest(self, word: str, max_distance: Optional[int] = None) -> Optional[str]:
+        found = self.matches(word, max_distance)
+        return found[0][1] if found else None
@@ -0,0 +1,78 @@
+"""One newest-first patient timeline merged from several per-patient collections.
+
+Every source is already indexed on (owner, time desc, id desc), so each one is
+read as a sorted cursor capped at the page size, all of them concurrently, and
+the pages are k-way merged lazily until the page is full. Entries are ordered
+by (time, kind, id), which the next-page cursor encodes.
+"""
+import asyncio
+import heapq
+import itertools
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from pagination import decode_cursor, encode_cursor
+from serialization import fast_encoder
+
+
+class TimelineSource(NamedTuple):
+    kind: str
+    collection: str
+    owner_field: str
+    time_field: str
+    model: Type[BaseModel]
+
+
+def encode_timeline_cursor(at: datetime, kind: str, doc_id: str) -> str:
+    return encode_cursor(at, f"{kind}:{doc_id}")
+
+
+def decode_timeline_cursor(cursor: str) -> Tuple[datetime, str, str]:
+    """Turn a cursor back into (time, kind, id); raises ValueError if it is malformed"""
+    at, key = decode_cursor(cursor)
+    kind, sep, doc_id = key.partition(":")
+    if not isinstance(at, datetime) or not sep:
+        raise ValueError("invalid cursor")
+    return at, kind, doc_id
+
+
+def source_query(source: TimelineSource, owner_id: str, after: Optional[Tuple[datetime, str, str]]) -> Dict[str, Any]:
+    """Documents of source that sort after the cursor position"""
+    query: Dict[str, Any] = {source.owner_field: owner_id}
+    if after is None:
+        return query
+    at, kind, doc_id = after
+    if source.kind < kind:
+        query[source.time_field] = {"$lte": at}
+    elif source.kind > kind:
+        query[source.time_field] = {"$lt": at}
+    else:
+        query["$or"] = [{source.time_field: {"$lt": at}}, {source.time_field: at, "id": {"$lt": doc_id}}]
+    return query
+
+
+async def _read_source(db, source: TimelineSource, owner_id: str, after, limit: int):
+    cursor = db[source.collection].find(source_query(source, owner_id, after), fast_encoder(source.model).projection())
+    docs = await cursor.sort([(source.time_field, -1), ("id", -1)]).limit(limit).to_list(limit)
+    return [((doc.get(source.time_field) or datetime.min, source.kind, doc["id"]), source, doc) for doc in docs]
+
+
+async def fetch_timeline(db, sources: List[TimelineSource], owner_id: str, limit: int,
+                         after: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Return (entries, next_cursor) for one page of the timeline, newest first"""
+    position = decode_timeline_cursor(after) if after else None
+    # No source can contribute more than a page (plus one to tell whether there is a next page)
+    pages = await asyncio.gather(*(_read_source(db, source, owner_id, position, limit + 1) for source in sources))
+    merged = list(itertools.islice(heapq.merge(*pages, key=lambda entry: entry[0], reverse=True), limit + 1))
+
+    entries = [
+        {"kind": source.kind, "timestamp": key[0], "item": source.model(**doc)}
+        for key, source, doc in merged[:limit]
+    ]
+    next_cursor = None
+    if len(merged) > limit:
+        at, kind, doc_id = merged[limit - 1][0]
+        next_cursor = encode_timeline_cursor(at, kind, doc_id)
+    return entries, next_cursor
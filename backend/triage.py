@@ -0,0 +1,178 @@
+"""Offline symptom triage compiled from a multilingual lexicon and weighted severity rules."""
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from text_match import AhoCorasick, FuzzyIndex, normalize_text
+
+# In free-text notes, terms up to NEGATION_SCOPE words after a cue (or before a Hindi "nahi") in the same clause are denied
+NEGATION_BEFORE = frozenset({"no", "not", "without", "denies", "denied", "deny", "never", "nil"})
+NEGATION_AFTER = frozenset({"nahi", "nahin", "nahee", "नहीं", "नही"})
+# "no relief from chest pain" still reports the pain
+PSEUDO_NEGATION = frozenset({"relief", "improvement", "better", "improving", "change", "able", "stop", "stopping",
+                             "only", "just", "sure"})
+NEGATION_SCOPE = 4
+CLAUSE_BREAK = re.compile(r"[,.;:!?\n।]|\b(?:but|however|although|though|except|lekin|magar|लेकिन|मगर)\b", re.IGNORECASE)
+
+
+def negated_words(words: List[str]) -> List[bool]:
+    """Which words of one clause fall in the scope of a negation cue; another cue ends the scope"""
+    cues = NEGATION_BEFORE | NEGATION_AFTER
+    negated = [False] * len(words)
+    for i, word in enumerate(words):
+        if word in NEGATION_BEFORE:
+            if i + 1 < len(words) and words[i + 1] in PSEUDO_NEGATION:
+                continue
+            scope = range(i + 1, min(len(words), i + 1 + NEGATION_SCOPE))
+        elif word in NEGATION_AFTER:
+            scope = range(i - 1, max(-1, i - 1 - NEGATION_SCOPE), -1)
+        else:
+            continue
+        for j in scope:
+            if words[j] in cues:
+                break
+            negated[j] = True
+    return negated
+
+
+class TriageResult(NamedTuple):
+    severity: str
+    score: int
+    symptoms: List[str]  # canonical symptom keys that matched
+    red_flags: List[str]  # labels of the red-flag symptoms and combinations found
+    unrecognized: List[str]  # input strings with no lexicon match
+    recommendations: List[str]
+
+
+class TriageEngine:
+    """Scores symptom strings against a lexicon compiled once into an Aho-Corasick automaton.
+
+    Matching runs on normalized text (NFKC, casefolded, punctuation removed)
+    and keeps the longest non-overlapping terms that start on a word boundary.
+    Latin-script words that miss the lexicon are corrected to a lexicon word
+    one edit away, which catches common misspellings like "fevr" or "vomitting".
+    """
+
+    def __init__(self, rules: Dict[str, Any]):
+        self.symptoms: Dict[str, Dict[str, Any]] = rules["symptoms"]
+        self.thresholds = rules["severity_thresholds"]
+        self.unrecognized_weight = rules.get("unrecognized_weight", 1)
+        self.recommendations: Dict[str, List[str]] = rules["recommendations"]
+        self.combinations: List[Tuple[FrozenSet[str], str]] = [
+            (frozenset(combo["all"]), combo["label"]) for combo in rules.get("red_flag_combinations", [])
+        ]
+
+        term_keys: Dict[str, str] = {}
+        for key, symptom in self.symptoms.items():
+            for terms in symptom["terms"].values():
+                for term in terms:
+                    normalized = normalize_text(term)
+                    if term_keys.setdefault(normalized, key) != key:
+                        raise ValueError(f"Term '{term}' is listed under both {term_keys[normalized]} and {key}")
+        self._term_keys = [term_keys[term] for term in term_keys]
+        self._automaton = AhoCorasick(term_keys)
+        self._vocabulary = {word for term in term_keys for word in term.split() if word.isascii()}
+        self._fuzzy = FuzzyIndex((word for word in self._vocabulary if len(word) >= 4), max_distance=1)
+
+    @classmethod
+    def load(cls, path: Path) -> "TriageEngine":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match(self, text: str, negation: bool = False) -> Set[str]:
+        """Canonical symptom keys mentioned in one free-text symptom string.
+
+        With negation, terms denied in the text ("no chest pain", "denies
+        breathlessness", "seene mein dard nahi") are left out. Terms that
+        themselves start with a cue, like "not responding", still match.
+        """
+        if not negation:
+            words = normalize_text(text).split()
+            return self._scan(" ".join(self._correct(word) for word in words))
+        keys: Set[str] = set()
+        for clause in CLAUSE_BREAK.split(text):
+            # Cues are found before spelling correction, which could turn "nahi" into a lexicon word
+            words = normalize_text(clause).split()
+            keys |= self._scan(" ".join(self._correct(word) for word in words), negated_words(words))
+        return keys
+
+    def _correct(self, word: str) -> str:
+        if word in self._vocabulary or len(word) < 4 or not word.isascii() or not word.isalpha():
+            return word
+        for _, candidate in self._fuzzy.matches(word):
+            # Typos rarely hit the first letter; requiring it avoids "rough" -> "cough"
+            if candidate[0] == word[0]:
+                return candidate
+        return word
+
+    def _scan(self, text: str, negated: Optional[List[bool]] = None) -> Set[str]:
+        # Terms must start a word but may end inside one, so "cough" also matches "coughing"
+        found = [
+            (start, end, index) for start, end, index in self._automaton.find(text)
+            if start == 0 or text[start - 1] == " "
+        ]
+        if negated is not None and any(negated):
+            word_at = {}
+            offset = 0
+            for i, word in enumerate(text.split(" ")):
+                word_at[offset] = i
+                offset += len(word) + 1
+            found = [match for match in found if not negated[word_at[match[0]]]]
+        taken = [False] * len(text)
+        keys = set()
+        for start, end, index in sorted(found, key=lambda m: (m[0] - m[1], m[0])):
+            if any(taken[start:end]):
+                continue
+            taken[start:end] = [True] * (end - start)
+            keys.add(self._term_keys[index])
+        return keys
+
+    def assess(self, texts: Iterable[str], context: Iterable[Optional[str]] = ()) -> TriageResult:
+        """Triage the symptom strings of one patient.
+
+        Strings in context (free-text notes) can add matches but are not
+        scored as unrecognized symptoms when nothing in them matches, and
+        symptoms they deny are not counted.
+        """
+        keys: Set[str] = set()
+        unrecognized = []
+        for text in texts:
+            if not text or not text.strip():
+                continue
+            found = self.match(text)
+            if found:
+                keys |= found
+            else:
+                unrecognized.append(text)
+        for text in context:
+            if text:
+                keys |= self.match(text, negation=True)
+
+        red_flags = [self.symptoms[key]["label"] for key in sorted(keys) if self.symptoms[key].get("red_flag")]
+        red_flags += [label for combo, label in self.combinations if combo <= keys and label not in red_flags]
+        score = sum(self.symptoms[key]["weight"] for key in keys) + self.unrecognized_weight * len(unrecognized)
+
+        if red_flags:
+            severity = "emergency"
+        elif score >= self.thresholds["high"]:
+            severity = "high"
+        elif score >= self.thresholds["medium"]:
+            severity = "medium"
+        elif keys:
+            severity = "low"
+        else:
+            # Nothing recognisable: do not reassure the patient
+            severity = "medium"
+
+        return TriageResult(
+            severity=severity,
+            score=score,
+            symptoms=sorted(keys),
+            red_flags=red_flags,
+            unrecognized=unrecognized,
+            recommendations=list(self.recommendations[severity]),
+        )
+
+    def assess_batch(self, batch: Iterable[Iterable[str]]) -> List[TriageResult]:
+        return [self.assess(texts) for texts in batch]
@@ -0,0 +1,155 @@
+"""Group commit for append-only collections: concurrent inserts share insert_many round trips.
+
+An insert joins its collection's buffer and waits. The buffer is written
+once it holds max_batch documents, or max_delay seconds after its first
+document arrived, whichever is sooner. The whole batch is stamped with one
+sequence reservation and written with one unordered insert_many, and each
+caller returns only once its own document is acknowledged (or gets that
+document's write error). Under load this turns thousands of two-round-trip
+inserts into a few dozen batches; when idle it adds at most max_delay to
+an insert.
+
+Backpressure: at most max_inflight batches per collection are written at
+once, and at most max_pending documents wait across all collections. When
+Mongo slows down, the buffers grow into bigger batches first, then new
+inserts wait for room instead of queueing without bound.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+from metrics import registry
+from sync import DUPLICATE_KEY_ERROR, SyncSequence
+
+logger = logging.getLogger(__name__)
+
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+write_behind_batch = registry.histogram("write_behind_batch_documents", "Documents per group-commit insert_many",
+                                        ("collection",), BATCH_BUCKETS)
+
+_Pending = Tuple[Dict[str, Any], asyncio.Future]
+
+
+def _report_abandoned(acknowledged: asyncio.Future) -> None:
+    """Retrieve and log the outcome of an insert whose caller was cancelled, so its error is not lost"""
+    if not acknowledged.cancelled() and acknowledged.exception() is not None:
+        logger.warning(f"Insert abandoned by its caller failed: {acknowledged.exception()!r}")
+
+
+class GroupCommitWriter:
+    """Coalesces concurrent inserts per collection into sequence-stamped insert_many batches"""
+
+    def __init__(self, db, sequence: SyncSequence, collections: Iterable[str], max_batch: int = 200,
+                 max_delay: float = 0.005, max_inflight: int = 4, max_pending: int = 5000):
+        self.db = db
+        self.sequence = sequence
+        self.collections = frozenset(collections)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_inflight = max_inflight
+        self._buffers: Dict[str, List[_Pending]] = {name: [] for name in self.collections}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._inflight: Dict[str, asyncio.Semaphore] = {}
+        self._room = asyncio.Semaphore(max_pending)
+        self._writes: Set[asyncio.Task] = set()
+        self._closed = False
+        self.counters = {"inserted": 0, "failed": 0, "batches": 0, "backpressured": 0}
+
+    async def insert(self, collection: str, doc: Dict[str, Any]) -> None:
+        """Stamp and insert doc, through the group commit buffer when the collection has one"""
+        if collection in self.collections and not self._closed:
+            if self._room.locked():
+                self.counters["backpressured"] += 1
+            await self._room.acquire()
+            if not self._closed:
+                await self._join(collection, doc)
+                return
+            # Closed while waiting for room: the last flush has already run
+            self._room.release()
+        await self.sequence.stamp(doc)
+        await self.db[collection].insert_one(doc)
+
+    async def _join(self, collection: str, doc: Dict[str, Any]) -> None:
+        acknowledged = asyncio.get_running_loop().create_future()
+        buffer = self._buffers[collection]
+        buffer.append((doc, acknowledged))
+        if len(buffer) >= self.max_batch:
+            self._flush(collection)
+        elif collection not in self._timers:
+            self._timers[collection] = asyncio.get_running_loop().call_later(self.max_delay, self._flush, collection)
+        # A caller that goes away does not take its document out of the batch, as with insert_one
+        try:
+            await asyncio.shield(acknowledged)
+        except asyncio.CancelledError:
+            acknowledged.add_done_callback(_report_abandoned)
+            raise
+
+    def _flush(self, collection: str) -> None:
+        timer = self._timers.pop(collection, None)
+        if timer is not None:
+            timer.cancel()
+        buffer = self._buffers[collection]
+        while buffer:
+            batch = buffer[:self.max_batch]
+            del buffer[:self.max_batch]
+            task = asyncio.create_task(self._write(collection, batch))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write(self, collection: str, batch: List[_Pending]) -> None:
+        inflight = self._inflight.get(collection)
+        if inflight is None:
+            inflight = self._inflight[collection] = asyncio.Semaphore(self.max_inflight)
+        errors: Dict[int, Exception] = {}
+        try:
+            async with inflight:
+                docs = [doc for doc, _ in batch]
+                # Stamped only once a write slot is free, so the settle window of the change feed covers the write
+                await self.sequence.stamp(*docs)
+                try:
+                    await self.db[collection].insert_many(docs, ordered=False)
+                except BulkWriteError as e:
+                    for error in e.details.get("writeErrors", []):
+                        error_class = DuplicateKeyError if error.get("code") == DUPLICATE_KEY_ERROR else WriteError
+                        errors[error["index"]] = error_class(error.get("errmsg", ""), error.get("code"), error)
+        except Exception as e:
+            errors = {i: e for i in range(len(batch))}
+            logger.error(f"Error writing a batch of {len(batch)} to {collection}: {e}")
+        finally:
+            for _ in batch:
+                self._room.release()
+        write_behind_batch.observe(len(batch), collection)
+        self.counters["batches"] += 1
+        self.counters["failed"] += len(errors)
+        self.counters["inserted"] += len(batch) - len(errors)
+        for i, (_, acknowledged) in enumerate(batch):
+            if acknowledged.done():
+                continue
+            if i in errors:
+                acknowledged.set_exception(errors[i])
+            else:
+                acknowledged.set_result(None)
+
+    async def close(self) -> None:
+        """Write everything buffered and wait for batches in flight; later inserts go straight to Mongo"""
+        self._closed = True
+        for collection in self.collections:
+            self._flush(collection)
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self.counters["batches"]
+        written = self.counters["inserted"] + self.counters["failed"]
+        return {
+            "collections": sorted(self.collections),
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay * 1000,
+            "buffered": {name: len(buffer) for name, buffer in self._buffers.items()},
+            "batches_in_flight": len(self._writes),
+            "mean_batch": round(written / batches, 1) if batches else 0.0,
+            **self.counters,
+        }